@@ -1,14 +1,21 @@
 """Flask app connecting pithy container to biologic container"""
 
 import flask
+import json
 import logging
 import os
-from threading import Event, Thread
-from time import sleep
 import werkzeug
 
-from biologic import experiment
+from biologic import commands, daemon, database, discovery, recent
+from biologic.config_store import get_store
+from biologic.decoding import BLOCK_DTYPE
+from biologic.events import bus
+from biologic.exceptions import PlanValidationError
 from biologic.potentiostats import HCP1005
+from biologic.profiling import profiler
+from biologic.registry import get_registry
+from biologic.scheduler import ChannelWorker, Scheduler
+from biologic.status import DEFAULT_TTL, MetadataCache
 
 log_filename = "logs/logs.log"
 os.makedirs(os.path.dirname(log_filename), exist_ok=True)
@@ -18,8 +25,141 @@ logging.basicConfig(filename=log_filename,
 
 PORT = '5002'
 
+settings = get_store().snapshot()
+
 app = flask.Flask(__name__)
 
+scheduler: Scheduler = None
+status_cache: MetadataCache = None
+discovery_service: discovery.DiscoveryService = None
+
+
+def _scheduler() -> Scheduler:
+    """Creates the scheduler on first use, picking up any experiments
+    queued before a restart.
+
+    With 'acquisition_daemon' set in config.json, acquisition runs in a
+    process of its own, see daemon.py, and this is its RemoteScheduler.
+    Its rings are sized like recent.py's, so /data reaches as far back.
+    """
+
+    global scheduler
+
+    if scheduler is None and settings.get('acquisition_daemon'):
+        scheduler = daemon.spawn(
+            potentiostat_class=HCP1005,
+            usb_port=settings['usb_port'],
+            capacity=max(recent.MAX_BYTES // BLOCK_DTYPE.itemsize, 1),
+            status_ttl=settings.get('status_ttl', DEFAULT_TTL)
+            ).scheduler
+    elif scheduler is None:
+        scheduler = Scheduler(potentiostat_class=HCP1005)
+
+    return scheduler
+
+
+def _status_cache() -> MetadataCache:
+    """Starts refreshing device metadata on first use, every
+    'status_ttl' seconds as set in config.json, on the scheduler's
+    connection. With an acquisition daemon, the daemon does, and this is
+    its RemoteMetadataCache.
+    """
+
+    global status_cache
+
+    if status_cache is None and isinstance(
+        _scheduler(), daemon.RemoteScheduler
+        ):
+        status_cache = scheduler.client.status_cache
+    elif status_cache is None:
+        status_cache = MetadataCache(
+            usb_port=settings['usb_port'],
+            connection=scheduler.connection,
+            ttl=settings.get('status_ttl', DEFAULT_TTL)
+            )
+        status_cache.start()
+
+    return status_cache
+
+
+def _discovery() -> discovery.DiscoveryService:
+    """Starts scanning for devices on first use, every
+    'discovery_interval' seconds as set in config.json.
+    """
+
+    global discovery_service
+
+    if discovery_service is None:
+        discovery_service = discovery.DiscoveryService(
+            interval=settings.get(
+                'discovery_interval', discovery.DEFAULT_INTERVAL
+                )
+            )
+        discovery_service.start()
+
+    return discovery_service
+
+
+def _usb_port(device: dict) -> str:
+    """Address of a discovered device the way 'usb_port' in config.json
+    has it, e.g. 'USB0' for USB device '0'.
+    """
+
+    address = device['address']
+
+    if device['interface'] == 'usb' and address.isdigit():
+        return f'USB{address}'
+
+    return address
+
+
+def _experiment_status(channel: int) -> dict:
+    """What /check_status says of a channel, None if nothing ran on it."""
+
+    if scheduler is None:
+        return None
+
+    worker = scheduler.worker(channel=channel, create=False)
+
+    if worker is None:
+        return None
+
+    return {
+        'status': worker.experiment.status,
+        'stop_reason': worker.experiment.stop_reason,
+        'paused': worker.paused,
+        }
+
+
+def _daemon() -> daemon.DaemonClient:
+    """The acquisition daemon, None unless 'acquisition_daemon' is set in
+    config.json, see daemon.py. Driver calls, transitions and most writes
+    to Drops happen there, so statistics of those have to be fetched
+    from it.
+    """
+
+    if not settings.get('acquisition_daemon'):
+        return None
+
+    return _scheduler().client
+
+
+def _worker() -> ChannelWorker:
+    """Worker for the channel in the query string, if there is one."""
+
+    if scheduler is None:
+        return None
+
+    channel = flask.request.args.get('channel', 0, type=int)
+
+    return scheduler.worker(channel=channel, create=False)
+
+
+def _ns(seconds: float) -> int:
+    """Host UTC (s) from a query string as ns, None if not given."""
+
+    return None if seconds is None else int(seconds * 1e9)
+
 
 def configure_routes(app):
 
@@ -33,58 +173,359 @@ def configure_routes(app):
 
         return "Flask BioLogic server running"
 
-    # Runs resonance
     @app.route('/run', methods=['POST'])
     def run():
-        """This is where the magic happens."""
+        """This is where the magic happens.
 
-        if 'experiment_' not in globals():
-            global experiment_
-            experiment_ = experiment.Experiment()
-
-        if experiment_.status == 'running':
-            return "Aborted: Experiment already running"
+        Queues the experiment if its channel is busy. Optional keys
+        'channel' and 'priority' (higher runs first) in the request.
+        """
 
-        global pill, potentiostat, thread
+        params = flask.request.json
 
-        pill = Event()  # kills thread when called
-        potentiostat = HCP1005()
+        try:
+            job, ahead = _scheduler().submit(raw_params=params)
+        except PlanValidationError as e:
+            return f'Rejected: {e.message}'
 
-        params = flask.request.json
+        if ahead > 0:
+            return f'Queued behind {ahead} experiment(s), id {job.job_id}'
 
-        thread = Thread(target=experiment.run,
-               args=(potentiostat, params, pill, experiment_))
+        if scheduler.worker(channel=job.channel).paused:
+            return f'Queued until /resume, id {job.job_id}'
 
-        thread.start()
+        scheduler.wait_started(job=job)
 
-        while experiment_.status != 'running':
-            sleep(0.1)
+        if job.error is not None:
+            return f'Aborted: {job.error}'
 
         return 'Technique started'
 
+    @app.route('/queue')
+    def queue():
+        """Experiments waiting to run, in the order they will."""
+
+        if scheduler is None:
+            return flask.jsonify([])
+
+        return flask.jsonify(scheduler.to_dict())
+
+    @app.route('/cancel/<job_id>')
+    def cancel(job_id: str):
+        """Drops a queued experiment."""
+
+        if scheduler is None or not scheduler.cancel(job_id=job_id):
+            return 'No such experiment queued'
+
+        return 'Experiment cancelled'
+
     @app.route('/check_status')
     def check_status():
-        if 'experiment_' not in globals():
+        worker = _worker()
+
+        if worker is None:
             return 'No experiment instance in scope'
 
-        return experiment_.status
+        if worker.experiment.stop_reason is not None:
+            return f'{worker.experiment.status}: {worker.experiment.stop_reason}'
+
+        return worker.experiment.status
+
+    @app.route('/status')
+    def status():
+        """Every device and channel at once, from cached metadata, see
+        status.py and discovery.py, so polling it never reaches the
+        instrument.
+
+        Returns:
+            Response: JSON, {'devices': [...]}, one per device found by
+                discovery, plus the one this server runs if discovery
+                hasn't found it. Each has its address and type as found,
+                whether this server runs it ('served'), and if so its
+                device info, its channels' info and experiment status,
+                and when and whether its metadata was last refreshed.
+        """
+
+        snapshot = _status_cache().snapshot()
+
+        for channel in snapshot['channels']:
+            channel['experiment'] = _experiment_status(
+                channel=channel['channel']
+                )
+
+        devices = list()
+
+        for device in _discovery().devices():
+            usb_port = _usb_port(device=device)
+
+            if usb_port == snapshot['usb_port']:
+                devices.append({**device, **snapshot, 'served': True})
+                snapshot = None
+            else:
+                devices.append({
+                    **device,
+                    'usb_port': usb_port,
+                    'served': False,
+                    'device': None,
+                    'channels': list(),
+                    'refreshed': None,
+                    'age': None,
+                    'error': None,
+                    })
+
+        # Not found by the last scan, e.g. before the first one
+        if snapshot is not None:
+            devices.insert(0, {**snapshot, 'served': True})
+
+        return flask.jsonify(devices=devices)
+
+    @app.route('/devices')
+    def devices():
+        """Devices found by the last background scan, see discovery.py.
+
+        Returns:
+            Response: JSON with the devices, when they were scanned for
+                (host UTC [s], null until the first scan is done) and
+                any errors of that scan, per interface.
+        """
+
+        service = _discovery()
+
+        return flask.jsonify(
+            devices=service.devices(),
+            scanned=service.scanned,
+            errors=service.errors
+            )
+
+    @app.route('/devices/events')
+    def device_events():
+        """Devices showing up or going away, as Server-Sent Events."""
+
+        _discovery()
+
+        def stream():
+            for event in discovery.events.stream():
+                yield f'data: {json.dumps(event.to_dict())}\n\n'
+
+        return flask.Response(stream(), mimetype='text/event-stream')
 
     @app.route('/stop')
     def stop():
         """A big, fat, virtual emergency stop button.
         
-        Does three things:
-            (1) Stops the running technique.
-            (2) Stops data logging.
+        Does four things:
+            (1) Stops the running technique, ahead of any other call on
+                the instrument.
+            (2) Writes out what's left on the instrument and stops data
+                logging.
             (3) Sets status to 'stopped'.
+            (4) Holds the channel's queue until /resume.
         """
 
-        potentiostat.stop_channel()
-        pill.set()
-        experiment_.set_status('stopped')
+        worker = _worker()
+
+        if worker is None:
+            return 'No experiment instance in scope'
+
+        worker.stop()
 
         return "Technique stopped"
 
+    @app.route('/stop_all')
+    def stop_all():
+        """/stop for every channel, in as few requests as possible."""
+
+        if scheduler is None:
+            return 'No experiment instance in scope'
+
+        latencies = scheduler.stop_all()
+
+        return f'{len(latencies)} technique(s) stopped'
+
+    @app.route('/stop/latency')
+    def stop_latency():
+        """From requesting a stop to the instrument accepting it [ms],
+        in the acquisition daemon if there is one.
+        """
+
+        client = _daemon()
+
+        if client is not None:
+            return flask.jsonify(client.call('stop_latency'))
+
+        return flask.jsonify(commands.latency_stats())
+
+    @app.route('/resume')
+    def resume():
+        """Lets a stopped channel carry on with its queue."""
+
+        worker = _worker()
+
+        if worker is None:
+            return 'No experiment instance in scope'
+
+        worker.resume()
+
+        return "Queue resumed"
+
+    @app.route('/events')
+    def events():
+        """Step and loop transitions as Server-Sent Events, pushed as
+        soon as the instrument data shows them.
+
+        Optional query parameter 'channel' to only follow one channel.
+        Not available with an acquisition daemon, which publishes them
+        in its own process.
+        """
+
+        if _daemon() is not None:
+            return 'Rejected: transitions stay in the acquisition daemon', 501
+
+        channel = flask.request.args.get('channel', None, type=int)
+
+        def stream():
+            for transition in bus.stream(channel=channel):
+                yield f'data: {json.dumps(transition.to_dict())}\n\n'
+
+        return flask.Response(stream(), mimetype='text/event-stream')
+
+    @app.route('/events/latency')
+    def events_latency():
+        """Latency from data arrival to transition publication [ms],
+        in the acquisition daemon if there is one.
+        """
+
+        client = _daemon()
+
+        if client is not None:
+            return flask.jsonify(client.call('events_latency'))
+
+        return flask.jsonify(bus.latency_stats())
+
+    @app.route('/publishing')
+    def publishing():
+        """Delivery of what was written to Drops, per topic: QoS, counts
+        of published, acknowledged and undelivered messages, and
+        acknowledgement latencies [ms].
+
+        With an acquisition daemon, this process only writes out the
+        sinks, and what the daemon writes is under 'daemon'.
+        """
+
+        publishing = {
+            'connections': database.get_pool().health(),
+            'topics': database.metrics.stats(),
+            }
+        client = _daemon()
+
+        if client is not None:
+            publishing['daemon'] = client.call('publishing')
+
+        return flask.jsonify(**publishing)
+
+    @app.route('/data')
+    def data():
+        """Recent data of a channel, from memory rather than Drops.
+
+        Optional query parameters: 'channel', 'since' and 'until' (host
+        UTC [s], since inclusive) and 'fields', comma-separated columns
+        of decoding.BLOCK_DTYPE, e.g. 'timestamp,Ewe,I'. As much is kept
+        per channel as 'recent_data_mb' in config.json allows.
+
+        Returns:
+            Response: JSON, column name: list of values, oldest first,
+                null where not recorded. Without 'fields', columns with
+                nothing recorded are left out.
+        """
+
+        args = flask.request.args
+        fields = args.get('fields', None)
+        fields = None if fields is None else fields.split(',')
+
+        if fields is not None:
+            try:
+                recent.check_fields(fields=fields)
+            except ValueError as e:
+                return f'Rejected: {e}'
+
+        query = {
+            'channel': args.get('channel', 0, type=int),
+            'since': _ns(args.get('since', None, type=float)),
+            'until': _ns(args.get('until', None, type=float)),
+            'fields': fields,
+            }
+
+        # With a daemon, it's in the daemon's rings
+        if isinstance(scheduler, daemon.RemoteScheduler):
+            rows = scheduler.data(**query)
+        else:
+            rows = recent.query(**query)
+
+        # Unless asked for, columns the technique doesn't record are noise
+        return flask.jsonify(
+            recent.to_columns(rows=rows, drop_empty=fields is None)
+            )
+
+    @app.route('/profiling')
+    def profiling():
+        """Per-function statistics of EC-Lab driver calls, made by the
+        acquisition daemon if there is one.
+
+        Returns:
+            Response: JSON with call counts, latencies [ms] and return
+                code distribution for each BL_* function called.
+        """
+
+        client = _daemon()
+
+        if client is not None:
+            return flask.jsonify(client.call('profiling'))
+
+        return flask.jsonify(
+            enabled=profiler.enabled, functions=profiler.stats()
+            )
+
+    @app.route('/profiling/<action>')
+    def toggle_profiling(action: str):
+        """Switches driver profiling at runtime.
+
+        Args:
+            action (str): 'enable', 'disable', or 'reset'. Passed on to
+                the acquisition daemon if there is one.
+        """
+
+        actions = {
+            'enable': profiler.enable,
+            'disable': profiler.disable,
+            'reset': profiler.reset,
+            }
+
+        if action not in actions:
+            flask.abort(404)
+
+        client = _daemon()
+
+        if client is not None:
+            client.call('profiling', action=action)
+        else:
+            actions[action]()
+
+        return f'Profiling {action}d'
+
+    @app.route('/profiling/trace')
+    def profiling_trace():
+        """Collapsed-stack trace of driver calls, weighted by time [us].
+
+        Pipe into flamegraph.pl or load in speedscope. Of the acquisition
+        daemon if there is one.
+        """
+
+        client = _daemon()
+        trace = profiler.trace() if client is None else client.call(
+            'profiling_trace'
+            )
+
+        return flask.Response(trace, mimetype='text/plain')
 
     @app.errorhandler(werkzeug.exceptions.BadRequest)
     def handle_bad_request(e):
@@ -98,10 +539,10 @@ def configure_routes(app):
         the previous is finished.
         """
 
-        if 'thread' not in globals():
+        if scheduler is None:
             return "Thread nonexistent"
         
-        thread.join()
+        scheduler.wait_idle()
 
         return "Thread joined"
 
@@ -110,4 +551,11 @@ def configure_routes(app):
 configure_routes(app)
 
 if __name__ == '__main__':
-    app.run(port=PORT, host="0.0.0.0", debug=True)
+    # Fail fast on missing or corrupted technique files
+    get_registry()
+    # Reattach to runs left behind by a previous process right away,
+    # rather than on the first request
+    _scheduler()
+    _status_cache()
+    # The reloader would restart the process, and with it every run
+    app.run(port=PORT, host="0.0.0.0", debug=True, use_reloader=False)
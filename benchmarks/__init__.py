@@ -0,0 +1,5 @@
+"""Performance benchmarks of the acquisition to publish pipeline.
+
+Run from the repository root with `python -m benchmarks`, see
+__main__.py. Results are stored per commit in benchmarks/results/.
+"""
@@ -0,0 +1,70 @@
+"""Runs the benchmarks and stores their results for this commit.
+
+Example:
+    python -m benchmarks
+    python -m benchmarks --only decode parse_payload
+    python -m benchmarks --capture captures/cell_3.bin --speed 10
+
+Exits with 1 if anything regressed against the baseline, by default the
+results stored last.
+"""
+
+import argparse
+import json
+import sys
+
+from benchmarks import results, suite
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--only', nargs='+', choices=list(suite.BENCHMARKS), default=None
+        )
+    parser.add_argument(
+        '--capture', default=None, help='replay this capture, see capture.py'
+        )
+    parser.add_argument(
+        '--speed',
+        type=float,
+        default=None,
+        help='replay speed, as fast as polled if not given'
+        )
+    parser.add_argument('--output', default=results.RESULTS_DIR)
+    parser.add_argument(
+        '--baseline', default=None, help='results to compare against'
+        )
+    parser.add_argument('--threshold', type=float, default=0.1)
+    arguments = parser.parse_args()
+
+    if arguments.capture is None:
+        driver_factory = suite.simulated()
+    else:
+        driver_factory = suite.replayed(
+            path=arguments.capture, speed=arguments.speed
+            )
+
+    baseline = arguments.baseline or results.latest(directory=arguments.output)
+    current = suite.run(names=arguments.only, driver_factory=driver_factory)
+    path = results.save(results=current, directory=arguments.output)
+
+    print(json.dumps(current, indent=2))
+    print(f'Saved to {path}')
+
+    if baseline is None or baseline == path:
+        return 0
+
+    regressions = results.compare(
+        baseline=results.load(path=baseline)['results'],
+        current=current,
+        threshold=arguments.threshold
+        )
+
+    for regression in regressions:
+        print(f'Regression against {baseline}: {regression}')
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""A stand-in MQTT broker, for measuring without a network or Drops.
+
+Speaks just enough MQTT 3.1.1 for Database's client: it accepts any
+CONNECT, acknowledges PUBLISH at QoS 0, 1 and 2, answers PINGREQ and
+records every message with the host time it arrived. Nothing is ever
+delivered anywhere.
+
+Example:
+    broker = StandInBroker()
+    broker.start()
+    database.host, database.port = broker.address
+    ...
+    broker.wait_for(count=1000)
+"""
+
+from dataclasses import dataclass
+import socketserver
+from threading import Condition, Thread
+import time
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PUBREC = 5
+PUBREL = 6
+PUBCOMP = 7
+SUBSCRIBE = 8
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+
+@dataclass
+class Message:
+    """A PUBLISH as received.
+
+    Attributes:
+        self.received_ns (int): Host UTC when it arrived (ns).
+        self.topic (str): Topic it was published to.
+        self.payload (bytes): As published.
+        self.qos (int): 0, 1 or 2.
+    """
+    received_ns: int
+    topic: str
+    payload: bytes
+    qos: int
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """One client connection, packet by packet."""
+
+    def handle(self) -> None:
+        while True:
+            packet = self._read_packet()
+
+            if packet is None:
+                return
+
+            type_, flags, body = packet
+
+            if type_ == CONNECT:
+                self.request.sendall(bytes([CONNACK << 4, 2, 0, 0]))
+            elif type_ == PUBLISH:
+                self._publish(flags=flags, body=body)
+            elif type_ == PUBREL:
+                self.request.sendall(bytes([PUBCOMP << 4, 2]) + body[:2])
+            elif type_ == PINGREQ:
+                self.request.sendall(bytes([PINGRESP << 4, 0]))
+            elif type_ == DISCONNECT:
+                return
+
+    def _publish(self, flags: int, body: bytes) -> None:
+        received_ns = time.time_ns()
+        qos = (flags >> 1) & 3
+        length = int.from_bytes(body[:2], 'big')
+        topic = body[2:2 + length].decode()
+        offset = 2 + length
+
+        if qos > 0:
+            packet_id = body[offset:offset + 2]
+            offset += 2
+            reply = PUBACK if qos == 1 else PUBREC
+            self.request.sendall(bytes([reply << 4, 2]) + packet_id)
+
+        self.server.receive(
+            message=Message(
+                received_ns=received_ns,
+                topic=topic,
+                payload=body[offset:],
+                qos=qos
+                )
+            )
+
+    def _read_packet(self) -> tuple[int, int, bytes]:
+        """Returns:
+            int: Packet type.
+            int: Flags.
+            bytes: Everything after the fixed header.
+            None once the client is gone.
+        """
+
+        first = self._read_exactly(size=1)
+
+        if first is None:
+            return None
+
+        # Remaining length, 7 bits at a time
+        length, shift = 0, 0
+
+        while True:
+            byte = self._read_exactly(size=1)
+
+            if byte is None:
+                return None
+
+            length |= (byte[0] & 0x7F) << shift
+            shift += 7
+
+            if not byte[0] & 0x80:
+                break
+
+        body = self._read_exactly(size=length) if length else b''
+
+        if body is None:
+            return None
+
+        return first[0] >> 4, first[0] & 0x0F, body
+
+    def _read_exactly(self, size: int) -> bytes:
+        chunks = bytearray()
+
+        while len(chunks) < size:
+            try:
+                chunk = self.request.recv(size - len(chunks))
+            except OSError:
+                return None
+
+            if not chunk:
+                return None
+
+            chunks.extend(chunk)
+
+        return bytes(chunks)
+
+
+class StandInBroker(socketserver.ThreadingTCPServer):
+    """Records what's published to it.
+
+    Attributes:
+        self.messages (list[Message]): In the order received.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple[str, int] = ('127.0.0.1', 0)):
+        """
+        Args:
+            address (tuple[str, int], optional): Defaults to a free port
+                on loopback.
+        """
+
+        self.messages: list[Message] = list()
+
+        self._received = Condition()
+
+        super(StandInBroker, self).__init__(address, _Handler)
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self.server_address[:2]
+
+    def start(self) -> None:
+        """Serves in a background thread."""
+
+        Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def receive(self, message: Message) -> None:
+        with self._received:
+            self.messages.append(message)
+            self._received.notify_all()
+
+    def wait_for(self, count: int, timeout: float = 30) -> bool:
+        """Waits until count messages have arrived in total.
+
+        Returns:
+            bool: False if they didn't within timeout (s).
+        """
+
+        with self._received:
+            return self._received.wait_for(
+                lambda: len(self.messages) >= count, timeout=timeout
+                )
+
+    def clear(self) -> None:
+        with self._received:
+            self.messages.clear()
@@ -0,0 +1,138 @@
+"""Stores benchmark results per commit and compares them.
+
+Each run is written to <directory>/<commit>.json, the commit being the
+short hash of HEAD, suffixed with '-dirty' if the tree has changes.
+Metrics are compared by their unit: '_ms' and '_bytes' are better lower,
+'_per_s' better higher. Anything else, e.g. counts, isn't compared.
+"""
+
+import glob
+import json
+import os
+import platform
+import subprocess
+import time
+
+RESULTS_DIR = os.path.join('benchmarks', 'results')
+LOWER_IS_BETTER = ('_ms', '_bytes')
+HIGHER_IS_BETTER = ('_per_s', '_ratio')
+
+
+def commit_id() -> str:
+    """Short hash of HEAD, e.g. '0e327ec' or '0e327ec-dirty'.
+
+    Returns:
+        str: 'unknown' outside a git checkout.
+    """
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            check=True,
+            text=True
+            ).stdout.strip()
+        changes = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            capture_output=True,
+            check=True,
+            text=True
+            ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+    return f'{commit}-dirty' if changes else commit
+
+
+def save(
+    results: dict, directory: str = RESULTS_DIR, commit: str = None
+    ) -> str:
+    """Writes results of a run.
+
+    Args:
+        results (dict): See suite.run().
+        directory (str, optional): Defaults to RESULTS_DIR.
+        commit (str, optional): Defaults to commit_id().
+
+    Returns:
+        str: Path written to.
+    """
+
+    commit = commit_id() if commit is None else commit
+    path = os.path.join(directory, f'{commit}.json')
+    os.makedirs(directory, exist_ok=True)
+
+    with open(path, 'w') as f:
+        json.dump(
+            {
+                'commit': commit,
+                'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'machine': platform.node(),
+                'results': results,
+                },
+            f,
+            indent=2
+            )
+
+    return path
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def latest(directory: str = RESULTS_DIR, exclude: str = None) -> str:
+    """Path of the most recently written results, None if none.
+
+    Args:
+        exclude (str, optional): Path to skip, e.g. the run just saved.
+    """
+
+    paths = [
+        path for path in glob.glob(os.path.join(directory, '*.json'))
+        if exclude is None or os.path.abspath(path) != os.path.abspath(exclude)
+        ]
+
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+def compare(
+    baseline: dict, current: dict, threshold: float = 0.1
+    ) -> list[str]:
+    """Finds metrics that got worse by more than threshold.
+
+    Args:
+        baseline (dict): Results of suite.run(), e.g. load()['results'].
+        current (dict): Same, of the run to check.
+        threshold (float, optional): Relative change tolerated.
+            Defaults to 0.1, i.e. 10 %.
+
+    Returns:
+        list[str]: One line per regression, empty if there are none.
+    """
+
+    regressions = list()
+
+    for name, metrics in current.items():
+        for metric, value in metrics.items():
+            before = baseline.get(name, {}).get(metric)
+
+            if not isinstance(value, (int, float)) or not before:
+                continue
+
+            change = (value - before) / before
+
+            if metric.endswith(HIGHER_IS_BETTER):
+                change = -change
+            elif not metric.endswith(LOWER_IS_BETTER):
+                continue
+
+            if change > threshold:
+                regressions.append(
+                    f'{name}.{metric}: {before:.4g} -> {value:.4g} '
+                    f'({change:+.0%} worse)'
+                    )
+
+    return regressions
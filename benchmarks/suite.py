@@ -0,0 +1,479 @@
+"""Benchmarks of the acquisition to publish pipeline.
+
+Each runs against a simulated or replayed driver (see simulator.py) and,
+where anything is published, a StandInBroker, so no instrument, cell or
+network is needed. Latencies are in ms, throughputs per second.
+
+Example:
+    results = run(names=['decode', 'parse_payload'])
+"""
+
+import contextlib
+import ctypes
+import json
+import os
+from threading import Event
+import time
+import tracemalloc
+import typing
+
+import numpy as np
+
+from benchmarks.broker import StandInBroker
+from biologic import codec, database, experiment, techniques
+from biologic.decoding import decode
+from biologic.potentiostats import DATA_BUFFER_SIZE, Potentiostat, is_full
+from biologic.profiling import FunctionStats
+from biologic.reduction import to_payload
+from biologic.simulator import ReplayDriver, SimulatedDriver
+from biologic.utils import parse_payload
+
+# A fast CV, which fills the BL_GetData buffer on every poll
+cv = {
+    'Voltage_step': (0.0, 0.5, -0.5, 0.0, 0.0),
+    'Scan_Rate': (1000.0, ) * 5,  # mV/s
+    'Scan_number': 2,
+    'N_Cycles': 1,
+    }
+
+ocv_params = {
+    'exp_id': 'benchmarks/end_to_end',
+    'steps': {
+        'OCV': {
+            'Rest_time_T': 3.0,
+            'Record_every_dT': 0.1,
+            }
+        }
+    }
+
+# Traces to compress, as technique file and parameters
+traces = {
+    'ocv': ('ocv', {
+        'Rest_time_T': 30.0,
+        }),
+    'cp': ('cplimit', {
+        'Current_step': (0.001, -0.001),
+        'Duration_step': (15.0, 15.0),
+        'Step_number': 1,
+        }),
+    }
+
+DriverFactory = typing.Callable[[], object]
+
+
+def simulated(sampling_rate: float = 5000.0) -> DriverFactory:
+    """Fresh SimulatedDrivers, running in real time."""
+
+    return lambda: SimulatedDriver(sampling_rate=sampling_rate)
+
+
+def replayed(path: str, speed: float = None) -> DriverFactory:
+    """Fresh ReplayDrivers of a capture, as fast as polled by default."""
+
+    return lambda: ReplayDriver(path=path, speed=speed)
+
+
+def measure(function: typing.Callable, repeat: int) -> dict:
+    """Times repeated calls of function.
+
+    Returns:
+        dict: Count, total, mean and percentile latencies (ms).
+    """
+
+    stats = FunctionStats(max_samples=repeat)
+
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        function()
+        stats.record(duration_ns=time.perf_counter_ns() - start, return_code=0)
+
+    timings = stats.to_dict()
+    del timings['return_codes']
+
+    return timings
+
+
+@contextlib.contextmanager
+def _driver(driver):
+    """Compiles parameters with driver, as techniques does with the DLL."""
+
+    previous = techniques.driver
+    techniques.driver = driver
+
+    try:
+        yield driver
+    finally:
+        techniques.driver = previous
+
+
+def _start(
+    driver, channel: int = 0, technique: str = 'cv', params: dict = cv
+    ) -> Potentiostat:
+    potentiostat = Potentiostat(
+        channel=channel, type_='KBIO_DEV_HCP1005', driver=driver
+        )
+    potentiostat.connect(usb_port='USB0')
+    potentiostat.load_technique(
+        technique_paths=[f'drivers\\{technique}.ecc'],
+        c_tecc_params=techniques.set_technique_params([params])
+        )
+    potentiostat.start_channel()
+
+    return potentiostat
+
+
+def _fullest_poll(driver, polls: int = 100) -> tuple[object, dict, dict]:
+    """The BL_GetData call with the most data out of a few.
+
+    Returns:
+        ctypes.Array: Copy of its buffer.
+        dict: Its data_infos.
+        dict: Its current_values.
+    """
+
+    with _driver(driver=driver):
+        potentiostat = _start(driver=driver)
+
+    best = None
+
+    for _ in range(polls):
+        data_infos, current_values = potentiostat.get_data()
+
+        if best is None or data_infos['NbRaws'] > best[1]['NbRaws']:
+            buffer = (ctypes.c_uint32 * DATA_BUFFER_SIZE)()
+            ctypes.memmove(
+                buffer, potentiostat._data_buffer, ctypes.sizeof(buffer)
+                )
+            best = buffer, data_infos, current_values
+
+        if is_full(data_infos=data_infos):
+            break
+
+        time.sleep(0.05)
+
+    potentiostat.stop_channel()
+
+    return best
+
+
+def bench_compile(driver_factory: DriverFactory, repeat: int = 200) -> dict:
+    """techniques.set_technique_params() of a CV."""
+
+    with _driver(driver=driver_factory()):
+        return measure(
+            function=lambda: techniques.set_technique_params([cv]),
+            repeat=repeat
+            )
+
+
+def bench_decode(driver_factory: DriverFactory, repeat: int = 1000) -> dict:
+    """decoding.decode() of the fullest buffer polled."""
+
+    buffer, data_infos, current_values = _fullest_poll(driver=driver_factory())
+
+    result = measure(
+        function=lambda: decode(
+            buffer=buffer,
+            data_infos=data_infos,
+            time_base=current_values['TimeBase']
+            ),
+        repeat=repeat
+        )
+    result['rows'] = data_infos['NbRaws']
+    result['rows_per_s'] = data_infos['NbRaws'] / result['mean_ms'] * 1000
+
+    return result
+
+
+def bench_parse_payload(
+    driver_factory: DriverFactory, repeat: int = 10000
+    ) -> dict:
+    """utils.parse_payload() of a poll, as written to the 'biologic' table."""
+
+    _, data_infos, current_values = _fullest_poll(driver=driver_factory())
+
+    # parse_payload() prints, which is part of its cost, but not the
+    # terminal's
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            result = measure(
+                function=lambda: parse_payload(
+                    raw_data=current_values, raw_metadata=data_infos
+                    ),
+                repeat=repeat
+                )
+
+    result['calls_per_s'] = 1000 / result['mean_ms']
+
+    return result
+
+
+@contextlib.contextmanager
+def _broker():
+    """A StandInBroker that Database connects to."""
+
+    broker = StandInBroker()
+    broker.start()
+    previous = database.host, database.port
+    database.host, database.port = broker.address
+
+    try:
+        yield broker
+    finally:
+        database.close_pools()
+        database.host, database.port = previous
+        broker.stop()
+
+
+def bench_database_write(
+    driver_factory: DriverFactory, count: int = 5000
+    ) -> dict:
+    """Database.write() of poll-sized payloads to a local broker."""
+
+    payload = {'Ewe': 3.0, 'I': 0.001, 'ElapsedTime': 1.0, 'cycle': 0}
+
+    with _broker() as broker:
+        db = database.Database(path='benchmarks/write')
+        start = time.perf_counter_ns()
+
+        for _ in range(count):
+            db.write(payload=payload, table='biologic')
+
+        written_ns = time.perf_counter_ns() - start
+        delivered = broker.wait_for(count=count)
+        delivered_ns = time.perf_counter_ns() - start
+
+        db.close()
+
+    return {
+        'count': count,
+        'write_ms': written_ns / count / 1e6,
+        'writes_per_s': count / written_ns * 1e9,
+        'delivered_per_s': count / delivered_ns * 1e9 if delivered else 0.0,
+        }
+
+
+def bench_end_to_end(driver_factory: DriverFactory) -> dict:
+    """Latency from sample to publish, over a whole experiment.run().
+
+    The sample time is the 'timestamp' of each row in the 'biologic'
+    table, i.e. when the instrument recorded it in host UTC, see
+    clock.ClockAnchor. The publish time is when the broker received it.
+    """
+
+    driver = driver_factory()
+
+    with _broker() as broker, _driver(driver=driver):
+        potentiostat = Potentiostat(type_='KBIO_DEV_HCP1005', driver=driver)
+        start = time.perf_counter_ns()
+
+        # See bench_parse_payload()
+        with open(os.devnull, 'w') as devnull:
+            with contextlib.redirect_stdout(devnull):
+                experiment.run(
+                    potentiostat=potentiostat,
+                    raw_params=ocv_params,
+                    pill=Event(),
+                    experiment_=experiment.Experiment()
+                    )
+
+        duration_ns = time.perf_counter_ns() - start
+        potentiostat.disconnect()
+        messages = list(broker.messages)
+
+    stats = FunctionStats(max_samples=len(messages) or 1)
+
+    for message in messages:
+        if message.topic.endswith('/biologic'):
+            payload = json.loads(message.payload)
+            stats.record(
+                duration_ns=message.received_ns - payload['timestamp'],
+                return_code=0
+                )
+
+    result = stats.to_dict() if stats.count else {'count': 0}
+    result.pop('return_codes', None)
+    result['messages'] = len(messages)
+    result['run_ms'] = duration_ns / 1e6
+
+    return result
+
+
+def bench_memory(
+    driver_factory: DriverFactory, channels: int = 8, polls: int = 20
+    ) -> dict:
+    """Memory allocated per running channel, by polling and decoding.
+
+    Always simulated, as a capture holds a single channel's worth.
+    """
+
+    now = [0.0]
+    driver = SimulatedDriver(
+        sampling_rate=5000.0, clock=lambda: now[0], no_channels=channels
+        )
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+
+    with _driver(driver=driver):
+        potentiostats = [
+            _start(driver=driver, channel=channel)
+            for channel in range(channels)
+            ]
+
+    for _ in range(polls):
+        now[0] += 0.1
+
+        for potentiostat in potentiostats:
+            potentiostat.get_block()
+
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    for potentiostat in potentiostats:
+        potentiostat.stop_channel()
+
+    return {
+        'channels': channels,
+        'current_per_channel_bytes': (current - before) / channels,
+        'peak_per_channel_bytes': (peak - before) / channels,
+        }
+
+
+def _record(
+    driver, technique: str, params: dict, step: typing.Callable[[], None]
+    ) -> list[tuple[np.ndarray, float, float]]:
+    """Polls a technique through to the end.
+
+    Args:
+        step (typing.Callable): Moves the driver's clock on, if need be.
+
+    Returns:
+        list[tuple[np.ndarray, float, float]]: Each non-empty block, with
+            the TimeBase and StartTime it was decoded with.
+    """
+
+    with _driver(driver=driver):
+        potentiostat = _start(
+            driver=driver, technique=technique, params=params
+            )
+
+    blocks = list()
+
+    while True:
+        step()
+        data_infos, current_values, block = potentiostat.get_block()
+
+        if len(block) > 0:
+            blocks.append(
+                (block, current_values['TimeBase'], data_infos['StartTime'])
+                )
+
+        if not is_full(data_infos=data_infos) and not current_values['State']:
+            return blocks
+
+
+def _compress(blocks: list[tuple[np.ndarray, float, float]]) -> dict:
+    """codec.encode_block() and decode_block() of each block, timed."""
+
+    raw = sum(block.nbytes for block, _, _ in blocks)
+    text = sum(
+        len(json.dumps(to_payload(rows=block))) for block, _, _ in blocks
+        )
+
+    start = time.perf_counter_ns()
+    encoded = [
+        codec.encode_block(
+            block=block, time_base=time_base, start_time=start_time
+            )
+        for block, time_base, start_time in blocks
+        ]
+    encoded_ns = time.perf_counter_ns() - start
+
+    start = time.perf_counter_ns()
+
+    for data in encoded:
+        codec.decode_block(data=data)
+
+    decoded_ns = time.perf_counter_ns() - start
+    size = sum(len(data) for data in encoded)
+
+    return {
+        'rows': sum(len(block) for block, _, _ in blocks),
+        'raw_ratio': raw / size,
+        'json_ratio': text / size,
+        'encode_mb_per_s': raw / encoded_ns * 1e3,
+        'decode_mb_per_s': raw / decoded_ns * 1e3,
+        }
+
+
+def bench_codec(driver_factory: DriverFactory) -> dict:
+    """Compression of OCV and CP traces by codec, versus raw and JSON.
+
+    The traces are simulated at 1 kHz with 100 uV of noise, as noiseless
+    data compresses unrealistically well. A replayed driver_factory adds
+    the capture, as recorded, as the 'capture' trace.
+    """
+
+    now = [0.0]
+
+    def step():
+        now[0] += 0.5
+
+    result = dict()
+
+    for name, (technique, params) in traces.items():
+        driver = SimulatedDriver(clock=lambda: now[0], noise=1e-4)
+        blocks = _record(
+            driver=driver, technique=technique, params=params, step=step
+            )
+
+        for metric, value in _compress(blocks=blocks).items():
+            result[f'{name}_{metric}'] = value
+
+    driver = driver_factory()
+
+    if isinstance(driver, ReplayDriver):
+        blocks = _record(
+            driver=driver, technique='ocv', params={}, step=lambda: None
+            )
+
+        for metric, value in _compress(blocks=blocks).items():
+            result[f'capture_{metric}'] = value
+
+    return result
+
+
+BENCHMARKS = {
+    'compile': bench_compile,
+    'decode': bench_decode,
+    'parse_payload': bench_parse_payload,
+    'database_write': bench_database_write,
+    'end_to_end': bench_end_to_end,
+    'memory': bench_memory,
+    'codec': bench_codec,
+    }
+
+
+def run(
+    names: list[str] = None, driver_factory: DriverFactory = None
+    ) -> dict[str, dict]:
+    """Runs benchmarks, in the order of BENCHMARKS.
+
+    Args:
+        names (list[str], optional): Defaults to all of BENCHMARKS.
+        driver_factory (DriverFactory, optional): Defaults to
+            simulated().
+
+    Returns:
+        dict[str, dict]: Name to results.
+    """
+
+    names = list(BENCHMARKS) if names is None else names
+    driver_factory = simulated() if driver_factory is None else driver_factory
+
+    return {
+        name: BENCHMARKS[name](driver_factory=driver_factory)
+        for name in BENCHMARKS
+        if name in names
+        }
@@ -0,0 +1,254 @@
+"""Computes per-cycle electrochemistry while the data streams in.
+
+Capacity, coulombic efficiency, mean voltage and energy used to be worked
+out offline from the raw rows in Drops. Instead, the acquisition loop
+feeds each decoded block to a CycleAggregator, which integrates I dt and
+Ewe I dt (trapezoidal rule) per step and per cycle, and returns a compact
+summary once a loop completes. Only running totals and the last point
+are kept, so memory doesn't grow with the length of the run.
+
+Intervals between two points in different steps are left out, as a
+trapezoid across e.g. a current reversal is meaningless.
+
+Example:
+    aggregator = CycleAggregator()
+    for summary in aggregator.update(block):
+        db.write(payload=summary.to_dict(), table='cycles')
+"""
+
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+
+from biologic.decoding import empty_block
+
+# Rows sharing these belong to the same step
+STEP_KEYS = ('loop', 'technique_index', 'process_index')
+
+
+@dataclass
+class Totals:
+    """Running integrals over a step or cycle.
+
+    Attributes:
+        self.duration (float): Integrated time (s).
+        self.charge_in (float): Integral of positive current (C).
+        self.charge_out (float): Integral of negative current, as a
+            positive number (C).
+        self.energy_in (float): Integral of power while the current is
+            positive (J).
+        self.energy_out (float): Same while negative, positive (J).
+        self.voltage_time (float): Integral of Ewe (V s), for the mean.
+    """
+    duration: float = 0.0
+    charge_in: float = 0.0
+    charge_out: float = 0.0
+    energy_in: float = 0.0
+    energy_out: float = 0.0
+    voltage_time: float = 0.0
+
+    def add(self, other: 'Totals') -> None:
+        for name in self.__dataclass_fields__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    @property
+    def mean_voltage(self) -> float:
+        if self.duration == 0:
+            return float('nan')
+
+        return self.voltage_time / self.duration
+
+
+@dataclass
+class CycleSummary:
+    """What a loop amounted to.
+
+    Attributes:
+        self.channel (int): Channel it ran on.
+        self.loop (int): Loop number.
+        self.start_time (float): Instrument time of the first point (s).
+        self.end_time (float): Instrument time of the last point (s).
+        self.totals (Totals): Integrated over the whole loop.
+        self.steps (list[dict]): Per technique/process index, in order.
+    """
+    channel: int
+    loop: int
+    start_time: float
+    end_time: float
+    totals: Totals = field(default_factory=Totals)
+    steps: list[dict] = field(default_factory=list)
+
+    @property
+    def coulombic_efficiency(self) -> float:
+        """charge_out / charge_in, NaN if nothing went in."""
+
+        if self.totals.charge_in == 0:
+            return float('nan')
+
+        return self.totals.charge_out / self.totals.charge_in
+
+    def to_dict(self) -> dict:
+        """A single flat row, ready to be written out."""
+
+        return {
+            'channel': self.channel,
+            'loop': self.loop,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            **asdict(self.totals),
+            'mean_voltage': self.totals.mean_voltage,
+            'coulombic_efficiency': self.coulombic_efficiency,
+            'steps': self.steps,
+            }
+
+
+def _integrate(block: np.ndarray) -> dict[str, np.ndarray]:
+    """Integrates each interval between consecutive points.
+
+    Helper function for CycleAggregator.
+
+    Returns:
+        dict[str, np.ndarray]: Totals field: value per interval, i.e. one
+            fewer than the rows in block.
+    """
+
+    dt = np.diff(block['time'])
+    current = np.nan_to_num(block['I'].astype(np.float64))
+    voltage = np.nan_to_num(block['Ewe'].astype(np.float64))
+    power = voltage * current
+
+    charge = (current[1:] + current[:-1]) / 2 * dt
+    energy = (power[1:] + power[:-1]) / 2 * dt
+    positive = charge > 0
+
+    return {
+        'duration': dt,
+        'charge_in': np.where(positive, charge, 0),
+        'charge_out': np.where(positive, 0, -charge),
+        'energy_in': np.where(positive, energy, 0),
+        'energy_out': np.where(positive, 0, -energy),
+        'voltage_time': (voltage[1:] + voltage[:-1]) / 2 * dt,
+        }
+
+
+class CycleAggregator:
+    """Integrates the blocks of a single channel into cycle summaries.
+
+    Attributes:
+        self.channel (int): Channel the blocks come from.
+        self.cycle (CycleSummary): The loop in progress, None before the
+            first point. Its totals are up to date after every update(),
+            e.g. for stop conditions.
+    """
+
+    def __init__(self, channel: int = 0):
+        self.channel = channel
+        self.cycle: CycleSummary = None
+
+        self._last = empty_block()
+        self._step: dict = None
+
+    def update(self, block: np.ndarray) -> list[CycleSummary]:
+        """Adds a block to the running totals.
+
+        Args:
+            block (np.ndarray): Decoded block, see decoding.BLOCK_DTYPE.
+
+        Returns:
+            list[CycleSummary]: One per loop completed by this block,
+                usually none.
+        """
+
+        if len(block) == 0:
+            return list()
+
+        if self.cycle is None:
+            self.cycle = self._new_cycle(row=block[0])
+            self._step = self._new_step(row=block[0])
+
+        block = np.concatenate((self._last, block))
+        self._last = block[-1:].copy()
+
+        intervals = _integrate(block=block)
+
+        # Intervals are split wherever the step changes. The one spanning
+        # each change is dropped, the rest summed per segment.
+        changed = np.zeros(len(block) - 1, dtype=bool)
+
+        for key in STEP_KEYS:
+            changed |= block[key][1:] != block[key][:-1]
+
+        starts = np.flatnonzero(changed) + 1
+        bounds = np.concatenate(([0], starts, [len(block)]))
+
+        completed = list()
+
+        # Rows [start, end) are one step, intervals [start, end - 1) in it
+        for index, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            if index > 0:
+                completed += self._next_step(row=block[start])
+
+            segment = Totals(
+                **{
+                    name: float(values[start:end - 1].sum())
+                    for name, values in intervals.items()
+                    }
+                )
+            self._step['totals'].add(segment)
+            self.cycle.totals.add(segment)
+            self.cycle.end_time = float(block['time'][end - 1])
+
+        return completed
+
+    def flush(self) -> list[CycleSummary]:
+        """Closes the loop in progress, e.g. when the run ends.
+
+        Returns:
+            list[CycleSummary]: The last loop, empty if nothing came in.
+        """
+
+        if self.cycle is None:
+            return list()
+
+        self._close_step()
+        cycle, self.cycle = self.cycle, None
+        self._last = empty_block()
+
+        return [cycle]
+
+    def _next_step(self, row) -> list[CycleSummary]:
+        self._close_step()
+        completed = list()
+
+        if row['loop'] != self.cycle.loop:
+            completed.append(self.cycle)
+            self.cycle = self._new_cycle(row=row)
+
+        self._step = self._new_step(row=row)
+
+        return completed
+
+    def _close_step(self) -> None:
+        totals: Totals = self._step['totals']
+        self.cycle.steps.append({
+            'technique_index': self._step['technique_index'],
+            'process_index': self._step['process_index'],
+            'duration': totals.duration,
+            'charge': totals.charge_in - totals.charge_out,
+            'energy': totals.energy_in - totals.energy_out,
+            })
+
+    def _new_cycle(self, row) -> CycleSummary:
+        return CycleSummary(
+            channel=self.channel,
+            loop=int(row['loop']),
+            start_time=float(row['time']),
+            end_time=float(row['time'])
+            )
+
+    def _new_step(self, row) -> dict:
+        return {
+            'technique_index': int(row['technique_index']),
+            'process_index': int(row['process_index']),
+            'totals': Totals(),
+            }
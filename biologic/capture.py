@@ -0,0 +1,214 @@
+"""Records raw instrument streams for replay, see simulator.ReplayDriver.
+
+With 'capture_path' set in config.json, every BL_GetData call is logged
+to that file as returned by the instrument: its DataInfos, its
+CurrentValues and the part of the buffer holding data, stamped with the
+host time. A production run's data can then be fed back through
+Potentiostat.get_data without the cell or the instrument, e.g. to
+measure decode and publish throughput on real multi-day traces, or to
+check a new pipeline against an old one.
+
+File layout, all little-endian:
+
+    MAGIC
+    record*
+
+    record:
+        RECORD_HEADER: host UTC (ns, int64), channel (int32)
+        DataInfos, as the structure's bytes
+        CurrentValues, as the structure's bytes
+        buffer: uint32[NbRaws * NbCols]
+
+Example:
+    for record in read_capture(path='captures/cell_3.bin'):
+        print(record.timestamp, record.data_infos.NbRaws)
+"""
+
+import ctypes
+from dataclasses import dataclass
+import struct
+from threading import Lock
+import time
+import typing
+
+import numpy as np
+
+from biologic.structures import CurrentValues, DataInfos
+
+MAGIC = b'BLCAPT01'
+RECORD_HEADER = struct.Struct('<qi')
+
+
+@dataclass
+class Record:
+    """A BL_GetData call as captured.
+
+    Attributes:
+        self.timestamp (int): Host UTC when it returned (ns).
+        self.channel (int): Channel it was made for.
+        self.data_infos (DataInfos): As returned.
+        self.current_values (CurrentValues): As returned.
+        self.buffer (np.ndarray): The uint32s holding data.
+    """
+    timestamp: int
+    channel: int
+    data_infos: DataInfos
+    current_values: CurrentValues
+    buffer: np.ndarray
+
+
+class CaptureWriter:
+    """Appends records to a capture file.
+
+    Attributes:
+        self.path (str): Capture file, created if need be.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        self._file = open(path, 'ab')
+        self._lock = Lock()
+
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+
+    def write(
+        self,
+        channel: int,
+        buffer,
+        data_infos: DataInfos,
+        current_values: CurrentValues,
+        timestamp: int = None
+        ) -> None:
+        """Appends a BL_GetData call.
+
+        Args:
+            channel (int): Channel it was made for.
+            buffer: Pointer to, or array of, the uint32 data buffer.
+            data_infos (DataInfos): As returned.
+            current_values (CurrentValues): As returned.
+            timestamp (int, optional): Host UTC (ns). Defaults to now.
+        """
+
+        if timestamp is None:
+            timestamp = time.time_ns()
+
+        size = max(data_infos.NbRaws * data_infos.NbCols, 0) * 4
+        data = ctypes.string_at(buffer, size) if size else b''
+
+        with self._lock:
+            self._file.write(RECORD_HEADER.pack(timestamp, channel))
+            self._file.write(bytes(data_infos))
+            self._file.write(bytes(current_values))
+            self._file.write(data)
+            # Whatever made it to disk replays, should the run die
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def read_capture(path: str) -> typing.Iterator[Record]:
+    """Reads a capture file, one record at a time.
+
+    A record cut short, e.g. by a crash mid-write, ends the capture.
+
+    Args:
+        path (str): Capture file.
+
+    Yields:
+        Record: In the order captured.
+
+    Raises:
+        ValueError: If the file isn't a capture.
+    """
+
+    sizes = RECORD_HEADER.size, ctypes.sizeof(DataInfos), ctypes.sizeof(
+        CurrentValues
+        )
+
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a capture')
+
+        while True:
+            fixed = f.read(sum(sizes))
+
+            if len(fixed) < sum(sizes):
+                return
+
+            timestamp, channel = RECORD_HEADER.unpack_from(fixed)
+            data_infos = DataInfos.from_buffer_copy(fixed, sizes[0])
+            current_values = CurrentValues.from_buffer_copy(
+                fixed, sizes[0] + sizes[1]
+                )
+
+            size = max(data_infos.NbRaws * data_infos.NbCols, 0) * 4
+            data = f.read(size)
+
+            if len(data) < size:
+                return
+
+            yield Record(
+                timestamp=timestamp,
+                channel=channel,
+                data_infos=data_infos,
+                current_values=current_values,
+                buffer=np.frombuffer(data, dtype=np.uint32)
+                )
+
+
+class CapturingDriver:
+    """Passes calls through to a driver, capturing BL_GetData's results.
+
+    Attributes:
+        self.driver: Driver wrapped, e.g. from prototypes.load_driver().
+        self.writer (CaptureWriter): Where to.
+    """
+
+    def __init__(self, driver, writer: CaptureWriter):
+        self.driver = driver
+        self.writer = writer
+
+    def __getattr__(self, name: str):
+        return getattr(self.driver, name)
+
+    def BL_GetData(
+        self, id_, channel, buffer, data_infos, current_values
+        ) -> int:
+        result = self.driver.BL_GetData(
+            id_, channel, buffer, data_infos, current_values
+            )
+
+        self.writer.write(
+            channel=getattr(channel, 'value', channel),
+            buffer=buffer,
+            data_infos=getattr(data_infos, '_obj', data_infos),
+            current_values=getattr(current_values, '_obj', current_values)
+            )
+
+        return result
+
+
+_writers: dict[str, CaptureWriter] = dict()
+_lock = Lock()
+
+
+def capturing(driver, path: str) -> CapturingDriver:
+    """Wraps a driver to capture into path, sharing one writer per file.
+
+    Args:
+        driver: E.g. from prototypes.load_driver().
+        path (str): Capture file.
+
+    Returns:
+        CapturingDriver: Use in place of driver.
+    """
+
+    with _lock:
+        if path not in _writers:
+            _writers[path] = CaptureWriter(path=path)
+
+        return CapturingDriver(driver=driver, writer=_writers[path])
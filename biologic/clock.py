@@ -0,0 +1,154 @@
+"""Aligns instrument time with the host clock.
+
+Data points are timed by the instrument, in seconds since the channel
+started. To line them up with other instruments (acoustics, temperature)
+on Drops, each point also gets a host UTC timestamp in int64 nanoseconds.
+
+Every poll is a chance to estimate the offset between the two clocks: the
+instrument reports its current ElapsedTime somewhere between sending the
+request and receiving the reply, so the midpoint is the best guess, give
+or take half the round-trip time. As with NTP, the estimate with the
+smallest round-trip time in a sliding window wins. Re-estimating on
+every poll tracks drift between the clocks over multi-day runs.
+
+ElapsedTime is a float32, so the anchor itself loses precision on long
+runs (about 8 ms after a day). Points are then still ordered and spaced
+exactly, as their timestamps come from the float64 block time.
+
+Only polls of a running channel tell anything: once it stops,
+ElapsedTime freezes while the host clock moves on, so such polls would
+make ever larger offsets, and stamping with those would send timestamps
+backwards. observe() therefore ignores polls whose ElapsedTime hasn't
+advanced, and callers only pass polls of a running channel, bar the
+first, which is better than no anchor at all.
+
+The offset is kept against the host's monotonic clock, which unlike UTC
+never jumps, and converted to UTC when stamping.
+
+Example:
+    anchor = ClockAnchor()
+    sent = time.monotonic_ns()
+    data_infos, current_values, block = potentiostat.get_block()
+    anchor.observe(current_values['ElapsedTime'], sent, time.monotonic_ns())
+    anchor.stamp(block)  # block['timestamp'] in UTC ns
+"""
+
+from collections import deque
+import time
+
+import numpy as np
+
+
+class ClockAnchor:
+    """Maps instrument time to host time for a single run.
+
+    Attributes:
+        self.window (int): Number of polls to pick the best estimate from.
+    """
+
+    def __init__(self, window: int = 32, tolerance_ns: int = 1_000_000):
+        """
+        Args:
+            window (int, optional): Defaults to 32.
+            tolerance_ns (int, optional): How far the offset must move
+                for observe() to report an update. Defaults to 1 ms.
+        """
+
+        self.window = window
+        self.tolerance_ns = tolerance_ns
+
+        # (rtt_ns, offset_ns, instrument_time) per poll
+        self._samples: deque = deque(maxlen=window)
+        self._offset_ns: int = None
+        self._rtt_ns: int = None
+        self._instrument_time: float = None
+        self._utc_offset_ns = time.time_ns() - time.monotonic_ns()
+
+    @property
+    def is_anchored(self) -> bool:
+        return self._offset_ns is not None
+
+    def observe(
+        self, instrument_time: float, sent_ns: int, received_ns: int
+        ) -> bool:
+        """Adds a poll round-trip to the estimate.
+
+        Args:
+            instrument_time (float): Instrument time reported by the poll,
+                i.e. CurrentValues.ElapsedTime (s).
+            sent_ns (int): time.monotonic_ns() before the poll.
+            received_ns (int): time.monotonic_ns() after the poll.
+
+        Returns:
+            bool: Whether the estimate moved by more than tolerance_ns,
+                i.e. whether the anchor is worth republishing. False if
+                instrument_time hasn't advanced since the last poll
+                observed, which is then ignored.
+        """
+
+        if self._samples and instrument_time <= self._samples[-1][2]:
+            return False
+
+        rtt_ns = received_ns - sent_ns
+        midpoint_ns = sent_ns + rtt_ns // 2
+        offset_ns = midpoint_ns - round(instrument_time * 1e9)
+
+        self._samples.append((rtt_ns, offset_ns, instrument_time))
+        self._utc_offset_ns = time.time_ns() - time.monotonic_ns()
+
+        rtt_ns, offset_ns, instrument_time = min(self._samples)
+        previous_ns, self._offset_ns = self._offset_ns, offset_ns
+        self._rtt_ns = rtt_ns
+        self._instrument_time = instrument_time
+
+        return previous_ns is None or abs(
+            offset_ns - previous_ns
+            ) > self.tolerance_ns
+
+    def to_utc_ns(self, instrument_time):
+        """Converts instrument time to host UTC.
+
+        Args:
+            instrument_time (float or np.ndarray): Seconds since channel
+                start.
+
+        Returns:
+            int or np.ndarray[np.int64]: UTC nanoseconds.
+        """
+
+        offset_ns = self._offset_ns + self._utc_offset_ns
+
+        if isinstance(instrument_time, np.ndarray):
+            return np.rint(instrument_time * 1e9).astype(np.int64) + offset_ns
+
+        return round(instrument_time * 1e9) + offset_ns
+
+    def stamp(self, block: np.ndarray) -> None:
+        """Fills in the timestamp column of a decoded block, in place.
+
+        Args:
+            block (np.ndarray): See decoding.BLOCK_DTYPE.
+        """
+
+        if self.is_anchored:
+            block['timestamp'] = self.to_utc_ns(block['time'])
+
+    def to_dict(self) -> dict:
+        """The current anchor, for publishing alongside the data.
+
+        Returns:
+            dict: Instrument time of the winning poll, the host UTC and
+                monotonic time it maps to [ns], and the poll's round-trip
+                time [ns], i.e. twice the worst-case error.
+        """
+
+        host_monotonic_ns = self._offset_ns + round(
+            self._instrument_time * 1e9
+            )
+
+        return {
+            'instrument_time': self._instrument_time,
+            'host_monotonic_ns': host_monotonic_ns,
+            'host_utc_ns': host_monotonic_ns + self._utc_offset_ns,
+            'rtt_ns': self._rtt_ns,
+            }
@@ -0,0 +1,424 @@
+"""Compresses decoded blocks column by column, Gorilla style.
+
+Ewe, I and time change slowly from one point to the next, yet are
+shipped as full floats, as JSON text even. Instead:
+
+    Floats: each value is XORed with the one before it. Similar values
+        share sign, exponent and the top of the mantissa, so the result
+        has many leading zeros, and instrument data, being quantized,
+        often trailing zeros too.
+    Integers, e.g. timestamps and loop numbers: delta-of-delta, then
+        zigzag, so that a steady rate or a constant becomes a run of
+        zeros.
+    time: as integer ticks of the time base, delta-of-delta, if that is
+        lossless (see encode_block()), else as floats.
+
+Values are then bit-packed in chunks of CHUNK: each chunk keeps only
+the bits between its values' common leading and trailing zeros, see
+pack(). A chunk of zeros, e.g. deltas-of-deltas at a steady sampling
+rate, takes no bits at all. Unlike Gorilla, which works value by value,
+everything is done on whole arrays with NumPy. Lossless.
+
+Column layout:
+
+    kind (uint8), n (varint), [origin, resolution (float64) if TICKS]
+    first value (uint64), if n
+    the other n - 1, see pack():
+        shifts: uint8[chunks]
+        widths: uint8[chunks]
+        bits: the kept bits of each value, MSB first, grouped by width
+
+Block layout: MAGIC, number of columns (varint), then per column its
+name, dtype (varint-length-prefixed strings) and encoding (varint
+length, column).
+
+Example:
+    data = encode_block(block=block, time_base=current_values['TimeBase'])
+    assert decode_block(data).tobytes() == block.tobytes()
+"""
+
+import struct
+
+import numpy as np
+
+MAGIC = b'BLZ1'
+CHUNK = 64  # Values per chunk
+
+# Column kinds
+XOR32 = 0
+XOR64 = 1
+DOD = 2
+TICKS = 3
+
+_FLOAT64 = struct.Struct('<d')
+_FIRST = struct.Struct('<Q')
+
+
+def _varint(value: int) -> bytes:
+    """LEB128 of a non-negative int."""
+
+    out = bytearray()
+
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+
+            return bytes(out)
+
+
+def _read_varint(data: bytes, offset: int) -> tuple[int, int]:
+    """Returns:
+        int: Value.
+        int: Offset just past it.
+    """
+
+    value, shift = 0, 0
+
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+
+        if not byte & 0x80:
+            return value, offset
+
+
+def _string(value: str) -> bytes:
+    encoded = value.encode()
+
+    return _varint(len(encoded)) + encoded
+
+
+def _read_string(data: bytes, offset: int) -> tuple[str, int]:
+    length, offset = _read_varint(data=data, offset=offset)
+
+    return data[offset:offset + length].decode(), offset + length
+
+
+def _bit_length(words: np.ndarray) -> np.ndarray:
+    """Bits needed for each uint64, 0 for 0."""
+
+    def bit_length32(halves: np.ndarray) -> np.ndarray:
+        # Exact, as floats hold 32-bit ints exactly
+        return np.frexp(halves.astype(np.float64))[1]
+
+    high = words >> np.uint64(32)
+    low = words & np.uint64(0xFFFFFFFF)
+
+    return np.where(high > 0, 32 + bit_length32(high), bit_length32(low))
+
+
+def _trailing_zeros(words: np.ndarray) -> np.ndarray:
+    """Trailing zeros of each uint64, 64 for 0."""
+
+    lowest = words & (~words + np.uint64(1))
+
+    return np.where(words > 0, _bit_length(lowest) - 1, 64)
+
+
+def pack(words: np.ndarray) -> bytes:
+    """Bit-packs unsigned words (uint32 or uint64) in chunks.
+
+    Each chunk keeps the bits between its words' common leading and
+    trailing zeros, i.e. width bits after shifting right by shift.
+    Chunks of the same width are packed together, in order, narrowest
+    first.
+
+    Returns:
+        bytes: Shifts (uint8[chunks]), widths (uint8[chunks]) and the
+            bits. The number of words and their size aren't included.
+    """
+
+    n = len(words)
+
+    if n == 0:
+        return b''
+
+    words = words.astype(np.uint64)
+    starts = np.arange(0, n, CHUNK)
+    shifts = np.minimum.reduceat(_trailing_zeros(words=words), starts)
+    widths = np.maximum.reduceat(_bit_length(words=words), starts)
+
+    zero = widths == 0
+    shifts = np.where(zero, 0, shifts).astype(np.uint8)
+    widths = np.where(zero, 0, widths - shifts).astype(np.uint8)
+
+    out = bytearray(shifts.tobytes() + widths.tobytes())
+    word_widths = np.repeat(widths, CHUNK)[:n]
+    shifted = words >> np.repeat(shifts, CHUNK)[:n].astype(np.uint64)
+
+    for width in np.unique(widths[widths > 0]).tolist():
+        # Big-endian, so that a word's low width bits are its last
+        values = shifted[word_widths == width].astype('>u8')
+        bits = np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1)
+        out += np.packbits(bits[:, 64 - width:]).tobytes()
+
+    return bytes(out)
+
+
+def unpack(data: bytes, n: int, dtype: np.dtype) -> np.ndarray:
+    """Inverse of pack().
+
+    Args:
+        data (bytes): As returned by pack().
+        n (int): Number of words.
+        dtype (np.dtype): np.uint32 or np.uint64.
+
+    Returns:
+        np.ndarray: Of dtype.
+    """
+
+    if n == 0:
+        return np.empty(0, dtype=dtype)
+
+    chunks = -(-n // CHUNK)
+    shifts = np.frombuffer(data, dtype=np.uint8, count=chunks)
+    widths = np.frombuffer(data, dtype=np.uint8, count=chunks, offset=chunks)
+    stream = np.frombuffer(data, dtype=np.uint8, offset=2 * chunks)
+
+    word_widths = np.repeat(widths, CHUNK)[:n]
+    words = np.zeros(n, dtype=np.uint64)
+    offset = 0
+
+    for width in np.unique(widths[widths > 0]).tolist():
+        selected = word_widths == width
+        count = np.count_nonzero(selected)
+        size = -(-count * width // 8)
+
+        bits = np.unpackbits(stream[offset:offset + size])
+        bits = bits[:count * width].reshape(count, width)
+        offset += size
+
+        # Right-aligned in 64 bits, to read as big-endian uint64s
+        padded = np.zeros((count, 64), dtype=np.uint8)
+        padded[:, 64 - width:] = bits
+        words[selected] = np.packbits(padded, axis=1).view('>u8').ravel()
+
+    words <<= np.repeat(shifts, CHUNK)[:n].astype(np.uint64)
+
+    return words.astype(dtype)
+
+
+def _xor(words: np.ndarray) -> np.ndarray:
+    """Each word but the first XORed with the one before it."""
+
+    return words[1:] ^ words[:-1]
+
+
+def _delta_of_delta(values: np.ndarray) -> np.ndarray:
+    """Zigzagged deltas-of-deltas of ints, as uint64, bar the first value.
+
+    The first is the first delta, so that a steady rate is all zeros.
+    """
+
+    deltas = np.diff(values.astype(np.int64))
+    dods = np.diff(deltas, prepend=np.int64(0))
+
+    return ((dods << 1) ^ (dods >> 63)).view(np.uint64)
+
+
+def _undo_delta_of_delta(first: int, words: np.ndarray) -> np.ndarray:
+    dods = (words >> np.uint64(1)) ^ (
+        np.uint64(0) - (words & np.uint64(1))
+        )
+    # Wraps around as the deltas did, so int64 extremes survive
+    steps = np.cumsum(np.cumsum(dods.view(np.int64)))
+
+    return np.concatenate(([np.int64(first)], np.int64(first) + steps))
+
+
+def _column(
+    kind: int, n: int, first: int, words: np.ndarray, header: bytes = b''
+    ) -> bytes:
+    """Kind, n, header, the first value as is, the rest bit-packed."""
+
+    if n == 0:
+        return bytes([kind]) + _varint(0) + header
+
+    return (
+        bytes([kind]) + _varint(n) + header + _FIRST.pack(first) +
+        pack(words=words)
+        )
+
+
+def _first_int(values: np.ndarray) -> int:
+    """The first value's int64 bits, as an unsigned int."""
+
+    return int(values[0]) & 0xFFFFFFFFFFFFFFFF if len(values) else 0
+
+
+def encode_floats(values: np.ndarray) -> bytes:
+    """XOR-float encodes a float32 or float64 column."""
+
+    words = values.view(np.uint32 if values.itemsize == 4 else np.uint64)
+    kind = XOR32 if values.itemsize == 4 else XOR64
+    first = int(words[0]) if len(words) else 0
+
+    return _column(kind=kind, n=len(words), first=first, words=_xor(words))
+
+
+def encode_ints(values: np.ndarray) -> bytes:
+    """Delta-of-delta encodes an integer column."""
+
+    return _column(
+        kind=DOD,
+        n=len(values),
+        first=_first_int(values=values),
+        words=_delta_of_delta(values=values)
+        )
+
+
+def encode_time(
+    values: np.ndarray, resolution: float, origin: float = 0.0
+    ) -> bytes:
+    """Encodes float64 times as ticks if exactly origin + ticks *
+    resolution, as decoding.decode() computes them, else as floats.
+    """
+
+    ticks = np.rint((values - origin) / resolution).astype(np.int64)
+
+    if not np.array_equal(origin + ticks * resolution, values):
+        return encode_floats(values=values)
+
+    return _column(
+        kind=TICKS,
+        n=len(ticks),
+        first=_first_int(values=ticks),
+        words=_delta_of_delta(values=ticks),
+        header=_FLOAT64.pack(origin) + _FLOAT64.pack(resolution)
+        )
+
+
+def encode_column(values: np.ndarray) -> bytes:
+    """Encodes a column by its dtype, see encode_floats() and
+    encode_ints().
+    """
+
+    values = np.ascontiguousarray(values)
+
+    if values.dtype.kind == 'f':
+        return encode_floats(values=values)
+
+    return encode_ints(values=values)
+
+
+def decode_column(data: bytes, dtype: np.dtype) -> np.ndarray:
+    """Inverse of the encode_*() functions.
+
+    Args:
+        data (bytes): An encoded column.
+        dtype (np.dtype): Of the column.
+
+    Raises:
+        ValueError: If the column's kind is unknown.
+    """
+
+    dtype = np.dtype(dtype)
+    kind = data[0]
+    n, offset = _read_varint(data=data, offset=1)
+
+    if kind not in (XOR32, XOR64, DOD, TICKS):
+        raise ValueError(f'Unknown column kind {kind}')
+
+    if kind == TICKS:
+        origin, = _FLOAT64.unpack_from(data, offset)
+        resolution, = _FLOAT64.unpack_from(data, offset + 8)
+        offset += 16
+
+    if n == 0:
+        return np.empty(0, dtype=dtype)
+
+    first, = _FIRST.unpack_from(data, offset)
+    words = unpack(
+        data=data[offset + _FIRST.size:],
+        n=n - 1,
+        dtype=np.uint32 if kind == XOR32 else np.uint64
+        )
+
+    if kind in (XOR32, XOR64):
+        words = np.concatenate(([words.dtype.type(first)], words))
+
+        return np.bitwise_xor.accumulate(words).view(dtype)
+
+    values = _undo_delta_of_delta(
+        first=np.uint64(first).view(np.int64), words=words
+        )
+
+    if kind == TICKS:
+        return (origin + values * resolution).astype(dtype)
+
+    return values.astype(dtype)
+
+
+def encode_block(
+    block: np.ndarray, time_base: float = None, start_time: float = 0.0
+    ) -> bytes:
+    """Encodes a structured array, e.g. of decoding.BLOCK_DTYPE.
+
+    Args:
+        block (np.ndarray): Structured array.
+        time_base (float, optional): CurrentValues.TimeBase the block was
+            decoded with. Its 'time' column is then encoded as ticks, if
+            lossless. Defaults to None, i.e. as floats.
+        start_time (float, optional): DataInfos.StartTime, likewise.
+            Defaults to 0.
+
+    Returns:
+        bytes: See the module docstring.
+    """
+
+    out = bytearray(MAGIC)
+    out += _varint(len(block.dtype.names))
+
+    for name in block.dtype.names:
+        values = np.ascontiguousarray(block[name])
+
+        if name == 'time' and time_base is not None:
+            encoded = encode_time(
+                values=values, resolution=time_base, origin=start_time
+                )
+        else:
+            encoded = encode_column(values=values)
+
+        out += _string(name) + _string(values.dtype.str)
+        out += _varint(len(encoded)) + encoded
+
+    return bytes(out)
+
+
+def decode_block(data: bytes) -> np.ndarray:
+    """Inverse of encode_block().
+
+    Raises:
+        ValueError: If data isn't an encoded block.
+    """
+
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('Not an encoded block')
+
+    no_columns, offset = _read_varint(data=data, offset=len(MAGIC))
+    columns = dict()
+
+    for _ in range(no_columns):
+        name, offset = _read_string(data=data, offset=offset)
+        dtype, offset = _read_string(data=data, offset=offset)
+        length, offset = _read_varint(data=data, offset=offset)
+        columns[name] = decode_column(
+            data=data[offset:offset + length], dtype=np.dtype(dtype)
+            )
+        offset += length
+
+    no_rows = len(next(iter(columns.values()))) if columns else 0
+    dtype = [(name, values.dtype) for name, values in columns.items()]
+    block = np.empty(no_rows, dtype=np.dtype(dtype))
+
+    for name, values in columns.items():
+        block[name] = values
+
+    return block
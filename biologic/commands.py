@@ -0,0 +1,204 @@
+"""Serializes driver calls per connection handle, stops first.
+
+The acquisition thread polls a handle while /stop, safety limits and
+other channels' workers may want it too. EC-Lab doesn't promise that is
+safe, so every call on a handle goes through that handle's
+CommandSerializer: one call at a time, the highest priority first.
+
+A call in progress can't be interrupted, but a stop goes right after it,
+and polls queued behind the stop are dropped rather than run. The
+acquisition loop is woken up as soon as the stop returns, so it drains
+the remaining points straight away instead of waiting out its interval.
+
+Example:
+    commands = for_handle(handle=potentiostat._id.value)
+    polled = commands.poll(potentiostat.driver.BL_GetData, ...)
+    latency = commands.stop(
+        potentiostat.driver.BL_StopChannel, ..., channels=[channel]
+        )
+"""
+
+from collections import defaultdict, deque
+import heapq
+import itertools
+from threading import Condition, Event, Lock
+import time
+import typing
+
+import numpy as np
+
+# Priorities, lower goes first
+STOP = 0
+CONTROL = 1
+POLL = 2
+
+
+class Dropped(Exception):
+    """A poll gave way to a stop."""
+
+
+class CommandSerializer:
+    """Runs calls on a single handle one at a time, by priority.
+
+    Attributes:
+        self.stop_latencies (deque): Seconds from requesting each stop to
+            the instrument accepting it, most recent last.
+    """
+
+    def __init__(self, max_samples: int = 1000):
+        self.stop_latencies: deque = deque(maxlen=max_samples)
+
+        self._stopped: dict[int, Event] = defaultdict(Event)
+
+        self._condition = Condition()
+        self._busy = False
+        self._waiting: list[tuple[int, int]] = list()
+        self._tickets = itertools.count()
+        self._stops_requested = 0
+
+    def call(
+        self, function: typing.Callable, *args, priority: int = CONTROL
+        ):
+        """Runs function(*args) once every call ahead of it is done.
+
+        Args:
+            function (typing.Callable): E.g. a BL_* driver function.
+            priority (int, optional): STOP, CONTROL or POLL.
+                Defaults to CONTROL.
+
+        Raises:
+            Dropped: If a POLL was overtaken by a stop.
+
+        Returns:
+            Whatever function returns.
+        """
+
+        ticket = (priority, next(self._tickets))
+
+        with self._condition:
+            stops_requested = self._stops_requested
+            heapq.heappush(self._waiting, ticket)
+            self._condition.wait_for(
+                lambda: not self._busy and self._waiting[0] == ticket
+                )
+            heapq.heappop(self._waiting)
+
+            if priority == POLL and self._stops_requested != stops_requested:
+                self._condition.notify_all()
+
+                raise Dropped()
+
+            self._busy = True
+
+        try:
+            return function(*args)
+        finally:
+            with self._condition:
+                self._busy = False
+                self._condition.notify_all()
+
+    def poll(self, function: typing.Callable, *args):
+        """Runs a poll, unless a stop is requested before its turn.
+
+        Polls requested after a stop run once it's through, e.g. to drain
+        the channel.
+
+        Raises:
+            Dropped: If a stop was requested first.
+        """
+
+        return self.call(function, *args, priority=POLL)
+
+    def stopped(self, channel: int) -> Event:
+        """Set once a stop on channel has gone through, cleared by start().
+
+        For the acquisition loop to wait on, so that it wakes up to drain
+        the channel as soon as it's stopped.
+        """
+
+        with self._condition:
+            return self._stopped[channel]
+
+    def stop(
+        self, function: typing.Callable, *args, channels: typing.Iterable[int]
+        ) -> float:
+        """Runs a stop ahead of everything else waiting.
+
+        Args:
+            channels (typing.Iterable[int]): Channels function stops.
+
+        Returns:
+            float: Latency, from this call to function returning (s).
+        """
+
+        start = time.monotonic()
+
+        with self._condition:
+            self._stops_requested += 1
+
+        self.call(function, *args, priority=STOP)
+
+        latency = time.monotonic() - start
+        self.stop_latencies.append(latency)
+
+        for channel in channels:
+            self.stopped(channel=channel).set()
+
+        return latency
+
+    def start(self, function: typing.Callable, *args, channel: int) -> None:
+        """Runs a start and rearms stopped(channel)."""
+
+        self.call(function, *args)
+        self.stopped(channel=channel).clear()
+
+    def latency_stats(self) -> dict:
+        """Stop latencies [ms]."""
+
+        return _latency_stats(latencies=list(self.stop_latencies))
+
+
+_serializers: dict[int, CommandSerializer] = dict()
+_lock = Lock()
+
+
+def for_handle(handle: int) -> CommandSerializer:
+    """The serializer of a connection handle, created on first use.
+
+    Args:
+        handle (int): Device ID as returned by BL_Connect.
+    """
+
+    with _lock:
+        if handle not in _serializers:
+            _serializers[handle] = CommandSerializer()
+
+        return _serializers[handle]
+
+
+def latency_stats() -> dict:
+    """Stop latencies [ms] across all handles."""
+
+    with _lock:
+        serializers = list(_serializers.values())
+
+    return _latency_stats(
+        latencies=[
+            latency for serializer in serializers
+            for latency in serializer.stop_latencies
+            ]
+        )
+
+
+def _latency_stats(latencies: list[float]) -> dict:
+    if len(latencies) == 0:
+        return {'count': 0}
+
+    latencies = np.array(latencies) * 1e3
+
+    return {
+        'count': len(latencies),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'max_ms': float(latencies.max()),
+        }
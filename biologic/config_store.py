@@ -0,0 +1,117 @@
+"""config.json, read once per process and written atomically.
+
+Every module used to open and parse config.json at import, while
+InstrumentFinder.save() rewrote it in place, so a process starting up
+mid-write could read half a file. Now a single ConfigStore per process
+reads it once and serves copies from memory. Updates are written to a
+temporary file next to it and renamed over it, which readers see either
+wholly or not at all, and go to the in-memory copy at the same time.
+
+Example:
+    settings = get_store().snapshot()
+    get_store().update(usb_port='USB1')
+"""
+
+import copy
+import json
+import os
+from threading import Lock
+
+CONFIG_PATH = 'biologic\\config.json'
+
+
+class ConfigStore:
+    """A JSON config file with an in-memory copy.
+
+    Attributes:
+        self.path (str): The file.
+    """
+
+    def __init__(self, path: str = CONFIG_PATH):
+        """
+        Args:
+            path (str, optional): Defaults to CONFIG_PATH.
+
+        Raises:
+            FileNotFoundError: If there's no such file.
+        """
+
+        self.path = path
+
+        self._lock = Lock()
+        self._settings = self._read()
+
+    def _read(self) -> dict:
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def _write(self, settings: dict) -> None:
+        """Replaces the file in one go.
+
+        Helper function for update().
+        """
+
+        # The file itself, not a link to it, e.g. the Windows path the
+        # Docker entrypoint links to biologic/config.json. Renaming over
+        # the link would replace it rather than the file it points to.
+        path = os.path.realpath(self.path)
+        # Next to the file, as a rename across file systems isn't atomic
+        temporary = f'{path}.{os.getpid()}.tmp'
+
+        try:
+            with open(temporary, 'w') as f:
+                json.dump(settings, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(temporary, path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def snapshot(self) -> dict:
+        """A copy of the settings, without touching the file."""
+
+        with self._lock:
+            return copy.deepcopy(self._settings)
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            return copy.deepcopy(self._settings.get(key, default))
+
+    def update(self, **changes) -> None:
+        """Changes settings, in memory and on file.
+
+        Raises:
+            TypeError: If a value can't be written as JSON. Nothing is
+                changed then.
+        """
+
+        with self._lock:
+            settings = {**self._settings, **changes}
+            self._write(settings=settings)
+            self._settings = settings
+
+    def reload(self) -> None:
+        """Picks up changes made to the file by other processes."""
+
+        settings = self._read()
+
+        with self._lock:
+            self._settings = settings
+
+
+_store: ConfigStore = None
+_lock = Lock()
+
+
+def get_store() -> ConfigStore:
+    """This process' store of config.json, read on first use."""
+
+    global _store
+
+    with _lock:
+        if _store is None:
+            _store = ConfigStore()
+
+        return _store
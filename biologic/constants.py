@@ -103,3 +103,59 @@ class Technique(Enum):
     KBIO_TECHID_CA = 101
     KBIO_TECHID_CP = 102
     KBIO_TECHID_CV = 103
+    KBIO_TECHID_LOOP = 150
+    KBIO_TECHID_CPLIMIT = 155
+
+
+class ErrorCode(Enum):
+    """EC-Lab library error codes, see section 5.4 of the documentation."""
+    ERR_NOERROR = 0
+    # General errors
+    ERR_GEN_NOTCONNECTED = -1
+    ERR_GEN_CONNECTIONINPROGRESS = -2
+    ERR_GEN_CHANNELNOTPLUGGED = -3
+    ERR_GEN_INVALIDPARAMETERS = -4
+    ERR_GEN_FILENOTEXISTS = -5
+    ERR_GEN_FUNCTIONFAILED = -6
+    ERR_GEN_NOCHANNELSELECTED = -7
+    ERR_GEN_INVALIDCONF = -8
+    ERR_GEN_ECLAB_LOADED = -9
+    ERR_GEN_LIBNOTCORRECTLYLOADED = -10
+    ERR_GEN_USBLIBRARYERROR = -11
+    ERR_GEN_FUNCTIONINPROGRESS = -12
+    ERR_GEN_CHANNEL_RUNNING = -13
+    ERR_GEN_DEVICE_NOTALLOWED = -14
+    ERR_GEN_UPDATEPARAMETERS = -15
+    # Instrument errors
+    ERR_INSTR_VMEERROR = -101
+    ERR_INSTR_TOOMANYDATA = -102
+    ERR_INSTR_RESPNOTPOSSIBLE = -103
+    ERR_INSTR_RESPERROR = -104
+    ERR_INSTR_MSGSIZEERROR = -105
+    # Communication errors
+    ERR_COMM_COMMFAILED = -200
+    ERR_COMM_CONNECTIONFAILED = -201
+    ERR_COMM_WAITINGACK = -202
+    ERR_COMM_INVALIDIPADDRESS = -203
+    ERR_COMM_ALLOCMEMFAILED = -204
+    ERR_COMM_LOADFIRMWAREFAILED = -205
+    ERR_COMM_INCOMPATIBLESERVER = -206
+    ERR_COMM_MAXCONNREACHED = -207
+    # Firmware errors
+    ERR_FIRM_FIRMFILENOTEXISTS = -300
+    ERR_FIRM_FIRMFILEACCESSFAILED = -301
+    ERR_FIRM_FIRMINVALIDFILE = -302
+    ERR_FIRM_FIRMLOADINGFAILED = -303
+    ERR_FIRM_XILFILENOTEXISTS = -304
+    ERR_FIRM_XILFILEACCESSFAILED = -305
+    ERR_FIRM_XILINVALIDFILE = -306
+    ERR_FIRM_XILLOADINGFAILED = -307
+    ERR_FIRM_FIRMWARENOTLOADED = -308
+    ERR_FIRM_FIRMWAREINCOMPATIBLE = -309
+    # Technique errors
+    ERR_TECH_ECCFILENOTEXISTS = -400
+    ERR_TECH_INCOMPATIBLEECC = -401
+    ERR_TECH_ECCFILECORRUPTED = -402
+    ERR_TECH_LOADTECHNIQUEFAILED = -403
+    ERR_TECH_DATACORRUPTED = -404
+    ERR_TECH_MEMFULL = -405
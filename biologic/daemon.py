@@ -0,0 +1,708 @@
+"""Runs the acquisition of each device in a process of its own.
+
+Polling the instrument used to share a process, and a GIL, with Flask,
+MQTT, Slack and whatever else the server was up to, so a slow consumer
+could delay the next poll. Instead, spawn() starts a daemon per device
+that runs the Scheduler, i.e. connecting, loading, polling and the
+writes that can't wait (safety events, transitions, instrument state,
+cycle summaries and clock fits), and nothing else. It writes every
+decoded block into a shared-memory ring per channel (see ring.py), which
+the API process, or any other, reads without copying and without ever
+holding the daemon up.
+
+Device metadata (/status, see status.py) is cached in the daemon too, on
+the scheduler's connection, and fetched with the 'metadata' command.
+
+The sinks, i.e. reducing, encoding and writing out the rows of each run
+(see reduction.py), run in the API process: the daemon announces where
+each run's rows start and end in the ring, and a SinkConsumer follows
+the ring from there. /data reads the ring too.
+
+Commands travel over a small control channel, a multiprocessing Pipe.
+Each is answered by a thread of its own, so e.g. a stop never waits
+behind a request waiting for a run to start. On the API side, the
+daemon's scheduler is stood in for by a RemoteScheduler with the methods
+app.py uses, so the routes don't care where acquisition runs.
+
+Driver statistics (/stop/latency, /profiling), transition latencies
+(/events/latency) and delivery of what the daemon writes to Drops
+(/publishing) are kept in the daemon too, and fetched with commands of
+their own. Transitions themselves (/events) are published in the
+daemon's process and aren't forwarded, so /events refuses in daemon
+mode.
+
+Example:
+    client = spawn(potentiostat_class=HCP1005, usb_port='USB0')
+    job, ahead = client.scheduler.submit(raw_params=ocv_params)
+    reader = client.reader(channel=0)
+    block, cursor, lost = reader.read(cursor=0)
+"""
+
+from collections import deque
+from dataclasses import dataclass
+import itertools
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection
+import os
+from threading import Condition, Event, Lock, Thread
+
+import numpy as np
+
+from biologic import commands, database, exceptions, ring
+from biologic.database import Database
+from biologic.decoding import BLOCK_DTYPE, packed_dtype
+from biologic.events import bus
+from biologic.profiling import profiler
+from biologic.reduction import make_sinks
+from biologic.status import DEFAULT_TTL
+
+# Commands a daemon answers, see _Server
+COMMANDS = (
+    'submit',
+    'wait_started',
+    'status',
+    'stop',
+    'resume',
+    'stop_all',
+    'cancel',
+    'queue',
+    'wait_idle',
+    'metadata',
+    'stop_latency',
+    'events_latency',
+    'publishing',
+    'profiling',
+    'profiling_trace',
+    )
+
+# What the 'profiling' command may do to the daemon's profiler
+PROFILING_ACTIONS = ('enable', 'disable', 'reset')
+
+
+def _serve(
+    connection: Connection,
+    potentiostat_class: type,
+    usb_port: str,
+    prefix: str,
+    state_dir: str,
+    capacity: int,
+    status_ttl: float
+    ) -> None:
+    """Entry point of the daemon process.
+
+    Helper function for spawn().
+    """
+
+    from biologic import experiment
+    from biologic.scheduler import JobQueue, Scheduler
+    from biologic.state import StateStore
+    from biologic.status import MetadataCache
+
+    # This process only ever talks to a single device
+    experiment.usb_port = usb_port
+    ring.enable(prefix=prefix, capacity=capacity)
+
+    # Before the scheduler, which may reattach to runs right away
+    server = _Server(connection=connection)
+    experiment.announce = server.announce
+
+    os.makedirs(state_dir, exist_ok=True)
+    server.scheduler = Scheduler(
+        potentiostat_class=potentiostat_class,
+        queue=JobQueue(path=os.path.join(state_dir, 'queue.json')),
+        store=StateStore(path=os.path.join(state_dir, 'state.db'))
+        )
+
+    server.status_cache = MetadataCache(
+        usb_port=usb_port,
+        connection=server.scheduler.connection,
+        ttl=status_ttl
+        )
+    server.status_cache.start()
+
+    try:
+        server.serve()
+    finally:
+        server.status_cache.stop()
+        ring.close()
+
+
+class _Server:
+    """Answers commands with a daemon's scheduler, and announces runs.
+
+    Attributes:
+        self.jobs (dict[str, scheduler.Job]): Submitted through this
+            server, until they've started.
+        self.status_cache (status.MetadataCache): Of the daemon's device.
+    """
+
+    def __init__(self, connection: Connection, scheduler=None):
+        self.connection = connection
+        self.scheduler = scheduler
+        self.jobs = dict()
+        self.status_cache = None
+
+        self._lock = Lock()
+
+    def serve(self) -> None:
+        """Until told to shut down, or the other end goes away."""
+
+        while True:
+            try:
+                request_id, command, kwargs = self.connection.recv()
+            except EOFError:
+                return
+
+            if command == 'shutdown':
+                self._reply(request_id=request_id, response=('ok', None))
+
+                return
+
+            Thread(
+                target=self._handle,
+                args=(request_id, command, kwargs),
+                daemon=True
+                ).start()
+
+    def _handle(self, request_id: int, command: str, kwargs: dict) -> None:
+        try:
+            if command not in COMMANDS:
+                raise ValueError(f'Unknown command {command}')
+
+            result = getattr(self, command)(**kwargs)
+            response = ('ok', result)
+        except exceptions.ECLibException as e:
+            response = ('error', type(e).__name__, e.error_code, e.message)
+        except Exception as e:
+            logging.error(e)
+            response = ('error', type(e).__name__, None, str(e))
+
+        self._reply(request_id=request_id, response=response)
+
+    def _reply(self, request_id: int, response: tuple) -> None:
+        with self._lock:
+            self.connection.send((request_id, response))
+
+    def announce(self, info: dict) -> None:
+        """Tells the other end a run started or finished, see
+        experiment._sinks() and SinkConsumer.
+        """
+
+        try:
+            self._reply(request_id=None, response=('run', info))
+        except (BrokenPipeError, OSError) as e:
+            # Nobody left to write the run out, but it carries on
+            logging.error(e)
+
+    def submit(self, raw_params: dict) -> dict:
+        job, ahead = self.scheduler.submit(raw_params=raw_params)
+        self.jobs[job.job_id] = job
+
+        return {
+            'job_id': job.job_id,
+            'channel': job.channel,
+            'ahead': ahead,
+            }
+
+    def wait_started(self, job_id: str) -> str:
+        """Returns:
+            str: Why the job failed, None if it didn't (yet).
+        """
+
+        job = self.jobs.pop(job_id)
+        self.scheduler.wait_started(job=job)
+
+        return job.error
+
+    def status(self, channel: int) -> dict:
+        worker = self.scheduler.worker(channel=channel, create=False)
+
+        if worker is None:
+            return None
+
+        return {
+            'status': worker.experiment.status,
+            'stop_reason': worker.experiment.stop_reason,
+            'paused': worker.paused,
+            }
+
+    def stop(self, channel: int, timeout: float) -> float:
+        return self.scheduler.worker(channel=channel).stop(timeout=timeout)
+
+    def resume(self, channel: int) -> None:
+        self.scheduler.worker(channel=channel).resume()
+
+    def stop_all(self, timeout: float) -> list[float]:
+        return self.scheduler.stop_all(timeout=timeout)
+
+    def cancel(self, job_id: str) -> bool:
+        return self.scheduler.cancel(job_id=job_id)
+
+    def queue(self) -> list[dict]:
+        return self.scheduler.to_dict()
+
+    def wait_idle(self, timeout: float) -> None:
+        self.scheduler.wait_idle(timeout=timeout)
+
+    def metadata(self) -> dict:
+        return self.status_cache.snapshot()
+
+    def stop_latency(self) -> dict:
+        return commands.latency_stats()
+
+    def events_latency(self) -> dict:
+        return bus.latency_stats()
+
+    def publishing(self) -> dict:
+        return {
+            'connections': database.get_pool().health(),
+            'topics': database.metrics.stats(),
+            }
+
+    def profiling(self, action: str = None) -> dict:
+        """Statistics of the daemon's driver calls, after an action
+        (see PROFILING_ACTIONS) if given.
+        """
+
+        if action is not None:
+            if action not in PROFILING_ACTIONS:
+                raise ValueError(f'Unknown profiling action {action}')
+
+            getattr(profiler, action)()
+
+        return {'enabled': profiler.enabled, 'functions': profiler.stats()}
+
+    def profiling_trace(self) -> str:
+        return profiler.trace()
+
+
+class SinkConsumer:
+    """Writes the rows of a daemon's runs out to their sinks.
+
+    Runs in the API process. For each run the daemon announces, a thread
+    per channel reads the run's rows off the channel's ring, from the
+    row it started at to the one it finished at, and passes them through
+    the run's sinks, see reduction.make_sinks(). Runs on a channel are
+    written out one after the other, in order. Rows overwritten before
+    they were read are lost, and logged, rather than ever holding the
+    daemon up.
+
+    Attributes:
+        self.prefix (str): The rings' names, see ring.ring_name().
+        self.interval (float): Seconds between reads of a ring while a
+            run is going.
+    """
+
+    def __init__(self, prefix: str, interval: float = 1):
+        self.prefix = prefix
+        self.interval = interval
+
+        self._runs: dict[int, deque[dict]] = dict()
+        self._changed = Condition()
+
+    def announce(self, info: dict) -> None:
+        """Takes note of a run starting or finishing.
+
+        Args:
+            info (dict): As announced by experiment._sinks(), 'event'
+                being 'started' or 'finished', and 'row' where the run's
+                rows start or end.
+        """
+
+        channel = info['channel']
+
+        with self._changed:
+            if info['event'] == 'started':
+                if channel not in self._runs:
+                    self._runs[channel] = deque()
+                    Thread(
+                        target=self._follow,
+                        args=(channel, ),
+                        name=f'sinks-{channel}',
+                        daemon=True
+                        ).start()
+
+                self._runs[channel].append({**info, 'end': None})
+            else:
+                for run in self._runs.get(channel, list()):
+                    if run['run_id'] == info['run_id'] and run['end'] is None:
+                        run['end'] = info['row']
+
+            self._changed.notify_all()
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """Until every run announced has been written out.
+
+        Returns:
+            bool: False if timed out.
+        """
+
+        with self._changed:
+            return self._changed.wait_for(
+                lambda: not any(self._runs.values()), timeout=timeout
+                )
+
+    def _follow(self, channel: int) -> None:
+        """Writes out the runs of a channel as they come, forever."""
+
+        reader = None
+
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._runs[channel])
+                run = self._runs[channel][0]
+
+            try:
+                if reader is None:
+                    name = ring.ring_name(prefix=self.prefix, channel=channel)
+                    reader = ring.RingReader(name=name)
+
+                self._consume(reader=reader, run=run)
+            except Exception as e:
+                logging.error(f'{run["exp_id"]}: {e}')
+
+            with self._changed:
+                self._runs[channel].popleft()
+                self._changed.notify_all()
+
+    def _consume(self, reader: ring.RingReader, run: dict) -> None:
+        """Writes out a single run, returning once it finished and all
+        its rows have been read.
+        """
+
+        from biologic.experiment import write_rows
+
+        db = Database(path=run['exp_id'], qos=run['qos'])
+        sinks = make_sinks(config=run['sinks'])
+        cursor = run['row']
+        lost = 0
+
+        try:
+            while True:
+                # Taken before reading, so that once set every row up to
+                # it is in the ring already
+                end = run['end']
+                block, cursor, missed = reader.read(cursor=cursor, end=end)
+                lost += missed
+
+                for sink in sinks:
+                    write_rows(
+                        db=db,
+                        rows=sink.policy.reduce(block),
+                        sink=sink,
+                        time_base=reader.time_base,
+                        start_time=reader.start_time
+                        )
+
+                if end is not None and cursor >= end:
+                    break
+
+                with self._changed:
+                    self._changed.wait_for(
+                        lambda: run['end'] is not None, timeout=self.interval
+                        )
+        finally:
+            for sink in sinks:
+                try:
+                    write_rows(
+                        db=db,
+                        rows=sink.policy.flush(),
+                        sink=sink,
+                        time_base=reader.time_base,
+                        start_time=reader.start_time
+                        )
+                except Exception as e:
+                    logging.error(e)
+
+            db.close()
+
+            if lost:
+                logging.error(
+                    f'{run["exp_id"]}: {lost} rows overwritten before they '
+                    'were written out, consider a larger ring'
+                    )
+
+
+class DaemonClient:
+    """The API process' end of a daemon.
+
+    Attributes:
+        self.process (multiprocessing.Process): The daemon.
+        self.prefix (str): Its rings' names, see ring.ring_name().
+        self.scheduler (RemoteScheduler): Stands in for its scheduler.
+        self.status_cache (RemoteMetadataCache): Stands in for its
+            metadata cache.
+        self.sinks (SinkConsumer): Writes out its runs.
+    """
+
+    def __init__(
+        self,
+        process: multiprocessing.Process,
+        connection: Connection,
+        prefix: str
+        ):
+        self.process = process
+        self.prefix = prefix
+        self.scheduler = RemoteScheduler(client=self)
+        self.status_cache = RemoteMetadataCache(client=self)
+        self.sinks = SinkConsumer(prefix=prefix)
+
+        self._connection = connection
+        self._requests = itertools.count()
+        self._pending: dict[int, tuple[Event, list]] = dict()
+        self._lock = Lock()
+
+        Thread(target=self._receive, daemon=True).start()
+
+    def _receive(self) -> None:
+        while True:
+            try:
+                request_id, response = self._connection.recv()
+            except (EOFError, OSError):
+                response = ('error', 'ConnectionError', None, 'Daemon gone')
+
+                with self._lock:
+                    pending = list(self._pending.values())
+                    self._pending.clear()
+
+                for done, slot in pending:
+                    slot.append(response)
+                    done.set()
+
+                return
+
+            # Not an answer, but an announcement
+            if request_id is None:
+                self.sinks.announce(info=response[1])
+
+                continue
+
+            with self._lock:
+                done, slot = self._pending.pop(request_id)
+
+            slot.append(response)
+            done.set()
+
+    def call(self, command: str, **kwargs):
+        """Runs a command in the daemon and waits for its answer.
+
+        Raises:
+            exceptions.ECLibException: Whatever the daemon raised, if it
+                was one, e.g. PlanValidationError.
+            RuntimeError: For anything else the daemon raised.
+        """
+
+        done, slot = Event(), list()
+
+        with self._lock:
+            request_id = next(self._requests)
+            self._pending[request_id] = (done, slot)
+            self._connection.send((request_id, command, kwargs))
+
+        done.wait()
+        response = slot[0]
+
+        if response[0] == 'ok':
+            return response[1]
+
+        _, class_name, error_code, message = response
+
+        if class_name == 'PlanValidationError':
+            raise exceptions.PlanValidationError(message=message)
+
+        if class_name == 'TechniqueFileError':
+            raise exceptions.TechniqueFileError(message=message)
+
+        if error_code is not None:
+            raise exceptions.from_code(error_code=error_code, message=message)
+
+        raise RuntimeError(f'{class_name}: {message}')
+
+    def reader(self, channel: int) -> ring.RingReader:
+        """The ring of a channel, None until the daemon wrote to it."""
+
+        try:
+            return ring.RingReader(
+                name=ring.ring_name(prefix=self.prefix, channel=channel)
+                )
+        except FileNotFoundError:
+            return None
+
+    def shutdown(self, timeout: float = 10) -> None:
+        """Stops serving commands and waits for the daemon to exit.
+
+        Runs in progress are left to a future daemon to reattach to.
+        """
+
+        try:
+            self.call('shutdown')
+        except RuntimeError:
+            pass
+
+        self.process.join(timeout=timeout)
+
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+@dataclass
+class RemoteJob:
+    """What app.py needs of a scheduler.Job run by a daemon."""
+    job_id: str
+    channel: int
+    error: str = None
+
+
+@dataclass
+class RemoteExperiment:
+    """Snapshot of a daemon's experiment.Experiment."""
+    status: str
+    stop_reason: str = None
+
+
+class RemoteWorker:
+    """Stands in for a daemon's scheduler.ChannelWorker."""
+
+    def __init__(self, client: DaemonClient, channel: int):
+        self.client = client
+        self.channel = channel
+
+    def _status(self) -> dict:
+        return self.client.call('status', channel=self.channel) or {
+            'status': 'stopped', 'stop_reason': None, 'paused': False
+            }
+
+    @property
+    def experiment(self) -> RemoteExperiment:
+        status = self._status()
+
+        return RemoteExperiment(
+            status=status['status'], stop_reason=status['stop_reason']
+            )
+
+    @property
+    def paused(self) -> bool:
+        return self._status()['paused']
+
+    def stop(self, timeout: float = 5) -> float:
+        return self.client.call('stop', channel=self.channel, timeout=timeout)
+
+    def resume(self) -> None:
+        self.client.call('resume', channel=self.channel)
+
+
+class RemoteScheduler:
+    """Stands in for a daemon's scheduler.Scheduler, see app.py."""
+
+    def __init__(self, client: DaemonClient):
+        self.client = client
+
+    def worker(self, channel: int, create: bool = True) -> RemoteWorker:
+        """None if create is False and the daemon has no such worker."""
+
+        if not create and self.client.call('status', channel=channel) is None:
+            return None
+
+        return RemoteWorker(client=self.client, channel=channel)
+
+    def submit(self, raw_params: dict) -> tuple[RemoteJob, int]:
+        submitted = self.client.call('submit', raw_params=raw_params)
+        job = RemoteJob(
+            job_id=submitted['job_id'], channel=submitted['channel']
+            )
+
+        return job, submitted['ahead']
+
+    def wait_started(self, job: RemoteJob) -> None:
+        job.error = self.client.call('wait_started', job_id=job.job_id)
+
+    def stop_all(self, timeout: float = 5) -> list[float]:
+        return self.client.call('stop_all', timeout=timeout)
+
+    def cancel(self, job_id: str) -> bool:
+        return self.client.call('cancel', job_id=job_id)
+
+    def wait_idle(self, timeout: float = None) -> None:
+        self.client.call('wait_idle', timeout=timeout)
+
+    def to_dict(self) -> list[dict]:
+        return self.client.call('queue')
+
+    def data(
+        self,
+        channel: int,
+        since: int = None,
+        until: int = None,
+        fields: list[str] = None
+        ) -> np.ndarray:
+        """As recent.query(), off the ring of a channel."""
+
+        fields = list(BLOCK_DTYPE.names) if fields is None else fields
+        reader = self.client.reader(channel=channel)
+
+        if reader is None:
+            return np.empty(0, dtype=packed_dtype(fields=fields))
+
+        try:
+            return reader.query(since=since, until=until, fields=fields)
+        finally:
+            reader.close()
+
+
+class RemoteMetadataCache:
+    """Stands in for a daemon's status.MetadataCache, see app.py."""
+
+    def __init__(self, client: DaemonClient):
+        self.client = client
+
+    def snapshot(self) -> dict:
+        return self.client.call('metadata')
+
+
+def spawn(
+    potentiostat_class: type,
+    usb_port: str,
+    state_dir: str = 'state',
+    capacity: int = ring.DEFAULT_CAPACITY,
+    status_ttl: float = DEFAULT_TTL
+    ) -> DaemonClient:
+    """Starts the acquisition daemon of a device.
+
+    Args:
+        potentiostat_class (type): E.g. potentiostats.HCP1005. Must be
+            importable by the daemon.
+        usb_port (str): Address of the device, e.g. 'USB0'.
+        state_dir (str, optional): Where the daemon keeps its queue and
+            run state. Defaults to 'state'.
+        capacity (int, optional): Rows per channel ring. Defaults to
+            ring.DEFAULT_CAPACITY.
+        status_ttl (float, optional): Seconds between refreshes of the
+            device metadata. Defaults to status.DEFAULT_TTL.
+
+    Returns:
+        DaemonClient: Connected.
+    """
+
+    context = multiprocessing.get_context('spawn')
+    parent, child = context.Pipe()
+    prefix = f'biologic-{usb_port}'
+
+    process = context.Process(
+        target=_serve,
+        args=(
+            child,
+            potentiostat_class,
+            usb_port,
+            prefix,
+            state_dir,
+            capacity,
+            status_ttl
+            ),
+        name=f'acquisition-{usb_port}',
+        daemon=True
+        )
+    process.start()
+    child.close()
+
+    return DaemonClient(process=process, connection=parent, prefix=prefix)
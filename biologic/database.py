@@ -1,42 +1,497 @@
-"""Employs the mqtt protocol to relay data stream to database."""
+"""Employs the mqtt protocol to relay data stream to database.
 
+Connections are long-lived and shared: a process-wide ConnectionPool per
+broker holds a few clients, each with its own network thread, and every
+Database is merely a topic-scoped handle on one of them. Starting a run
+thus costs no broker handshake, and hundreds of runs don't leave
+hundreds of threads and sockets behind. A dropped connection is
+reconnected by its network thread, with backoff; one that was closed is
+replaced the next time it's used.
+
+Each table is published at a QoS of its own, see TABLE_QOS. A handle
+allows only so many messages in flight, i.e. sent but not acknowledged
+(QoS 1 and 2) or not yet sent (QoS 0), and write() blocks while that
+many are, holding up the acquisition loop instead of letting a backlog
+grow in memory. Acknowledgement latency and undelivered messages are
+counted per topic, see metrics.
+"""
+
+import itertools
 import json
-from paho.mqtt.client import Client, MQTTMessageInfo
+import logging
+from threading import Condition, Event, Lock
+import time
+import typing
+
+from paho.mqtt.client import Client, MQTTMessageInfo, MQTT_ERR_SUCCESS
 
 from biologic.config import drops_prefix, host, port
+from biologic.profiling import FunctionStats
+
+KEEPALIVE = 60  # s, short enough to notice a dead broker within a run
+POOL_SIZE = 2  # Connections per broker
+RECONNECT_MAX_DELAY = 30  # s, backoff cap
+
+DEFAULT_QOS = 0
+# Rarely written and not to be lost, unlike the data tables
+TABLE_QOS = {'events': 1, 'cycles': 1, 'clock': 1}
+MAX_IN_FLIGHT = 1000  # Messages per handle
+WINDOW_TIMEOUT = 30  # s, after which write() carries on regardless
+
+
+def check_qos(qos: dict) -> dict[str, int]:
+    """Validates QoS per table, e.g. from raw_params['qos'].
+
+    Args:
+        qos (dict): Table name to 0, 1 or 2. None for the defaults.
+
+    Returns:
+        dict[str, int]: TABLE_QOS, updated with qos.
+
+    Raises:
+        ValueError: If anything isn't a table name and a QoS.
+    """
+
+    if qos is None:
+        return dict(TABLE_QOS)
+
+    if not isinstance(qos, dict):
+        raise ValueError('qos must map table names to 0, 1 or 2')
+
+    for table, level in qos.items():
+        if not isinstance(table, str) or level not in (0, 1, 2):
+            raise ValueError(f'qos of {table} must be 0, 1 or 2, not {level}')
+
+    return {**TABLE_QOS, **qos}
+
+
+class TopicStats:
+    """Delivery of the messages published to a topic.
+
+    Attributes:
+        self.qos (int): Of the last message published.
+        self.published (int): Messages handed to the client.
+        self.acknowledged (int): Acknowledged by the broker, or sent at
+            QoS 0.
+        self.dropped (int): Never to be delivered, e.g. QoS 0 messages
+            published while disconnected.
+        self.overflows (int): Writes that found the window still full
+            after WINDOW_TIMEOUT.
+        self.latencies (FunctionStats): From publish to acknowledgement.
+    """
+
+    def __init__(self, max_samples: int = 10000):
+        self.qos = DEFAULT_QOS
+        self.published = 0
+        self.acknowledged = 0
+        self.dropped = 0
+        self.overflows = 0
+        self.latencies = FunctionStats(max_samples=max_samples)
+
+    @property
+    def undelivered(self) -> int:
+        """Published, but neither acknowledged nor dropped (yet)."""
+
+        return self.published - self.acknowledged - self.dropped
+
+    def to_dict(self) -> dict:
+        return {
+            'qos': self.qos,
+            'published': self.published,
+            'acknowledged': self.acknowledged,
+            'undelivered': self.undelivered,
+            'dropped': self.dropped,
+            'overflows': self.overflows,
+            'ack_p50_ms': self.latencies.percentile(50),
+            'ack_p90_ms': self.latencies.percentile(90),
+            'ack_p99_ms': self.latencies.percentile(99),
+            }
+
+
+class PublishMetrics:
+    """Process-wide TopicStats, by topic."""
+
+    def __init__(self):
+        self._topics: dict[str, TopicStats] = dict()
+        self._lock = Lock()
+
+    def _topic(self, topic: str) -> TopicStats:
+        if topic not in self._topics:
+            self._topics[topic] = TopicStats()
+
+        return self._topics[topic]
+
+    def published(self, topic: str, qos: int) -> None:
+        with self._lock:
+            stats = self._topic(topic=topic)
+            stats.qos = qos
+            stats.published += 1
+
+    def acknowledged(self, topic: str, latency_ns: int) -> None:
+        with self._lock:
+            stats = self._topic(topic=topic)
+            stats.acknowledged += 1
+            stats.latencies.record(duration_ns=latency_ns, return_code=0)
+
+    def dropped(self, topic: str) -> None:
+        with self._lock:
+            self._topic(topic=topic).dropped += 1
+
+    def overflowed(self, topic: str) -> None:
+        with self._lock:
+            self._topic(topic=topic).overflows += 1
+
+    def stats(self) -> dict[str, dict]:
+        with self._lock:
+            return {
+                topic: stats.to_dict()
+                for topic, stats in self._topics.items()
+                }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._topics = dict()
+
+
+metrics = PublishMetrics()
+
+
+class InFlightWindow:
+    """Counts messages in flight, letting only so many be.
+
+    Attributes:
+        self.size (int): Messages allowed in flight.
+        self.in_flight (int): Messages in flight.
+    """
+
+    def __init__(self, size: int = MAX_IN_FLIGHT):
+        self.size = size
+        self.in_flight = 0
+
+        self._changed = Condition()
+
+    def acquire(self, timeout: float = None) -> bool:
+        """Takes a place, waiting for one to free up.
+
+        Returns:
+            bool: False if none did within timeout (s). The place is
+                taken regardless.
+        """
+
+        with self._changed:
+            free = self._changed.wait_for(
+                lambda: self.in_flight < self.size, timeout=timeout
+                )
+            self.in_flight += 1
+
+        return free
+
+    def release(self) -> None:
+        with self._changed:
+            self.in_flight -= 1
+            self._changed.notify_all()
+
+    def wait_empty(self, timeout: float = None) -> bool:
+        """Returns:
+            bool: False if messages were still in flight after timeout.
+        """
+
+        with self._changed:
+            return self._changed.wait_for(
+                lambda: self.in_flight <= 0, timeout=timeout
+                )
+
+
+class _Connection:
+    """A long-lived client and its network thread.
+
+    Helper class for ConnectionPool.
+
+    Attributes:
+        self.client (Client): The mqtt client.
+        self.connected (threading.Event): Set while the broker has
+            acknowledged the connection.
+        self.stopped (bool): Whether the connection was closed, rather
+            than lost, so that nothing will reconnect it.
+    """
+
+    def __init__(self, host: str, port: int, keepalive: int):
+        self.connected = Event()
+        self.stopped = False
+
+        # Message ID to the callback awaiting its acknowledgement
+        self._pending: dict[int, typing.Callable[[bool], None]] = dict()
+        # Acknowledged before publish() returned their ID
+        self._early: set[int] = set()
+        self._lock = Lock()
+
+        self.client = Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+        self.client.reconnect_delay_set(
+            min_delay=1, max_delay=RECONNECT_MAX_DELAY
+            )
+        self.client.connect(host=host, port=port, keepalive=keepalive)
+        self.client.loop_start()
+
+    def _on_connect(self, client, userdata, flags, rc) -> None:
+        if rc == 0:
+            self.connected.set()
+
+    def _on_disconnect(self, client, userdata, rc) -> None:
+        self.connected.clear()
+
+        if rc == 0:
+            self.stopped = True
+        else:
+            logging.warning(f'mqtt connection lost ({rc}), reconnecting')
+
+    def _on_publish(self, client, userdata, mid: int) -> None:
+        with self._lock:
+            done = self._pending.pop(mid, None)
+
+            if done is None:
+                self._early.add(mid)
+
+        if done is not None:
+            done(True)
+
+    def publish(
+        self,
+        topic: str,
+        payload: str,
+        qos: int,
+        done: typing.Callable[[bool], None]
+        ) -> MQTTMessageInfo:
+        """Publishes, calling done once the message is acknowledged, with
+        True, or once it never will be, with False.
+        """
+
+        # Not under the lock: the client calls _on_publish() under locks
+        # of its own that publish() needs too
+        info = self.client.publish(topic=topic, payload=payload, qos=qos)
+
+        with self._lock:
+            # Only QoS 1 and 2 messages are kept to send on reconnecting
+            if info.rc != MQTT_ERR_SUCCESS and qos == 0:
+                acknowledged = False
+            elif info.mid in self._early:
+                self._early.discard(info.mid)
+                acknowledged = True
+            else:
+                self._pending[info.mid] = done
+
+                return info
+
+        done(acknowledged)
+
+        return info
+
+    def close(self) -> None:
+        self.stopped = True
+        self.client.disconnect()
+        self.client.loop_stop()
+
+        # Won't be acknowledged by this client any more
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+
+        for done in pending:
+            done(False)
+
+
+class ConnectionPool:
+    """Long-lived connections to a broker, shared by Database handles.
+
+    Attributes:
+        self.host (str): Broker address.
+        self.port (int): Broker port.
+        self.size (int): Number of connections, created on first use.
+        self.keepalive (int): Seconds between pings of an idle connection.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        size: int = POOL_SIZE,
+        keepalive: int = KEEPALIVE
+        ):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.keepalive = keepalive
+
+        self._connections: list[_Connection] = [None] * size
+        self._slots = itertools.count()
+        self._lock = Lock()
+
+    def assign(self) -> int:
+        """Picks the connection for a new handle, round robin.
+
+        Returns:
+            int: Slot to pass to client().
+        """
+
+        with self._lock:
+            return next(self._slots) % self.size
+
+    def client(self, slot: int) -> Client:
+        """The client of a slot, see connection()."""
+
+        return self.connection(slot=slot).client
+
+    def connection(self, slot: int) -> _Connection:
+        """The connection of a slot, connecting it if it isn't (any more).
+
+        Raises:
+            OSError: E.g. ConnectionRefusedError, if the broker can't be
+                reached to (re)create the connection.
+        """
+
+        connection = self._connections[slot]
+
+        if connection is not None and not connection.stopped:
+            return connection
+
+        with self._lock:
+            connection = self._connections[slot]
+
+            if connection is None or connection.stopped:
+                connection = _Connection(
+                    host=self.host, port=self.port, keepalive=self.keepalive
+                    )
+                self._connections[slot] = connection
+
+        return connection
+
+    def health(self) -> list[dict]:
+        """State of each connection, e.g. for a status endpoint.
+
+        Returns:
+            list[dict]: Per slot, whether it's connected and whether it
+                was ever opened.
+        """
+
+        return [
+            {
+                'slot': slot,
+                'open': connection is not None and not connection.stopped,
+                'connected': (
+                    connection is not None and connection.connected.is_set()
+                    ),
+                }
+            for slot, connection in enumerate(self._connections)
+            ]
+
+    def close(self) -> None:
+        """Closes every connection. The pool can still be used after."""
+
+        with self._lock:
+            for connection in self._connections:
+                if connection is not None:
+                    connection.close()
+
+            self._connections = [None] * self.size
+
+
+_pools: dict[tuple[str, int], ConnectionPool] = dict()
+_pools_lock = Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """The process-wide pool of the configured broker."""
+
+    with _pools_lock:
+        if (host, port) not in _pools:
+            _pools[(host, port)] = ConnectionPool(host=host, port=port)
+
+        return _pools[(host, port)]
+
+
+def close_pools() -> None:
+    """Closes every pooled connection, e.g. on shutdown."""
+
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+
+        _pools.clear()
+
 
 class Database:
     """Establishes a one-way connection to Drops to push data through
     the mqtt protocol.
 
+    A lightweight handle on a pooled connection, scoped to a path in
+    Drops. Close it once done, or use it as a context manager, to make
+    sure everything written was delivered.
+
     Attributes:
-        self.client: The mqtt-client responsible for starting and
-            maintaining the connection.
+        self.pool (ConnectionPool): Where the connection comes from.
+        self.url (str): Topic prefix of the path.
+        self.qos (dict[str, int]): QoS per table, DEFAULT_QOS for any
+            other.
+        self.window (InFlightWindow): Messages of this handle in flight.
+        self.timeout (float): Longest write() waits for the window (s).
 
     Example:
         path = 'test'
         table = 'exp_xx'
-        db = database.Database(path=path)
-        while *data is being updated*:
-            db.write(payload, table)
+        with database.Database(path=path) as db:
+            while *data is being updated*:
+                db.write(payload, table)
     """
 
-    def __init__(self, path: str):
+    def __init__(
+        self,
+        path: str,
+        pool: ConnectionPool = None,
+        qos: dict = None,
+        window: int = MAX_IN_FLIGHT,
+        timeout: float = WINDOW_TIMEOUT
+        ):
         """
         Args:
             path (str): Path in Drops hierarchy w/o leading or
-            trailing slashes.
-        """
+                trailing slashes.
+            pool (ConnectionPool, optional): Defaults to get_pool().
+            qos (dict, optional): QoS per table, on top of TABLE_QOS.
+                Defaults to None, i.e. TABLE_QOS.
+            window (int, optional): Messages allowed in flight. Defaults
+                to MAX_IN_FLIGHT.
+            timeout (float, optional): Defaults to WINDOW_TIMEOUT.
 
-        self.client = Client()
-        self.client.connect(host=host, port=port, keepalive=3600)
-        self.client.loop_start()
+        Raises:
+            OSError: E.g. ConnectionRefusedError, if the broker can't be
+                reached.
+            ValueError: If qos is invalid, see check_qos().
+        """
 
+        self.pool = get_pool() if pool is None else pool
         self.url = f'{drops_prefix}/{path}/{path}/'
+        self.qos = check_qos(qos=qos)
+        self.window = InFlightWindow(size=window)
+        self.timeout = timeout
+
+        self._slot = self.pool.assign()
+
+        # Fail here, rather than on the first write
+        self.pool.client(slot=self._slot)
+
+    @property
+    def client(self) -> Client:
+        """The mqtt client responsible for the connection."""
+
+        return self.pool.client(slot=self._slot)
 
     def write(self, payload: dict, table: str = 'table') -> MQTTMessageInfo:
         """Writes data out to data.ceec.echem.io, a.k.a. drops.
 
+        Blocks while the window is full, for up to self.timeout.
+
         Args:
             payload (dict): The output data.
             table (str, optional): Table name in database.
@@ -48,8 +503,48 @@ class Database:
         """
 
         destination = f'{self.url}{str(table)}'
+        qos = self.qos.get(table, DEFAULT_QOS)
+
+        if not self.window.acquire(timeout=self.timeout):
+            metrics.overflowed(topic=destination)
+            logging.warning(f'{destination}: {self.window.size} in flight')
+
+        metrics.published(topic=destination, qos=qos)
+        published_ns = time.monotonic_ns()
+
+        def done(acknowledged: bool) -> None:
+            if acknowledged:
+                metrics.acknowledged(
+                    topic=destination,
+                    latency_ns=time.monotonic_ns() - published_ns
+                    )
+            else:
+                metrics.dropped(topic=destination)
 
-        return self.client.publish(
+            self.window.release()
+
+        return self.pool.connection(slot=self._slot).publish(
             topic=destination,
-            payload=json.dumps(payload)
-        )
+            payload=json.dumps(payload),
+            qos=qos,
+            done=done
+            )
+
+    def close(self, timeout: float = 5) -> None:
+        """Waits for what was written to be delivered. The connection
+        stays open for other handles.
+
+        Args:
+            timeout (float, optional): Seconds to wait. Defaults to 5.
+        """
+
+        if not self.window.wait_empty(timeout=timeout):
+            logging.warning(
+                f'{self.url}: {self.window.in_flight} write(s) undelivered'
+                )
+
+    def __enter__(self) -> 'Database':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,194 @@
+"""Decodes the raw BL_GetData buffer into NumPy blocks.
+
+The buffer is NbRaws rows of NbCols uint32s. The first two columns of
+every row are the high and low words of the time since StartTime, in
+units of TimeBase. The remaining columns depend on the technique, and
+hold floats reinterpreted as uint32s (see utils.convert_numeric_to_single)
+or plain integers like the cycle number.
+
+Rather than converting value by value through the driver, whole blocks
+are reinterpreted at once.
+
+CV points are additionally tagged with the sweep (scan) they belong to,
+counting reversals of the control potential Ec. As a sweep can span
+several polls, SweepTagger carries the state from one block to the next.
+
+Example:
+    data_infos, current_values, buffer = potentiostat.get_raw_data()
+    block = decode(
+        buffer=buffer,
+        data_infos=data_infos,
+        time_base=current_values['TimeBase']
+        )
+    block['Ewe']  # np.ndarray[np.float32]
+    sweeps.tag(block=block)  # sweeps = SweepTagger(), one per channel
+"""
+
+import numpy as np
+
+from biologic.constants import Technique
+
+# Every block has the same layout regardless of technique, so blocks can
+# be concatenated and consumed without caring where they came from.
+# Columns a technique doesn't record are NaN (floats) or 0 (integers), as
+# is the timestamp until the block is stamped.
+BLOCK_DTYPE = np.dtype([
+    ('time', np.float64),  # Since channel start (s)
+    ('Ewe', np.float32),  # Working electrode potential (V)
+    ('Ece', np.float32),  # Counter electrode potential (V)
+    ('Ec', np.float32),  # Control potential (V)
+    ('I', np.float32),  # Current (A)
+    ('cycle', np.int32),  # Cycle number within the technique
+    ('scan', np.int32),  # Sweep within the technique, see SweepTagger
+    ('technique_index', np.int32),
+    ('process_index', np.int32),
+    ('loop', np.int32),
+    ('timestamp', np.int64),  # Host UTC (ns), see clock.ClockAnchor.stamp
+    ])
+
+# Columns after t_high and t_low, per technique ID. Some devices record
+# fewer columns (e.g. OCV without Ece), hence only the first NbCols - 2
+# are used.
+COLUMNS = {
+    Technique.KBIO_TECHID_OCV.value: ('Ewe', 'Ece'),
+    Technique.KBIO_TECHID_CA.value: ('Ewe', 'I', 'cycle'),
+    Technique.KBIO_TECHID_CP.value: ('Ewe', 'I', 'cycle'),
+    Technique.KBIO_TECHID_CV.value: ('Ec', 'I', 'Ewe', 'cycle'),
+    Technique.KBIO_TECHID_CPLIMIT.value: ('Ewe', 'I', 'cycle'),
+    }
+
+
+def empty_block(no_rows: int = 0) -> np.ndarray:
+    """A block with NaN floats and zeroed integers.
+
+    Args:
+        no_rows (int, optional): Defaults to 0.
+
+    Returns:
+        np.ndarray: Structured array of BLOCK_DTYPE.
+    """
+
+    block = np.zeros(no_rows, dtype=BLOCK_DTYPE)
+
+    for name in ('Ewe', 'Ece', 'Ec', 'I'):
+        block[name] = np.nan
+
+    return block
+
+
+def packed_dtype(fields: list[str]) -> np.dtype:
+    """Just those columns of BLOCK_DTYPE, unlike BLOCK_DTYPE[fields],
+    which keeps the others as padding.
+    """
+
+    return np.dtype([(name, BLOCK_DTYPE[name]) for name in fields])
+
+
+def decode(buffer, data_infos: dict, time_base: float) -> np.ndarray:
+    """Decodes a BL_GetData buffer.
+
+    Args:
+        buffer: The data buffer, e.g. a ctypes.c_uint32 array or a
+            np.ndarray[np.uint32]. Only the first NbRaws * NbCols values
+            are read.
+        data_infos (dict): DataInfos of the same BL_GetData call.
+        time_base (float): CurrentValues.TimeBase (s).
+
+    Returns:
+        np.ndarray: Structured array of BLOCK_DTYPE, one row per point.
+    """
+
+    no_rows = data_infos['NbRaws']
+    no_cols = data_infos['NbCols']
+
+    block = empty_block(no_rows=no_rows)
+
+    if no_rows == 0:
+        return block
+
+    raw = np.frombuffer(buffer, dtype=np.uint32, count=no_rows * no_cols)
+    raw = raw.reshape(no_rows, no_cols)
+
+    t_rel = (raw[:, 0].astype(np.uint64) << np.uint64(32)) | raw[:, 1]
+    block['time'] = data_infos['StartTime'] + t_rel * time_base
+
+    columns = COLUMNS.get(data_infos['TechniqueID'], ())
+
+    for index, name in enumerate(columns[:no_cols - 2], start=2):
+        if name == 'cycle':
+            block[name] = raw[:, index].view(np.int32)
+        else:
+            block[name] = raw[:, index].view(np.float32)
+
+    block['technique_index'] = data_infos['TechniqueIndex']
+    block['process_index'] = data_infos['ProcessIndex']
+    block['loop'] = data_infos['loop']
+
+    return block
+
+
+class SweepTagger:
+    """Numbers the sweeps of a CV, i.e. runs of monotonic Ec.
+
+    The scan number starts at 0 with each technique and goes up by one
+    at every vertex, so a full cycle is two scans. Points without Ec,
+    i.e. of other techniques, are left at 0. Repeated Ec values, e.g.
+    when averaging over dE, keep the direction they follow.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        """Forgets the sweep in progress, e.g. when a channel restarts."""
+
+        self._technique_index: int = None
+        self._last = np.nan
+        self._direction = 0.0
+        self._scan = 0
+
+    def tag(self, block: np.ndarray) -> None:
+        """Fills block['scan'] in place.
+
+        Args:
+            block (np.ndarray): Decoded block, see BLOCK_DTYPE. Rows must
+                be in order, and follow those of the previous call.
+        """
+
+        valid = np.flatnonzero(~np.isnan(block['Ec']))
+
+        if len(valid) == 0:
+            return
+
+        technique_index = int(block['technique_index'][valid[0]])
+
+        if technique_index != self._technique_index:
+            self.reset()
+            self._technique_index = technique_index
+
+        values = np.concatenate(
+            ([self._last], block['Ec'][valid].astype(np.float64))
+            )
+        steps = np.nan_to_num(np.sign(np.diff(values)))
+
+        # Carry the last direction over flat stretches
+        moved = np.flatnonzero(steps)
+        direction = np.full(len(steps), self._direction)
+
+        if len(moved) > 0:
+            carried = np.maximum.accumulate(
+                np.where(steps != 0, np.arange(len(steps)), -1)
+                )
+            direction = np.where(
+                carried >= 0, steps[np.maximum(carried, 0)], self._direction
+                )
+
+        previous = np.concatenate(([self._direction], direction[:-1]))
+        reversed_ = (direction != previous) & (previous != 0)
+        scans = self._scan + np.cumsum(reversed_)
+
+        block['scan'][valid] = scans
+
+        self._last = values[-1]
+        self._direction = direction[-1]
+        self._scan = int(scans[-1])
@@ -0,0 +1,299 @@
+"""Finds instruments in the background and keeps track of them.
+
+InstrumentFinder.find() blocks on a BL_FindEChemEthDev scan, which takes
+seconds, and only ever knows of one device. Instead, a DiscoveryService
+scans USB and Ethernet at the same time, every interval seconds, in a
+thread of its own. Each scan is diffed against the devices known so far;
+a device showing up or going away is published as a DeviceEvent on
+events, and the known devices are persisted under 'devices' in
+config.json, see config_store.py, which is also where they're picked up
+from on restart. Requests only ever read what the last scan found.
+
+A scan that fails leaves what's known of its interface as it was, so a
+flaky search doesn't look like devices coming and going.
+
+Example:
+    service = DiscoveryService(interval=60)
+    events.subscribe(callback=lambda event: print(event.to_dict()))
+    service.start()
+    service.devices()
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import ctypes
+from dataclasses import dataclass, field
+import logging
+from threading import Event, Lock, Thread
+import time
+
+from biologic.config_store import ConfigStore, get_store
+from biologic.events import EventBus
+from biologic.potentiostats import InstrumentFinder
+
+DEFAULT_INTERVAL = 60.0  # s
+BUFFER_SIZE = 4096  # bytes, for the list of devices found
+
+# Functions of the finder library, per interface
+SEARCHES = {
+    'usb': 'BL_FindEChemUsbDev',
+    'ethernet': 'BL_FindEChemEthDev',
+    }
+
+# Non-empty '$'-separated fields of a device, as utils.
+# parse_potentiostat_search() reads them
+ADDRESS_FIELD = 1
+TYPE_FIELD = -3
+
+# Device events, separate from transitions
+events = EventBus()
+
+
+@dataclass(frozen=True)
+class Device:
+    """An instrument as found.
+
+    Attributes:
+        self.interface (str): 'usb' or 'ethernet'.
+        self.address (str): E.g. 'USB0' or '192.168.0.1'.
+        self.type_ (str): E.g. 'HCP-1005'.
+    """
+    interface: str
+    address: str
+    type_: str
+
+    def to_dict(self) -> dict:
+        return {
+            'interface': self.interface,
+            'address': self.address,
+            'type': self.type_,
+            }
+
+
+@dataclass
+class DeviceEvent:
+    """A device showing up or going away.
+
+    Attributes:
+        self.kind (str): 'added' or 'removed'.
+        self.device (Device): Which.
+        self.received (float): time.monotonic() of the scan that found
+            out, for EventBus' latency statistics.
+        self.channel: Always None, devices have no channel. For
+            EventBus.stream().
+        self.latency_ms (float): Set by EventBus.publish().
+    """
+    kind: str
+    device: Device
+    received: float = field(default_factory=time.monotonic)
+    channel: int = None
+    latency_ms: float = None
+
+    def to_dict(self) -> dict:
+        return {'event': f'device_{self.kind}', **self.device.to_dict()}
+
+
+def parse_devices(raw: bytes, interface: str) -> list[Device]:
+    """Parses the list of devices a search returns.
+
+    Devices are separated by '%', their fields by '$'. Characters may be
+    UTF-16, hence the NULs dropped.
+
+    Args:
+        raw (bytes): As written to the search's buffer.
+        interface (str): Searched, see SEARCHES.
+
+    Returns:
+        list[Device]: In the order found.
+    """
+
+    text = raw.decode('latin-1').replace('\x00', '')
+    devices = list()
+
+    for record in text.split('%'):
+        fields = [field_ for field_ in record.split('$') if field_]
+
+        if len(fields) < max(ADDRESS_FIELD + 1, -TYPE_FIELD):
+            continue
+
+        devices.append(
+            Device(
+                interface=interface,
+                address=fields[ADDRESS_FIELD],
+                type_=fields[TYPE_FIELD]
+                )
+            )
+
+    return devices
+
+
+def search(driver, interface: str) -> list[Device]:
+    """Runs one search of the finder library, blocking.
+
+    Args:
+        driver: The finder library, e.g. InstrumentFinder().driver.
+        interface (str): See SEARCHES.
+
+    Returns:
+        list[Device]: Found.
+    """
+
+    buffer = ctypes.c_buffer(BUFFER_SIZE)
+    size = ctypes.c_uint32(BUFFER_SIZE)
+    no_devices = ctypes.c_uint32(0)
+
+    getattr(driver, SEARCHES[interface])(
+        buffer, ctypes.byref(size), ctypes.byref(no_devices)
+        )
+
+    if no_devices.value == 0:
+        return list()
+
+    return parse_devices(raw=buffer.raw, interface=interface)
+
+
+class DiscoveryService:
+    """Scans for devices, every interval seconds once started.
+
+    Attributes:
+        self.driver: The finder library.
+        self.interval (float): Seconds between scans.
+        self.store (ConfigStore): Where known devices are persisted.
+        self.scanned (float): Host UTC (s) of the last scan, None before.
+        self.errors (dict[str, str]): Of the last scan, per interface.
+    """
+
+    def __init__(
+        self,
+        driver=None,
+        interval: float = DEFAULT_INTERVAL,
+        store: ConfigStore = None
+        ):
+        """
+        Args:
+            driver (optional): Defaults to None, i.e. blfind64.dll as
+                InstrumentFinder loads it.
+            interval (float, optional): Defaults to DEFAULT_INTERVAL.
+            store (ConfigStore, optional): Defaults to get_store().
+
+        Raises:
+            ValueError: If interval isn't positive.
+        """
+
+        if interval <= 0:
+            raise ValueError(f'Interval must be positive, not {interval}')
+
+        self.driver = InstrumentFinder().driver if driver is None else driver
+        self.interval = interval
+        self.store = get_store() if store is None else store
+        self.scanned: float = None
+        self.errors: dict[str, str] = dict()
+
+        # As persisted, so a restart only reports what changed meanwhile
+        self._known: dict[str, set[Device]] = {
+            interface: set() for interface in SEARCHES
+            }
+
+        for device in self.store.get('devices', list()):
+            self._known[device['interface']].add(
+                Device(
+                    interface=device['interface'],
+                    address=device['address'],
+                    type_=device['type']
+                    )
+                )
+
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread: Thread = None
+        # One thread per interface, so they're searched at the same time
+        self._pool = ThreadPoolExecutor(
+            max_workers=len(SEARCHES), thread_name_prefix='discovery'
+            )
+
+    def devices(self) -> list[dict]:
+        """Known devices, as of the last scan, without scanning."""
+
+        with self._lock:
+            known = set().union(*self._known.values())
+
+        return [
+            device.to_dict()
+            for device in sorted(known, key=lambda d: (d.interface, d.address))
+            ]
+
+    def scan(self) -> list[DeviceEvent]:
+        """Searches every interface at once and publishes what changed.
+
+        Returns:
+            list[DeviceEvent]: Published, removals first.
+        """
+
+        received = time.monotonic()
+        futures = {
+            interface: self._pool.submit(
+                search, driver=self.driver, interface=interface
+                )
+            for interface in SEARCHES
+            }
+        results = dict()
+        errors = dict()
+
+        # Outside the lock, so devices() never waits on a search
+        for interface, future in futures.items():
+            try:
+                results[interface] = set(future.result())
+            except Exception as e:
+                logging.error(e)
+                errors[interface] = f'{type(e).__name__}: {e}'
+
+        changes = list()
+
+        with self._lock:
+            for interface, found in results.items():
+                known = self._known[interface]
+                changes.extend(
+                    DeviceEvent(kind='removed', device=d, received=received)
+                    for d in known - found
+                    )
+                changes.extend(
+                    DeviceEvent(kind='added', device=d, received=received)
+                    for d in found - known
+                    )
+                self._known[interface] = found
+
+            self.scanned = time.time()
+            self.errors = errors
+
+        changes.sort(key=lambda event: event.kind != 'removed')
+
+        if changes:
+            self.store.update(devices=self.devices())
+
+        for event in changes:
+            events.publish(transition=event)
+
+        return changes
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.scan()
+            except Exception as e:
+                logging.error(e)
+
+            self._stopped.wait(timeout=self.interval)
+
+    def start(self) -> None:
+        """Scans in a background thread, right away and every interval."""
+
+        if self._thread is None:
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stopped.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+        self._pool.shutdown(wait=False)
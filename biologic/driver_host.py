@@ -0,0 +1,461 @@
+"""Runs the EC-Lab libraries in a process of their own.
+
+The DLLs are the only part of the server that needs Windows. Instead of
+running everything under Wine, a DriverHost loads them in a small Wine
+process, and the server talks to it from native Linux through a
+RemoteDriver. RemoteDriver has the same BL_* functions, taking the same
+ctypes arguments, so Potentiostat can't tell the difference.
+
+Each call is one request and one response, over a loopback TCP
+connection (Python under Wine has no Unix sockets) with TCP_NODELAY.
+Frames are a 4-byte length followed by a pickle of plain values only:
+ctypes arguments are sent as their raw bytes and every argument the DLL
+may write to is copied back in place. The BL_GetData buffer only travels
+as far as NbRaws * NbCols values, i.e. a single bulk copy of what was
+recorded.
+
+Driver errors are raised on the host, by the errcheck hooks, and raised
+again on the client as the same exception.
+
+Example:
+    # Under Wine
+    python -m biologic.driver_host --port 5002
+
+    # Natively, or set 'driver_host' in config.json
+    driver = RemoteDriver(address=('127.0.0.1', 5002))
+    potentiostat = HCP1005()  # picks up config.json's 'driver_host'
+"""
+
+import argparse
+import ctypes
+import io
+import logging
+import ntpath
+import pickle
+import socket
+import socketserver
+import struct
+from threading import local
+import typing
+
+from biologic import exceptions, structures
+
+HEADER = struct.Struct('>I')
+
+# ctypes types arguments may be made of, by name
+TYPES = {
+    type_.__name__: type_
+    for type_ in (
+        ctypes.c_bool,
+        ctypes.c_char,
+        ctypes.c_double,
+        ctypes.c_float,
+        ctypes.c_int32,
+        ctypes.c_uint8,
+        ctypes.c_uint32,
+        structures.ChannelInfos,
+        structures.CurrentValues,
+        structures.DataInfos,
+        structures.DeviceInfos,
+        structures.EccParam,
+        )
+    }
+
+
+class _Unpickler(pickle.Unpickler):
+    """Only plain values, never classes or functions."""
+
+    def find_class(self, module: str, name: str):
+        raise pickle.UnpicklingError(f'{module}.{name} not allowed')
+
+
+def _loads(payload: bytes):
+    return _Unpickler(io.BytesIO(payload)).load()
+
+
+def send(sock: socket.socket, message) -> None:
+    """Writes a single length-prefixed frame."""
+
+    payload = pickle.dumps(message, protocol=4)
+    sock.sendall(HEADER.pack(len(payload)) + payload)
+
+
+def receive(sock: socket.socket):
+    """Reads a single frame, or returns None if the peer hung up."""
+
+    header = _read_exactly(sock=sock, size=HEADER.size)
+
+    if header is None:
+        return None
+
+    payload = _read_exactly(sock=sock, size=HEADER.unpack(header)[0])
+
+    return _loads(payload=payload)
+
+
+def _read_exactly(sock: socket.socket, size: int) -> bytes:
+    view = memoryview(bytearray(size))
+    received = 0
+
+    while received < size:
+        chunk = sock.recv_into(view[received:])
+
+        if chunk == 0:
+            return None
+
+        received += chunk
+
+    return view.tobytes()
+
+
+def encode_arguments(arguments: tuple) -> list[tuple]:
+    """Turns ctypes arguments into plain values.
+
+    Helper function for RemoteDriver.
+
+    Returns:
+        list[tuple]: (kind, ...) per argument, see decode_arguments().
+    """
+
+    encoded = list()
+
+    for argument in arguments:
+        # ctypes.byref() hides the object itself behind _obj
+        argument = getattr(argument, '_obj', argument)
+
+        if isinstance(argument, structures.EccParams):
+            params = [
+                bytes(argument.pParams[index])
+                for index in range(argument.len)
+                ]
+            encoded.append(('params', params))
+        elif isinstance(argument, ctypes.Structure):
+            encoded.append(
+                ('struct', type(argument).__name__, bytes(argument))
+                )
+        elif isinstance(argument, ctypes.Array):
+            encoded.append(
+                (
+                    'array',
+                    argument._type_.__name__,
+                    len(argument),
+                    bytes(argument)
+                    )
+                )
+        elif isinstance(argument, ctypes._Pointer):
+            # Only ever the BL_GetData buffer, nothing to send
+            encoded.append(('buffer', ))
+        elif isinstance(argument, ctypes._SimpleCData):
+            encoded.append(
+                ('scalar', type(argument).__name__, argument.value)
+                )
+        else:
+            encoded.append(('plain', argument))
+
+    return encoded
+
+
+def decode_arguments(encoded: list[tuple], buffer_size: int) -> list:
+    """Rebuilds ctypes arguments from encode_arguments().
+
+    Helper function for DriverHost.
+
+    Args:
+        buffer_size (int): uint32s to allocate for a 'buffer' argument.
+    """
+
+    arguments = list()
+
+    for kind, *rest in encoded:
+        if kind == 'params':
+            params = (structures.EccParam * max(len(rest[0]), 1))()
+
+            for index, raw in enumerate(rest[0]):
+                ctypes.memmove(ctypes.byref(params[index]), raw, len(raw))
+
+            arguments.append(structures.EccParams(len(rest[0]), params))
+        elif kind == 'struct':
+            arguments.append(TYPES[rest[0]].from_buffer_copy(rest[1]))
+        elif kind == 'array':
+            type_name, length, raw = rest
+            arguments.append((TYPES[type_name] * length).from_buffer_copy(raw))
+        elif kind == 'buffer':
+            arguments.append((ctypes.c_uint32 * buffer_size)())
+        elif kind == 'scalar':
+            arguments.append(TYPES[rest[0]](rest[1]))
+        else:
+            arguments.append(rest[0])
+
+    return arguments
+
+
+def _outputs(name: str, arguments: list) -> list:
+    """What the DLL may have written, per argument, None for inputs.
+
+    Helper function for DriverHost.
+    """
+
+    outputs = list()
+
+    for argument in arguments:
+        if isinstance(argument, (ctypes.Structure, ctypes.Array)) and not (
+            isinstance(argument, structures.EccParams)
+            ):
+            outputs.append(bytes(argument))
+        elif isinstance(argument, ctypes._SimpleCData):
+            outputs.append(argument.value)
+        else:
+            outputs.append(None)
+
+    if name == 'BL_GetData':
+        # Buffer, DataInfos: only send what was recorded
+        buffer, data_infos = arguments[2], arguments[3]
+        outputs[2] = bytes(buffer)[:data_infos.NbRaws * data_infos.NbCols * 4]
+
+    return outputs
+
+
+class DriverHost(socketserver.ThreadingTCPServer):
+    """Serves driver calls to RemoteDrivers.
+
+    Attributes:
+        self.drivers (dict[str, object]): Library filename, e.g.
+            'EClib64.dll', to the loaded driver.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        drivers: dict[str, object],
+        address: tuple[str, int] = ('127.0.0.1', 5002),
+        buffer_size: int = 1000
+        ):
+        """
+        Args:
+            drivers (dict[str, object]): See class docstring. Anything
+                with the BL_* functions, e.g. simulator.SimulatedDriver.
+            address (tuple[str, int], optional): Loopback only.
+                Defaults to ('127.0.0.1', 5002).
+            buffer_size (int, optional): BL_GetData buffer (uint32s).
+                Defaults to 1000.
+        """
+
+        self.drivers = drivers
+        self.buffer_size = buffer_size
+
+        super(DriverHost, self).__init__(address, _Handler)
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self.server_address[:2]
+
+    def call(self, library: str, name: str, encoded: list[tuple]) -> tuple:
+        """Runs a single request.
+
+        Returns:
+            tuple: ('ok', return value, outputs) or ('error', exception
+                class name, error code, message).
+        """
+
+        arguments = decode_arguments(
+            encoded=encoded, buffer_size=self.buffer_size
+            )
+
+        try:
+            function = getattr(self.drivers[library], name)
+            result = function(*arguments)
+        except exceptions.ECLibException as e:
+            return ('error', type(e).__name__, e.error_code, e.message)
+
+        return ('ok', result, _outputs(name=name, arguments=arguments))
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """One RemoteDriver connection, served until it hangs up."""
+
+    def handle(self) -> None:
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        while True:
+            message = receive(sock=self.request)
+
+            if message is None:
+                return
+
+            library, name, encoded = message
+
+            try:
+                response = self.server.call(
+                    library=library, name=name, encoded=encoded
+                    )
+            except Exception as e:
+                logging.error(f'driver host: {name} failed: {e!r}')
+                response = ('error', 'ECLibError', -1, repr(e))
+
+            send(sock=self.request, message=response)
+
+
+def _write_back(argument, output) -> None:
+    """Copies what the host got back from the DLL into the argument.
+
+    Helper function for RemoteDriver.
+    """
+
+    if output is None:
+        return
+
+    argument = getattr(argument, '_obj', argument)
+
+    if isinstance(argument, ctypes._Pointer):
+        ctypes.memmove(argument, output, len(output))
+    elif isinstance(argument, (ctypes.Structure, ctypes.Array)):
+        ctypes.memmove(ctypes.byref(argument), output, len(output))
+    elif isinstance(argument, ctypes._SimpleCData):
+        argument.value = output
+
+
+class RemoteDriver:
+    """Stands in for a ctypes.WinDLL, forwarding calls to a DriverHost.
+
+    Each thread gets a connection of its own, so calls on different
+    handles don't wait for each other.
+    """
+
+    def __init__(
+        self,
+        address: tuple[str, int] = ('127.0.0.1', 5002),
+        library: str = 'EClib64.dll',
+        timeout: float = 30
+        ):
+        """
+        Args:
+            address (tuple[str, int], optional): Of the DriverHost.
+                Defaults to ('127.0.0.1', 5002).
+            library (str, optional): Which of the host's drivers to call.
+                Defaults to 'EClib64.dll'.
+            timeout (float, optional): Per call (s). Defaults to 30.
+        """
+
+        self.address = tuple(address)
+        self.library = library
+        self.timeout = timeout
+
+        # Identifies the driver in utils._error_catalog
+        self._name = f'{address[0]}:{address[1]}/{library}'
+        self._local = local()
+
+    def __getattr__(self, name: str) -> typing.Callable:
+        if not name.startswith('BL_'):
+            raise AttributeError(name)
+
+        def call(*arguments):
+            return self._call(name, arguments)
+
+        call.__name__ = name
+        setattr(self, name, call)
+
+        return call
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, 'sock', None)
+
+        if sock is None:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._local.sock = sock
+
+        return sock
+
+    def _call(self, name: str, arguments: tuple):
+        sock = self._connection()
+
+        try:
+            send(
+                sock=sock,
+                message=(self.library, name, encode_arguments(arguments))
+                )
+            response = receive(sock=sock)
+        except OSError:
+            self.close()
+            raise
+
+        if response is None:
+            self.close()
+            raise ConnectionError(f'Driver host {self._name} hung up')
+
+        if response[0] == 'error':
+            _, class_name, error_code, message = response
+
+            if class_name == 'BLFindError':
+                raise exceptions.BLFindError(
+                    error_code=error_code, message=message
+                    )
+
+            raise exceptions.from_code(error_code=error_code, message=message)
+
+        _, result, outputs = response
+
+        for argument, output in zip(arguments, outputs):
+            _write_back(argument=argument, output=output)
+
+        return result
+
+    def close(self) -> None:
+        """Closes the connection of the calling thread."""
+
+        sock = getattr(self._local, 'sock', None)
+
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    """'127.0.0.1:5002' -> ('127.0.0.1', 5002)."""
+
+    host, port = address.rsplit(':', 1)
+
+    return host, int(port)
+
+
+def library_name(path: str) -> str:
+    """'drivers\\\\EClib64.dll' -> 'EClib64.dll', whichever the separator."""
+
+    return ntpath.basename(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5002)
+    parser.add_argument(
+        '--simulate',
+        action='store_true',
+        help='Serve a simulated instrument instead of the DLLs'
+        )
+    args = parser.parse_args()
+
+    if args.simulate:
+        from biologic.simulator import SimulatedDriver
+
+        drivers = {'EClib64.dll': SimulatedDriver()}
+    else:
+        from biologic.prototypes import load_driver
+        from biologic.utils import DRIVERPATH
+
+        drivers = {
+            'EClib64.dll': load_driver(path=DRIVERPATH + 'EClib64.dll'),
+            'blfind64.dll': load_driver(
+                path=DRIVERPATH + 'blfind64.dll', finder=True
+                ),
+            }
+
+    with DriverHost(drivers=drivers, address=(args.host, args.port)) as host:
+        logging.info(f'Driver host serving on {host.address}')
+        host.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""Detects step and loop transitions as soon as the data shows them.
+
+External instruments (acoustics, temperature, ...) often need to act at
+the start of a step or cycle. Instead of leaving them to infer that from
+the live table, the acquisition loop feeds each decoded block to a
+TransitionDetector and publishes what it finds on the event bus. From
+there it goes out on the 'events' table in Drops, to local callbacks, and
+to /events as Server-Sent Events.
+
+Example:
+    detector = TransitionDetector(channel=0)
+    for transition in detector.update(data_infos, block, received):
+        bus.publish(transition)
+"""
+
+from collections import deque
+from dataclasses import asdict, dataclass
+import logging
+import queue
+from threading import Lock
+import time
+import typing
+
+import numpy as np
+
+# Transition kind: DataInfos key
+KINDS = {
+    'technique': 'TechniqueIndex',
+    'process': 'ProcessIndex',
+    'loop': 'loop',
+    }
+
+
+@dataclass
+class Transition:
+    """A change of technique, process or loop on a channel.
+
+    Attributes:
+        self.channel (int): Channel it happened on.
+        self.kind (str): 'technique', 'process' or 'loop'.
+        self.previous (int): Index/number before.
+        self.current (int): Index/number after.
+        self.technique_index (int): Technique index after.
+        self.process_index (int): Process index after.
+        self.loop (int): Loop number after.
+        self.instrument_time (float): StartTime + elapsed time of the
+            first point after the transition (s).
+        self.timestamp (int): Host UTC of that point (ns). None if the
+            block wasn't stamped.
+        self.host_time (float): When the block showing it arrived (UNIX).
+        self.received (float): Same, but time.monotonic(). For latency.
+        self.latency_ms (float): From block arrival to publication.
+    """
+    channel: int
+    kind: str
+    previous: int
+    current: int
+    technique_index: int
+    process_index: int
+    loop: int
+    instrument_time: float
+    host_time: float
+    received: float
+    timestamp: int = None
+    latency_ms: float = None
+
+    def to_dict(self) -> dict:
+        out = asdict(self)
+        del out['received']
+
+        return out
+
+
+class TransitionDetector:
+    """Tracks technique, process and loop indices of a single channel.
+
+    The first block seen sets the baseline, so reattaching to a run
+    doesn't fire spurious transitions.
+    """
+
+    def __init__(self, channel: int):
+        self.channel = channel
+        self._state: dict = None
+
+    def update(
+        self,
+        data_infos: dict,
+        block: np.ndarray,
+        received: float,
+        host_time: float = None
+        ) -> list[Transition]:
+        """Compares the block against the previous one.
+
+        Args:
+            data_infos (dict): DataInfos of the block.
+            block (np.ndarray): Decoded block, see decoding.BLOCK_DTYPE.
+            received (float): time.monotonic() when the block arrived.
+            host_time (float, optional): time.time() when it arrived.
+                Defaults to now.
+
+        Returns:
+            list[Transition]: One per index that changed, empty if none.
+        """
+
+        if len(block) == 0:
+            return list()
+
+        state = {kind: data_infos[key] for kind, key in KINDS.items()}
+        previous, self._state = self._state, state
+
+        if previous is None:
+            return list()
+
+        host_time = time.time() if host_time is None else host_time
+
+        return [
+            Transition(
+                channel=self.channel,
+                kind=kind,
+                previous=previous[kind],
+                current=state[kind],
+                technique_index=state['technique'],
+                process_index=state['process'],
+                loop=state['loop'],
+                instrument_time=float(block['time'][0]),
+                host_time=host_time,
+                received=received,
+                timestamp=int(block['timestamp'][0]) or None
+                )
+            for kind in KINDS
+            if state[kind] != previous[kind]
+            ]
+
+
+class EventBus:
+    """Fans transitions out to subscribers and keeps latency statistics.
+
+    Attributes:
+        self.latencies (deque): Most recent latencies [ms].
+    """
+
+    def __init__(self, max_samples: int = 1000):
+        self.latencies: deque = deque(maxlen=max_samples)
+
+        self._subscribers: list[typing.Callable] = list()
+        self._lock = Lock()
+
+    def subscribe(self, callback: typing.Callable) -> None:
+        """Calls callback(transition) on every transition.
+
+        Callbacks run on the acquisition thread, so must be quick.
+        """
+
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: typing.Callable) -> None:
+        with self._lock:
+            self._subscribers.remove(callback)
+
+    def publish(self, transition: Transition) -> None:
+        transition.latency_ms = (time.monotonic() - transition.received) * 1e3
+        self.latencies.append(transition.latency_ms)
+
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for callback in subscribers:
+            try:
+                callback(transition)
+            except Exception as e:
+                logging.error(e)
+
+    def stream(self, channel: int = None) -> typing.Iterator[Transition]:
+        """Yields transitions as they're published, e.g. for SSE.
+
+        Args:
+            channel (int, optional): Only transitions on this channel.
+                Defaults to None, i.e. all.
+        """
+
+        transitions: queue.Queue = queue.Queue(maxsize=1000)
+
+        def enqueue(transition: Transition) -> None:
+            if channel is None or transition.channel == channel:
+                try:
+                    transitions.put_nowait(transition)
+                except queue.Full:
+                    pass  # Slow consumer, never hold up acquisition
+
+        self.subscribe(callback=enqueue)
+
+        try:
+            while True:
+                yield transitions.get()
+        finally:
+            self.unsubscribe(callback=enqueue)
+
+    def latency_stats(self) -> dict:
+        """Latency from block arrival to publication [ms]."""
+
+        if len(self.latencies) == 0:
+            return {'count': 0}
+
+        latencies = np.array(self.latencies)
+
+        return {
+            'count': len(latencies),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'max_ms': float(latencies.max()),
+            }
+
+
+bus = EventBus()
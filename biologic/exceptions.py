@@ -34,6 +34,80 @@ class ECLibError(ECLibException):
             )
 
 
+class GeneralError(ECLibError):
+    """General library errors, codes -1 to -99"""
+
+
+class NotConnectedError(GeneralError):
+    """No instrument connected"""
+
+
+class ChannelNotPluggedError(GeneralError):
+    """Selected channel(s) unplugged"""
+
+
+class InvalidParametersError(GeneralError):
+    """Invalid function parameters"""
+
+
+class ChannelRunningError(GeneralError):
+    """Selected channel(s) already used"""
+
+
+class InstrumentError(ECLibError):
+    """Instrument errors, codes -100 to -199"""
+
+
+class CommunicationError(ECLibError):
+    """Communication errors, codes -200 to -299"""
+
+
+class FirmwareError(ECLibError):
+    """Firmware errors, codes -300 to -399"""
+
+
+class TechniqueError(ECLibError):
+    """Technique errors, codes -400 to -499"""
+
+
+# Specific codes take precedence over the range they belong to.
+error_classes = {
+    -1: NotConnectedError,
+    -3: ChannelNotPluggedError,
+    -4: InvalidParametersError,
+    -13: ChannelRunningError,
+    }
+
+# Keyed by -error_code // 100
+error_ranges = {
+    0: GeneralError,
+    1: InstrumentError,
+    2: CommunicationError,
+    3: FirmwareError,
+    4: TechniqueError,
+    }
+
+
+def from_code(error_code: int, message: str) -> ECLibError:
+    """Instantiates the most specific ECLibError for an error code.
+
+    Args:
+        error_code (int): Return code from ECLib function call.
+        message (str): Decoded error message.
+
+    Returns:
+        ECLibError: E.g. ChannelRunningError for -13, TechniqueError
+            for -402. ECLibError for codes outside documented ranges.
+    """
+
+    if error_code in error_classes:
+        error_class = error_classes[error_code]
+    else:
+        error_class = error_ranges.get(-error_code // 100, ECLibError)
+
+    return error_class(error_code=error_code, message=message)
+
+
 class BLFindError(ECLibException):
 
     def __init__(self, error_code: int, message: str):
@@ -50,3 +124,21 @@ class ECLibCustomException(ECLibException):
         super(ECLibCustomException, self).__init__(
             error_code=error_code, message=message
             )
+
+
+class PlanValidationError(ECLibCustomException):
+    """Experiment steps that don't match their technique schemas"""
+
+    def __init__(self, message: str):
+        super(PlanValidationError, self).__init__(
+            error_code=-9002, message=message
+            )
+
+
+class TechniqueFileError(ECLibCustomException):
+    """Technique (.ecc) file missing, unknown or corrupted"""
+
+    def __init__(self, message: str):
+        super(TechniqueFileError, self).__init__(
+            error_code=-9003, message=message
+            )
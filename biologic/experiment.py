@@ -1,15 +1,30 @@
-import json
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 import logging
 import os
 from threading import Event
+import time
+import typing
 
+from biologic import recent, ring
+from biologic.aggregates import CycleAggregator
+from biologic.clock import ClockAnchor
+from biologic.commands import Dropped
 from biologic.config import slack_user_id, slack_channel_url
+from biologic.config_store import get_store
 from biologic.constants import State
-from biologic.database import Database
-from biologic.potentiostats import Potentiostat
-from biologic import slackbot
-from biologic.techniques import set_technique_params
-from biologic.utils import parse_raw_params, parse_payload
+from biologic.database import Database, check_qos
+from biologic.events import TransitionDetector, bus
+from biologic.exceptions import PlanValidationError, TechniqueFileError
+from biologic.notifier import Notifier, SlackBackend
+from biologic.plans import Step, compile_steps, parse_steps
+from biologic.potentiostats import Potentiostat, is_full
+from biologic.reduction import Sink, make_sinks, to_payload
+from biologic.registry import get_registry
+from biologic.safety import Breach, Limits
+from biologic.state import RunState, StateStore
+from biologic.structures import EccParams
+from biologic.utils import parse_payload
 
 
 log_filename = "logs/logs.log"
@@ -18,16 +33,24 @@ logging.basicConfig(filename=log_filename,
                     level=logging.INFO,
                     format='%(asctime)s: %(message)s')
 
-with open('biologic\\config.json') as f:
-    settings = json.load(f)
+settings = get_store().snapshot()
 
 usb_port = settings['usb_port']
 
+notifier = Notifier(
+    backend=SlackBackend(url=slack_channel_url, user_id=slack_user_id)
+    )
+
+# Set by an acquisition daemon, whose sinks run in the API process
+# instead, see _sinks()
+announce: typing.Callable[[dict], None] = None
+
 
 class Experiment:
 
     def __init__(self):
         self._status = 'stopped'
+        self.stop_reason: str = None
 
     @property
     def status(self):
@@ -40,45 +63,514 @@ class Experiment:
         self._status = State(state).name
 
 
-def run(potentiostat: Potentiostat, raw_params: dict, pill: Event, experiment_: Experiment):
+@dataclass(frozen=True)
+class Plan:
+    """Everything run() needs that can be compiled without the instrument.
+
+    Immutable, and hashable on its path and steps, so the same plan can
+    be shared between channels.
+
+    Attributes:
+        self.db_path (str): Path in Drops hierarchy, i.e. the exp_id.
+        self.steps (tuple[plans.Step, ...]): Validated steps, in order.
+        self.technique_paths (tuple[str, ...]): Technique ecc-file paths,
+            in sequential order.
+        self.c_tecc_params (tuple[EccParams, ...]): Technique parameters
+            ready to be passed to Potentiostat.load_technique(). Shared,
+            don't modify.
+        self.sinks (dict): Tables to write decoded blocks to and how to
+            reduce them, see reduction.make_sinks(). Defaults to None,
+            i.e. reduction.DEFAULT_SINKS.
+        self.limits (dict): Host-side safety limits, see
+            safety.Limits.from_config(). Defaults to None, i.e. none.
+        self.qos (dict): MQTT QoS per table, see database.check_qos().
+            Defaults to None, i.e. database.TABLE_QOS.
+    """
+    db_path: str
+    steps: tuple[Step, ...]
+    technique_paths: tuple[str, ...]
+    c_tecc_params: tuple[EccParams, ...] = field(compare=False)
+    sinks: dict = field(default=None, compare=False)
+    limits: dict = field(default=None, compare=False)
+    qos: dict = field(default=None, compare=False)
+
+
+def prepare(raw_params: dict) -> Plan:
+    """Validates and compiles experiment parameters ahead of running them.
+
+    Args:
+        raw_params (dict): As passed to run().
+
+    Raises:
+        PlanValidationError: If anything doesn't validate, before the
+            instrument is touched.
+
+    Returns:
+        Plan: Compiled experiment.
+    """
+
+    db_path = raw_params.get('exp_id')
+
+    if not isinstance(db_path, str) or not db_path:
+        raise PlanValidationError(message='exp_id must be a non-empty str')
+
+    steps = parse_steps(raw_steps=raw_params.get('steps'))
+    technique_paths, c_tecc_params = compile_steps(steps=steps)
+
+    # Fail on submission rather than once the channel is running
+    sinks = raw_params.get('sinks')
+    limits = raw_params.get('limits')
+    qos = raw_params.get('qos')
+
+    try:
+        make_sinks(config=sinks)
+        Limits.from_config(config=limits)
+        check_qos(qos=qos)
+    except ValueError as e:
+        raise PlanValidationError(message=str(e))
+
+    return Plan(
+        db_path=db_path,
+        steps=steps,
+        technique_paths=technique_paths,
+        c_tecc_params=c_tecc_params,
+        sinks=sinks,
+        limits=limits,
+        qos=qos
+        )
+
+
+def run(
+    potentiostat: Potentiostat,
+    raw_params: dict,
+    pill: Event,
+    experiment_: Experiment,
+    plan: Plan = None,
+    store: StateStore = None,
+    run_id: str = None
+    ):
     """Wrapper for running experiments.
 
     Args:
         potentiostat (potentiostats.Potentiostat): Instance of (a subclass of)
-            a potentiostat.
+            a potentiostat. Connected if it isn't already, and left
+            connected so that the next experiment can start right away.
         raw_params (dict): 
         pill (threading.Event): Emergency stop button if an experiment must be
             externally terminated.
+        plan (Plan, optional): raw_params, compiled in advance by prepare().
+            Compiled here if not passed. Defaults to None.
+        store (StateStore, optional): Where to record progress, so that
+            the run can be reattached to after a restart. Defaults to None.
+        run_id (str, optional): Identifies the run in store.
+            Defaults to None.
     """
 
-    parsed_params, technique_paths, db_path = parse_raw_params(
-        raw_params=raw_params
+    if plan is None:
+        plan = prepare(raw_params=raw_params)
+
+    registry = get_registry()
+    missing = {step.technique for step in plan.steps} - registry.available(
+        device=potentiostat._type
         )
-    db = Database(path=db_path)
-    c_tecc_params = set_technique_params(parsed_params)
-    potentiostat.connect(usb_port=usb_port)
+
+    if missing:
+        raise TechniqueFileError(
+            message=f'No technique file for {missing} on {potentiostat._type}'
+            )
+
+    registry.verify(paths=plan.technique_paths)
+
+    db = Database(path=plan.db_path, qos=plan.qos)
+
+    if not potentiostat.is_connected:
+        potentiostat.connect(usb_port=usb_port)
+
     potentiostat.load_technique(
-        technique_paths=technique_paths, c_tecc_params=c_tecc_params
+        technique_paths=plan.technique_paths,
+        c_tecc_params=plan.c_tecc_params
         )
+
+    # Stopped while connecting or loading
+    if pill.is_set():
+        return
+
     potentiostat.start_channel()
 
+    if store is not None:
+        store.start(
+            run_id=run_id,
+            exp_id=plan.db_path,
+            device=potentiostat._type,
+            channel=potentiostat.channel,
+            raw_params=raw_params
+            )
+
+    experiment_.set_status('running')
+    experiment_.stop_reason = None
+
+    with _sinks(
+        channel=potentiostat.channel,
+        exp_id=plan.db_path,
+        config=plan.sinks,
+        qos=plan.qos,
+        run_id=run_id
+        ) as sinks:
+        _acquire(
+            potentiostat=potentiostat,
+            db=db,
+            pill=pill,
+            experiment_=experiment_,
+            exp_id=raw_params['exp_id'],
+            sinks=sinks,
+            limits=Limits.from_config(config=plan.limits),
+            store=store,
+            run_id=run_id
+            )
+
+
+def reattach(
+    potentiostat: Potentiostat,
+    run_state: RunState,
+    pill: Event,
+    experiment_: Experiment,
+    store: StateStore
+    ):
+    """Picks up a run left behind by a previous process.
+
+    The channel kept running in the meantime, so nothing is loaded or
+    started. Data points up to the stored cursor were already written
+    out and are skipped. If the channel has stopped since, the remaining
+    data is drained and the run finished.
+
+    Args:
+        potentiostat (potentiostats.Potentiostat): On run_state.channel.
+        run_state (RunState): As recorded by store.
+        pill (threading.Event): Emergency stop button.
+        store (StateStore): Store run_state was read from.
+    """
+
+    db = Database(
+        path=run_state.exp_id, qos=run_state.raw_params.get('qos')
+        )
+
+    if not potentiostat.is_connected:
+        potentiostat.connect(usb_port=usb_port)
+
     experiment_.set_status('running')
 
+    with _sinks(
+        channel=potentiostat.channel,
+        exp_id=run_state.exp_id,
+        config=run_state.raw_params.get('sinks'),
+        qos=run_state.raw_params.get('qos'),
+        run_id=run_state.run_id
+        ) as sinks:
+        _acquire(
+            potentiostat=potentiostat,
+            db=db,
+            pill=pill,
+            experiment_=experiment_,
+            exp_id=run_state.exp_id,
+            sinks=sinks,
+            limits=Limits.from_config(
+                config=run_state.raw_params.get('limits')
+                ),
+            store=store,
+            run_id=run_state.run_id,
+            cursor=(
+                float('-inf') if run_state.cursor is None else run_state.cursor
+                )
+            )
+
+
+@contextmanager
+def _sinks(
+    channel: int,
+    exp_id: str,
+    config: dict = None,
+    qos: int = None,
+    run_id: str = None
+    ) -> typing.Iterator[list[Sink]]:
+    """The sinks _acquire() writes to, none if handed off.
+
+    Helper function for run() and reattach(). In an acquisition daemon,
+    the sinks run in the API process instead, reading the run's rows off
+    the channel's ring (see daemon.SinkConsumer), so that reducing and
+    encoding never hold up the next poll. All that's left to do here is
+    announce where in the ring the run's rows start, and where they end.
+
+    Args:
+        config (dict, optional): The 'sinks' key of the raw parameters.
+            Defaults to None, i.e. reduction.DEFAULT_SINKS.
+        qos (int, optional): The 'qos' key of the raw parameters.
+    """
+
+    if announce is None or not ring.enabled():
+        yield make_sinks(config=config)
+
+        return
+
+    info = {
+        'run_id': run_id,
+        'channel': channel,
+        'exp_id': exp_id,
+        'sinks': config,
+        'qos': qos,
+        }
+    announce({
+        **info, 'event': 'started', 'row': ring.position(channel=channel)
+        })
+
+    try:
+        yield list()
+    finally:
+        announce({
+            **info, 'event': 'finished', 'row': ring.position(channel=channel)
+            })
+
+
+def _acquire(
+    potentiostat: Potentiostat,
+    db: Database,
+    pill: Event,
+    experiment_: Experiment,
+    exp_id: str,
+    sinks: list[Sink] = None,
+    limits: Limits = None,
+    store: StateStore = None,
+    run_id: str = None,
+    cursor: float = None
+    ):
+    """Polls the instrument and writes out data until the channel stops.
+
+    Helper function for run() and reattach().
+
+    Args:
+        sinks (list[Sink], optional): Fresh sinks to write decoded blocks
+            to, see _sinks(). Defaults to None, i.e.
+            reduction.DEFAULT_SINKS.
+        limits (Limits, optional): Fresh safety limits, checked on every
+            poll. Defaults to None, i.e. none.
+        cursor (float, optional): Time ('time' column, s) of the last
+            row written out before a restart. Rows up to and including
+            it are skipped, for reattach(). Defaults to None, i.e.
+            nothing is skipped.
+    """
+
+    detector = TransitionDetector(channel=potentiostat.channel)
+    anchor = ClockAnchor()
+    aggregator = CycleAggregator(channel=potentiostat.channel)
+    sinks = make_sinks() if sinks is None else sinks
+    limits = Limits() if limits is None else limits
+    breach = None
+
+    stopped = potentiostat.commands.stopped(channel=potentiostat.channel)
+    drained = False
+    full = False
+    skipping = cursor is not None
+    # TimeBase and StartTime of the latest rows, for codec sinks
+    time_base, start_time = None, 0.0
+
     try:
-        while experiment_.status == 'running' and not pill.wait(1):
-            data_infos, current_values = potentiostat.get_data()
+        # A full buffer, e.g. from a fast CV, is drained without waiting,
+        # even once the channel reports it stopped.
+        while (experiment_.status == 'running' or full) and not pill.is_set():
+            # A stop cuts the wait short once, to drain what's left
+            if full:
+                pass
+            elif drained:
+                pill.wait(1)
+            else:
+                drained = stopped.wait(1)
+
+            if pill.is_set():
+                break
+
+            sent_ns = time.monotonic_ns()
+
+            try:
+                data_infos, current_values, block = potentiostat.get_block()
+            except Dropped:
+                continue
+
+            full = is_full(data_infos=data_infos)
+
+            received_ns = time.monotonic_ns()
+            received = received_ns / 1e9
+            experiment_.check_status(state=current_values['State'])
+
+            # A stopped channel's ElapsedTime is frozen, see clock.py
+            ticking = experiment_.status == 'running'
+
+            if (ticking or not anchor.is_anchored) and anchor.observe(
+                instrument_time=current_values['ElapsedTime'],
+                sent_ns=sent_ns,
+                received_ns=received_ns
+                ):
+                db.write(
+                    payload={
+                        **anchor.to_dict(), 'StartTime': data_infos['StartTime']
+                        },
+                    table='clock'
+                    )
+
+            anchor.stamp(block=block)
+
+            # Reattached: rows before the cursor were written out already.
+            # Rows only ever go forward in time, so once some are past it,
+            # so is everything after.
+            if skipping:
+                block = block[block['time'] > cursor]
+
+                if len(block) == 0:
+                    continue
+
+                skipping = False
+
+            if len(block) > 0:
+                time_base = current_values['TimeBase']
+                start_time = data_infos['StartTime']
+
+            # For /data, and the sinks if this runs in an acquisition daemon
+            if ring.enabled():
+                ring.write_block(
+                    channel=potentiostat.channel,
+                    block=block,
+                    time_base=time_base,
+                    start_time=start_time
+                    )
+            else:
+                recent.write_block(channel=potentiostat.channel, block=block)
+
+            summaries = aggregator.update(block=block)
+
+            # Stop first, writing out can wait. The loop carries on until
+            # the instrument reports the channel stopped, draining the rest.
+            if breach is None:
+                breach = limits.check(
+                    block=block,
+                    current_values=current_values,
+                    aggregator=aggregator,
+                    summaries=summaries
+                    )
+
+                if breach is not None:
+                    potentiostat.stop_channel()
+                    experiment_.stop_reason = breach.reason
+                    logging.warning(f'{exp_id} stopped: {breach.reason}')
+                    db.write(payload=breach.to_dict(), table='events')
+                    notifier.notify(
+                        message=f'experiment {exp_id} stopped: {breach.reason}'
+                        )
+
+            # After the safety check, but ahead of writing anything out to
+            # Drops, as external instruments wait on them
+            transitions = detector.update(
+                data_infos=data_infos, block=block, received=received
+                )
+
+            for transition in transitions:
+                bus.publish(transition=transition)
+                db.write(payload=transition.to_dict(), table='events')
+
+            for sink in sinks:
+                write_rows(
+                    db=db,
+                    rows=sink.policy.reduce(block),
+                    sink=sink,
+                    time_base=time_base,
+                    start_time=start_time
+                    )
+
+            for summary in summaries:
+                db.write(payload=summary.to_dict(), table='cycles')
+
             payload = parse_payload(raw_data=current_values, raw_metadata=data_infos)
+            payload['timestamp'] = anchor.to_utc_ns(
+                current_values['ElapsedTime']
+                )
             db.write(payload=payload, table='biologic')
-            experiment_.check_status(state=current_values['State'])
+
+            if store is not None and len(block) > 0:
+                cursor = float(block['time'][-1])
+                store.acknowledge(run_id=run_id, cursor=cursor)
 
     except Exception as e:
         pill.set()
         logging.error(e)
 
+        # Nothing checks the limits from here on, so don't leave the
+        # channel running without them
+        if limits.rules and breach is None:
+            breach = Breach(
+                rule='error',
+                reason=f'acquisition failed, limits unchecked: {e}',
+                instrument_time=None
+                )
+            experiment_.stop_reason = breach.reason
+
+            try:
+                potentiostat.stop_channel()
+            except Exception as stop_error:
+                logging.error(stop_error)
+
+            try:
+                db.write(payload=breach.to_dict(), table='events')
+            except Exception as write_error:
+                logging.error(write_error)
+
+            notifier.notify(
+                message=f'experiment {exp_id} stopped: {breach.reason}'
+                )
+
     finally:
-        message = f'experiment {raw_params["exp_id"]} finished'
-        slackbot.post(
-            message=message,
-            user_id=slack_user_id,
-            url=slack_channel_url
+        for sink in sinks:
+            try:
+                write_rows(
+                    db=db,
+                    rows=sink.policy.flush(),
+                    sink=sink,
+                    time_base=time_base,
+                    start_time=start_time
+                    )
+            except Exception as e:
+                logging.error(e)
+
+        try:
+            for summary in aggregator.flush():
+                db.write(payload=summary.to_dict(), table='cycles')
+        except Exception as e:
+            logging.error(e)
+
+        if store is not None:
+            store.finish(run_id=run_id)
+
+        # Only the handle, the connection stays open for the next run
+        db.close()
+
+        notifier.notify(message=f'experiment {exp_id} finished')
+
+
+def write_rows(
+    db: Database,
+    rows,
+    sink: Sink,
+    time_base: float = None,
+    start_time: float = 0.0
+    ) -> None:
+    """Writes reduced rows out to sink's table as one payload, if there
+    are any.
+
+    Used by _acquire() and daemon.SinkConsumer. time_base and start_time
+    are passed on to to_payload().
+    """
+
+    if len(rows) > 0:
+        payload = to_payload(
+            rows=rows,
+            encoding=sink.encoding,
+            time_base=time_base,
+            start_time=start_time
             )
+        db.write(payload=payload, table=sink.table)
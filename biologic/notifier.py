@@ -0,0 +1,170 @@
+"""Sends notifications off the acquisition path.
+
+notify() only puts the message on a queue. A background worker sends it,
+retrying with exponential backoff, and coalesces bursts (e.g. dozens of
+channels finishing at once) into a single digest.
+
+Example:
+    notifier = Notifier(backend=SlackBackend(url=slack_channel_url))
+    notifier.notify('experiment brix2/test/test finished')
+"""
+
+import logging
+import queue
+from threading import Lock, Thread
+import time
+
+from biologic import slackbot
+
+
+class SlackBackend:
+    """Posts to a Slack channel through an incoming webhook.
+
+    Attributes:
+        self.url (str): Webhook URL.
+        self.user_id (str): User to tag in each message.
+        self.timeout (float): Seconds to wait for Slack per attempt.
+    """
+
+    def __init__(self, url: str, user_id: str = None, timeout: float = 10):
+        self.url = url
+        self.user_id = user_id
+        self.timeout = timeout
+
+    def send(self, message: str) -> None:
+        slackbot.post(
+            message=message,
+            url=self.url,
+            user_id=self.user_id,
+            timeout=self.timeout
+            )
+
+
+class FileBackend:
+    """Appends messages to a local file, one per line.
+
+    Attributes:
+        self.path (str): File to append to.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def send(self, message: str) -> None:
+        with open(self.path, 'a') as f:
+            f.write(f'{time.strftime("%Y-%m-%d %H:%M:%S")}: {message}\n')
+
+
+def _make_digest(messages: list[str]) -> str:
+    """Merges coalesced messages into one.
+
+    Helper function for Notifier.
+
+    Args:
+        messages (list[str]): Messages in the order they arrived.
+
+    Returns:
+        str: The message itself if there's only one.
+    """
+
+    if len(messages) == 1:
+        return messages[0]
+
+    lines = '\n'.join(f'- {message}' for message in messages)
+
+    return f'{len(messages)} notifications:\n{lines}'
+
+
+class Notifier:
+    """Queues messages and sends them from a background thread.
+
+    Attributes:
+        self.backend: Anything with a send(message: str) method.
+        self.coalesce_window (float): Seconds to keep collecting messages
+            after the first before sending them as one.
+        self.retries (int): Attempts after the first before a digest is
+            dropped.
+        self.backoff (float): Seconds before the first retry, doubled on
+            each following one.
+    """
+
+    def __init__(
+        self,
+        backend,
+        coalesce_window: float = 5.0,
+        retries: int = 3,
+        backoff: float = 1.0,
+        maxsize: int = 1000
+        ):
+        """
+        Args:
+            maxsize (int, optional): Messages to buffer before new ones are
+                dropped. Defaults to 1000.
+        """
+
+        self.backend = backend
+        self.coalesce_window = coalesce_window
+        self.retries = retries
+        self.backoff = backoff
+
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._thread: Thread = None
+        self._lock = Lock()
+
+    def notify(self, message: str) -> None:
+        """Queues a message. Never blocks.
+
+        Args:
+            message (str): The message to be sent.
+        """
+
+        self._start()
+
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            logging.error(f'Notification queue full, dropped: {message}')
+
+    def flush(self) -> None:
+        """Blocks until every queued message has been sent or dropped."""
+
+        self._queue.join()
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._work, daemon=True)
+                self._thread.start()
+
+    def _work(self) -> None:
+        while True:
+            messages = [self._queue.get()]
+            deadline = time.monotonic() + self.coalesce_window
+
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    messages.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._send(message=_make_digest(messages=messages))
+            finally:
+                for _ in messages:
+                    self._queue.task_done()
+
+    def _send(self, message: str) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                self.backend.send(message)
+
+                return
+            except Exception as e:
+                logging.error(
+                    f'Notification attempt {attempt + 1} failed: {e}'
+                    )
+
+                if attempt < self.retries:
+                    time.sleep(self.backoff * 2**attempt)
+
+        logging.error(f'Notification dropped: {message}')
@@ -0,0 +1,382 @@
+"""Validates experiment steps against per-technique schemas.
+
+Steps used to be an untyped dict, keyed by technique name with digits
+tacked on to repeat a technique (OCV1, OCV2), and a wrong label or type
+only surfaced deep inside BL_LoadTechnique. Now every step is checked
+against the schema of its technique (names, types, ranges) when the
+experiment is submitted, and turned into an immutable, hashable Step.
+Identical step sequences compile to the same technique parameters once,
+and are shared between channels from then on.
+
+Steps are an ordered list:
+
+    'steps': [
+        {'technique': 'OCV', 'params': {'Rest_time_T': 3.0}},
+        {'technique': 'CPLIMIT', 'params': {'Current_step': -1.0, ...}},
+        {'technique': 'OCV', 'params': {'Rest_time_T': 3.0}},
+        {'technique': 'CA', 'params': {
+            'Voltage_step': [0.1, 0.2], 'Duration_step': [5.0, 5.0]
+            }},
+        ]
+
+Techniques with several steps (CA, CPLIMIT, CV) take a list wherever a
+parameter differs per step, a single value otherwise.
+
+The legacy dict, e.g. {'OCV1': {...}, 'CPLIMIT1': {...}}, is still
+accepted.
+
+Example:
+    steps = parse_steps(raw_steps=raw_params['steps'])
+    technique_paths, c_tecc_params = compile_steps(steps=steps)
+"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+import re
+import typing
+
+from biologic.exceptions import PlanValidationError, TechniqueFileError
+from biologic.registry import get_registry
+from biologic.structures import EccParams
+from biologic.techniques import set_technique_params
+
+Value = typing.Union[float, int, bool, tuple]
+
+
+@dataclass(frozen=True)
+class ParamSpec:
+    """What a technique parameter accepts.
+
+    Attributes:
+        self.type_ (type): float, int or bool, which decides how it's
+            passed to the driver.
+        self.unit (str): For documentation, e.g. 'V'.
+        self.minimum (float): Inclusive, None if unbounded.
+        self.maximum (float): Inclusive, None if unbounded.
+        self.required (bool): Whether the step must set it.
+        self.steps (int): How many values a list may hold, one per step
+            of the technique. 1 if it only takes a single value.
+    """
+    type_: type
+    unit: str = ''
+    minimum: float = None
+    maximum: float = None
+    required: bool = False
+    steps: int = 1
+
+    def check(self, label: str, value) -> typing.Union[Value, str]:
+        """Coerces and checks a value, or each value of a list.
+
+        Returns:
+            The value, an int turned float and a list turned tuple if
+                need be, or a description of what's wrong with it.
+        """
+
+        if not isinstance(value, (list, tuple)):
+            return self._check_one(label=label, value=value)
+
+        if self.steps == 1:
+            return f'{label} takes a single value, got {value!r}'
+
+        if not 0 < len(value) <= self.steps:
+            return f'{label} takes 1 to {self.steps} values, got {len(value)}'
+
+        checked = tuple(
+            self._check_one(label=f'{label}[{index}]', value=value_)
+            for index, value_ in enumerate(value)
+            )
+
+        for value_ in checked:
+            if isinstance(value_, str):
+                return value_
+
+        return checked
+
+    def _check_one(self, label: str, value) -> typing.Union[Value, str]:
+        # bool is a subclass of int, but must never pass for one
+        if self.type_ is bool:
+            if not isinstance(value, bool):
+                return f'{label} must be a bool, got {value!r}'
+
+            return value
+
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return f'{label} must be a {self.type_.__name__}, got {value!r}'
+
+        if self.type_ is int and not isinstance(value, int):
+            return f'{label} must be an int, got {value!r}'
+
+        value = self.type_(value)
+
+        if self.minimum is not None and value < self.minimum:
+            return f'{label} = {value} below {self.minimum} {self.unit}'.strip()
+
+        if self.maximum is not None and value > self.maximum:
+            return f'{label} = {value} above {self.maximum} {self.unit}'.strip()
+
+        return value
+
+
+# Most steps a single CA, CP or CPLIMIT technique can hold
+MAX_STEPS = 100
+
+RECORDING = {
+    'Record_every_dT': ParamSpec(float, 's', minimum=0),
+    'Record_every_dE': ParamSpec(float, 'V', minimum=0),
+    'E_Range': ParamSpec(int, minimum=0, maximum=3),
+    }
+
+# Technique name, i.e. ecc-file name in upper case: label: spec
+SCHEMAS: dict[str, dict[str, ParamSpec]] = {
+    'OCV': {
+        'Rest_time_T': ParamSpec(float, 's', minimum=0, required=True),
+        **RECORDING,
+        },
+    'CA': {
+        'Voltage_step': ParamSpec(
+            float, 'V', minimum=-10, maximum=10, required=True,
+            steps=MAX_STEPS
+            ),
+        'Duration_step': ParamSpec(
+            float, 's', minimum=0, required=True, steps=MAX_STEPS
+            ),
+        'vs_initial': ParamSpec(bool, steps=MAX_STEPS),
+        'Step_number': ParamSpec(int, minimum=0, maximum=MAX_STEPS - 2),
+        'Record_every_dT': ParamSpec(float, 's', minimum=0),
+        'Record_every_dI': ParamSpec(float, 'A', minimum=0),
+        'N_Cycles': ParamSpec(int, minimum=0),
+        'I_Range': ParamSpec(int, minimum=0),
+        'E_Range': ParamSpec(int, minimum=0, maximum=3),
+        'Bandwidth': ParamSpec(int, minimum=1, maximum=9),
+        },
+    'CPLIMIT': {
+        'Current_step': ParamSpec(float, 'A', required=True, steps=MAX_STEPS),
+        'Duration_step': ParamSpec(
+            float, 's', minimum=0, required=True, steps=MAX_STEPS
+            ),
+        'Step_number': ParamSpec(int, minimum=0, maximum=MAX_STEPS - 2),
+        'vs_initial': ParamSpec(bool, steps=MAX_STEPS),
+        'Voltage_limit': ParamSpec(
+            float, 'V', minimum=-10, maximum=10, steps=MAX_STEPS
+            ),
+        'Exit_Cond': ParamSpec(int, minimum=0, maximum=2),
+        'N_Cycles': ParamSpec(int, minimum=0),
+        'I_Range': ParamSpec(int, minimum=0),
+        **RECORDING,
+        },
+    # Five vertices: Ei, E1, E2, Ei again and Ef, the latter two only
+    # used by the last cycle.
+    'CV': {
+        'Voltage_step': ParamSpec(
+            float, 'V', minimum=-10, maximum=10, required=True, steps=5
+            ),
+        'Scan_Rate': ParamSpec(
+            float, 'mV/s', minimum=0, required=True, steps=5
+            ),
+        'vs_initial': ParamSpec(bool, steps=5),
+        'Scan_number': ParamSpec(int, minimum=2, maximum=2),
+        'Record_every_dE': ParamSpec(float, 'V', minimum=0),
+        'Average_over_dE': ParamSpec(bool),
+        'N_Cycles': ParamSpec(int, minimum=0),
+        'Begin_measuring_I': ParamSpec(float, minimum=0, maximum=1),
+        'End_measuring_I': ParamSpec(float, minimum=0, maximum=1),
+        'I_Range': ParamSpec(int, minimum=0),
+        'E_Range': ParamSpec(int, minimum=0, maximum=3),
+        'Bandwidth': ParamSpec(int, minimum=1, maximum=9),
+        },
+    'LOOP': {
+        'loop_N_times': ParamSpec(int, minimum=0, required=True),
+        'protocol_number': ParamSpec(int, minimum=0, required=True),
+        },
+    }
+
+
+def _check_steps(params: dict[str, Value]) -> list[str]:
+    """Checks that per-step lists agree with each other and Step_number.
+
+    Helper function for parse_steps().
+
+    Returns:
+        list[str]: Problems found, empty if none.
+    """
+
+    lengths = {
+        label: len(value) for label, value in params.items()
+        if isinstance(value, tuple) and len(value) > 1
+        }
+
+    if len(set(lengths.values())) > 1:
+        return [f'per-step lists differ in length: {lengths}']
+
+    step_number = params.get('Step_number')
+
+    if lengths and step_number is not None:
+        length = next(iter(lengths.values()))
+
+        if step_number != length - 1:
+            return [f'Step_number = {step_number} but {length} steps given']
+
+    return list()
+
+
+@dataclass(frozen=True)
+class Step:
+    """A validated technique and its parameters.
+
+    Attributes:
+        self.technique (str): E.g. 'OCV', a key of SCHEMAS.
+        self.params (tuple[tuple[str, Value], ...]): Label, value pairs
+            in the order given. Per-step lists are tuples.
+    """
+    technique: str
+    params: tuple[tuple[str, Value], ...]
+
+    @property
+    def ecc_path(self) -> str:
+        """See registry.Registry.path()."""
+
+        return get_registry().path(technique=self.technique)
+
+    def as_dict(self) -> dict[str, Value]:
+        return dict(self.params)
+
+
+def _normalize(raw_steps) -> list[tuple[str, dict]]:
+    """Turns either form of steps into (technique, params) pairs.
+
+    Helper function for parse_steps().
+    """
+
+    if isinstance(raw_steps, dict):
+        # Legacy: digits were only there to keep the keys unique
+        return [
+            (re.sub('[0-9]', '', name), params)
+            for name, params in raw_steps.items()
+            ]
+
+    if not isinstance(raw_steps, list):
+        raise PlanValidationError(message='steps must be a list')
+
+    pairs = list()
+
+    for index, raw_step in enumerate(raw_steps):
+        if not isinstance(raw_step, dict) or 'technique' not in raw_step:
+            raise PlanValidationError(
+                message=f'Step {index} must be a dict with a technique'
+                )
+
+        pairs.append((raw_step['technique'], raw_step.get('params', dict())))
+
+    return pairs
+
+
+def parse_steps(raw_steps) -> tuple[Step, ...]:
+    """Validates steps against SCHEMAS.
+
+    Args:
+        raw_steps (list[dict] or dict): See module docstring.
+
+    Raises:
+        PlanValidationError: Listing every problem found.
+
+    Returns:
+        tuple[Step, ...]: In the order they'll run.
+    """
+
+    pairs = _normalize(raw_steps=raw_steps)
+    steps = list()
+    errors = list()
+
+    if not pairs:
+        errors.append('No steps')
+
+    for index, (technique, params) in enumerate(pairs):
+        technique = str(technique).upper()
+        prefix = f'Step {index} ({technique})'
+        schema = SCHEMAS.get(technique)
+
+        if schema is None:
+            errors.append(
+                f'{prefix}: unknown technique, choose from {list(SCHEMAS)}'
+                )
+            continue
+
+        if not isinstance(params, dict):
+            errors.append(f'{prefix}: params must be a dict')
+            continue
+
+        checked = list()
+
+        for label, value in params.items():
+            if label not in schema:
+                errors.append(f'{prefix}: unknown parameter {label}')
+                continue
+
+            value = schema[label].check(label=label, value=value)
+
+            if isinstance(value, str):
+                errors.append(f'{prefix}: {value}')
+            else:
+                checked.append((label, value))
+
+        for label, spec in schema.items():
+            if spec.required and label not in params:
+                errors.append(f'{prefix}: {label} missing')
+
+        errors += [
+            f'{prefix}: {error}' for error in _check_steps(dict(checked))
+            ]
+
+        # The driver only runs as many steps as Step_number says
+        longest = max(
+            (len(value) for _, value in checked if isinstance(value, tuple)),
+            default=1
+            )
+
+        if 'Step_number' in schema and 'Step_number' not in params and (
+            longest > 1
+            ):
+            checked.append(('Step_number', longest - 1))
+
+        protocol_number = dict(checked).get('protocol_number')
+
+        if protocol_number is not None and protocol_number >= index:
+            errors.append(f'{prefix}: protocol_number must be an earlier step')
+
+        steps.append(Step(technique=technique, params=tuple(checked)))
+
+    if errors:
+        raise PlanValidationError(message='; '.join(errors))
+
+    return tuple(steps)
+
+
+@lru_cache(maxsize=128)
+def compile_steps(
+    steps: tuple[Step, ...]
+    ) -> tuple[tuple[str, ...], tuple[EccParams, ...]]:
+    """Compiles validated steps, once per distinct sequence.
+
+    The result is shared by every caller with the same steps, so it must
+    not be modified.
+
+    Args:
+        steps (tuple[Step, ...]): From parse_steps().
+
+    Raises:
+        PlanValidationError: If a technique has no file.
+
+    Returns:
+        tuple[str, ...]: Technique ecc-file paths.
+        tuple[EccParams, ...]: Technique parameters ready to be passed
+            to Potentiostat.load_technique().
+    """
+
+    try:
+        technique_paths = tuple(step.ecc_path for step in steps)
+    except TechniqueFileError as e:
+        raise PlanValidationError(message=e.message)
+
+    c_tecc_params = set_technique_params([step.as_dict() for step in steps])
+
+    return technique_paths, tuple(c_tecc_params)
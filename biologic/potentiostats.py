@@ -1,10 +1,17 @@
 """Classes containing methods for using EC-Lab drivers to communicate with BioLogic potentiostat."""
 
+from collections import defaultdict
 import ctypes
-import json
 import typing
 
+import numpy as np
+
+from biologic import commands
+from biologic.capture import capturing
+from biologic.config_store import get_store
 from biologic.constants import Device
+from biologic.decoding import SweepTagger, decode
+from biologic.prototypes import load_driver
 from biologic.structures import (
     DeviceInfos,
     EccParams,
@@ -13,20 +20,24 @@ from biologic.structures import (
     DataInfos
 )
 from biologic.utils import (
-    assert_finder_ok,
-    assert_status_ok,
+    DRIVERPATH,
     assert_device_type_ok,
     assert_one_device,
+    assert_status_ok,
     parse_potentiostat_search,
     structure_to_dict,
     parse_channel_info,
     parse_proposed_ip
 )
 
-with open('biologic\\config.json', 'r') as f:
-    settings = json.load(f)
+settings = get_store().snapshot()
+
+# Address of a driver_host.DriverHost, if the DLLs run out of process
+DRIVER_HOST = settings.get('driver_host')
+# File to record every BL_GetData call to, see capture.py
+CAPTURE_PATH = settings.get('capture_path')
 
-DRIVERPATH = settings['driverpath']
+DATA_BUFFER_SIZE = 1000  # uint32s, as defined by the EC-Lab library
 
 
 class InstrumentFinder:
@@ -43,7 +54,9 @@ class InstrumentFinder:
             driver (str, optional): Driver filename. For distinguishing
                 between 32 and 64-bit systems. Defaults to 'blfind64.dll'.
         """
-        self.driver = ctypes.WinDLL(DRIVERPATH + driver)
+        self.driver = load_driver(
+            path=DRIVERPATH + driver, finder=True, host=DRIVER_HOST
+            )
         self._usb_port: str = None
         self._instrument_type: str = None
 
@@ -66,14 +79,13 @@ class InstrumentFinder:
         return str(self._instrument_type)
 
     def save(self):
-        with open('biologic\\config.json', 'r') as f:
-            config = json.load(f)
-
-        config['usb_port'] = self.usb_port
-        config['instrument_type'] = self.instrument_type
+        """Makes the instrument found the one to connect to, see
+        config_store.py.
+        """
 
-        with open('biologic\\config.json', 'w') as f:
-            json.dump(config, f)
+        get_store().update(
+            usb_port=self.usb_port, instrument_type=self.instrument_type
+            )
 
     def find(self, bytes_: int = 255) -> None:
         """Searches for ethernet-connected BioLogic potentiostats.
@@ -87,13 +99,12 @@ class InstrumentFinder:
         size = ctypes.c_uint32(bytes_)
         nbr_dev = ctypes.c_uint32(bytes_)
 
-        status = self.driver.BL_FindEChemEthDev(
-            ctypes.byref(lst_dev),
+        self.driver.BL_FindEChemEthDev(
+            lst_dev,
             ctypes.byref(size),
             ctypes.byref(nbr_dev)
         )
 
-        assert_finder_ok(driver=self.driver, return_code=status)
         assert_one_device(c_nbr_dev=nbr_dev)
 
         self._usb_port, self._instrument_type = parse_potentiostat_search(
@@ -109,11 +120,7 @@ class InstrumentFinder:
         new_ip_parsed = parse_proposed_ip(proposed_ip=new_ip)
         cfg = ctypes.c_buffer(new_ip_parsed.encode())
 
-        status = self.driver.BL_SetConfig(
-            ctypes.byref(c_ip), ctypes.byref(cfg)
-        )
-
-        assert_finder_ok(driver=self.driver, return_code=status)
+        self.driver.BL_SetConfig(c_ip, cfg)
 
 
 class Potentiostat:
@@ -123,12 +130,17 @@ class Potentiostat:
     as opposed to subclass Config, which contains methods for setting up,
     debugging, and configuring new ones.
 
+    Every call on the connection goes through its command serializer, see
+    commands.py, so the channel can be stopped from any thread at any time.
+
     Attributes:
         self.channel (int): The channel on which the potentiostat resides.
         self._type (str): Potentiostat type.
         self._id (ctypes.c_int32): Potentistat id, passed to all functions
             calling instrument.
         self._device_info (DeviceInfo):
+        self.driver: The loaded EC-Lab library, or anything exposing the
+            same BL_* functions, e.g. simulator.SimulatedDriver.
 
     Raises:
         ECLibError: All class class methods use the EC-lib DLL
@@ -141,12 +153,14 @@ class Potentiostat:
         self,
         channel: int = 0,
         type_: str = None,
-        driver: str = 'EClib64.dll'
+        driver: typing.Union[str, object] = 'EClib64.dll'
         ):
         """Initialize the potentiostat driver.
 
         Args:
             type_ (str, optional): Device type, e.g. 'KBIO_DEV_HCP1005'.
+            driver (str or object, optional): Driver filename, or a
+                driver object to use as is. Defaults to 'EClib64.dll'.
         
         Raises:
             WindowsError: If driver isn't found.
@@ -157,8 +171,31 @@ class Potentiostat:
 
         self._id = None
         self._device_info = None
+        # Raw data is retrieved in an array of integers, reused across calls
+        self._data_buffer = (ctypes.c_uint32 * DATA_BUFFER_SIZE)()
+        self._sweeps = SweepTagger()
 
-        self.driver = ctypes.WinDLL(DRIVERPATH + driver)
+        if isinstance(driver, str):
+            driver = load_driver(path=DRIVERPATH + driver, host=DRIVER_HOST)
+
+            if CAPTURE_PATH is not None:
+                driver = capturing(driver=driver, path=CAPTURE_PATH)
+
+        self.driver = driver
+
+    @property
+    def is_connected(self) -> bool:
+        """Whether connect() has been called without a disconnect() since."""
+
+        return self._id is not None
+
+    @property
+    def commands(self) -> commands.CommandSerializer:
+        """Serializer of the connection handle, shared by all channels
+        on it.
+        """
+
+        return commands.for_handle(handle=self._id.value)
 
     def connect(self, usb_port: str, timeout: int = 5) -> None:
         """Connects to instrument and returns device info.
@@ -177,13 +214,11 @@ class Potentiostat:
         self._id = ctypes.c_int32()
         self._device_info = DeviceInfos()
 
-        status = self.driver.BL_Connect(
-            ctypes.byref(address), ctypes.c_uint8(timeout),
+        self.driver.BL_Connect(
+            address, timeout,
             ctypes.byref(self._id), ctypes.byref(self._device_info)
             )
 
-        assert_status_ok(driver=self.driver, return_code=status)
-
         assert_device_type_ok(
             device_code=self._device_info.DeviceCode,
             reference_device=self._type
@@ -211,7 +246,8 @@ class Potentiostat:
             first = True if index==0 else False
             last = True if index==no_techniques-1 else False
 
-            status = self.driver.BL_LoadTechnique(
+            self.commands.call(
+                self.driver.BL_LoadTechnique,
                 self._id,
                 self.channel,
                 technique_path.encode(),
@@ -221,14 +257,17 @@ class Potentiostat:
                 False,
             )
 
-            assert_status_ok(driver=self.driver, return_code=status)
-
     def start_channel(self) -> None:
         """Starts technique loaded on channel."""
 
-        status = self.driver.BL_StartChannel(self._id, self.channel)
+        self._sweeps.reset()
 
-        assert_status_ok(driver=self.driver, return_code=status)
+        self.commands.start(
+            self.driver.BL_StartChannel,
+            self._id,
+            self.channel,
+            channel=self.channel
+            )
 
     def get_current_values(self) -> dict:
         """Get the current values for the spcified channel.
@@ -238,16 +277,20 @@ class Potentiostat:
         
         Returns:
             dict: A dict of current values information
+
+        Raises:
+            commands.Dropped: If the channel is being stopped.
         """
 
         c_current_values = CurrentValues()
 
-        status = self.driver.BL_GetCurrentValues(
-            self._id, self.channel, ctypes.byref(c_current_values)
+        self.commands.poll(
+            self.driver.BL_GetCurrentValues,
+            self._id,
+            self.channel,
+            ctypes.byref(c_current_values)
             )
 
-        assert_status_ok(driver=self.driver, return_code=status)
-
         current_values = structure_to_dict(c_current_values)
 
         return current_values
@@ -261,17 +304,19 @@ class Potentiostat:
             data_infos (dict): Metadata, most importantly cycle number
                 (loop number).
             current_values (dict): Current values like time, Ewe and I.
+
+        Raises:
+            commands.Dropped: If the channel is being stopped.
         """
 
-        # Raw data is retrieved in an array of integers
-        c_databuffer = (ctypes.c_uint32 * 1000)()
         p_data_buffer = ctypes.cast(
-            c_databuffer, ctypes.POINTER(ctypes.c_uint32)
+            self._data_buffer, ctypes.POINTER(ctypes.c_uint32)
             )
         c_data_infos = DataInfos()
         c_current_values = CurrentValues()
 
-        status = self.driver.BL_GetData(
+        self.commands.poll(
+            self.driver.BL_GetData,
             self._id,
             self.channel,
             p_data_buffer,
@@ -279,51 +324,147 @@ class Potentiostat:
             ctypes.byref(c_current_values),
             )
 
-        assert_status_ok(driver=self.driver, return_code=status)
-
         data_infos = structure_to_dict(c_data_infos)
         current_values = structure_to_dict(c_current_values)
 
         return data_infos, current_values
 
-    def stop_channel(self) -> None:
-        """Stops technique loaded on channel."""
+    def get_block(self) -> tuple[dict, dict, np.ndarray]:
+        """Get data for the specified channel, including every point
+        recorded since the last call.
+
+        Returns:
+            data_infos (dict): Metadata, most importantly cycle number
+                (loop number).
+            current_values (dict): Current values like time, Ewe and I.
+            block (np.ndarray): Decoded data buffer, see
+                decoding.BLOCK_DTYPE. CV sweeps are tagged.
 
-        status = self.driver.BL_StopChannel(self._id, self.channel)
+        Raises:
+            commands.Dropped: If the channel is being stopped.
+        """
 
-        assert_status_ok(driver=self.driver, return_code=status)
+        data_infos, current_values = self.get_data()
+        block = decode(
+            buffer=self._data_buffer,
+            data_infos=data_infos,
+            time_base=current_values['TimeBase']
+            )
+        self._sweeps.tag(block=block)
+
+        return data_infos, current_values, block
+
+    def stop_channel(self) -> float:
+        """Stops technique loaded on channel, ahead of any other call.
+
+        Returns:
+            float: Stop latency, see commands.CommandSerializer.stop() (s).
+        """
+
+        return self.commands.stop(
+            self.driver.BL_StopChannel,
+            self._id,
+            self.channel,
+            channels=[self.channel]
+            )
 
     def disconnect(self) -> None:
         """Disconnects from device."""
 
-        status = self.driver.BL_Disconnect(self._id)
-
-        assert_status_ok(driver=self.driver, return_code=status)
+        self.commands.call(self.driver.BL_Disconnect, self._id)
 
         self._id = None
         self._device_info = None
 
 
+def is_full(data_infos: dict) -> bool:
+    """Whether a BL_GetData call returned as many rows as fit the buffer.
+
+    If so, more points are likely waiting on the instrument, e.g. a CV at
+    a high scan rate, and the channel should be polled again right away.
+    """
+
+    no_cols = data_infos['NbCols']
+
+    if no_cols == 0:
+        return False
+
+    return data_infos['NbRaws'] >= DATA_BUFFER_SIZE // no_cols
+
+
+def stop_channels(potentiostats: list[Potentiostat]) -> list[float]:
+    """Stops several channels at once.
+
+    Channels sharing a connection are stopped with a single
+    BL_StopChannels request.
+
+    Args:
+        potentiostats (list[Potentiostat]): Connected, one per channel.
+
+    Raises:
+        ECLibError: If any channel failed to stop. The others are
+            stopped regardless.
+
+    Returns:
+        list[float]: Stop latency per potentiostat (s).
+    """
+
+    handles = defaultdict(list)
+
+    for potentiostat in potentiostats:
+        handles[potentiostat._id.value].append(potentiostat)
+
+    latencies = dict()
+    results = list()
+
+    for group in handles.values():
+        first: Potentiostat = group[0]
+        channels = [potentiostat.channel for potentiostat in group]
+
+        c_channels = (ctypes.c_uint8 * len(channels))(*channels)
+        c_results = (ctypes.c_int32 * len(channels))()
+
+        latency = first.commands.stop(
+            first.driver.BL_StopChannels,
+            first._id,
+            c_channels,
+            c_results,
+            len(channels),
+            channels=channels
+            )
+
+        for potentiostat, result in zip(group, c_results):
+            latencies[id(potentiostat)] = latency
+            results.append((first.driver, result))
+
+    for driver, result in results:
+        assert_status_ok(driver=driver, return_code=result)
+
+    return [latencies[id(potentiostat)] for potentiostat in potentiostats]
+
+
 class HCP1005(Potentiostat):
     """Specific driver for the HCP-1005 potentiostat"""
 
-    def __init__(self):
+    def __init__(self, channel: int = 0):
         """Initialize the HCP-1005 potentiostat driver.
         Refer to superclass initializer for arguments.
         """
 
-        super(HCP1005, self).__init__(type_='KBIO_DEV_HCP1005')
+        super(HCP1005, self).__init__(
+            channel=channel, type_='KBIO_DEV_HCP1005'
+            )
 
 
 class SP150(Potentiostat):
     """Specific driver for the SP-150 potentiostat"""
 
-    def __init__(self):
-        """Initialize the HCP-1005 potentiostat driver.
+    def __init__(self, channel: int = 0):
+        """Initialize the SP-150 potentiostat driver.
         Refer to superclass initializer for arguments.
         """
 
-        super(SP150, self).__init__(type_='KBIO_DEV_SP150')
+        super(SP150, self).__init__(channel=channel, type_='KBIO_DEV_SP150')
 
 
 class Config(Potentiostat):
@@ -332,11 +473,42 @@ class Config(Potentiostat):
 
     It does not explicitly contain any of the methods
     for running experiments but calling Potentiostat.connect()
-    is necessary to run the config.
+    is necessary to run the config. Alternatively, sharing() borrows the
+    connection of a potentiostat that is connected already.
     """
 
-    def __init__(self, type):
-        super(Config, self).__init__(type_=type)
+    def __init__(
+        self, type, driver: typing.Union[str, object] = 'EClib64.dll'
+        ):
+        super(Config, self).__init__(type_=type, driver=driver)
+
+    @classmethod
+    def sharing(cls, potentiostat: Potentiostat) -> 'Config':
+        """A Config on the connection of a connected potentiostat, e.g.
+        a scheduler's, rather than on one of its own.
+
+        Its calls go through the same command serializer, so they never
+        interleave with the owner's. Disconnecting is left to the owner.
+
+        Args:
+            potentiostat (Potentiostat): Connected.
+
+        Raises:
+            ConnectionError: If potentiostat isn't connected.
+        """
+
+        # Read once, the owner may disconnect meanwhile
+        handle, device_info = potentiostat._id, potentiostat._device_info
+
+        if handle is None:
+            raise ConnectionError('Not connected, nothing to share')
+
+        config = cls(type=potentiostat._type, driver=potentiostat.driver)
+        config.channel = potentiostat.channel
+        config._id = handle
+        config._device_info = device_info
+
+        return config
 
     @property
     def device_info(self) -> dict:
@@ -351,7 +523,7 @@ class Config(Potentiostat):
             return None
 
         out = structure_to_dict(self._device_info)
-        out['DeviceCode(translated)'] = Device(out['DeviceCode']).value
+        out['DeviceCode(translated)'] = Device(out['DeviceCode']).name
 
         return out
 
@@ -370,8 +542,11 @@ class Config(Potentiostat):
 
         c_channel_info = ChannelInfos()
 
-        self.driver.BL_GetChannelInfos(
-            self._id, self.channel, ctypes.byref(c_channel_info)
+        self.commands.call(
+            self.driver.BL_GetChannelInfos,
+            self._id,
+            self.channel,
+            ctypes.byref(c_channel_info)
             )
 
         channel_info = structure_to_dict(
@@ -393,12 +568,10 @@ class Config(Potentiostat):
         status_ = (ctypes.c_uint8 * no_channels)()
         pstatus = ctypes.cast(status_, ctypes.POINTER(ctypes.c_uint8))
 
-        status = self.driver.BL_GetChannelsPlugged(
-            self._id, pstatus, no_channels
+        self.commands.call(
+            self.driver.BL_GetChannelsPlugged, self._id, pstatus, no_channels
             )
 
-        assert_status_ok(driver=self.driver, return_code=status)
-
         return [result == 1 for result in status_]
 
     def get_error_status(self):
@@ -407,13 +580,14 @@ class Config(Potentiostat):
         c_opt_error = ctypes.c_int32()
         c_opt_pos = ctypes.c_int32()
 
-        status = self.driver.BL_GetOptErr(
-            self._id, self.channel, ctypes.byref(c_opt_error),
+        self.commands.call(
+            self.driver.BL_GetOptErr,
+            self._id,
+            self.channel,
+            ctypes.byref(c_opt_error),
             ctypes.byref(c_opt_pos)
             )
 
-        assert_status_ok(driver=self.driver, return_code=status)
-
     def is_channel_plugged(self) -> bool:
         """Test if the selected channel is plugged.
 
@@ -425,8 +599,8 @@ class Config(Potentiostat):
             bool: Whether the channel is plugged or not.
         """
 
-        result = self.driver.BL_IsChannelPlugged(
-            self._id, self.channel
+        result = self.commands.call(
+            self.driver.BL_IsChannelPlugged, self._id, self.channel
             )
 
         return bool(result)
@@ -441,13 +615,14 @@ class Config(Potentiostat):
         size = ctypes.c_uint32(255)
         message = ctypes.c_buffer(255)
 
-        status = self.driver.BL_GetMessage(
-            self._id, self.channel, ctypes.byref(message),
+        self.commands.call(
+            self.driver.BL_GetMessage,
+            self._id,
+            self.channel,
+            message,
             ctypes.byref(size)
             )
 
-        assert_status_ok(driver=self.driver, return_code=status)
-
         return message.value.decode()
 
 
@@ -495,22 +670,24 @@ class Config(Potentiostat):
         xlx_file: str = DRIVERPATH + xlx
         c_xlx_file = ctypes.c_buffer(xlx_file.encode())
 
-        status = self.driver.BL_LoadFirmware(
-            self._id, p_channels, ctypes.byref(c_results),
-            len(channels), show_gauge, force_reload,
-            ctypes.byref(c_bin_file), ctypes.byref(c_xlx_file)
+        self.commands.call(
+            self.driver.BL_LoadFirmware,
+            self._id,
+            p_channels,
+            c_results,
+            len(channels),
+            show_gauge,
+            force_reload,
+            c_bin_file,
+            c_xlx_file
             )
 
-        assert_status_ok(driver=self.driver, return_code=status)
-
         return list(c_results)
 
     def test_connection(self) -> None:
         """Tests device connection."""
 
-        status = self.driver.BL_TestConnection(self._id)
-
-        assert_status_ok(driver=self.driver, return_code=status)
+        self.commands.call(self.driver.BL_TestConnection, self._id)
 
     def test_communication_speed(self) -> typing.List[str]:
         """Tests communication speed between computer and instrument.
@@ -522,13 +699,14 @@ class Config(Potentiostat):
         c_spd_rcvt = ctypes.c_int32()
         c_spd_kernel = ctypes.c_int32()
 
-        status = self.driver.BL_TestCommSpeed(
-            self._id, self.channel, ctypes.byref(c_spd_rcvt),
+        self.commands.call(
+            self.driver.BL_TestCommSpeed,
+            self._id,
+            self.channel,
+            ctypes.byref(c_spd_rcvt),
             ctypes.byref(c_spd_kernel)
             )
 
-        assert_status_ok(driver=self.driver, return_code=status)
-
         # print(
         #     'communication speed between library and device:',
         #     c_spd_rcvt.value
@@ -0,0 +1,263 @@
+"""Instrumentation of EC-Lab driver calls for finding out where time goes.
+
+Every driver handle is wrapped in a DriverProxy (see instrument()). While
+profiling is disabled the proxy simply forwards BL_* calls. Once enabled
+it records per-function call counts, latencies and return codes, as well
+as a collapsed-stack trace that can be fed directly to flamegraph.pl or
+speedscope.
+
+Example:
+    driver = instrument(ctypes.WinDLL('drivers\\EClib64.dll'))
+    profiler.enable()
+    ...  # Run experiment
+    stats = profiler.stats()
+    trace = profiler.trace()
+"""
+
+from collections import Counter, deque
+import sys
+import threading
+import time
+import typing
+
+DRIVER_PREFIX = 'BL_'
+
+
+class FunctionStats:
+    """Call statistics of a single driver function.
+
+    Attributes:
+        self.count (int): Number of calls.
+        self.total_ns (int): Cumulative latency [ns].
+        self.samples (deque): Most recent latencies [ns], used for
+            percentiles. Bounded to keep memory flat on long runs.
+        self.return_codes (Counter): Return code distribution.
+    """
+
+    def __init__(self, max_samples: int):
+        self.count: int = 0
+        self.total_ns: int = 0
+        self.samples: deque = deque(maxlen=max_samples)
+        self.return_codes: Counter = Counter()
+
+    def record(self, duration_ns: int, return_code) -> None:
+        self.count += 1
+        self.total_ns += duration_ns
+        self.samples.append(duration_ns)
+        self.return_codes[return_code] += 1
+
+    def percentile(self, q: float) -> float:
+        """Nearest-rank percentile of the recorded latencies.
+
+        Args:
+            q (float): Percentile, 0-100.
+
+        Returns:
+            float: Latency [ms]. 0.0 if nothing has been recorded.
+        """
+
+        if len(self.samples) == 0:
+            return 0.0
+
+        ordered = sorted(self.samples)
+        rank = round(q / 100 * (len(ordered) - 1))
+
+        return ordered[rank] / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'total_ms': self.total_ns / 1e6,
+            'mean_ms': self.total_ns / self.count / 1e6,
+            'p50_ms': self.percentile(50),
+            'p90_ms': self.percentile(90),
+            'p99_ms': self.percentile(99),
+            'return_codes': {
+                str(code): n
+                for code, n in self.return_codes.items()
+                },
+            }
+
+
+class Profiler:
+    """Process-wide collector for driver call statistics.
+
+    Attributes:
+        self.max_samples (int): Latency samples kept per function.
+    """
+
+    def __init__(self, max_samples: int = 10000):
+        self.max_samples = max_samples
+
+        self._enabled = False
+        self._lock = threading.Lock()
+        self._functions: dict[str, FunctionStats] = dict()
+        self._stacks: Counter = Counter()
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    def enable(self) -> None:
+        self._enabled = True
+
+    def disable(self) -> None:
+        self._enabled = False
+
+    def reset(self) -> None:
+        """Discards everything recorded so far, e.g. at the start of a run."""
+
+        with self._lock:
+            self._functions = dict()
+            self._stacks = Counter()
+
+    def record(
+        self, name: str, duration_ns: int, return_code, stack: str
+        ) -> None:
+        """Adds a single driver call.
+
+        Args:
+            name (str): Driver function name, e.g. 'BL_GetData'.
+            duration_ns (int): Call latency [ns].
+            return_code: Return value of the call, or the error code
+                of the exception it raised.
+            stack (str): Semicolon-separated caller stack, root first.
+        """
+
+        with self._lock:
+            if name not in self._functions:
+                self._functions[name] = FunctionStats(
+                    max_samples=self.max_samples
+                    )
+
+            self._functions[name].record(
+                duration_ns=duration_ns, return_code=return_code
+                )
+            self._stacks[f'{stack};{name}'] += duration_ns // 1000
+
+    def stats(self) -> dict:
+        """Returns call statistics per driver function.
+
+        Returns:
+            dict: Function name -> count, latencies [ms] and return code
+                distribution.
+        """
+
+        with self._lock:
+            return {
+                name: stats.to_dict()
+                for name, stats in self._functions.items()
+                }
+
+    def trace(self) -> str:
+        """Returns the recorded calls in collapsed-stack format.
+
+        One line per unique stack, weighted by cumulative time [us],
+        e.g. 'app:run;experiment:run;potentiostats:get_data;BL_GetData 512'.
+
+        Returns:
+            str: Flamegraph-compatible trace.
+        """
+
+        with self._lock:
+            lines = [
+                f'{stack} {weight}'
+                for stack, weight in self._stacks.items()
+                ]
+
+        return '\n'.join(lines)
+
+
+profiler = Profiler()
+
+
+def _caller_stack(depth: int = 2) -> str:
+    """Collapses the Python call stack above a driver call.
+
+    Helper function for DriverProxy.
+
+    Args:
+        depth (int, optional): Number of innermost frames to skip.
+            Defaults to 2, i.e. this function and the proxy wrapper.
+
+    Returns:
+        str: Semicolon-separated stack, root first.
+    """
+
+    frames = list()
+    frame = sys._getframe(depth)
+
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '?')
+        frames.append(f'{module}:{frame.f_code.co_name}')
+        frame = frame.f_back
+
+    return ';'.join(reversed(frames))
+
+
+class DriverProxy:
+    """Wraps a driver handle so that every BL_* call can be profiled.
+
+    All other attributes are forwarded untouched. Wrapped functions are
+    resolved once and then cached on the proxy.
+
+    Attributes:
+        self.driver: The wrapped driver, e.g. a ctypes.WinDLL.
+    """
+
+    def __init__(self, driver, profiler_: Profiler = profiler):
+        self.driver = driver
+        self._profiler = profiler_
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.driver, name)
+
+        if not name.startswith(DRIVER_PREFIX):
+            return attribute
+
+        wrapped = self._wrap(name=name, function=attribute)
+        setattr(self, name, wrapped)
+
+        return wrapped
+
+    def _wrap(self, name: str, function: typing.Callable) -> typing.Callable:
+        profiler_ = self._profiler
+
+        def call(*args):
+            if not profiler_.enabled:
+                return function(*args)
+
+            return_code = None
+            start = time.perf_counter_ns()
+
+            try:
+                return_code = function(*args)
+                return return_code
+            except Exception as e:
+                return_code = getattr(e, 'error_code', type(e).__name__)
+                raise
+            finally:
+                duration_ns = time.perf_counter_ns() - start
+                profiler_.record(
+                    name=name,
+                    duration_ns=duration_ns,
+                    return_code=return_code,
+                    stack=_caller_stack()
+                    )
+
+        call.__name__ = name
+
+        return call
+
+
+def instrument(driver) -> DriverProxy:
+    """Wraps a freshly loaded driver for profiling.
+
+    Args:
+        driver: E.g. ctypes.WinDLL('drivers\\EClib64.dll').
+
+    Returns:
+        DriverProxy: Drop-in replacement for the driver.
+    """
+
+    return DriverProxy(driver=driver)
@@ -0,0 +1,250 @@
+"""Function prototypes for the EC-Lab development package drivers.
+
+Unprototyped ctypes functions guess how to convert each argument on
+every call, and will happily push a wrongly typed argument onto the
+stack. Binding explicit argtypes/restype once per driver makes calls
+cheaper and turns ABI mismatches into a ctypes.ArgumentError before the
+DLL ever sees them.
+
+Functions returning a status code additionally get an errcheck hook, so
+a non-zero status raises straight out of the call. Callers need not
+check return codes themselves.
+
+Function load_driver() is the only one that should be called externally.
+"""
+
+import ctypes
+from ctypes import (
+    POINTER,
+    c_bool,
+    c_char_p,
+    c_float,
+    c_int32,
+    c_uint8,
+    c_uint32
+)
+import typing
+
+from biologic.driver_host import RemoteDriver, library_name, parse_address
+from biologic.profiling import instrument
+from biologic.structures import (
+    ChannelInfos,
+    CurrentValues,
+    DataInfos,
+    DeviceInfos,
+    EccParam,
+    EccParams
+)
+from biologic.utils import assert_finder_ok, assert_status_ok
+
+# name: (restype, argtypes, errcheck). Argument names in comments follow
+# the EC-Lab development package documentation.
+ECLIB_PROTOTYPES = {
+    # address, timeout, ID, DeviceInfos
+    'BL_Connect': (
+        c_int32,
+        [c_char_p, c_uint8, POINTER(c_int32), POINTER(DeviceInfos)],
+        True
+        ),
+    # ID
+    'BL_Disconnect': (c_int32, [c_int32], True),
+    # ID
+    'BL_TestConnection': (c_int32, [c_int32], True),
+    # ID, channel, spd_rcvt, spd_kernel
+    'BL_TestCommSpeed': (
+        c_int32,
+        [c_int32, c_uint8, POINTER(c_int32), POINTER(c_int32)],
+        True
+        ),
+    # ID, pChannels, pResults, Length, ShowGauge, ForceReload, BinFile,
+    # XlxFile
+    'BL_LoadFirmware': (
+        c_int32,
+        [
+            c_int32,
+            POINTER(c_uint8),
+            POINTER(c_int32),
+            c_uint8,
+            c_bool,
+            c_bool,
+            c_char_p,
+            c_char_p
+            ],
+        True
+        ),
+    # ID, pChPlugged, Size
+    'BL_GetChannelsPlugged': (
+        c_int32, [c_int32, POINTER(c_uint8), c_uint8], True
+        ),
+    # ID, channel. Returns a bool, not a status code.
+    'BL_IsChannelPlugged': (c_bool, [c_int32, c_uint8], False),
+    # ID, channel, pInfos
+    'BL_GetChannelInfos': (
+        c_int32, [c_int32, c_uint8, POINTER(ChannelInfos)], True
+        ),
+    # ID, channel, msg, size
+    'BL_GetMessage': (
+        c_int32, [c_int32, c_uint8, c_char_p, POINTER(c_uint32)], True
+        ),
+    # ID, channel, pOptErr, pOptPos
+    'BL_GetOptErr': (
+        c_int32,
+        [c_int32, c_uint8, POINTER(c_int32), POINTER(c_int32)],
+        True
+        ),
+    # ID, channel, pFName, Params, FirstTechnique, LastTechnique,
+    # DisplayParams
+    'BL_LoadTechnique': (
+        c_int32,
+        [c_int32, c_uint8, c_char_p, EccParams, c_bool, c_bool, c_bool],
+        True
+        ),
+    # lbl, value, index, pParam
+    'BL_DefineBoolParameter': (
+        c_int32, [c_char_p, c_bool, c_int32, POINTER(EccParam)], True
+        ),
+    'BL_DefineSglParameter': (
+        c_int32, [c_char_p, c_float, c_int32, POINTER(EccParam)], True
+        ),
+    'BL_DefineIntParameter': (
+        c_int32, [c_char_p, c_int32, c_int32, POINTER(EccParam)], True
+        ),
+    # ID, channel
+    'BL_StartChannel': (c_int32, [c_int32, c_uint8], True),
+    'BL_StopChannel': (c_int32, [c_int32, c_uint8], True),
+    # ID, pChannels, pResults, length
+    'BL_StopChannels': (
+        c_int32, [c_int32, POINTER(c_uint8), POINTER(c_int32), c_uint8], True
+        ),
+    # ID, channel, pValues
+    'BL_GetCurrentValues': (
+        c_int32, [c_int32, c_uint8, POINTER(CurrentValues)], True
+        ),
+    # ID, channel, pBuf, pInfos, pValues
+    'BL_GetData': (
+        c_int32,
+        [
+            c_int32,
+            c_uint8,
+            POINTER(c_uint32),
+            POINTER(DataInfos),
+            POINTER(CurrentValues)
+            ],
+        True
+        ),
+    # num, psgl
+    'BL_ConvertNumericIntoSingle': (
+        c_int32, [c_uint32, POINTER(c_float)], True
+        ),
+    # errorcode, pmsg, psize. Never checked, as the check itself calls it.
+    'BL_GetErrorMsg': (
+        c_int32, [c_int32, c_char_p, POINTER(c_uint32)], False
+        ),
+    }
+
+BLFIND_PROTOTYPES = {
+    # pLstDev, pSize, pNbrDevice
+    'BL_FindEChemEthDev': (
+        c_int32, [c_char_p, POINTER(c_uint32), POINTER(c_uint32)], True
+        ),
+    'BL_FindEChemUsbDev': (
+        c_int32, [c_char_p, POINTER(c_uint32), POINTER(c_uint32)], True
+        ),
+    # pIp, pCfg
+    'BL_SetConfig': (c_int32, [c_char_p, c_char_p], True),
+    # errorcode, pmsg, psize
+    'BL_GetErrorMsg': (
+        c_int32, [c_int32, c_char_p, POINTER(c_uint32)], False
+        ),
+    }
+
+
+def _make_errcheck(
+    driver, assert_ok: typing.Callable
+    ) -> typing.Callable:
+    """Creates an errcheck hook routing return codes through assert_ok.
+
+    Helper function for bind().
+
+    Args:
+        driver: Driver used to translate error codes to messages.
+        assert_ok (typing.Callable): utils.assert_status_ok() or
+            utils.assert_finder_ok().
+
+    Returns:
+        typing.Callable: errcheck(result, function, arguments).
+    """
+
+    def errcheck(result: int, function, arguments: tuple) -> int:
+        assert_ok(driver=driver, return_code=result)
+
+        return result
+
+    return errcheck
+
+
+def bind(
+    driver,
+    prototypes: dict = ECLIB_PROTOTYPES,
+    assert_ok: typing.Callable = assert_status_ok
+    ) -> None:
+    """Declares argtypes, restype and errcheck of every prototyped function.
+
+    Args:
+        driver: A freshly loaded ctypes.WinDLL.
+        prototypes (dict, optional): Name -> (restype, argtypes, errcheck).
+            Defaults to ECLIB_PROTOTYPES.
+        assert_ok (typing.Callable, optional): Return code check.
+            Defaults to utils.assert_status_ok.
+    """
+
+    errcheck = _make_errcheck(driver=driver, assert_ok=assert_ok)
+
+    for name, (restype, argtypes, checked) in prototypes.items():
+        function = getattr(driver, name)
+        function.restype = restype
+        function.argtypes = argtypes
+
+        if checked:
+            function.errcheck = errcheck
+
+
+def load_driver(path: str, finder: bool = False, host: str = None):
+    """Loads and prototypes a driver.
+
+    Args:
+        path (str): Driver path, e.g. 'drivers\\EClib64.dll'.
+        finder (bool, optional): Whether the driver is the instrument
+            finder (blfind64.dll). Defaults to False.
+        host (str, optional): Address of a driver_host.DriverHost to
+            forward calls to instead, e.g. '127.0.0.1:5002'. The host has
+            already prototyped the driver. Defaults to None, i.e. load
+            the DLL in this process.
+
+    Returns:
+        profiling.DriverProxy: Driver with pre-resolved, prototyped
+            BL_* functions.
+
+    Raises:
+        WindowsError: If driver isn't found.
+    """
+
+    if host is not None:
+        driver = RemoteDriver(
+            address=parse_address(address=host), library=library_name(path)
+            )
+
+        return instrument(driver)
+
+    driver = ctypes.WinDLL(path)
+
+    if finder:
+        bind(
+            driver=driver,
+            prototypes=BLFIND_PROTOTYPES,
+            assert_ok=assert_finder_ok
+            )
+    else:
+        bind(driver=driver)
+
+    return instrument(driver)
@@ -0,0 +1,261 @@
+"""The most recent decoded rows of each channel, in memory, by time.
+
+experiment.run used to keep nothing once a block was written out, so the
+last few minutes of a running experiment could only be had from Drops.
+Instead, every decoded block also goes into a bounded ring per channel,
+which answers time range queries, e.g. for /data, straight from memory.
+
+Rows are indexed by their host UTC timestamp (see clock.ClockAnchor),
+kept in an array of its own next to the rows, so a query is two binary
+searches per contiguous stretch of the ring and copies nothing but the
+rows and columns it returns. Timestamps only ever go up: a row older
+than the newest one kept, e.g. after the clock was re-anchored, is
+dropped rather than breaking the index.
+
+Each ring holds 'recent_data_mb' from config.json worth of rows, at
+BLOCK_DTYPE.itemsize bytes each.
+
+Example:
+    write_block(channel=0, block=block)
+    rows = query(channel=0, since=time.time_ns() - 60 * 10**9)
+"""
+
+from threading import Lock
+
+import numpy as np
+
+from biologic.config_store import get_store
+from biologic.decoding import BLOCK_DTYPE, packed_dtype
+
+settings = get_store().snapshot()
+
+DEFAULT_MB = 32  # Per channel, about 10 min at 1 kHz
+
+MAX_BYTES = int(settings.get('recent_data_mb', DEFAULT_MB) * 2**20)
+
+
+class RecentRing:
+    """A channel's most recent rows, the oldest overwritten once full.
+
+    Rows are numbered from 0 as they're written; row n lives in slot
+    n % capacity, as in ring.BlockRing.
+
+    Attributes:
+        self.capacity (int): Rows kept.
+        self.written (int): Rows written so far.
+        self.dropped (int): Rows dropped for being out of order.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        Args:
+            capacity (int): Rows kept.
+
+        Raises:
+            ValueError: If capacity isn't positive.
+        """
+
+        if capacity < 1:
+            raise ValueError(f'Capacity must be positive, not {capacity}')
+
+        self.capacity = capacity
+        self.written = 0
+        self.dropped = 0
+
+        self._rows = np.zeros(capacity, dtype=BLOCK_DTYPE)
+        self._times = np.zeros(capacity, dtype=np.int64)
+        self._lock = Lock()
+
+    def write(self, block: np.ndarray) -> None:
+        """Appends rows, overwriting the oldest once full.
+
+        Args:
+            block (np.ndarray): Of BLOCK_DTYPE, stamped.
+        """
+
+        times = block['timestamp']
+        newest = np.maximum.accumulate(times) if len(block) else times
+
+        # In order if no earlier row, nor the newest kept, is later
+        in_order = times >= newest
+
+        with self._lock:
+            if self.written > 0:
+                last = self._times[(self.written - 1) % self.capacity]
+                in_order &= times >= last
+
+            if not in_order.all():
+                self.dropped += int(np.count_nonzero(~in_order))
+                block = block[in_order]
+
+            # Only the last capacity rows would survive anyway
+            block = block[-self.capacity:]
+            end = self.written + len(block)
+            slot = (end - len(block)) % self.capacity
+            head = min(len(block), self.capacity - slot)
+
+            self._rows[slot:slot + head] = block[:head]
+            self._rows[:len(block) - head] = block[head:]
+            self._times[slot:slot + head] = block['timestamp'][:head]
+            self._times[:len(block) - head] = block['timestamp'][head:]
+            self.written = end
+
+    def _stretches(self) -> list[slice]:
+        """Slots of the rows kept, oldest first, in one or two slices."""
+
+        start = max(self.written - self.capacity, 0)
+        slot = start % self.capacity
+        head = min(self.written - start, self.capacity - slot)
+        stretches = [slice(slot, slot + head)]
+
+        if head < self.written - start:
+            stretches.append(slice(0, self.written - start - head))
+
+        return stretches
+
+    def query(
+        self, since: int = None, until: int = None, fields: list[str] = None
+        ) -> np.ndarray:
+        """Rows stamped in [since, until).
+
+        Args:
+            since (int, optional): Host UTC (ns). Defaults to None, i.e.
+                from the oldest row kept.
+            until (int, optional): Host UTC (ns). Defaults to None, i.e.
+                up to the newest.
+            fields (list[str], optional): Columns of BLOCK_DTYPE to
+                return. Defaults to None, i.e. all.
+
+        Returns:
+            np.ndarray: Structured array of those columns, a copy.
+        """
+
+        fields = list(BLOCK_DTYPE.names) if fields is None else fields
+        parts = list()
+
+        with self._lock:
+            for stretch in self._stretches():
+                times = self._times[stretch]
+                start = 0 if since is None else np.searchsorted(times, since)
+                end = len(times) if until is None else np.searchsorted(
+                    times, until
+                    )
+
+                if start < end:
+                    parts.append(self._rows[stretch][start:end][fields])
+
+            # The only copy, of just what's returned
+            rows = np.empty(
+                sum(len(part) for part in parts),
+                dtype=packed_dtype(fields=fields)
+                )
+            offset = 0
+
+            for part in parts:
+                rows[offset:offset + len(part)] = part
+                offset += len(part)
+
+        return rows
+
+
+_rings: dict[int, RecentRing] = dict()
+_lock = Lock()
+
+
+def check_fields(fields: list[str]) -> None:
+    """Raises:
+        ValueError: If a field isn't a column of BLOCK_DTYPE.
+    """
+
+    unknown = [name for name in fields if name not in BLOCK_DTYPE.names]
+
+    if unknown:
+        raise ValueError(
+            f'Unknown fields {unknown}, choose from {list(BLOCK_DTYPE.names)}'
+            )
+
+
+def write_block(channel: int, block: np.ndarray) -> None:
+    """Appends a block to the ring of a channel, creating it on first use.
+
+    Args:
+        channel (int): Channel the block was recorded on.
+        block (np.ndarray): Of BLOCK_DTYPE, stamped.
+    """
+
+    if len(block) == 0:
+        return
+
+    with _lock:
+        if channel not in _rings:
+            _rings[channel] = RecentRing(
+                capacity=max(MAX_BYTES // BLOCK_DTYPE.itemsize, 1)
+                )
+
+        ring = _rings[channel]
+
+    ring.write(block=block)
+
+
+def query(
+    channel: int,
+    since: int = None,
+    until: int = None,
+    fields: list[str] = None
+    ) -> np.ndarray:
+    """Rows of a channel stamped in [since, until), see RecentRing.query().
+
+    Raises:
+        ValueError: If a field is unknown.
+
+    Returns:
+        np.ndarray: Empty if nothing was recorded on the channel.
+    """
+
+    fields = list(BLOCK_DTYPE.names) if fields is None else fields
+    check_fields(fields=fields)
+
+    with _lock:
+        ring = _rings.get(channel)
+
+    if ring is None:
+        return np.empty(0, dtype=packed_dtype(fields=fields))
+
+    return ring.query(since=since, until=until, fields=fields)
+
+
+def to_columns(rows: np.ndarray, drop_empty: bool = False) -> dict:
+    """Rows as JSON-ready columns, NaN as None, which JSON has no
+    literal for.
+
+    Args:
+        rows (np.ndarray): From query().
+        drop_empty (bool, optional): Leave out float columns that are NaN
+            throughout, i.e. that the technique doesn't record, as
+            reduction.to_payload() does. Defaults to False.
+
+    Returns:
+        dict: Column name: list of values.
+    """
+
+    columns = dict()
+
+    for name in rows.dtype.names:
+        values = rows[name]
+
+        if values.dtype.kind != 'f':
+            columns[name] = values.tolist()
+            continue
+
+        missing = np.isnan(values)
+
+        if drop_empty and len(values) > 0 and missing.all():
+            continue
+
+        if missing.any():
+            values = values.astype(object)
+            values[missing] = None
+
+        columns[name] = values.tolist()
+
+    return columns
@@ -0,0 +1,384 @@
+"""Reduces decoded blocks before they're written out, per sink.
+
+An archive needs every point, while the live table in Drops and
+dashboards are better off with a summary. Each sink is a table paired
+with a policy, and every policy works on whole blocks at once. Policies
+keep whatever state they need between blocks, so one instance serves a
+single run.
+
+Sinks are configured per experiment through the optional 'sinks' key of
+the raw parameters, mapping table name to policy, e.g.
+
+    'sinks': {
+        'data': {'policy': 'all'},
+        'live': {'policy': 'time_bucket', 'width': 1.0, 'how': 'mean'},
+        'changes': {'policy': 'deadband', 'Ewe': 0.001, 'I': 1e-6},
+        'archive': {'policy': 'all', 'encoding': 'codec'},
+        }
+
+A sink's rows are written as JSON lists by default, or with 'encoding':
+'codec' compressed by codec.encode_block(), see to_payload().
+
+Example:
+    sinks = make_sinks(config=raw_params.get('sinks'))
+    for sink in sinks:
+        rows = sink.policy.reduce(block)
+        db.write(payload=to_payload(rows, sink.encoding), table=sink.table)
+"""
+
+import base64
+from dataclasses import dataclass
+
+import numpy as np
+
+from biologic import codec
+from biologic.decoding import BLOCK_DTYPE, empty_block
+
+DEFAULT_SINKS = {'data': {'policy': 'all'}}
+
+FLOATS = ('Ewe', 'Ece', 'Ec', 'I')
+
+ENCODINGS = ('json', 'codec')
+
+# Rows sharing these belong to the same step, or CV sweep
+STEP_KEYS = ('technique_index', 'process_index', 'loop', 'scan')
+
+
+def _step_changes(block: np.ndarray) -> np.ndarray:
+    """Indices of rows where a new step starts, excluding row 0.
+
+    Helper function for TimeBucket and StepEdges.
+    """
+
+    changed = np.zeros(len(block) - 1, dtype=bool)
+
+    for key in STEP_KEYS:
+        changed |= block[key][1:] != block[key][:-1]
+
+    return np.flatnonzero(changed) + 1
+
+
+class All:
+    """Keeps every point."""
+
+    def reduce(self, block: np.ndarray) -> np.ndarray:
+        return block
+
+    def flush(self) -> np.ndarray:
+        return empty_block()
+
+
+class EveryNth:
+    """Keeps every n-th point, counting across blocks.
+
+    Attributes:
+        self.n (int): Keep one point in n.
+    """
+
+    def __init__(self, n: int):
+        if n < 1:
+            raise ValueError(f'n must be at least 1, got {n}')
+
+        self.n = n
+        self._offset = 0
+
+    def reduce(self, block: np.ndarray) -> np.ndarray:
+        rows = block[(-self._offset) % self.n::self.n]
+        self._offset = (self._offset + len(block)) % self.n
+
+        return rows
+
+    def flush(self) -> np.ndarray:
+        return empty_block()
+
+
+class TimeBucket:
+    """Summarizes points in fixed-width time buckets.
+
+    Buckets never span steps. The last bucket of a block may still get
+    points from the next block, so it's held back until it's complete or
+    the run ends.
+
+    Attributes:
+        self.width (float): Bucket width (s).
+        self.how (str): 'mean', 'min' or 'max' of Ewe, Ece, Ec and I.
+            Time, timestamp and integer columns are those of the first
+            point in the bucket.
+    """
+
+    reducers = {
+        'min': np.minimum.reduceat,
+        'max': np.maximum.reduceat,
+        }
+
+    def __init__(self, width: float, how: str = 'mean'):
+        if width <= 0:
+            raise ValueError(f'width must be positive, got {width}')
+
+        if how not in ('mean', 'min', 'max'):
+            raise ValueError(f'how must be mean, min or max, got {how}')
+
+        self.width = width
+        self.how = how
+        self._pending = empty_block()
+
+    def reduce(self, block: np.ndarray) -> np.ndarray:
+        block = np.concatenate((self._pending, block))
+
+        if len(block) == 0:
+            return block
+
+        buckets = np.floor(block['time'] / self.width)
+        starts = np.union1d(
+            np.flatnonzero(buckets[1:] != buckets[:-1]) + 1,
+            _step_changes(block=block)
+            )
+
+        # Rows from the last start onwards may not be complete yet
+        last = starts[-1] if len(starts) > 0 else 0
+        self._pending = block[last:].copy()
+
+        return self._summarize(block=block[:last], starts=starts[:-1])
+
+    def flush(self) -> np.ndarray:
+        block, self._pending = self._pending, empty_block()
+
+        return self._summarize(block=block, starts=np.array([], dtype=int))
+
+    def _summarize(self, block: np.ndarray, starts: np.ndarray) -> np.ndarray:
+        if len(block) == 0:
+            return empty_block()
+
+        starts = np.concatenate(([0], starts)).astype(np.intp)
+        rows = block[starts].copy()
+
+        for name in FLOATS:
+            values = block[name]
+
+            if self.how == 'mean':
+                sums = np.add.reduceat(values.astype(np.float64), starts)
+                counts = np.diff(np.append(starts, len(block)))
+                rows[name] = sums / counts
+            else:
+                rows[name] = self.reducers[self.how](values, starts)
+
+        return rows
+
+
+class Deadband:
+    """Keeps points where a column moved by a band or more since the
+    last point kept, e.g. Ewe or I.
+
+    Each point kept becomes the reference for the next, across blocks, so
+    noise within a band of it is dropped however it straddles multiples
+    of the band, and a slow drift is reported once per band moved. The
+    search for the next point to keep is vectorized, the loop is over the
+    points kept only.
+
+    Attributes:
+        self.bands (dict[str, float]): Band per column, e.g.
+            {'Ewe': 0.001, 'I': 1e-6}.
+    """
+
+    def __init__(self, **bands: float):
+        if not bands or not set(bands) <= set(FLOATS):
+            raise ValueError(f'Bands must be given for some of {FLOATS}')
+
+        self.bands = bands
+        self._kept: dict[str, float] = None
+
+    def reduce(self, block: np.ndarray) -> np.ndarray:
+        if len(block) == 0:
+            return block
+
+        columns = {
+            name: block[name].astype(np.float64) for name in self.bands
+            }
+        keep = list()
+        start = 0
+
+        if self._kept is None:
+            keep.append(0)
+            self._kept = {name: values[0] for name, values in columns.items()}
+            start = 1
+
+        while start < len(block):
+            moved = np.zeros(len(block) - start, dtype=bool)
+
+            for name, band in self.bands.items():
+                values, kept = columns[name][start:], self._kept[name]
+
+                # Columns the technique doesn't record stay NaN throughout
+                if np.isnan(kept):
+                    moved |= ~np.isnan(values)
+                else:
+                    moved |= np.abs(values - kept) >= band
+
+            if not moved.any():
+                break
+
+            index = start + int(np.argmax(moved))
+            keep.append(index)
+            self._kept = {
+                name: values[index] for name, values in columns.items()
+                }
+            start = index + 1
+
+        return block[keep]
+
+    def flush(self) -> np.ndarray:
+        return empty_block()
+
+
+class StepEdges:
+    """Keeps the first and last point of every step.
+
+    The last point of a step is only known once the next one starts, or
+    the run ends.
+    """
+
+    def __init__(self):
+        self._last = empty_block()
+        self._last_kept = False
+
+    def reduce(self, block: np.ndarray) -> np.ndarray:
+        if len(block) == 0:
+            return block
+
+        first = len(self._last) == 0
+
+        # Prepend the held back point, it may turn out to end a step
+        block = np.concatenate((self._last, block))
+        starts = _step_changes(block=block)
+
+        keep = np.zeros(len(block), dtype=bool)
+        keep[starts] = True
+        keep[starts - 1] = True
+
+        if first:
+            keep[0] = True
+        elif self._last_kept:
+            keep[0] = False
+
+        self._last = block[-1:].copy()
+        self._last_kept = keep[-1]
+
+        return block[keep]
+
+    def flush(self) -> np.ndarray:
+        last, self._last = self._last, empty_block()
+
+        return empty_block() if self._last_kept else last
+
+
+policies = {
+    'all': All,
+    'every_nth': EveryNth,
+    'time_bucket': TimeBucket,
+    'deadband': Deadband,
+    'step_edges': StepEdges,
+    }
+
+
+@dataclass
+class Sink:
+    """A table in Drops and how to reduce data on its way there.
+
+    Attributes:
+        self.table (str): Table name.
+        self.policy: One of the policies above.
+        self.encoding (str): One of ENCODINGS, see to_payload().
+    """
+    table: str
+    policy: object
+    encoding: str = 'json'
+
+
+def make_sinks(config: dict = None) -> list[Sink]:
+    """Builds fresh sinks from the 'sinks' key of the raw parameters.
+
+    Args:
+        config (dict, optional): Table name: {'policy': name,
+            'encoding': one of ENCODINGS (optional), **kwargs}. Defaults
+            to None, i.e. DEFAULT_SINKS.
+
+    Raises:
+        ValueError: If a policy or encoding is unknown, or a policy is
+            badly configured.
+
+    Returns:
+        list[Sink]: One per table.
+    """
+
+    config = DEFAULT_SINKS if config is None else config
+    sinks = list()
+
+    for table, options in config.items():
+        options = dict(options)
+        name = options.pop('policy', None)
+        encoding = options.pop('encoding', 'json')
+
+        if name not in policies:
+            raise ValueError(
+                f'Unknown policy {name} for sink {table}, '
+                f'choose from {list(policies)}'
+                )
+
+        if encoding not in ENCODINGS:
+            raise ValueError(
+                f'Unknown encoding {encoding} for sink {table}, '
+                f'choose from {list(ENCODINGS)}'
+                )
+
+        try:
+            policy = policies[name](**options)
+        except TypeError as e:
+            raise ValueError(f'Bad options for sink {table}: {e}')
+
+        sinks.append(Sink(table=table, policy=policy, encoding=encoding))
+
+    return sinks
+
+
+def to_payload(
+    rows: np.ndarray,
+    encoding: str = 'json',
+    time_base: float = None,
+    start_time: float = 0.0
+    ) -> dict:
+    """Turns reduced rows into a single columnar payload.
+
+    Columns the technique doesn't record (all NaN) are left out, unless
+    encoded, where they take next to no space anyway.
+
+    Args:
+        rows (np.ndarray): Structured array of BLOCK_DTYPE.
+        encoding (str, optional): 'json' or 'codec'. Defaults to 'json'.
+        time_base (float, optional): CurrentValues.TimeBase of the run,
+            so that codec encodes 'time' as ticks. Defaults to None,
+            i.e. as floats.
+        start_time (float, optional): DataInfos.StartTime of the rows'
+            technique, likewise. Defaults to 0.
+
+    Returns:
+        dict: Column name: list of values, or if encoding is 'codec',
+            {'encoding': codec.MAGIC, 'rows': count, 'data': the block
+            encoded, in base64}.
+    """
+
+    if encoding == 'codec':
+        data = codec.encode_block(
+            block=rows, time_base=time_base, start_time=start_time
+            )
+
+        return {
+            'encoding': codec.MAGIC.decode(),
+            'rows': len(rows),
+            'data': base64.b64encode(data).decode(),
+            }
+
+    return {
+        name: rows[name].tolist()
+        for name in BLOCK_DTYPE.names
+        if not (name in FLOATS and np.isnan(rows[name]).all())
+        }
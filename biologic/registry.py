@@ -0,0 +1,309 @@
+"""Keeps track of the technique (.ecc) files in the driver directory.
+
+Instead of deriving file names from technique names and finding out
+whether they exist when BL_LoadTechnique fails, the driver directory is
+scanned once. Each .ecc file is mapped to its constants.Technique ID and
+device family, and checked against the SHA-256 checksums pinned in
+MANIFEST, so a missing or corrupted file is reported before any
+experiment starts.
+
+EC-Lab ships one set of files per device family, told apart by a suffix,
+e.g. ocv.ecc for the VMP3 family and ocv4.ecc for the SP-300 series.
+
+BL_LoadTechnique only takes a path, so the DLL always reads the file
+itself. The registry keeps the bytes it verified in memory regardless,
+and only rehashes a file when its size or modification time changed
+since, so verifying on every load is cheap.
+
+Example:
+    registry = get_registry()
+    registry.available(device='KBIO_DEV_HCP1005')  # {'OCV', 'CPLIMIT', ...}
+    path = registry.path(technique='OCV', device='KBIO_DEV_HCP1005')
+    registry.verify(paths=[path])
+"""
+
+from dataclasses import dataclass
+import hashlib
+import json
+import logging
+import os
+from threading import Lock
+
+from biologic.constants import Device, Technique
+from biologic.exceptions import TechniqueFileError
+from biologic.utils import DRIVERPATH, native_path
+
+MANIFEST = 'ecc_manifest.json'
+
+# Device: suffix of its technique files. The SP-300 series would be '4'.
+FAMILIES = {
+    Device.KBIO_DEV_SP150.name: '',
+    Device.KBIO_DEV_HCP1005.name: '',
+    }
+
+
+@dataclass(frozen=True)
+class TechniqueFile:
+    """A verified .ecc file.
+
+    Attributes:
+        self.technique (str): E.g. 'OCV', see constants.Technique.
+        self.technique_id (int): E.g. 100.
+        self.family (str): File name suffix, '' for the VMP3 family.
+        self.path (str): As passed to BL_LoadTechnique.
+        self.sha256 (str): Hex digest.
+        self.size (int): Bytes.
+        self.mtime_ns (int): Modification time when verified.
+    """
+    technique: str
+    technique_id: int
+    family: str
+    path: str
+    sha256: str
+    size: int
+    mtime_ns: int
+
+
+def _identify(filename: str) -> tuple[Technique, str]:
+    """Splits e.g. 'ocv4.ecc' into (Technique.KBIO_TECHID_OCV, '4').
+
+    Helper function for Registry.
+
+    Returns:
+        Technique: None if the file isn't an implemented technique.
+        str: Family suffix.
+    """
+
+    stem = filename[:-len('.ecc')].upper()
+    family = ''
+
+    while stem and stem[-1].isdigit():
+        stem, family = stem[:-1], stem[-1] + family
+
+    technique = Technique.__members__.get(f'KBIO_TECHID_{stem}')
+
+    return technique, family
+
+
+def _sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class Registry:
+    """Technique files found in a directory.
+
+    Attributes:
+        self.directory (str): Scanned directory.
+        self.files (dict[tuple[str, str], TechniqueFile]): Keyed by
+            technique and family.
+    """
+
+    def __init__(self, directory: str = DRIVERPATH, cache: bool = True):
+        """
+        Args:
+            directory (str, optional): With either separator. Defaults
+                to DRIVERPATH.
+            cache (bool, optional): Keep verified bytes in memory.
+                Defaults to True.
+
+        Raises:
+            TechniqueFileError: If a file in the manifest is missing, or
+                its checksum doesn't match.
+        """
+
+        self.directory = native_path(directory)
+        self.cache = cache
+        self.files: dict[tuple[str, str], TechniqueFile] = dict()
+
+        self._bytes: dict[str, bytes] = dict()
+        self._lock = Lock()
+
+        self.scan()
+
+    def scan(self) -> None:
+        """(Re)reads every .ecc file and checks it against the manifest."""
+
+        manifest = self._read_manifest()
+        files = dict()
+        errors = list()
+
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.lower().endswith('.ecc'):
+                continue
+
+            technique, family = _identify(filename=filename)
+
+            if technique is None:
+                continue
+
+            path = os.path.join(self.directory, filename)
+            technique_file, content = self._read(
+                path=path,
+                technique=technique.name.replace('KBIO_TECHID_', ''),
+                technique_id=technique.value,
+                family=family
+                )
+
+            expected = manifest.get(filename)
+
+            if expected is not None and expected != technique_file.sha256:
+                errors.append(f'{filename} checksum mismatch')
+                continue
+
+            files[(technique_file.technique, family)] = technique_file
+
+            if self.cache:
+                self._bytes[path] = content
+
+        for filename in manifest:
+            if not os.path.isfile(os.path.join(self.directory, filename)):
+                errors.append(f'{filename} missing')
+
+        if errors:
+            raise TechniqueFileError(
+                message=f'{self.directory}: {"; ".join(errors)}'
+                )
+
+        if not manifest:
+            logging.warning(
+                f'No {MANIFEST} in {self.directory}, technique files '
+                'are not verified'
+                )
+
+        with self._lock:
+            self.files = files
+
+    def available(self, device: str) -> set[str]:
+        """Techniques with a file for a device.
+
+        Args:
+            device (str): E.g. 'KBIO_DEV_HCP1005'.
+        """
+
+        family = FAMILIES[device]
+
+        return {
+            technique for technique, family_ in self.files
+            if family_ == family
+            }
+
+    def path(self, technique: str, device: str = None) -> str:
+        """The file to load a technique from.
+
+        Args:
+            technique (str): E.g. 'OCV'.
+            device (str, optional): E.g. 'KBIO_DEV_HCP1005'. Defaults to
+                None, i.e. the VMP3 family.
+
+        Raises:
+            TechniqueFileError: If there's no such file.
+        """
+
+        family = '' if device is None else FAMILIES[device]
+        technique_file = self.files.get((technique, family))
+
+        if technique_file is None:
+            raise TechniqueFileError(
+                message=f'No {technique} technique file for '
+                f'{device or "VMP3 family"} in {self.directory}'
+                )
+
+        return technique_file.path
+
+    def content(self, path: str) -> bytes:
+        """Verified bytes of a technique file, from memory if cached."""
+
+        self.verify(paths=[path])
+
+        with self._lock:
+            if path in self._bytes:
+                return self._bytes[path]
+
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def verify(self, paths: list[str]) -> None:
+        """Checks that files are still what they were when scanned.
+
+        Only rehashes files whose size or modification time changed.
+
+        Raises:
+            TechniqueFileError: If a file is gone, unknown or changed.
+        """
+
+        by_path = {file.path: file for file in self.files.values()}
+
+        for path in paths:
+            technique_file = by_path.get(path)
+
+            if technique_file is None:
+                raise TechniqueFileError(message=f'{path} not registered')
+
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                raise TechniqueFileError(message=f'{path} missing')
+
+            if (stat.st_size, stat.st_mtime_ns) == (
+                technique_file.size, technique_file.mtime_ns
+                ):
+                continue
+
+            with open(path, 'rb') as f:
+                if _sha256(f.read()) != technique_file.sha256:
+                    raise TechniqueFileError(message=f'{path} changed')
+
+    def write_manifest(self) -> None:
+        """Pins the checksums of the files currently registered."""
+
+        manifest = {
+            os.path.basename(file.path): file.sha256
+            for file in self.files.values()
+            }
+
+        with open(os.path.join(self.directory, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=4, sort_keys=True)
+
+    def _read_manifest(self) -> dict[str, str]:
+        path = os.path.join(self.directory, MANIFEST)
+
+        if not os.path.isfile(path):
+            return dict()
+
+        with open(path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def _read(
+        path: str, technique: str, technique_id: int, family: str
+        ) -> tuple[TechniqueFile, bytes]:
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        stat = os.stat(path)
+
+        return TechniqueFile(
+            technique=technique,
+            technique_id=technique_id,
+            family=family,
+            path=path,
+            sha256=_sha256(content=content),
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns
+            ), content
+
+
+_registry: Registry = None
+_registry_lock = Lock()
+
+
+def get_registry() -> Registry:
+    """The registry of DRIVERPATH, scanned on first use."""
+
+    global _registry
+
+    with _registry_lock:
+        if _registry is None:
+            _registry = Registry()
+
+        return _registry
@@ -0,0 +1,414 @@
+"""Shared-memory ring buffers of decoded blocks, one per channel.
+
+An acquisition daemon (see daemon.py) writes every decoded block into the
+ring of its channel, and any process on the machine can read it, without
+copying and without ever slowing the writer down: there are no locks,
+and a reader that falls more than a ring behind loses the oldest rows
+rather than holding anything up.
+
+Layout, in a single multiprocessing.shared_memory block:
+
+    header: int64[HEADER_SIZE], see the indices below
+    rows: BLOCK_DTYPE[capacity]
+
+Rows are numbered from 0 as they're written; row n lives in slot
+n % capacity. Before touching any slot the writer advertises the end of
+the rows it's about to write (WRITING), and once done the end of the
+rows readable (WRITTEN). A reader takes WRITTEN as the end of what it
+can read, and after reading checks WRITING to find out which rows might
+have been overwritten meanwhile. This relies on stores becoming visible
+in order, as they do on x86.
+
+The header also holds the TimeBase and StartTime of the latest block,
+for readers that encode 'time' as ticks, see codec.py.
+
+Example:
+    # Writer, e.g. in the acquisition daemon
+    enable(prefix='biologic-USB0')
+    write_block(channel=0, block=block)
+
+    # Reader, in any other process
+    reader = RingReader(name='biologic-USB0-0')
+    block, cursor, lost = reader.read(cursor=0)
+    rows = reader.query(since=time.time_ns() - 60 * 10**9)
+"""
+
+import re
+from multiprocessing import resource_tracker, shared_memory
+from threading import Lock
+
+import numpy as np
+
+from biologic.decoding import BLOCK_DTYPE, empty_block, packed_dtype
+
+# Header indices
+CAPACITY = 0
+WRITING = 1
+WRITTEN = 2
+TIME_BASE = 3  # float64, NaN if unknown
+START_TIME = 4  # float64
+HEADER_SIZE = 8  # int64s, the rest reserved
+
+DEFAULT_CAPACITY = 2**16  # rows, 52 bytes each
+
+
+def ring_name(prefix: str, channel: int) -> str:
+    """Shared memory name of a channel's ring, e.g. 'biologic-USB0-0'."""
+
+    return re.sub('[^A-Za-z0-9_-]', '-', f'{prefix}-{channel}')
+
+
+class _Ring:
+    """Views of a ring's header and rows.
+
+    Helper class for BlockRing and RingReader.
+    """
+
+    def __init__(self, memory: shared_memory.SharedMemory):
+        self.memory = memory
+        self.header = np.ndarray(
+            HEADER_SIZE, dtype=np.int64, buffer=memory.buf
+            )
+        self.floats = self.header.view(np.float64)
+        self.capacity = int(self.header[CAPACITY])
+        self.rows = np.ndarray(
+            self.capacity,
+            dtype=BLOCK_DTYPE,
+            buffer=memory.buf,
+            offset=self.header.nbytes
+            )
+
+    @property
+    def written(self) -> int:
+        return int(self.header[WRITTEN])
+
+    @property
+    def time_base(self) -> float:
+        """CurrentValues.TimeBase of the latest block (s), None if not
+        known.
+        """
+
+        time_base = float(self.floats[TIME_BASE])
+
+        return None if np.isnan(time_base) else time_base
+
+    @property
+    def start_time(self) -> float:
+        """DataInfos.StartTime of the latest block (s)."""
+
+        return float(self.floats[START_TIME])
+
+    def close(self) -> None:
+        # Views must go before the memory can
+        self.header = self.floats = self.rows = None
+        self.memory.close()
+
+
+class BlockRing(_Ring):
+    """The writing end of a ring, which owns its shared memory."""
+
+    def __init__(self, name: str, capacity: int = DEFAULT_CAPACITY):
+        """
+        Args:
+            name (str): Shared memory name, see ring_name().
+            capacity (int, optional): Rows. Defaults to DEFAULT_CAPACITY.
+        """
+
+        size = HEADER_SIZE * 8 + capacity * BLOCK_DTYPE.itemsize
+
+        try:
+            memory = shared_memory.SharedMemory(
+                name=name, create=True, size=size
+                )
+        except FileExistsError:
+            # Left behind by a daemon that died, nobody else writes it
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            memory = shared_memory.SharedMemory(
+                name=name, create=True, size=size
+                )
+
+        header = np.ndarray(HEADER_SIZE, dtype=np.int64, buffer=memory.buf)
+        header[:] = 0
+        header[CAPACITY] = capacity
+        header.view(np.float64)[TIME_BASE] = np.nan
+        header = None
+
+        super(BlockRing, self).__init__(memory=memory)
+
+    def write(
+        self,
+        block: np.ndarray,
+        time_base: float = None,
+        start_time: float = 0.0
+        ) -> None:
+        """Appends rows, overwriting the oldest once full.
+
+        Args:
+            block (np.ndarray): Of BLOCK_DTYPE.
+            time_base (float, optional): CurrentValues.TimeBase the block
+                was decoded with. Defaults to None, i.e. unknown.
+            start_time (float, optional): DataInfos.StartTime, likewise.
+                Defaults to 0.
+        """
+
+        if len(block) == 0:
+            return
+
+        self.floats[TIME_BASE] = np.nan if time_base is None else time_base
+        self.floats[START_TIME] = start_time
+
+        start = self.written
+        end = start + len(block)
+
+        # Only the last capacity rows could be read anyway
+        block = block[-self.capacity:]
+        first = end - len(block)
+
+        self.header[WRITING] = end
+
+        slot = first % self.capacity
+        head = min(len(block), self.capacity - slot)
+        self.rows[slot:slot + head] = block[:head]
+        self.rows[:len(block) - head] = block[head:]
+
+        self.header[WRITTEN] = end
+
+    def close(self) -> None:
+        """Closes and removes the ring, readers keep what they mapped."""
+
+        memory = self.memory
+        super(BlockRing, self).close()
+        memory.unlink()
+
+
+class RingReader(_Ring):
+    """A reading end of a ring, in any process."""
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name (str): Shared memory name, see ring_name().
+
+        Raises:
+            FileNotFoundError: If no such ring is being written.
+        """
+
+        memory = shared_memory.SharedMemory(name=name)
+        # Only the writer may remove the ring, not this process on exit
+        resource_tracker.unregister(memory._name, 'shared_memory')
+
+        super(RingReader, self).__init__(memory=memory)
+
+    def views(
+        self, cursor: int, end: int = None
+        ) -> tuple[list[np.ndarray], int, int]:
+        """Rows from cursor on, as views of the shared memory.
+
+        The views aren't copies: once done with them, call overwritten()
+        to find out how many of their first rows were overwritten while
+        in use, and discard those.
+
+        Args:
+            cursor (int): Number of the first row wanted, e.g. the end
+                returned by the previous call, or 0.
+            end (int, optional): Number of the row to stop before.
+                Defaults to None, i.e. the last written.
+
+        Returns:
+            list[np.ndarray]: One or two views, in order.
+            int: End, i.e. the cursor to pass next time.
+            int: Rows lost between cursor and the first row returned.
+        """
+
+        end = self.written if end is None else min(end, self.written)
+        start = max(cursor, end - self.capacity)
+
+        if start >= end:
+            return list(), end, start - cursor
+
+        slot = start % self.capacity
+        head = min(end - start, self.capacity - slot)
+        views = [self.rows[slot:slot + head]]
+
+        if head < end - start:
+            views.append(self.rows[:end - start - head])
+
+        return views, end, start - cursor
+
+    def overwritten(self, start: int) -> int:
+        """How many rows from start on can no longer be trusted."""
+
+        oldest = int(self.header[WRITING]) - self.capacity
+
+        return max(oldest - start, 0)
+
+    def read(
+        self, cursor: int, end: int = None
+        ) -> tuple[np.ndarray, int, int]:
+        """Copies rows from cursor on, dropping any overwritten meanwhile.
+
+        Args:
+            end (int, optional): See views().
+
+        Returns:
+            np.ndarray: Of BLOCK_DTYPE.
+            int: End, i.e. the cursor to pass next time.
+            int: Rows lost, by falling behind or being overwritten.
+        """
+
+        views, end, lost = self.views(cursor=cursor, end=end)
+
+        if not views:
+            return empty_block(), end, lost
+
+        block = np.concatenate(views)
+        stale = min(self.overwritten(start=cursor + lost), len(block))
+
+        return block[stale:], end, lost + stale
+
+    def query(
+        self, since: int = None, until: int = None, fields: list[str] = None
+        ) -> np.ndarray:
+        """Copies the rows stamped in [since, until), as recent.query().
+
+        Timestamps only go up from one row to the next, so each view is
+        binary searched rather than scanned, and the rows in range are
+        one run of row numbers. Those overwritten while being copied are
+        dropped.
+
+        Args:
+            since (int, optional): Host UTC (ns). Defaults to None, i.e.
+                from the oldest row kept.
+            until (int, optional): Host UTC (ns). Defaults to None, i.e.
+                up to the newest.
+            fields (list[str], optional): Columns of BLOCK_DTYPE to
+                return. Defaults to None, i.e. all.
+
+        Returns:
+            np.ndarray: Structured array of those columns.
+        """
+
+        fields = list(BLOCK_DTYPE.names) if fields is None else fields
+        views, end, _ = self.views(cursor=0)
+        number = end - sum(len(view) for view in views)
+        first = None
+        parts = list()
+
+        for view in views:
+            times = view['timestamp']
+            start = 0 if since is None else np.searchsorted(times, since)
+            stop = len(view) if until is None else np.searchsorted(
+                times, until
+                )
+
+            if start < stop:
+                first = number + start if first is None else first
+                parts.append(view[start:stop][fields])
+
+            number += len(view)
+
+        rows = np.empty(
+            sum(len(part) for part in parts),
+            dtype=packed_dtype(fields=fields)
+            )
+        offset = 0
+
+        for part in parts:
+            rows[offset:offset + len(part)] = part
+            offset += len(part)
+
+        views = parts = None
+
+        if first is None:
+            return rows
+
+        return rows[min(self.overwritten(start=first), len(rows)):]
+
+
+_prefix: str = None
+_capacity = DEFAULT_CAPACITY
+_writers: dict[int, BlockRing] = dict()
+_lock = Lock()
+
+
+def enable(prefix: str, capacity: int = DEFAULT_CAPACITY) -> None:
+    """Makes write_block() write to rings named after prefix.
+
+    Called once by each acquisition daemon. Without it, write_block()
+    does nothing.
+    """
+
+    global _prefix, _capacity
+
+    _prefix = prefix
+    _capacity = capacity
+
+
+def enabled() -> bool:
+    """Whether this process writes rings, see enable()."""
+
+    return _prefix is not None
+
+
+def _writer(channel: int) -> BlockRing:
+    """The ring of a channel, created on first use.
+
+    Helper function for position() and write_block(). Call with _lock
+    held.
+    """
+
+    if channel not in _writers:
+        _writers[channel] = BlockRing(
+            name=ring_name(prefix=_prefix, channel=channel),
+            capacity=_capacity
+            )
+
+    return _writers[channel]
+
+
+def position(channel: int) -> int:
+    """Number of the next row written to the ring of a channel, e.g.
+    where a run's rows start. None unless enabled.
+    """
+
+    if _prefix is None:
+        return None
+
+    with _lock:
+        return _writer(channel=channel).written
+
+
+def write_block(
+    channel: int,
+    block: np.ndarray,
+    time_base: float = None,
+    start_time: float = 0.0
+    ) -> None:
+    """Appends a block to the ring of a channel, creating it on first use.
+
+    Args:
+        channel (int): Channel the block was recorded on.
+        block (np.ndarray): Of BLOCK_DTYPE.
+        time_base (float, optional): See BlockRing.write().
+        start_time (float, optional): See BlockRing.write().
+    """
+
+    if _prefix is None:
+        return
+
+    with _lock:
+        _writer(channel=channel).write(
+            block=block, time_base=time_base, start_time=start_time
+            )
+
+
+def close() -> None:
+    """Removes the rings written by this process."""
+
+    with _lock:
+        for writer in _writers.values():
+            writer.close()
+
+        _writers.clear()
@@ -0,0 +1,314 @@
+"""Host-side safety limits, checked on every decoded block.
+
+The instrument only enforces what the techniques are told, i.e. a single
+voltage limit per CPLIMIT step. Everything else used to take an external
+process watching Drops and hitting /stop, which takes seconds. Instead,
+the acquisition loop checks the rules below on every poll and stops the
+channel on the first breach.
+
+Limits are configured per experiment through the optional 'limits' key of
+the raw parameters, e.g.
+
+    'limits': {
+        'Ewe': {'min': 2.5, 'max': 4.3},  # V
+        'I': {'min': -0.1, 'max': 0.1},  # A
+        'flags': ['Ioverflow', 'Eoverflow', 'Saturation'],
+        'capacity': {'charge_in': 3600},  # C, within a loop
+        'capacity_fade': 0.8,  # charge_out vs. the first loop
+        'cycles': 100,  # loops
+        }
+
+Example:
+    limits = Limits.from_config(config=raw_params.get('limits'))
+    breach = limits.check(block, current_values, aggregator)
+    if breach is not None:
+        potentiostat.stop_channel()
+"""
+
+from dataclasses import asdict, dataclass
+import math
+import numbers
+
+import numpy as np
+
+from biologic.aggregates import CycleAggregator, CycleSummary
+
+FLAGS = ('Ioverflow', 'Eoverflow', 'Saturation')
+
+
+def _number(name: str, value, integer: bool = False):
+    """Checks a limit value is a real number, or an int if integer.
+
+    Helper function for the rules below. Anything else, e.g. '4.3',
+    would only fail on the first check(), with the channel running.
+
+    Raises:
+        ValueError: If it isn't.
+    """
+
+    kind = numbers.Integral if integer else numbers.Real
+
+    if (
+        isinstance(value, bool) or not isinstance(value, kind)
+        or math.isnan(value)
+        ):
+        expected = 'an integer' if integer else 'a number'
+        raise ValueError(f'{name} must be {expected}, got {value!r}')
+
+    return value
+
+
+@dataclass
+class Breach:
+    """Why a channel was stopped.
+
+    Attributes:
+        self.rule (str): Name of the rule, e.g. 'Ewe' or 'cycles'.
+        self.reason (str): Human-readable description.
+        self.instrument_time (float): When it happened (s), None if
+            not known.
+    """
+    rule: str
+    reason: str
+    instrument_time: float
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class Bounds:
+    """Keeps a column of the block within [minimum, maximum].
+
+    Points the technique doesn't record (NaN) are ignored.
+    """
+
+    def __init__(self, column: str, min: float = None, max: float = None):
+        if min is None and max is None:
+            raise ValueError(f'{column} limit needs a min, a max or both')
+
+        self.column = column
+        self.minimum = -np.inf if min is None else _number(
+            name=f'{column} min', value=min
+            )
+        self.maximum = np.inf if max is None else _number(
+            name=f'{column} max', value=max
+            )
+
+    def check(self, block: np.ndarray, **_) -> Breach:
+        values = block[self.column]
+        outside = np.flatnonzero(
+            (values < self.minimum) | (values > self.maximum)
+            )
+
+        if len(outside) == 0:
+            return None
+
+        first = outside[0]
+
+        return Breach(
+            rule=self.column,
+            reason=(
+                f'{self.column} = {values[first]:.6g} outside '
+                f'[{self.minimum}, {self.maximum}]'
+                ),
+            instrument_time=float(block['time'][first])
+            )
+
+
+class Flags:
+    """Stops on overflow or saturation, as reported by CurrentValues."""
+
+    def __init__(self, names: list[str] = FLAGS):
+        unknown = set(names) - set(FLAGS)
+
+        if unknown:
+            raise ValueError(f'Unknown flags {unknown}, choose from {FLAGS}')
+
+        self.names = tuple(names)
+
+    def check(self, current_values: dict, **_) -> Breach:
+        raised = [name for name in self.names if current_values[name]]
+
+        if not raised:
+            return None
+
+        return Breach(
+            rule='flags',
+            reason=f'{", ".join(raised)} raised',
+            instrument_time=current_values['ElapsedTime']
+            )
+
+
+class Capacity:
+    """Caps the charge within the loop in progress.
+
+    Attributes:
+        self.maxima (dict[str, float]): Totals field, e.g. 'charge_in',
+            to its maximum (C or J).
+    """
+
+    def __init__(self, **maxima: float):
+        unknown = set(maxima) - {
+            'charge_in', 'charge_out', 'energy_in', 'energy_out'
+            }
+
+        if not maxima or unknown:
+            raise ValueError(
+                'Capacity limits must be among charge_in, charge_out, '
+                'energy_in and energy_out'
+                )
+
+        self.maxima = {
+            name: _number(name=name, value=maximum)
+            for name, maximum in maxima.items()
+            }
+
+    def check(self, aggregator: CycleAggregator, **_) -> Breach:
+        cycle = aggregator.cycle
+
+        if cycle is None:
+            return None
+
+        for name, maximum in self.maxima.items():
+            value = getattr(cycle.totals, name)
+
+            if value > maximum:
+                return Breach(
+                    rule='capacity',
+                    reason=(
+                        f'{name} = {value:.6g} above {maximum} '
+                        f'in loop {cycle.loop}'
+                        ),
+                    instrument_time=cycle.end_time
+                    )
+
+        return None
+
+
+class CapacityFade:
+    """Stops once a completed loop delivers less than a fraction of the
+    charge the first one did.
+    """
+
+    def __init__(self, fraction: float):
+        if not 0 < _number(name='capacity_fade', value=fraction) < 1:
+            raise ValueError(f'Fade fraction must be in (0, 1), got {fraction}')
+
+        self.fraction = fraction
+        self._reference: float = None
+
+    def check(self, summaries: list[CycleSummary], **_) -> Breach:
+        for summary in summaries:
+            charge = summary.totals.charge_out
+
+            if self._reference is None:
+                self._reference = charge
+            elif charge < self.fraction * self._reference:
+                return Breach(
+                    rule='capacity_fade',
+                    reason=(
+                        f'charge_out {charge:.6g} in loop {summary.loop} '
+                        f'below {self.fraction:.0%} of {self._reference:.6g}'
+                        ),
+                    instrument_time=summary.end_time
+                    )
+
+        return None
+
+
+class CycleCount:
+    """Stops after a number of completed loops."""
+
+    def __init__(self, maximum: int):
+        self.maximum = _number(name='cycles', value=maximum, integer=True)
+
+    def check(self, block: np.ndarray, **_) -> Breach:
+        if len(block) == 0 or block['loop'][-1] < self.maximum:
+            return None
+
+        return Breach(
+            rule='cycles',
+            reason=f'{self.maximum} loops completed',
+            instrument_time=float(block['time'][-1])
+            )
+
+
+class Limits:
+    """The rules of a single run.
+
+    Attributes:
+        self.rules (list): Anything with a check(**context) method
+            returning a Breach or None.
+    """
+
+    def __init__(self, rules: list = None):
+        self.rules = list() if rules is None else rules
+
+    @classmethod
+    def from_config(cls, config: dict = None) -> 'Limits':
+        """Builds fresh rules from the 'limits' key of the raw parameters.
+
+        Args:
+            config (dict, optional): See module docstring. Defaults to
+                None, i.e. no limits.
+
+        Raises:
+            ValueError: If a limit is unknown or badly configured.
+        """
+
+        rules = list()
+
+        for name, options in (config or dict()).items():
+            try:
+                if name in ('Ewe', 'Ece', 'Ec', 'I'):
+                    rules.append(Bounds(column=name, **options))
+                elif name == 'flags':
+                    if isinstance(options, str):
+                        raise TypeError('flags must be a list')
+
+                    rules.append(Flags(names=options))
+                elif name == 'capacity':
+                    rules.append(Capacity(**options))
+                elif name == 'capacity_fade':
+                    rules.append(CapacityFade(fraction=options))
+                elif name == 'cycles':
+                    rules.append(CycleCount(maximum=options))
+                else:
+                    raise ValueError(f'Unknown limit {name}')
+            except TypeError as e:
+                raise ValueError(f'Bad options for limit {name}: {e}')
+
+        return cls(rules=rules)
+
+    def check(
+        self,
+        block: np.ndarray,
+        current_values: dict,
+        aggregator: CycleAggregator,
+        summaries: list[CycleSummary] = None
+        ) -> Breach:
+        """Checks every rule against the latest poll.
+
+        Args:
+            block (np.ndarray): Decoded block, see decoding.BLOCK_DTYPE.
+            current_values (dict): CurrentValues of the same poll.
+            aggregator (CycleAggregator): Already updated with block.
+            summaries (list[CycleSummary], optional): Loops completed by
+                block. Defaults to None, i.e. none.
+
+        Returns:
+            Breach: The first rule breached, None if all is well.
+        """
+
+        for rule in self.rules:
+            breach = rule.check(
+                block=block,
+                current_values=current_values,
+                aggregator=aggregator,
+                summaries=summaries or list()
+                )
+
+            if breach is not None:
+                return breach
+
+        return None
@@ -0,0 +1,617 @@
+"""Queues experiments and runs them back to back, one worker per channel.
+
+Submitting while a channel is busy no longer aborts; the job waits in a
+priority queue that is persisted to disk. Jobs are compiled with
+experiment.prepare() as soon as they are submitted, and the instrument
+stays connected between runs, so when one experiment finishes the next
+one only has to be loaded and started.
+
+NOTE: Techniques can't be loaded onto a channel while it is running
+(ERR_GEN_CHANNEL_RUNNING), hence loading is the one step left between
+runs.
+
+Example:
+    scheduler = Scheduler(potentiostat_class=HCP1005)
+    job = scheduler.submit(raw_params=cp_params)
+    scheduler.wait_idle()
+"""
+
+import bisect
+from dataclasses import dataclass, field
+import json
+import logging
+import os
+from threading import Condition, Event, Lock, Thread
+import time
+import uuid
+
+from biologic import experiment
+from biologic.exceptions import PlanValidationError
+from biologic.potentiostats import Potentiostat, stop_channels
+from biologic.state import RunState, StateStore
+
+QUEUE_PATH = os.path.join('state', 'queue.json')
+
+
+@dataclass
+class Job:
+    """A single experiment waiting to run.
+
+    Attributes:
+        self.raw_params (dict): As passed to experiment.run().
+        self.channel (int): Channel to run on.
+        self.priority (int): Higher runs first. Ties run in order of
+            submission.
+        self.submitted (float): Submission time (UNIX).
+        self.job_id (str): Unique identifier.
+        self.plan (experiment.Plan): Compiled raw_params, not persisted.
+        self.done (threading.Event): Set once the job has run.
+        self.error (str): Why the job failed, if it did.
+    """
+    raw_params: dict
+    channel: int = 0
+    priority: int = 0
+    submitted: float = field(default_factory=time.time)
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    plan: experiment.Plan = field(default=None, repr=False)
+    done: Event = field(default_factory=Event, repr=False)
+    error: str = None
+
+    @property
+    def sort_key(self) -> tuple[int, float]:
+        return -self.priority, self.submitted
+
+    def to_dict(self) -> dict:
+        return {
+            'job_id': self.job_id,
+            'channel': self.channel,
+            'priority': self.priority,
+            'submitted': self.submitted,
+            'raw_params': self.raw_params,
+            }
+
+
+class JobQueue:
+    """Priority queue of jobs, persisted to disk on every change.
+
+    Jobs leave the file once they start running. Paused channels keep
+    their jobs queued until resumed.
+
+    Attributes:
+        self.path (str): Location of the persisted queue.
+    """
+
+    def __init__(self, path: str = QUEUE_PATH):
+        self.path = path
+
+        self._jobs: list[Job] = list()
+        self._active: dict[int, Job] = dict()
+        self._paused: set[int] = set()
+        self._condition = Condition()
+
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.isfile(self.path):
+            return
+
+        with open(self.path, 'r') as f:
+            jobs = json.load(f)
+
+        for job in jobs:
+            bisect.insort(self._jobs, Job(**job), key=_sort_key)
+
+    def _save(self) -> None:
+        """Writes the queue to a temporary file and swaps it in, so that
+        a crash never leaves a half-written queue behind.
+        """
+
+        directory = os.path.dirname(self.path)
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        temporary_path = f'{self.path}.tmp'
+
+        with open(temporary_path, 'w') as f:
+            json.dump([job.to_dict() for job in self._jobs], f)
+
+        os.replace(temporary_path, self.path)
+
+    def put(self, job: Job) -> int:
+        """Adds a job to the queue.
+
+        Args:
+            job (Job): Job to add.
+
+        Returns:
+            int: Number of jobs ahead of it on its channel, including the
+                one running.
+        """
+
+        with self._condition:
+            bisect.insort(self._jobs, job, key=_sort_key)
+            self._save()
+            self._condition.notify_all()
+
+            return self._position(job=job)
+
+    def get(self, channel: int) -> Job:
+        """Takes the next job for a channel, blocking until there is one
+        and the channel isn't paused.
+
+        The job stays active until task_done() is called.
+
+        Args:
+            channel (int): Channel to take a job for.
+
+        Returns:
+            Job: Highest-priority job for the channel.
+        """
+
+        with self._condition:
+            while True:
+                if channel not in self._paused:
+                    for job in self._jobs:
+                        if job.channel == channel:
+                            self._jobs.remove(job)
+                            self._active[channel] = job
+                            self._save()
+
+                            return job
+
+                self._condition.wait()
+
+    def activate(self, job: Job) -> None:
+        """Marks a job that never went through the queue as running."""
+
+        with self._condition:
+            self._active[job.channel] = job
+
+    def task_done(self, channel: int) -> None:
+        with self._condition:
+            self._active.pop(channel, None)
+            self._condition.notify_all()
+
+    def pause(self, channel: int) -> None:
+        with self._condition:
+            self._paused.add(channel)
+
+    def resume(self, channel: int) -> None:
+        with self._condition:
+            self._paused.discard(channel)
+            self._condition.notify_all()
+
+    def is_paused(self, channel: int) -> bool:
+        return channel in self._paused
+
+    def remove(self, job_id: str) -> bool:
+        """Drops a queued job.
+
+        Args:
+            job_id (str): Identifier of the job to drop.
+
+        Returns:
+            bool: Whether the job was queued.
+        """
+
+        with self._condition:
+            for job in self._jobs:
+                if job.job_id == job_id:
+                    self._jobs.remove(job)
+                    self._save()
+
+                    return True
+
+        return False
+
+    def jobs(self, channel: int = None) -> list[Job]:
+        """Queued jobs in the order they'll run.
+
+        Args:
+            channel (int, optional): Only jobs for this channel.
+                Defaults to None, i.e. all.
+
+        Returns:
+            list[Job]: Queued jobs, excluding those running.
+        """
+
+        with self._condition:
+            return [
+                job for job in self._jobs
+                if channel is None or job.channel == channel
+                ]
+
+    def active(self, channel: int) -> Job:
+        return self._active.get(channel)
+
+    def channels(self) -> set[int]:
+        with self._condition:
+            return {job.channel for job in self._jobs}
+
+    def wait_idle(self, channel: int, timeout: float = None) -> bool:
+        """Blocks until nothing is running or queued on a channel.
+
+        Returns:
+            bool: False if timed out.
+        """
+
+        def is_idle() -> bool:
+            return channel not in self._active and all(
+                job.channel != channel for job in self._jobs
+                )
+
+        with self._condition:
+            return self._condition.wait_for(is_idle, timeout=timeout)
+
+    def _position(self, job: Job) -> int:
+        ahead = [
+            queued for queued in self._jobs[:self._jobs.index(job)]
+            if queued.channel == job.channel
+            ]
+
+        return len(ahead) + int(job.channel in self._active)
+
+
+def _sort_key(job: Job) -> tuple[int, float]:
+    return job.sort_key
+
+
+def _as_job(run_state: RunState) -> Job:
+    return Job(
+        raw_params=run_state.raw_params,
+        channel=run_state.channel,
+        submitted=run_state.start_time,
+        job_id=run_state.run_id
+        )
+
+
+def _as_int(raw_params: dict, key: str, minimum: int = None) -> int:
+    """An integer option of raw_params, e.g. 'channel', 0 if missing.
+
+    Integral strings and floats, e.g. '1' or 1.0, are taken as the
+    integer they stand for, so they can't end up keyed apart from it.
+
+    Raises:
+        PlanValidationError: If the value isn't integral, or is below
+            minimum.
+    """
+
+    value = raw_params.get(key, 0)
+
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        elif isinstance(value, float) and value.is_integer():
+            value = int(value)
+        elif isinstance(value, str):
+            value = int(value.strip())
+        elif not isinstance(value, int):
+            raise ValueError
+    except ValueError:
+        raise PlanValidationError(
+            message=f'{key} must be an integer, not {value!r}'
+            )
+
+    if minimum is not None and value < minimum:
+        raise PlanValidationError(
+            message=f'{key} must be at least {minimum}, not {value}'
+            )
+
+    return value
+
+
+class ChannelWorker:
+    """Runs the jobs queued for a single channel, back to back.
+
+    Before taking jobs off the queue, it reattaches to any run a previous
+    process left on the channel.
+
+    Attributes:
+        self.channel (int): Channel the worker runs jobs on.
+        self.potentiostat (potentiostats.Potentiostat): Kept connected
+            across jobs.
+        self.experiment (experiment.Experiment): Status of the current job.
+        self.pill (threading.Event): Kills the current job when set.
+    """
+
+    def __init__(
+        self,
+        channel: int,
+        queue: JobQueue,
+        potentiostat_class: type,
+        store: StateStore
+        ):
+        self.channel = channel
+        self.queue = queue
+        self.store = store
+        self.potentiostat = potentiostat_class(channel=channel)
+        self.experiment = experiment.Experiment()
+        self.pill = Event()
+
+        interrupted = self.store.unfinished(channel=channel)
+
+        # Hold off new jobs from the start, not just once the thread runs
+        if interrupted:
+            self.queue.activate(job=_as_job(run_state=interrupted[0]))
+
+        self._thread = Thread(
+            target=self._work, args=(interrupted, ), daemon=True
+            )
+        self._thread.start()
+
+    @property
+    def current(self) -> Job:
+        return self.queue.active(channel=self.channel)
+
+    @property
+    def paused(self) -> bool:
+        return self.queue.is_paused(channel=self.channel)
+
+    def _work(self, interrupted: list[RunState]) -> None:
+        for run_state in interrupted:
+            self._reattach(run_state=run_state)
+
+        while True:
+            job = self.queue.get(channel=self.channel)
+            self.pill = Event()
+
+            try:
+                experiment.run(
+                    potentiostat=self.potentiostat,
+                    raw_params=job.raw_params,
+                    pill=self.pill,
+                    experiment_=self.experiment,
+                    plan=job.plan,
+                    store=self.store,
+                    run_id=job.job_id
+                    )
+            except Exception as e:
+                job.error = str(e)
+                self.experiment.set_status('stopped')
+                logging.error(e)
+            finally:
+                job.done.set()
+                self.queue.task_done(channel=self.channel)
+
+    def _reattach(self, run_state: RunState) -> None:
+        job = _as_job(run_state=run_state)
+        self.queue.activate(job=job)
+        self.pill = Event()
+
+        try:
+            experiment.reattach(
+                potentiostat=self.potentiostat,
+                run_state=run_state,
+                pill=self.pill,
+                experiment_=self.experiment,
+                store=self.store
+                )
+        except Exception as e:
+            job.error = str(e)
+            self.experiment.set_status('stopped')
+            # Can't reattach, e.g. instrument gone. Don't try again.
+            self.store.finish(run_id=run_state.run_id)
+            logging.error(e)
+        finally:
+            job.done.set()
+            self.queue.task_done(channel=self.channel)
+
+    def stop(self, timeout: float = 5) -> float:
+        """Stops the running job and holds the queue until resume().
+
+        The job drains what's left on the instrument and finishes by
+        itself, and is only killed if that takes longer than timeout.
+
+        Args:
+            timeout (float, optional): Seconds. Defaults to 5.
+
+        Returns:
+            float: Stop latency (s), None if nothing was stopped.
+        """
+
+        self.queue.pause(channel=self.channel)
+        job = self.current
+
+        if job is None or not self.potentiostat.is_connected:
+            self._kill()
+
+            return None
+
+        try:
+            latency = self.potentiostat.stop_channel()
+        except Exception:
+            self._kill()
+            raise
+
+        self.settle(job=job, timeout=timeout)
+
+        return latency
+
+    def settle(self, job: Job, timeout: float = 5) -> None:
+        """Waits for a stopped job to drain, killing it if it doesn't."""
+
+        if not job.done.wait(timeout=timeout):
+            self._kill()
+
+    def _kill(self) -> None:
+        self.pill.set()
+        self.experiment.set_status('stopped')
+
+    def resume(self) -> None:
+        self.queue.resume(channel=self.channel)
+
+
+class Scheduler:
+    """Assigns jobs to channel workers, creating those on demand.
+
+    Attributes:
+        self.queue (JobQueue): Jobs waiting for a channel.
+    """
+
+    def __init__(
+        self,
+        potentiostat_class: type,
+        queue: JobQueue = None,
+        store: StateStore = None
+        ):
+        """
+        Args:
+            potentiostat_class (type): E.g. potentiostats.HCP1005.
+            queue (JobQueue, optional): Defaults to JobQueue(), i.e. the
+                queue persisted at QUEUE_PATH.
+            store (StateStore, optional): Defaults to StateStore(), i.e.
+                the store persisted at state.STATE_PATH.
+        """
+
+        self.potentiostat_class = potentiostat_class
+        self.queue = JobQueue() if queue is None else queue
+        self.store = StateStore() if store is None else store
+
+        self._workers: dict[int, ChannelWorker] = dict()
+        self._lock = Lock()
+
+        # Jobs left over from a previous session
+        for job in self.queue.jobs():
+            self._compile(job=job)
+
+        interrupted = {run.channel for run in self.store.unfinished()}
+
+        for channel in self.queue.channels() | interrupted:
+            self.worker(channel=channel)
+
+    @staticmethod
+    def _compile(job: Job) -> None:
+        try:
+            job.plan = experiment.prepare(raw_params=job.raw_params)
+        except Exception as e:
+            logging.error(e)
+
+    def worker(self, channel: int, create: bool = True) -> ChannelWorker:
+        """Returns the worker for a channel.
+
+        Args:
+            channel (int): Channel number.
+            create (bool, optional): Create the worker if it doesn't
+                exist yet. Defaults to True.
+
+        Returns:
+            ChannelWorker: None if not created.
+        """
+
+        with self._lock:
+            if channel not in self._workers and create:
+                self._workers[channel] = ChannelWorker(
+                    channel=channel,
+                    queue=self.queue,
+                    potentiostat_class=self.potentiostat_class,
+                    store=self.store
+                    )
+
+            return self._workers.get(channel)
+
+    def connection(self) -> Potentiostat:
+        """A connected potentiostat of any worker, to borrow, e.g. for
+        status.MetadataCache. Workers stay connected between runs, so
+        this is None only until the first run connects.
+        """
+
+        with self._lock:
+            workers = list(self._workers.values())
+
+        for worker in workers:
+            if worker.potentiostat.is_connected:
+                return worker.potentiostat
+
+        return None
+
+    def submit(self, raw_params: dict) -> tuple[Job, int]:
+        """Compiles and queues an experiment.
+
+        Args:
+            raw_params (dict): As passed to experiment.run(), optionally
+                with 'channel' and 'priority' keys.
+
+        Raises:
+            PlanValidationError: If raw_params don't validate, including
+                a channel or priority that isn't an integer.
+
+        Returns:
+            Job: The queued job.
+            int: Number of jobs ahead of it, including the one running.
+        """
+
+        job = Job(
+            raw_params=raw_params,
+            channel=_as_int(raw_params=raw_params, key='channel', minimum=0),
+            priority=_as_int(raw_params=raw_params, key='priority')
+            )
+        job.plan = experiment.prepare(raw_params=raw_params)
+
+        self.worker(channel=job.channel)
+        ahead = self.queue.put(job=job)
+
+        return job, ahead
+
+    def stop_all(self, timeout: float = 5) -> list[float]:
+        """Stops every running job and holds all queues until resumed.
+
+        Channels sharing a connection are stopped in a single request.
+
+        Returns:
+            list[float]: Stop latency per channel stopped (s).
+        """
+
+        with self._lock:
+            workers = list(self._workers.values())
+
+        running = list()
+
+        for worker in workers:
+            self.queue.pause(channel=worker.channel)
+
+            if worker.current is None or not worker.potentiostat.is_connected:
+                worker._kill()
+            else:
+                running.append((worker, worker.current))
+
+        if not running:
+            return list()
+
+        try:
+            latencies = stop_channels(
+                potentiostats=[worker.potentiostat for worker, _ in running]
+                )
+        finally:
+            for worker, job in running:
+                worker.settle(job=job, timeout=timeout)
+
+        return latencies
+
+    def cancel(self, job_id: str) -> bool:
+        return self.queue.remove(job_id=job_id)
+
+    def wait_idle(self, timeout: float = None) -> None:
+        """Blocks until every channel has run out of jobs."""
+
+        with self._lock:
+            channels = list(self._workers)
+
+        for channel in channels:
+            self.queue.wait_idle(channel=channel, timeout=timeout)
+
+    def wait_started(self, job: Job, poll: float = 0.1) -> None:
+        """Blocks until a job is running, has finished, or its channel
+        is stopped.
+        """
+
+        worker = self.worker(channel=job.channel)
+
+        while not job.done.is_set() and not worker.paused:
+            if worker.current is job and worker.experiment.status == 'running':
+                return
+
+            time.sleep(poll)
+
+    def to_dict(self) -> list[dict]:
+        return [job.to_dict() for job in self.queue.jobs()]
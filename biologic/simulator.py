@@ -0,0 +1,689 @@
+"""A software stand-in for the EC-Lab library.
+
+Exposes the BL_* functions Potentiostat uses, with the same arguments,
+but generates the data itself: a resistive cell at a configurable
+sampling rate, in real time or on a clock of the caller's choosing. Data
+is encoded into the BL_GetData buffer exactly as the instrument does, so
+everything from decoding onwards runs as it would on hardware, and can
+be tested and measured at realistic kHz rates without it.
+
+Techniques run once each, in the order loaded. LOOP isn't simulated.
+ReplayDriver plays back data captured from an instrument instead, see
+capture.py.
+
+Example:
+    driver = SimulatedDriver(sampling_rate=5000)
+    potentiostat = Potentiostat(type_='KBIO_DEV_HCP1005', driver=driver)
+    potentiostat.connect(usb_port='USB0')
+"""
+
+from collections import defaultdict, deque
+import ctypes
+from dataclasses import dataclass, field
+import itertools
+import ntpath
+from threading import Lock
+import time
+import typing
+
+import numpy as np
+
+from biologic.capture import Record, read_capture
+from biologic.constants import (
+    Amplifier, Bandwidth, CurrentRange, Device, ErrorCode, Firmware,
+    Technique
+    )
+from biologic.decoding import COLUMNS
+from biologic.potentiostats import DATA_BUFFER_SIZE
+from biologic.registry import _identify
+from biologic.utils import assert_status_ok
+
+# EccParam.ParamType, as defined by the EC-Lab library
+PARAM_INT = 0
+PARAM_BOOLEAN = 1
+PARAM_SINGLE = 2
+
+TIME_BASE = 1e-5  # s
+RESISTANCE = 100.0  # Ohm, of the simulated cell
+OCV = 3.0  # V, of the simulated cell
+
+_handles = itertools.count(start=1)
+
+
+def _deref(argument):
+    """The object behind a ctypes.byref(), or the argument itself."""
+
+    return getattr(argument, '_obj', argument)
+
+
+def _value(argument):
+    """The Python value of a ctypes scalar or string buffer."""
+
+    argument = _deref(argument)
+
+    return getattr(argument, 'value', argument)
+
+
+@dataclass
+class _Technique:
+    """A loaded technique and the parameters it was given.
+
+    Attributes:
+        self.technique_id (int): See constants.Technique.
+        self.params (dict[str, dict[int, float]]): Label: index: value.
+    """
+    technique_id: int
+    params: dict[str, dict[int, float]] = field(default_factory=dict)
+
+    def values(self, label: str, default: float) -> np.ndarray:
+        """Per-step values of a parameter, in index order."""
+
+        indexed = self.params.get(label)
+
+        if not indexed:
+            return np.array([default], dtype=np.float64)
+
+        return np.array(
+            [indexed[index] for index in sorted(indexed)], dtype=np.float64
+            )
+
+    def value(self, label: str, default: float) -> float:
+        return float(self.values(label=label, default=default)[0])
+
+    @property
+    def steps(self) -> int:
+        return int(self.value(label='Step_number', default=0)) + 1
+
+    def _durations(self) -> np.ndarray:
+        durations = self.values(label='Duration_step', default=1.0)
+
+        return np.resize(durations, self.steps)
+
+    def _vertices(self) -> tuple[np.ndarray, np.ndarray]:
+        """CV vertices and the time each is reached (s)."""
+
+        voltages = np.resize(self.values(label='Voltage_step', default=0.0), 5)
+        rate = self.value(label='Scan_Rate', default=100.0) / 1000  # V/s
+        cycles = int(self.value(label='N_Cycles', default=0)) + 1
+
+        vertices = np.concatenate(
+            (voltages[:2], np.tile(voltages[[2, 1]], cycles))
+            )
+        times = np.concatenate(
+            ([0], np.cumsum(np.abs(np.diff(vertices)) / rate))
+            )
+
+        return vertices, times
+
+    @property
+    def duration(self) -> float:
+        """Time the technique takes (s)."""
+
+        technique = Technique(self.technique_id)
+        cycles = int(self.value(label='N_Cycles', default=0)) + 1
+
+        if technique == Technique.KBIO_TECHID_OCV:
+            return self.value(label='Rest_time_T', default=1.0)
+
+        if technique == Technique.KBIO_TECHID_CV:
+            return float(self._vertices()[1][-1])
+
+        if technique == Technique.KBIO_TECHID_LOOP:
+            return 0.0
+
+        return float(self._durations().sum()) * cycles
+
+    def signal(self, t: np.ndarray) -> dict[str, np.ndarray]:
+        """Columns of the points at times t since the technique started."""
+
+        technique = Technique(self.technique_id)
+        nan = np.full(len(t), np.nan)
+        columns = {
+            'Ewe': nan, 'Ece': nan, 'Ec': nan, 'I': nan,
+            'cycle': np.zeros(len(t), dtype=np.int32)
+            }
+
+        if technique == Technique.KBIO_TECHID_OCV:
+            columns['Ewe'] = np.full(len(t), OCV)
+            columns['Ece'] = np.zeros(len(t))
+
+        elif technique == Technique.KBIO_TECHID_CV:
+            vertices, times = self._vertices()
+            columns['Ec'] = np.interp(t, times, vertices)
+            columns['Ewe'] = columns['Ec']
+            columns['I'] = columns['Ec'] / RESISTANCE
+            segment = np.searchsorted(times, t, side='right') - 1
+            columns['cycle'] = (np.maximum(segment - 1, 0) // 2).astype(
+                np.int32
+                )
+
+        else:
+            durations = self._durations()
+            period = durations.sum()
+            step = np.searchsorted(
+                np.cumsum(durations), np.mod(t, period), side='right'
+                ).clip(max=self.steps - 1)
+            columns['cycle'] = (t // period).astype(np.int32)
+
+            if technique == Technique.KBIO_TECHID_CA:
+                voltages = np.resize(
+                    self.values(label='Voltage_step', default=OCV), self.steps
+                    )
+                columns['Ewe'] = voltages[step]
+                columns['I'] = (voltages[step] - OCV) / RESISTANCE
+            else:
+                currents = np.resize(
+                    self.values(label='Current_step', default=0.0), self.steps
+                    )
+                columns['I'] = currents[step]
+                columns['Ewe'] = OCV + currents[step] * RESISTANCE
+
+        return columns
+
+
+@dataclass
+class _Channel:
+    """What a simulated channel is doing.
+
+    Attributes:
+        self.techniques (list[_Technique]): As loaded, in order.
+        self.started (float): Clock time of BL_StartChannel (s).
+        self.stopped (float): Clock time it stopped, None while running.
+        self.index (int): Technique in progress.
+        self.offset (float): When it started, since the channel did (s).
+        self.emitted (int): Points of it handed out so far.
+    """
+    techniques: list[_Technique] = field(default_factory=list)
+    started: float = None
+    stopped: float = None
+    index: int = 0
+    offset: float = 0.0
+    emitted: int = 0
+
+    @property
+    def running(self) -> bool:
+        return self.started is not None and self.stopped is None
+
+
+class SimulatedDriver:
+    """Generates data the way a connected instrument would.
+
+    Attributes:
+        self.device (str): Reported on connect, e.g. 'KBIO_DEV_HCP1005'.
+        self.sampling_rate (float): Points per second (Hz).
+        self.clock (typing.Callable): Returns the current time (s).
+        self.noise (float): Standard deviation of the Gaussian noise on
+            Ewe (V), and through the cell's resistance on I.
+        self.channels (dict[int, _Channel]): Channels loaded so far.
+    """
+
+    def __init__(
+        self,
+        device: str = Device.KBIO_DEV_HCP1005.name,
+        sampling_rate: float = 1000.0,
+        clock: typing.Callable[[], float] = time.monotonic,
+        no_channels: int = 1,
+        noise: float = 0.0
+        ):
+        """
+        Args:
+            device (str, optional): Defaults to 'KBIO_DEV_HCP1005'.
+            sampling_rate (float, optional): Defaults to 1 kHz.
+            clock (typing.Callable, optional): E.g. a fake clock to step
+                through time. Defaults to time.monotonic.
+            no_channels (int, optional): Defaults to 1.
+            noise (float, optional): E.g. 1e-4 for data that looks
+                measured, to compress. Defaults to 0, i.e. none.
+        """
+
+        self.device = device
+        self.sampling_rate = sampling_rate
+        self.clock = clock
+        self.no_channels = no_channels
+        self.noise = noise
+        self.channels: dict[int, _Channel] = dict()
+
+        self._name = 'simulator'
+        self._lock = Lock()
+        self._rng = np.random.default_rng(seed=0)
+
+    def _status(self, return_code: int) -> int:
+        """Raises on errors, like the errcheck hook of a bound driver."""
+
+        assert_status_ok(driver=self, return_code=return_code)
+
+        return return_code
+
+    def _channel(self, channel) -> _Channel:
+        channel = _value(channel)
+
+        if not 0 <= channel < self.no_channels:
+            self._status(ErrorCode.ERR_GEN_CHANNELNOTPLUGGED.value)
+
+        return self.channels.setdefault(channel, _Channel())
+
+    def BL_GetErrorMsg(self, error_code, message, size) -> int:
+        try:
+            text = ErrorCode(_value(error_code)).name
+        except ValueError:
+            text = f'Unknown error {_value(error_code)}'
+
+        _deref(message).value = text.encode()[:_value(size) - 1]
+
+        return 0
+
+    def BL_Connect(self, address, timeout, id_, device_infos) -> int:
+        _deref(id_).value = next(_handles)
+        device_infos = _deref(device_infos)
+        device_infos.DeviceCode = Device[self.device].value
+        device_infos.NumberOfChannels = self.no_channels
+
+        return self._status(0)
+
+    def BL_Disconnect(self, id_) -> int:
+        return self._status(0)
+
+    def BL_DefineIntParameter(self, label, value, index, param) -> int:
+        return self._define(label, int(_value(value)), PARAM_INT, index, param)
+
+    def BL_DefineBoolParameter(self, label, value, index, param) -> int:
+        return self._define(
+            label, int(bool(_value(value))), PARAM_BOOLEAN, index, param
+            )
+
+    def BL_DefineSglParameter(self, label, value, index, param) -> int:
+        numeric = int(np.float32(_value(value)).view(np.uint32))
+
+        return self._define(label, numeric, PARAM_SINGLE, index, param)
+
+    def _define(self, label, numeric: int, type_: int, index, param) -> int:
+        param = _deref(param)
+        encoded = _value(label)[:63]
+
+        ctypes.memset(param.ParamStr, 0, len(param.ParamStr))
+        ctypes.memmove(param.ParamStr, encoded, len(encoded))
+        param.ParamType = type_
+        param.ParamVal = numeric & 0xFFFFFFFF
+        param.ParamIndex = _value(index)
+
+        return self._status(0)
+
+    def BL_ConvertNumericIntoSingle(self, numeric, single) -> int:
+        _deref(single).value = float(
+            np.uint32(_value(numeric)).view(np.float32)
+            )
+
+        return self._status(0)
+
+    def BL_LoadTechnique(
+        self, id_, channel, path, params, first, last, display
+        ) -> int:
+        path = _value(path)
+        path = path.decode() if isinstance(path, bytes) else path
+        technique, _ = _identify(filename=ntpath.basename(path).lower())
+
+        if technique is None:
+            return self._status(ErrorCode.ERR_GEN_FILENOTEXISTS.value)
+
+        loaded = _Technique(technique_id=technique.value)
+
+        for index in range(params.len):
+            param = params.pParams[index]
+            label = bytes(param.ParamStr).split(b'\0')[0].decode()
+            value = {
+                PARAM_INT: np.uint32(param.ParamVal).view(np.int32),
+                PARAM_BOOLEAN: param.ParamVal,
+                PARAM_SINGLE: np.uint32(param.ParamVal).view(np.float32),
+                }[param.ParamType]
+            loaded.params.setdefault(label, dict())[param.ParamIndex] = float(
+                value
+                )
+
+        with self._lock:
+            state = self._channel(channel=channel)
+
+            if first:
+                state.techniques = list()
+
+            state.techniques.append(loaded)
+
+        return self._status(0)
+
+    def BL_StartChannel(self, id_, channel) -> int:
+        with self._lock:
+            state = self._channel(channel=channel)
+            state.started = self.clock()
+            state.stopped = None
+            state.index, state.offset, state.emitted = 0, 0.0, 0
+
+        return self._status(0)
+
+    def BL_StopChannel(self, id_, channel) -> int:
+        with self._lock:
+            state = self._channel(channel=channel)
+
+            if state.running:
+                state.stopped = self.clock()
+
+        return self._status(0)
+
+    def BL_StopChannels(self, id_, channels, results, length) -> int:
+        for index in range(_value(length)):
+            try:
+                self.BL_StopChannel(id_, channels[index])
+                results[index] = 0
+            except Exception as e:
+                results[index] = getattr(e, 'error_code', -1)
+
+        return self._status(0)
+
+    def BL_GetCurrentValues(self, id_, channel, current_values) -> int:
+        with self._lock:
+            state = self._channel(channel=channel)
+            self._current_values(
+                state=state,
+                elapsed=self._elapsed(state=state),
+                current_values=_deref(current_values)
+                )
+
+        return self._status(0)
+
+    def BL_GetChannelsPlugged(self, id_, status, size) -> int:
+        for channel in range(_value(size)):
+            status[channel] = int(channel < self.no_channels)
+
+        return self._status(0)
+
+    def BL_IsChannelPlugged(self, id_, channel) -> bool:
+        return 0 <= _value(channel) < self.no_channels
+
+    def BL_GetChannelInfos(self, id_, channel, channel_infos) -> int:
+        with self._lock:
+            state = self._channel(channel=channel)
+            infos = _deref(channel_infos)
+
+            ctypes.memset(ctypes.byref(infos), 0, ctypes.sizeof(infos))
+            infos.Channel = _value(channel)
+            infos.FirmwareCode = Firmware.KBIO_FIRM_KERNEL.value
+            infos.AmpCode = Amplifier.KBIO_AMPL_NONE.value
+            infos.State = 1 if state.running else 0
+            infos.MaxIRange = CurrentRange.KBIO_IRANGE_1A.value
+            infos.MinIRange = CurrentRange.KBIO_IRANGE_100pA.value
+            infos.MaxBandwidth = Bandwidth.KBIO_BW_9.value
+            infos.NbOfTechniques = len(state.techniques)
+
+        return self._status(0)
+
+    def BL_GetData(
+        self, id_, channel, buffer, data_infos, current_values
+        ) -> int:
+        with self._lock:
+            state = self._channel(channel=channel)
+            elapsed = self._elapsed(state=state)
+            data_infos = _deref(data_infos)
+
+            ctypes.memset(ctypes.byref(data_infos), 0, ctypes.sizeof(data_infos))
+            self._advance(state=state, elapsed=elapsed)
+
+            if state.index < len(state.techniques):
+                raw = self._points(state=state, elapsed=elapsed)
+                technique = state.techniques[state.index]
+
+                out = np.ctypeslib.as_array(
+                    ctypes.cast(buffer, ctypes.POINTER(ctypes.c_uint32)),
+                    shape=(DATA_BUFFER_SIZE,)
+                    )
+                out[:raw.size] = raw.ravel()
+
+                data_infos.NbRaws, data_infos.NbCols = raw.shape
+                data_infos.TechniqueIndex = state.index
+                data_infos.TechniqueID = technique.technique_id
+                data_infos.StartTime = state.offset
+
+            self._current_values(
+                state=state,
+                elapsed=elapsed,
+                current_values=_deref(current_values)
+                )
+
+        return self._status(0)
+
+    def _elapsed(self, state: _Channel) -> float:
+        """Time since the channel started, stopping it once all the
+        techniques have run their course.
+        """
+
+        if state.started is None:
+            return 0.0
+
+        if state.stopped is None:
+            duration = sum(
+                technique.duration for technique in state.techniques
+                )
+
+            if self.clock() - state.started >= duration:
+                state.stopped = state.started + duration
+
+        end = self.clock() if state.stopped is None else state.stopped
+
+        return end - state.started
+
+    def _total(self, technique: _Technique) -> int:
+        """Points a technique records."""
+
+        return int(technique.duration * self.sampling_rate) + 1
+
+    def _advance(self, state: _Channel, elapsed: float) -> None:
+        """Moves on past techniques whose points have all been read."""
+
+        while state.index < len(state.techniques):
+            technique = state.techniques[state.index]
+
+            if state.emitted < self._total(technique=technique):
+                return
+
+            if elapsed < state.offset + technique.duration:
+                return
+
+            state.offset += technique.duration
+            state.index += 1
+            state.emitted = 0
+
+    def _points(self, state: _Channel, elapsed: float) -> np.ndarray:
+        """Encodes the points due since the last call, as many as fit."""
+
+        technique = state.techniques[state.index]
+        columns = COLUMNS.get(technique.technique_id, ())
+        no_cols = 2 + len(columns)
+
+        due = min(
+            self._total(technique=technique),
+            int(max(elapsed - state.offset, 0) * self.sampling_rate) + 1
+            )
+        no_rows = min(max(due - state.emitted, 0), DATA_BUFFER_SIZE // no_cols)
+
+        t = (state.emitted + np.arange(no_rows)) / self.sampling_rate
+        signal = technique.signal(t=t)
+        state.emitted += no_rows
+
+        if self.noise:
+            noise = self._rng.normal(scale=self.noise, size=no_rows)
+            signal['Ewe'] = signal['Ewe'] + noise
+            signal['I'] = signal['I'] + noise / RESISTANCE
+
+        raw = np.empty((no_rows, no_cols), dtype=np.uint32)
+        t_rel = np.round(t / TIME_BASE).astype(np.uint64)
+        raw[:, 0] = t_rel >> np.uint64(32)
+        raw[:, 1] = t_rel & np.uint64(0xFFFFFFFF)
+
+        for index, name in enumerate(columns, start=2):
+            if name == 'cycle':
+                raw[:, index] = signal[name].astype(np.int32).view(np.uint32)
+            else:
+                raw[:, index] = signal[name].astype(np.float32).view(np.uint32)
+
+        return raw
+
+    def _current_values(
+        self, state: _Channel, elapsed: float, current_values
+        ) -> None:
+        ctypes.memset(
+            ctypes.byref(current_values), 0, ctypes.sizeof(current_values)
+            )
+        current_values.State = 1 if state.running else 0
+        current_values.TimeBase = TIME_BASE
+        current_values.ElapsedTime = elapsed
+
+        if state.index < len(state.techniques):
+            technique = state.techniques[state.index]
+            now = technique.signal(t=np.array([elapsed - state.offset]))
+            current_values.Ewe = float(np.nan_to_num(now['Ewe'][0]))
+            current_values.I = float(np.nan_to_num(now['I'][0]))
+
+
+class ReplayDriver(SimulatedDriver):
+    """Plays back a capture, see capture.py.
+
+    Connecting, loading and starting work as they do on the simulator,
+    but the data comes from the capture: each BL_GetData call returns the
+    next record of the channel once it's due, i.e. as long after
+    BL_StartChannel as it was after the first record, divided by speed.
+    Until then there are no points. Once the records of a channel run
+    out, it stops.
+
+    Attributes:
+        self.path (str): Capture file.
+        self.speed (float): 1 replays in real time, 10 ten times as fast,
+            None as fast as called.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        speed: float = 1.0,
+        clock: typing.Callable[[], float] = time.monotonic,
+        device: str = Device.KBIO_DEV_HCP1005.name,
+        no_channels: int = 16
+        ):
+        """
+        Args:
+            path (str): Capture file.
+            speed (float, optional): Defaults to 1, i.e. real time.
+            clock (typing.Callable, optional): Defaults to time.monotonic.
+            device (str, optional): Defaults to 'KBIO_DEV_HCP1005'.
+            no_channels (int, optional): Defaults to 16.
+        """
+
+        super(ReplayDriver, self).__init__(
+            device=device, clock=clock, no_channels=no_channels
+            )
+
+        self.path = path
+        self.speed = speed
+
+        self._records = read_capture(path=path)
+        self._pending: dict[int, deque[Record]] = defaultdict(deque)
+        self._first: dict[int, int] = dict()
+        self._last: dict[int, Record] = dict()
+        self._name = 'replay'
+
+    def _peek(self, channel: int) -> Record:
+        """Next record of a channel, None once there are no more."""
+
+        pending = self._pending[channel]
+
+        while not pending:
+            record = next(self._records, None)
+
+            if record is None:
+                break
+
+            self._pending[record.channel].append(record)
+            self._first.setdefault(record.channel, record.timestamp)
+
+        return pending[0] if pending else None
+
+    def _due(self, channel: int, state: _Channel) -> Record:
+        """Takes the next record of a channel if it's due."""
+
+        if not state.running:
+            return None
+
+        record = self._peek(channel=channel)
+
+        if record is None:
+            state.stopped = self.clock()
+
+            return None
+
+        if self.speed is not None:
+            offset = (record.timestamp - self._first[channel]) / 1e9
+
+            if self.clock() - state.started < offset / self.speed:
+                return None
+
+        self._last[channel] = self._pending[channel].popleft()
+
+        return record
+
+    def _replay_values(
+        self, channel: int, state: _Channel, current_values
+        ) -> None:
+        """The last values replayed, stopped once the channel is."""
+
+        if channel in self._last:
+            ctypes.memmove(
+                ctypes.addressof(current_values),
+                ctypes.addressof(self._last[channel].current_values),
+                ctypes.sizeof(current_values)
+                )
+        else:
+            self._current_values(
+                state=state, elapsed=0.0, current_values=current_values
+                )
+
+        if not state.running:
+            current_values.State = 0
+
+    def BL_GetCurrentValues(self, id_, channel, current_values) -> int:
+        with self._lock:
+            state = self._channel(channel=channel)
+            self._replay_values(
+                channel=_value(channel),
+                state=state,
+                current_values=_deref(current_values)
+                )
+
+        return self._status(0)
+
+    def BL_GetData(
+        self, id_, channel, buffer, data_infos, current_values
+        ) -> int:
+        with self._lock:
+            state = self._channel(channel=channel)
+            record = self._due(channel=_value(channel), state=state)
+            data_infos = _deref(data_infos)
+
+            if record is None:
+                ctypes.memset(
+                    ctypes.byref(data_infos), 0, ctypes.sizeof(data_infos)
+                    )
+            else:
+                ctypes.memmove(
+                    ctypes.addressof(data_infos),
+                    ctypes.addressof(record.data_infos),
+                    ctypes.sizeof(data_infos)
+                    )
+                out = np.ctypeslib.as_array(
+                    ctypes.cast(buffer, ctypes.POINTER(ctypes.c_uint32)),
+                    shape=(DATA_BUFFER_SIZE,)
+                    )
+                out[:record.buffer.size] = record.buffer
+
+            self._replay_values(
+                channel=_value(channel),
+                state=state,
+                current_values=_deref(current_values)
+                )
+
+        return self._status(0)
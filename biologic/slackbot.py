@@ -26,7 +26,9 @@ def _prepend_user_id(user_id: str, message: str) -> str:
     return f'<@{user_id}>: {message}'
 
 
-def post(message: str, url: str, user_id: str = None) -> None:
+def post(
+    message: str, url: str, user_id: str = None, timeout: float = 10
+    ) -> None:
     """Sends message to slack channel.
 
     Requires incoming webhooks enabled for the channel IDd
@@ -39,6 +41,12 @@ def post(message: str, url: str, user_id: str = None) -> None:
             share this externally.
         user_id (str): User ID for tagging user in message.
             Refer to Notion manual on how to find.
+        timeout (float, optional): Seconds to wait for Slack before
+            giving up. Defaults to 10.
+
+    Raises:
+        requests.RequestException: If Slack can't be reached in time or
+            rejects the message.
     """
 
     if user_id is not None:
@@ -51,5 +59,7 @@ def post(message: str, url: str, user_id: str = None) -> None:
     response = requests.post(
         url=url,
         headers=HEADERS,
-        json=outgoing_message
-    )
\ No newline at end of file
+        json=outgoing_message,
+        timeout=timeout
+    )
+    response.raise_for_status()
@@ -0,0 +1,168 @@
+"""Persists the state of running experiments so they survive a restart.
+
+Instruments carry on with their techniques regardless of whether the
+server is up. If the container restarts mid-run, the store tells the new
+process which channels to reattach to, and where in the data stream the
+previous process left off.
+
+Example:
+    store = StateStore()
+    store.start(run_id=job_id, exp_id='brix2/test/test', ...)
+    store.acknowledge(run_id=job_id, cursor=12.5)
+    store.finish(run_id=job_id)
+"""
+
+from dataclasses import dataclass
+import json
+import os
+import sqlite3
+from threading import Lock
+import time
+
+STATE_PATH = os.path.join('state', 'state.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    exp_id TEXT NOT NULL,
+    device TEXT,
+    channel INTEGER NOT NULL,
+    raw_params TEXT NOT NULL,
+    start_time REAL NOT NULL,
+    cursor REAL,
+    finished INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+@dataclass
+class RunState:
+    """A run as recorded in the store.
+
+    Attributes:
+        self.run_id (str): Unique identifier, e.g. scheduler.Job.job_id.
+        self.exp_id (str): Experiment ID (corresponding to Drops schema).
+        self.device (str): Device type, e.g. 'KBIO_DEV_HCP1005'.
+        self.channel (int): Channel the run is on.
+        self.raw_params (dict): Technique sequence as passed to
+            experiment.run().
+        self.start_time (float): When the channel was started (UNIX).
+        self.cursor (float): Time (s) of the last acknowledged data
+            point, None if nothing has been acknowledged yet.
+    """
+    run_id: str
+    exp_id: str
+    device: str
+    channel: int
+    raw_params: dict
+    start_time: float
+    cursor: float = None
+
+
+class StateStore:
+    """SQLite-backed record of runs, safe to share between threads.
+
+    Attributes:
+        self.path (str): Database location.
+    """
+
+    def __init__(self, path: str = STATE_PATH):
+        self.path = path
+
+        directory = os.path.dirname(path)
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        # Each acknowledgement is durable without an fsync of the whole db
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(SCHEMA)
+        self._connection.commit()
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> list[tuple]:
+        with self._lock:
+            rows = self._connection.execute(sql, parameters).fetchall()
+            self._connection.commit()
+
+        return rows
+
+    def start(
+        self,
+        run_id: str,
+        exp_id: str,
+        device: str,
+        channel: int,
+        raw_params: dict
+        ) -> None:
+        """Records a run as started on the instrument."""
+
+        self._execute(
+            'INSERT OR REPLACE INTO runs '
+            '(run_id, exp_id, device, channel, raw_params, start_time) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (
+                run_id,
+                exp_id,
+                device,
+                channel,
+                json.dumps(raw_params),
+                time.time()
+                )
+            )
+
+    def acknowledge(self, run_id: str, cursor: float) -> None:
+        """Advances the cursor past a data point that has been written out.
+
+        Args:
+            run_id (str): Run the point belongs to.
+            cursor (float): Time of the point, its 'time' column (s).
+        """
+
+        self._execute(
+            'UPDATE runs SET cursor = ? WHERE run_id = ?', (cursor, run_id)
+            )
+
+    def finish(self, run_id: str) -> None:
+        self._execute(
+            'UPDATE runs SET finished = 1 WHERE run_id = ?', (run_id, )
+            )
+
+    def unfinished(self, channel: int = None) -> list[RunState]:
+        """Runs that were started but never finished, oldest first.
+
+        Args:
+            channel (int, optional): Only runs on this channel.
+                Defaults to None, i.e. all.
+
+        Returns:
+            list[RunState]: Runs to reattach to.
+        """
+
+        rows = self._execute(
+            'SELECT run_id, exp_id, device, channel, raw_params, '
+            'start_time, cursor FROM runs WHERE finished = 0 '
+            'ORDER BY start_time'
+            )
+
+        runs = [
+            RunState(
+                run_id=row[0],
+                exp_id=row[1],
+                device=row[2],
+                channel=row[3],
+                raw_params=json.loads(row[4]),
+                start_time=row[5],
+                cursor=row[6]
+                ) for row in rows
+            ]
+
+        return [
+            run for run in runs if channel is None or run.channel == channel
+            ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
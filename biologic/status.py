@@ -0,0 +1,184 @@
+"""Device and channel metadata, cached, for /status.
+
+Config.device_info, get_channel_info() and get_channels_plugged() each
+cost a round trip to the instrument, and monitoring tools poll them for
+every channel, over and over. Instead, a MetadataCache fetches them all
+in a background thread once every ttl seconds, translating codes (see
+utils.parse_channel_info) as it goes. Requests only ever read the last
+snapshot, without any instrument I/O.
+
+The cache doesn't connect to the device itself, a second connection
+would contend with the scheduler's. It borrows the scheduler's instead
+(see scheduler.Scheduler.connection() and potentiostats.Config.sharing()),
+so its calls queue behind acquisition's on the same command serializer.
+Until something has connected, there's nothing to refresh.
+
+Should a refresh fail, the last good snapshot is kept, along with the
+error, and the next refresh borrows the connection anew.
+
+Example:
+    cache = MetadataCache(usb_port='USB0', connection=scheduler.connection)
+    cache.start()
+    cache.snapshot()['channels'][0]['State(translated)']
+"""
+
+import copy
+import logging
+from threading import Event, Lock, Thread
+import time
+import typing
+
+from biologic.potentiostats import Config, Potentiostat
+
+DEFAULT_TTL = 30.0  # s
+
+
+class MetadataCache:
+    """Metadata of a device and its channels, refreshed every ttl.
+
+    Attributes:
+        self.usb_port (str): Address of the device.
+        self.connection (typing.Callable): Returns a connected
+            potentiostat on the device to borrow, None if there's none.
+        self.ttl (float): Seconds between refreshes.
+        self.clock (typing.Callable): Host UTC (s).
+    """
+
+    def __init__(
+        self,
+        usb_port: str,
+        connection: typing.Callable[[], Potentiostat],
+        ttl: float = DEFAULT_TTL,
+        clock: typing.Callable[[], float] = time.time
+        ):
+        """
+        Args:
+            usb_port (str): Address of the device, e.g. 'USB0'.
+            connection (typing.Callable): E.g. Scheduler.connection.
+            ttl (float, optional): Defaults to DEFAULT_TTL.
+            clock (typing.Callable, optional): Defaults to time.time.
+
+        Raises:
+            ValueError: If ttl isn't positive.
+        """
+
+        if ttl <= 0:
+            raise ValueError(f'TTL must be positive, not {ttl}')
+
+        self.usb_port = usb_port
+        self.connection = connection
+        self.ttl = ttl
+        self.clock = clock
+
+        self._snapshot = {
+            'usb_port': usb_port,
+            'device': None,
+            'channels': list(),
+            'refreshed': None,
+            'error': None,
+            }
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread: Thread = None
+
+    def _borrow(self) -> Config:
+        """A Config on the connection to borrow.
+
+        Raises:
+            ConnectionError: If there's none, yet.
+        """
+
+        potentiostat = self.connection()
+
+        if potentiostat is None:
+            raise ConnectionError('Not connected, nothing has run yet')
+
+        return Config.sharing(potentiostat=potentiostat)
+
+    def _fetch(self) -> tuple[dict, list[dict]]:
+        """Every round trip a refresh makes.
+
+        Returns:
+            dict: Device info.
+            list[dict]: Per channel, whether it's plugged and if it is,
+                its info, translated.
+        """
+
+        config = self._borrow()
+        device = config.device_info
+        plugged = config.get_channels_plugged(
+            no_channels=device['NumberOfChannels']
+            )
+        channels = list()
+
+        for channel, is_plugged in enumerate(plugged):
+            info = {'channel': channel, 'plugged': is_plugged}
+
+            if is_plugged:
+                config.channel = channel
+                info.update(config.get_channel_info())
+
+            channels.append(info)
+
+        return device, channels
+
+    def refresh(self) -> None:
+        """Fetches everything anew, keeping the last snapshot on failure."""
+
+        try:
+            device, channels = self._fetch()
+        except Exception as e:
+            logging.error(e)
+
+            # The connection isn't this cache's to reset, its owner will
+            with self._lock:
+                self._snapshot['error'] = f'{type(e).__name__}: {e}'
+
+            return
+
+        with self._lock:
+            self._snapshot = {
+                'usb_port': self.usb_port,
+                'device': device,
+                'channels': channels,
+                'refreshed': self.clock(),
+                'error': None,
+                }
+
+    def snapshot(self) -> dict:
+        """The last refresh, without touching the instrument.
+
+        Returns:
+            dict: 'usb_port', 'device' (None until the first refresh
+                succeeds), 'channels', 'refreshed' (host UTC [s]), 'age'
+                (s since) and 'error' (of the last refresh, None if it
+                succeeded).
+        """
+
+        with self._lock:
+            snapshot = copy.deepcopy(self._snapshot)
+
+        refreshed = snapshot['refreshed']
+        snapshot['age'] = None if refreshed is None else (
+            self.clock() - refreshed
+            )
+
+        return snapshot
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self.refresh()
+            self._stopped.wait(timeout=self.ttl)
+
+    def start(self) -> None:
+        """Refreshes in a background thread, right away and every ttl."""
+
+        if self._thread is None:
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stopped.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
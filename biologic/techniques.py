@@ -8,18 +8,31 @@ The functions are not sorted alphabetically but in the order of highest-level
 to lowest level.
 """
 
-from ctypes import Array, c_float, c_bool, c_int32, c_buffer, byref, WinDLL
-import json
+from ctypes import Array, c_float, c_bool, c_int32, c_buffer, byref
 from typing import Union
 
+from biologic.config_store import get_store
+from biologic.prototypes import load_driver
 from biologic.structures import EccParam, EccParams
+from biologic.utils import DRIVERPATH
 
-with open('biologic\\config.json', 'r') as f:
-    settings = json.load(f)
+settings = get_store().snapshot()
 
-DRIVERPATH = settings['driverpath']
+# Address of a driver_host.DriverHost, if the DLLs run out of process
+DRIVER_HOST = settings.get('driver_host')
 
-driver = WinDLL(DRIVERPATH + 'EClib64.dll')
+driver = load_driver(path=DRIVERPATH + 'EClib64.dll', host=DRIVER_HOST)
+
+# Parameters of multi-step techniques (CA, CPLIMIT, CV) that the driver
+# reads once per step. A single value is repeated for every step.
+STEP_LABELS = frozenset({
+    'Voltage_step',
+    'Duration_step',
+    'Current_step',
+    'Scan_Rate',
+    'vs_initial',
+    'Voltage_limit',
+    })
 
 
 def set_technique_params(
@@ -31,6 +44,10 @@ def set_technique_params(
         techniques (list[dict[str, Union[float, int, bool]]]): Techniques,
             as passed from utils.parse_raw_params().
 
+    Raises:
+        ValueError: If the per-step lists of a technique differ in
+            length, from each other or from its Step_number.
+
     Returns:
         EccParams: Technique parameters ready to be passed
             to potentiostats.load_technique().
@@ -53,25 +70,35 @@ def set_technique_params(
 
     for technique in techniques:
         ecc_param_list = list()
+        no_steps = _no_steps(technique=technique)
 
-        # If I understand it correctly, index>0 is only useful for techniques with
-        # multiple steps. Will implement if need be
+        # Techniques with several steps (CA, CP, CV) take a list per
+        # parameter, value i going to step i through index i.
         for label, value in technique.items():
 
             if label == 'Voltage_limit':
-                is_upper = True if technique['Current_step'
-                                            ] > 0 else False
-                config_limit, voltage_limit = _set_voltage_limit(
-                    voltage=value, is_upper=is_upper
+                ecc_param_list.extend(
+                    _set_voltage_limits(
+                        voltages=_per_step(
+                            label=label, value=value, no_steps=no_steps
+                            ),
+                        currents=_per_step(
+                            label='Current_step',
+                            value=technique['Current_step'],
+                            no_steps=no_steps
+                            )
+                        )
                     )
-                ecc_param_list.extend([config_limit, voltage_limit])
 
                 continue
 
-            ecc_param = _make_ecc_param(
-                label=label, value=value, index=0
-                )
-            ecc_param_list.append(ecc_param)
+            values = _per_step(label=label, value=value, no_steps=no_steps)
+
+            for index, value_ in enumerate(values):
+                ecc_param = _make_ecc_param(
+                    label=label, value=value_, index=index
+                    )
+                ecc_param_list.append(ecc_param)
 
         ecc_params = _consolidate_ecc_params(ecc_param_list)
         c_technique_params.append(ecc_params)
@@ -79,6 +106,65 @@ def set_technique_params(
     return c_technique_params
 
 
+def _as_list(value) -> list:
+    """Wraps single values, so every parameter can be indexed.
+
+    Helper function for set_technique_params().
+    """
+
+    if isinstance(value, (list, tuple)):
+        return list(value)
+
+    return [value]
+
+
+def _no_steps(technique: dict) -> int:
+    """Steps of a technique, as per its Step_number or per-step lists.
+
+    Helper function for set_technique_params().
+
+    Raises:
+        ValueError: If per-step lists differ in length, from each other
+            or from Step_number.
+    """
+
+    lengths = {
+        label: len(value) for label, value in technique.items()
+        if isinstance(value, (list, tuple)) and len(value) > 1
+        }
+
+    if len(set(lengths.values())) > 1:
+        raise ValueError(f'Per-step lists differ in length: {lengths}')
+
+    length = max(lengths.values(), default=1)
+    step_number = technique.get('Step_number')
+
+    if step_number is None:
+        return length
+
+    if lengths and length != step_number + 1:
+        raise ValueError(
+            f'Step_number = {step_number} but {length} steps given'
+            )
+
+    return step_number + 1
+
+
+def _per_step(label: str, value, no_steps: int) -> list:
+    """The value of each step, a single one repeated if label is one of
+    STEP_LABELS.
+
+    Helper function for set_technique_params().
+    """
+
+    values = _as_list(value)
+
+    if label in STEP_LABELS and len(values) == 1:
+        return values * no_steps
+
+    return values
+
+
 def _consolidate_ecc_params(
     *ecc_param_tuple: tuple[EccParam]
     ) -> EccParams:
@@ -132,7 +218,8 @@ def _make_ecc_param(
         label (str): Step label, e.g. 'Rest_time_T'. NOTE: Case-sensitive.
         value (Union[float, bool, int]): So, either a float, bool, or an int.
             The step value.
-        index (int): Technique index. Used for linked techniques.
+        index (int): Step the value applies to, for techniques with
+            several steps. 0 otherwise.
 
     Returns:
         EccParam: A ctypes.Structure, refer to class definition.
@@ -161,7 +248,7 @@ def _define_parameter(
         label (str): Step label, e.g. 'Rest_time_T'. NOTE: Case-sensitive.
         value (Union[float, bool, int]): So, either a float, bool, or an int.
             The step value.
-        index (int): Technique index. Used for linked techniques.
+        index (int): Step the value applies to, 0 if there's only one.
         EccParam: An _empty_ ctypes.Structure, refer to class definition.
     """
 
@@ -177,9 +264,46 @@ def _define_parameter(
     _function(c_label, c_value, index, byref(ecc_param))
 
 
+def _set_voltage_limits(
+    voltages: list[float], currents: list[float]
+    ) -> list[EccParam]:
+    """Configures a voltage limit per step.
+
+    Helper function for set_technique_params().
+
+    Args:
+        voltages (list[float]): Voltage limit per step [V].
+        currents (list[float]): Current per step, deciding whether each
+            limit is an upper or lower cutoff [A].
+
+    Raises:
+        ValueError: If there isn't a current per voltage.
+
+    Returns:
+        list[EccParam]: Config and value for each step, in order.
+    """
+
+    if len(voltages) != len(currents):
+        raise ValueError(
+            f'{len(voltages)} voltage limits but {len(currents)} currents'
+            )
+
+    ecc_params = list()
+
+    for index, (voltage, current) in enumerate(zip(voltages, currents)):
+        ecc_params.extend(
+            _set_voltage_limit(
+                voltage=voltage, is_upper=current > 0, index=index
+                )
+            )
+
+    return ecc_params
+
+
 def _set_voltage_limit(
     voltage: float,
-    is_upper: bool = True
+    is_upper: bool = True,
+    index: int = 0
     ) -> list[EccParam, EccParam]:
     """Configures parameters to set voltage limit.
     
@@ -192,6 +316,7 @@ def _set_voltage_limit(
         is_upper (bool, optional): Denoting whether the voltage value is
             upper or lower cutoff. Should hinge on the current sign.
             Defaults to True.
+        index (int, optional): Step the limit applies to. Defaults to 0.
 
     Returns:
         config_limit (EccParam): Numerical representation of the config,
@@ -205,10 +330,10 @@ def _set_voltage_limit(
     # be interpreted as a 2-based int (not 10-based, the default).
     config_val =  '101' if is_upper else '001'
     config_limit = _make_ecc_param(
-        label='Test1_Config', value=int(config_val, 2), index=0
+        label='Test1_Config', value=int(config_val, 2), index=index
         )
     voltage_limit = _make_ecc_param(
-        label='Test1_Value', value=voltage, index=0
+        label='Test1_Value', value=voltage, index=index
         )
 
     return config_limit, voltage_limit
@@ -1,19 +1,50 @@
 """Low-level helper functions for potentiostat classes and associated techniques."""
 
 import ctypes
-import json
+import os
 import re
 
 from biologic import constants, exceptions
+from biologic.config_store import get_store
 
-with open('biologic\\config.json', 'r') as f:
-    settings = json.load(f)
+settings = get_store().snapshot()
 
-DRIVERPATH = settings['driverpath']
+
+def native_path(path: str) -> str:
+    """A path from config.json, e.g. 'drivers\\', with the separators of
+    the OS running this process.
+
+    The server may run natively on Linux while the DLLs run under Wine,
+    see driver_host.py. Wine takes either separator, Linux only '/'.
+    """
+
+    return path.replace('\\', os.sep).replace('/', os.sep)
+
+
+DRIVERPATH = native_path(settings['driverpath'])
+
+# Decoded error messages keyed by (driver name, error code). A flapping
+# channel repeats the same few codes, so each is translated only once.
+_error_catalog: dict[tuple[str, int], str] = dict()
+
+
+def _driver_name(driver) -> str:
+    """Identifies a driver in the error catalog.
+
+    Helper function for _get_error_message() and _get_error_finder_message().
+
+    Args:
+        driver (ctypes.WinDLL): Driver for calling ECLib function.
+
+    Returns:
+        str: Library path, e.g. 'drivers\\EClib64.dll'.
+    """
+
+    return getattr(driver, '_name', str(id(driver)))
 
 
 def _get_error_message(
-    driver: ctypes.WinDLL, error_code: int, bytes_: int = 255
+    driver: ctypes.CDLL, error_code: int, bytes_: int = 255
     ) -> str:
     """Returns error message's corresponding error_code.
 
@@ -28,24 +59,33 @@ def _get_error_message(
         str: Error message's corresponding error_code.
     """
 
+    key = (_driver_name(driver), error_code)
+
+    if key in _error_catalog:
+        return _error_catalog[key]
+
     message = ctypes.create_string_buffer(bytes_)
     number_of_chars = ctypes.c_uint32(bytes_)
 
     status = driver.BL_GetErrorMsg(
         error_code,
-        ctypes.byref(message),
+        message,
         ctypes.byref(number_of_chars)
     )
 
     # # Can't use assert__status_ok() here since it implicitly runs this method.
     if status != 0:
-        raise exceptions.ECLibError(error_code=status, message=message)
+        raise exceptions.ECLibError(
+            error_code=status, message=exceptions.default_error_msg
+            )
 
-    return message.raw.decode()
+    _error_catalog[key] = message.value.decode()
+
+    return _error_catalog[key]
 
 
 def _get_error_finder_message(
-    driver: ctypes.WinDLL, error_code: int, bytes_: int = 255
+    driver: ctypes.CDLL, error_code: int, bytes_: int = 255
     ) -> str:
     """Returns error message's corresponding error_code.
 
@@ -60,19 +100,28 @@ def _get_error_finder_message(
         str: Error message's corresponding error_code.
     """
 
+    key = (_driver_name(driver), error_code)
+
+    if key in _error_catalog:
+        return _error_catalog[key]
+
     message = ctypes.create_string_buffer(bytes_)
     number_of_chars = ctypes.c_uint32(bytes_)
 
     status = driver.BL_GetErrorMsg(
-        error_code, ctypes.byref(message),
+        error_code, message,
         ctypes.byref(number_of_chars)
         )
 
     # # Can't use assert__status_ok() here since it implicitly runs this method.
     if status != 0:
-        raise exceptions.BLFindError(error_code=status, message=message)
+        raise exceptions.BLFindError(
+            error_code=status, message=exceptions.default_error_msg
+            )
 
-    return message.raw.decode()
+    _error_catalog[key] = message.value.decode()
+
+    return _error_catalog[key]
 
 
 def _get_tecc_ecc_path(
@@ -146,7 +195,7 @@ def assert_one_device(c_nbr_dev: ctypes.c_uint32):
     raise exceptions.ECLibCustomException(-9001, message)
 
 
-def assert_finder_ok(driver: ctypes.WinDLL, return_code: int) -> None:
+def assert_finder_ok(driver: ctypes.CDLL, return_code: int) -> None:
     """Checks return code and raises exception if necessary.
 
     For InstrumentFinder class.
@@ -169,7 +218,7 @@ def assert_finder_ok(driver: ctypes.WinDLL, return_code: int) -> None:
     raise exceptions.BLFindError(return_code, message)
 
 
-def assert_status_ok(driver: ctypes.WinDLL, return_code: int) -> None:
+def assert_status_ok(driver: ctypes.CDLL, return_code: int) -> None:
     """Checks return code and raises exception if necessary.
 
     Args:
@@ -177,7 +226,8 @@ def assert_status_ok(driver: ctypes.WinDLL, return_code: int) -> None:
         return_code (int): Return code from 
 
     Raises:
-        exceptions.ECLibError: If status is not OK.
+        exceptions.ECLibError: If status is not OK. The most specific
+            subclass for the code, see exceptions.from_code().
     """
 
     if return_code == 0:
@@ -187,7 +237,7 @@ def assert_status_ok(driver: ctypes.WinDLL, return_code: int) -> None:
         driver=driver, error_code=return_code
         )
 
-    raise exceptions.ECLibError(return_code, message)
+    raise exceptions.from_code(error_code=return_code, message=message)
 
 
 def convert_numeric_to_single(driver, numeric: int) -> float:
@@ -331,6 +381,9 @@ def parse_proposed_ip(proposed_ip: str):
 def parse_raw_params(raw_params: dict):  # -> list(dict, str, str):
     """Wrapper for parsing incoming experiment parameters.
 
+    NOTE: Superseded by plans.parse_steps(), which validates the steps and
+    accepts them as a list. Only handles the legacy dict.
+
     Args:
         raw_params (dict): Containing exp_id, technique name,
             and detailed params procedure.
@@ -0,0 +1,33 @@
+#!/bin/sh
+# Runs the EC-Lab DLLs under Wine, in a driver host of their own, and the
+# server natively, talking to it over loopback.
+set -e
+
+umask 0
+
+HOST=127.0.0.1
+PORT=5002
+
+# Modules read their settings from the Windows path 'biologic\config.json'
+ln -sf biologic/config.json 'biologic\config.json'
+
+python3 - <<PY
+import json
+
+with open('biologic/config.json') as f:
+    config = json.load(f)
+
+config['driver_host'] = '$HOST:$PORT'
+
+with open('biologic/config.json', 'w') as f:
+    json.dump(config, f)
+PY
+
+wine python -m biologic.driver_host --host $HOST --port $PORT &
+
+until python3 -c "import socket; socket.create_connection(('$HOST', $PORT), 1)" 2>/dev/null
+do
+	sleep 1
+done
+
+exec python3 app.py
@@ -72,7 +72,7 @@ dummy_metadata = {
     'NbCols': 4,
     'TechniqueIndex': 0,
     'TechniqueID': 100,
-    'ProcessIn--- dex': 0,
+    'ProcessIndex': 0,
     'loop': 0,
     'StartTime': 0.0
     }
@@ -0,0 +1,83 @@
+import math
+
+import numpy as np
+import pytest
+
+from biologic.aggregates import CycleAggregator
+from biologic.decoding import empty_block
+
+
+def make_block(time, I, Ewe=3.0, loop=0, technique_index=0) -> np.ndarray:
+    block = empty_block(no_rows=len(time))
+    block['time'] = time
+    block['I'] = I
+    block['Ewe'] = Ewe
+    block['loop'] = loop
+    block['technique_index'] = technique_index
+
+    return block
+
+
+@pytest.fixture
+def aggregator() -> CycleAggregator:
+    return CycleAggregator(channel=1)
+
+
+def test_charge(aggregator: CycleAggregator):
+    assert aggregator.update(block=make_block(time=[0, 1, 2], I=[1, 1, 1])) == []
+    assert aggregator.cycle.totals.charge_in == pytest.approx(2.0)
+    assert aggregator.cycle.totals.energy_in == pytest.approx(6.0)
+    assert aggregator.cycle.totals.mean_voltage == pytest.approx(3.0)
+
+
+def test_across_blocks(aggregator: CycleAggregator):
+    aggregator.update(block=make_block(time=[0, 1], I=[0, 2]))
+    aggregator.update(block=make_block(time=[2], I=[2]))
+
+    # Trapezoids 1 + 2, second one between the blocks
+    assert aggregator.cycle.totals.charge_in == pytest.approx(3.0)
+
+
+def test_cycle_summary(aggregator: CycleAggregator):
+    aggregator.update(
+        block=make_block(
+            time=[0, 1, 2, 3, 4, 5],
+            I=[1, 1, -0.5, -0.5, -0.5, 0],
+            technique_index=[0, 0, 1, 1, 1, 2]
+            )
+        )
+    summaries = aggregator.update(
+        block=make_block(time=[6, 7], I=[1, 1], loop=1)
+        )
+
+    assert len(summaries) == 1
+
+    summary = summaries[0].to_dict()
+
+    assert summary['loop'] == 0
+    assert summary['channel'] == 1
+    assert summary['end_time'] == 5
+    assert summary['charge_in'] == pytest.approx(1.0)
+    assert summary['charge_out'] == pytest.approx(1.0)
+    assert summary['coulombic_efficiency'] == pytest.approx(1.0)
+    assert [step['technique_index'] for step in summary['steps']] == [0, 1, 2]
+    assert summary['steps'][1]['charge'] == pytest.approx(-1.0)
+    assert aggregator.cycle.loop == 1
+
+
+def test_flush(aggregator: CycleAggregator):
+    assert aggregator.flush() == []
+
+    aggregator.update(block=make_block(time=[0, 1], I=[-1, -1]))
+    summary = aggregator.flush()[0]
+
+    assert math.isnan(summary.coulombic_efficiency)
+    assert aggregator.cycle is None
+
+
+def test_unrecorded_current(aggregator: CycleAggregator):
+    block = make_block(time=[0, 1], I=np.nan)
+    aggregator.update(block=block)
+
+    assert aggregator.cycle.totals.charge_in == 0
+    assert aggregator.cycle.totals.duration == 1
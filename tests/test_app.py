@@ -1,10 +1,19 @@
 import flask
 from flask.testing import FlaskClient
+import json
 import os
 import pytest
 from time import sleep
 
+import numpy as np
+
+import app
 from app import configure_routes
+from biologic import recent
+from biologic.decoding import empty_block
+from biologic.potentiostats import Potentiostat
+from biologic.simulator import SimulatedDriver
+from biologic.status import MetadataCache
 
 from tests.params import cp_params
 
@@ -73,12 +82,19 @@ def test_check_status_running(running_client: FlaskClient):
     assert response.get_data() == b'running'
 
 
-def test_block_new_if_already_running(running_client: FlaskClient):
-    response = running_client.post('/run')
+def test_queue_new_if_already_running(running_client: FlaskClient):
+    response = running_client.post('/run', json=cp_params)
 
     assert response.status_code == 200
-    assert response.get_data(
-    ) == b'Aborted: Experiment already running'
+    assert response.get_data().startswith(b'Queued behind 1 experiment(s)')
+
+
+def test_queue(running_client: FlaskClient):
+    running_client.post('/run', json=cp_params)
+    response = running_client.get('/queue')
+
+    assert response.status_code == 200
+    assert len(response.get_json()) == 1
 
 
 def test_stop(running_client: FlaskClient):
@@ -86,3 +102,144 @@ def test_stop(running_client: FlaskClient):
 
     assert response.status_code == 200
     assert response.get_data() == b'Technique stopped'
+
+
+def test_run_rejected(client: FlaskClient):
+    response = client.post(
+        '/run', json={**cp_params, 'steps': [{'technique': 'XYZ'}]}
+        )
+
+    assert response.status_code == 200
+    assert response.get_data().startswith(b'Rejected: Step 0 (XYZ)')
+
+
+def test_data_unknown_fields(client: FlaskClient):
+    response = client.get('/data?fields=Ewe,Q')
+
+    assert response.status_code == 200
+    assert response.get_data().startswith(b"Rejected: Unknown fields ['Q']")
+
+
+def test_data_nothing_recorded(client: FlaskClient):
+    response = client.get('/data?channel=15&fields=timestamp,Ewe')
+
+    assert response.status_code == 200
+    assert response.get_json() == {'timestamp': [], 'Ewe': []}
+
+
+class Discovered:
+    """Stands in for discovery.DiscoveryService."""
+    scanned = 1700000000.0
+    errors = {}
+
+    def __init__(self, devices: list[dict] = None):
+        self._devices = list() if devices is None else devices
+
+    def devices(self) -> list[dict]:
+        return self._devices
+
+
+@pytest.fixture
+def status_cache(monkeypatch) -> MetadataCache:
+    potentiostat = Potentiostat(
+        type_='KBIO_DEV_HCP1005', driver=SimulatedDriver(no_channels=2)
+        )
+    potentiostat.connect(usb_port='USB0')
+    cache = MetadataCache(usb_port='USB0', connection=lambda: potentiostat)
+    cache.refresh()
+    monkeypatch.setattr(app, 'status_cache', cache)
+
+    yield cache
+
+    potentiostat.disconnect()
+
+
+def test_status(client: FlaskClient, status_cache: MetadataCache, monkeypatch):
+    monkeypatch.setattr(app, 'discovery_service', Discovered())
+
+    response = client.get('/status')
+    device, = response.get_json()['devices']
+
+    assert device['usb_port'] == 'USB0'
+    assert device['served']
+    assert len(device['channels']) == 2
+    # Nothing ever ran on channel 1
+    assert device['channels'][1]['experiment'] is None
+
+
+def test_status_discovered(
+    client: FlaskClient, status_cache: MetadataCache, monkeypatch
+    ):
+    discovered = Discovered(
+        devices=[
+            {'interface': 'ethernet', 'address': '10.0.0.2', 'type': 'SP-150'},
+            {'interface': 'usb', 'address': '0', 'type': 'HCP-1005'},
+            ]
+        )
+    monkeypatch.setattr(app, 'discovery_service', discovered)
+
+    response = client.get('/status')
+    other, served = response.get_json()['devices']
+
+    assert (other['usb_port'], other['type']) == ('10.0.0.2', 'SP-150')
+    assert not other['served'] and other['channels'] == []
+    assert (served['usb_port'], served['type']) == ('USB0', 'HCP-1005')
+    assert served['served'] and len(served['channels']) == 2
+    assert served['device']['DeviceCode(translated)'] == 'KBIO_DEV_HCP1005'
+
+
+def test_devices(client: FlaskClient, monkeypatch):
+    class Service:
+        scanned = 1700000000.0
+        errors = {}
+
+        def devices(self) -> list[dict]:
+            return [{'interface': 'usb', 'address': '0', 'type': 'HCP-1005'}]
+
+    monkeypatch.setattr(app, 'discovery_service', Service())
+
+    response = client.get('/devices')
+
+    assert response.get_json()['devices'][0]['type'] == 'HCP-1005'
+    assert response.get_json()['scanned'] == 1700000000.0
+
+
+class FakeDaemon:
+    """Stands in for daemon.DaemonClient, recording commands."""
+
+    def __init__(self):
+        self.calls = list()
+
+    def call(self, command: str, **kwargs):
+        self.calls.append((command, kwargs))
+
+        return {'count': 3} if command.endswith('latency') else ''
+
+
+def test_daemon_mode_routes(client: FlaskClient, monkeypatch):
+    daemon_ = FakeDaemon()
+    monkeypatch.setattr(app, '_daemon', lambda: daemon_)
+
+    assert client.get('/stop/latency').get_json() == {'count': 3}
+    assert client.get('/events/latency').get_json() == {'count': 3}
+    assert client.get('/events').status_code == 501
+
+    client.get('/profiling/enable')
+
+    assert ('profiling', {'action': 'enable'}) in daemon_.calls
+    assert not app.profiler.enabled
+
+
+def test_data_valid_json(client: FlaskClient, monkeypatch):
+    block = empty_block(no_rows=2)
+    block['timestamp'] = [10, 20]
+    block['Ewe'] = [3.0, np.nan]
+    monkeypatch.setattr(recent, '_rings', dict())
+    recent.write_block(channel=0, block=block)
+
+    response = client.get('/data')
+    # Strictly, i.e. no NaN
+    data = json.loads(response.get_data(), parse_constant=pytest.fail)
+
+    assert data['Ewe'] == [3.0, None]
+    assert 'I' not in data
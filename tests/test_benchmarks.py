@@ -0,0 +1,72 @@
+import pytest
+from paho.mqtt.client import Client
+
+from benchmarks import results, suite
+from benchmarks.broker import StandInBroker
+
+
+@pytest.fixture
+def broker() -> StandInBroker:
+    broker = StandInBroker()
+    broker.start()
+
+    yield broker
+
+    broker.stop()
+
+
+@pytest.mark.parametrize('qos', [0, 1, 2])
+def test_broker_receives(broker: StandInBroker, qos: int):
+    client = Client()
+    client.connect(*broker.address)
+    client.loop_start()
+
+    info = client.publish(topic='drops/test/table', payload=b'{}', qos=qos)
+    info.wait_for_publish()
+
+    assert broker.wait_for(count=1, timeout=5)
+    assert broker.messages[0].topic == 'drops/test/table'
+    assert broker.messages[0].payload == b'{}'
+    assert broker.messages[0].qos == qos
+
+    client.disconnect()
+    client.loop_stop()
+
+
+def test_compare():
+    baseline = {'decode': {'mean_ms': 1.0, 'rows_per_s': 100.0, 'rows': 10}}
+    current = {'decode': {'mean_ms': 1.5, 'rows_per_s': 50.0, 'rows': 1}}
+
+    regressions = results.compare(baseline=baseline, current=current)
+
+    assert len(regressions) == 2
+    assert results.compare(baseline=baseline, current=baseline) == []
+
+
+def test_save_and_latest(tmp_path):
+    path = results.save(
+        results={'decode': {'mean_ms': 1.0}},
+        directory=str(tmp_path),
+        commit='abc1234'
+        )
+
+    assert path.endswith('abc1234.json')
+    assert results.latest(directory=str(tmp_path)) == path
+    assert results.latest(directory=str(tmp_path), exclude=path) is None
+    assert results.load(path=path)['results'] == {'decode': {'mean_ms': 1.0}}
+
+
+def test_run_subset():
+    measured = suite.run(names=['compile', 'decode'])
+
+    assert list(measured) == ['compile', 'decode']
+    assert measured['decode']['rows'] > 0
+    assert measured['compile']['count'] == 200
+
+
+def test_codec():
+    measured = suite.run(names=['codec'])['codec']
+
+    assert measured['ocv_rows'] > 0
+    assert measured['cp_raw_ratio'] > 1
+    assert measured['cp_json_ratio'] > measured['cp_raw_ratio']
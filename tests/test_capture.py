@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from biologic import techniques
+from biologic.capture import CaptureWriter, CapturingDriver, read_capture
+from biologic.potentiostats import Potentiostat
+from biologic.simulator import ReplayDriver, SimulatedDriver
+from tests.test_simulator import Clock, cv, drain
+
+
+@pytest.fixture
+def clock() -> Clock:
+    return Clock()
+
+
+def run(monkeypatch, driver, clock: Clock, times: list[float]) -> np.ndarray:
+    monkeypatch.setattr(techniques, 'driver', driver)
+
+    potentiostat = Potentiostat(type_='KBIO_DEV_HCP1005', driver=driver)
+    potentiostat.connect(usb_port='USB0')
+    potentiostat.load_technique(
+        technique_paths=['drivers/cv.ecc'],
+        c_tecc_params=techniques.set_technique_params([cv])
+        )
+    potentiostat.start_channel()
+    blocks = list()
+
+    for now in times:
+        clock.now = now
+        blocks.extend(drain(potentiostat=potentiostat))
+
+    return np.concatenate(blocks)
+
+
+@pytest.fixture
+def captured(monkeypatch, clock: Clock, tmp_path) -> tuple[str, np.ndarray]:
+    path = str(tmp_path / 'capture.bin')
+    writer = CaptureWriter(path=path)
+    driver = CapturingDriver(
+        driver=SimulatedDriver(sampling_rate=5000.0, clock=clock),
+        writer=writer
+        )
+
+    block = run(
+        monkeypatch=monkeypatch,
+        driver=driver,
+        clock=clock,
+        times=[0.5, 1.0, 5.0]
+        )
+    writer.close()
+
+    return path, block
+
+
+def test_records(captured: tuple[str, np.ndarray]):
+    path, block = captured
+    records = list(read_capture(path=path))
+
+    assert sum(record.data_infos.NbRaws for record in records) == len(block)
+    assert all(record.channel == 0 for record in records)
+    assert records[-1].current_values.State == 0
+    assert records[0].timestamp <= records[-1].timestamp
+
+
+def test_not_a_capture(tmp_path):
+    path = tmp_path / 'capture.bin'
+    path.write_bytes(b'garbage!')
+
+    with pytest.raises(ValueError):
+        next(read_capture(path=str(path)))
+
+
+def test_truncated_capture_ends(captured: tuple[str, np.ndarray], tmp_path):
+    path, _ = captured
+    truncated = tmp_path / 'truncated.bin'
+
+    with open(path, 'rb') as f:
+        truncated.write_bytes(f.read()[:-10])
+
+    assert len(list(read_capture(path=str(truncated)))) == len(
+        list(read_capture(path=path))
+        ) - 1
+
+
+def test_replay_max_speed(monkeypatch, captured: tuple[str, np.ndarray]):
+    path, block = captured
+    driver = ReplayDriver(path=path, speed=None)
+    replayed = run(
+        monkeypatch=monkeypatch,
+        driver=driver,
+        clock=Clock(),
+        times=[0.0] * len(list(read_capture(path=path)))
+        )
+
+    assert replayed.tobytes() == block.tobytes()
+    assert not driver.channels[0].running
+
+
+def test_replay_paced(monkeypatch, captured: tuple[str, np.ndarray]):
+    path, block = captured
+    clock = Clock()
+    driver = ReplayDriver(path=path, speed=1.0, clock=clock)
+
+    # Nothing is due until time has passed
+    first = run(
+        monkeypatch=monkeypatch, driver=driver, clock=clock, times=[0.0]
+        )
+    records = list(read_capture(path=path))
+
+    assert len(first) == records[0].data_infos.NbRaws
+    assert driver.channels[0].running
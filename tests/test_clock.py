@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from biologic.clock import ClockAnchor
+from biologic.decoding import empty_block
+
+# Instrument time 0 is at host monotonic 1000 s
+origin_ns = 1000 * 10**9
+
+
+def poll(anchor: ClockAnchor, instrument_time: float, rtt_ns: int) -> bool:
+    """A poll answered exactly halfway through its round-trip."""
+
+    midpoint_ns = origin_ns + round(instrument_time * 1e9)
+
+    return anchor.observe(
+        instrument_time=instrument_time,
+        sent_ns=midpoint_ns - rtt_ns // 2,
+        received_ns=midpoint_ns + rtt_ns // 2
+        )
+
+
+@pytest.fixture
+def anchor() -> ClockAnchor:
+    anchor = ClockAnchor(window=4)
+    poll(anchor, instrument_time=1.0, rtt_ns=2_000_000)
+
+    return anchor
+
+
+def test_not_anchored():
+    anchor = ClockAnchor()
+    block = empty_block(no_rows=2)
+    anchor.stamp(block=block)
+
+    assert not anchor.is_anchored
+    assert (block['timestamp'] == 0).all()
+
+
+def test_offset(anchor: ClockAnchor):
+    assert anchor.to_dict()['host_monotonic_ns'] == origin_ns + 10**9
+    assert anchor.to_dict()['rtt_ns'] == 2_000_000
+
+
+def test_keeps_fastest_round_trip(anchor: ClockAnchor):
+    # Reply arrived late, so the midpoint is 50 ms off
+    anchor.observe(
+        instrument_time=2.0,
+        sent_ns=origin_ns + 2 * 10**9,
+        received_ns=origin_ns + 2 * 10**9 + 100_000_000
+        )
+
+    assert anchor.to_dict()['rtt_ns'] == 2_000_000
+    assert anchor.to_dict()['host_monotonic_ns'] == origin_ns + 10**9
+
+
+def test_ignores_frozen_clock(anchor: ClockAnchor):
+    # Stopped at 1 s, polled again 2 s later, on a faster round trip
+    frozen = anchor.observe(
+        instrument_time=1.0,
+        sent_ns=origin_ns + 3 * 10**9,
+        received_ns=origin_ns + 3 * 10**9 + 1_000_000
+        )
+
+    assert not frozen
+    assert anchor.to_dict()['host_monotonic_ns'] == origin_ns + 10**9
+
+
+def test_window_tracks_drift(anchor: ClockAnchor):
+    global origin_ns
+    drifted, origin_ns = origin_ns, origin_ns + 5_000_000
+
+    try:
+        updates = [
+            poll(anchor, instrument_time=t, rtt_ns=3_000_000)
+            for t in (2.0, 3.0, 4.0, 5.0)
+            ]
+    finally:
+        origin_ns = drifted
+
+    # Initial estimate aged out of the window on the last poll
+    assert updates == [False, False, False, True]
+    assert anchor.to_dict()['host_monotonic_ns'] == drifted + 5_000_000 + 2 * 10**9
+
+
+def test_stamp(anchor: ClockAnchor):
+    block = empty_block(no_rows=3)
+    block['time'] = [1.0, 1.5, 86400.000001]
+    anchor.stamp(block=block)
+
+    utc_ns = anchor.to_utc_ns(1.0)
+    expected = utc_ns + np.array([0, 500_000_000, 86399_000_001_000])
+
+    assert block['timestamp'].dtype == np.int64
+    assert (block['timestamp'] == expected).all()
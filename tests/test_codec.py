@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from biologic.codec import (
+    CHUNK, TICKS, XOR64, decode_block, decode_column, encode_block,
+    encode_column, encode_time, pack, unpack
+    )
+from biologic.decoding import empty_block
+
+rng = np.random.default_rng(seed=0)
+
+
+def test_pack_roundtrip():
+    words = rng.integers(0, 2**64 - 1, 1000, dtype=np.uint64, endpoint=True)
+
+    decoded = unpack(data=pack(words), n=1000, dtype=np.uint64)
+
+    assert np.array_equal(decoded, words)
+
+
+def test_pack_zeros_take_no_bits():
+    words = np.zeros(10 * CHUNK, dtype=np.uint64)
+
+    # Just the shifts and widths
+    assert len(pack(words)) == 2 * 10
+
+
+def test_pack_drops_common_zeros():
+    words = np.arange(CHUNK, dtype=np.uint64) << np.uint64(40)
+
+    # 6 bits a word, as the low 40 are zero throughout
+    assert len(pack(words)) == 2 + CHUNK * 6 // 8
+    assert np.array_equal(
+        unpack(data=pack(words), n=CHUNK, dtype=np.uint64), words
+        )
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_floats_roundtrip(dtype):
+    values = np.cumsum(rng.normal(size=1000)).astype(dtype)
+    values[10:20] = np.nan
+    values[30] = np.inf
+    decoded = decode_column(data=encode_column(values), dtype=values.dtype)
+
+    # Bit for bit, NaNs included
+    assert decoded.tobytes() == values.tobytes()
+
+
+def test_constant_floats_compress():
+    values = np.full(1000, 3.1, dtype=np.float32)
+
+    assert len(encode_column(values)) < 100
+
+
+@pytest.mark.parametrize('dtype', [np.int32, np.int64])
+def test_ints_roundtrip(dtype):
+    values = (np.arange(1000) * 7 + rng.integers(-2, 3, 1000)).astype(dtype)
+    encoded = encode_column(values)
+
+    assert np.array_equal(decode_column(data=encoded, dtype=dtype), values)
+    assert len(encoded) < values.nbytes / 4
+
+
+def test_int64_extremes():
+    info = np.iinfo(np.int64)
+    values = np.array([info.min, info.max, 0, -1, info.max], dtype=np.int64)
+
+    assert np.array_equal(
+        decode_column(data=encode_column(values), dtype=np.int64), values
+        )
+
+
+def test_time_as_ticks():
+    time_base = float(np.float32(1e-5))
+    values = 0.5 + np.arange(1000) * 20 * time_base
+    encoded = encode_time(values=values, resolution=time_base, origin=0.5)
+
+    assert encoded[0] == TICKS
+    assert decode_column(data=encoded, dtype=np.float64).tobytes() == (
+        values.tobytes()
+        )
+
+
+def test_time_falls_back_to_floats():
+    values = np.array([0.0, 0.1, 0.25, 0.3333])
+    encoded = encode_time(values=values, resolution=0.1)
+
+    assert encoded[0] == XOR64
+    assert np.array_equal(
+        decode_column(data=encoded, dtype=np.float64), values
+        )
+
+
+def test_block_roundtrip():
+    time_base = float(np.float32(1e-5))
+    block = empty_block(no_rows=500)
+    block['time'] = 0.5 + np.arange(500) * 20 * time_base
+    block['Ewe'] = 3.0 + np.cumsum(rng.normal(scale=1e-4, size=500))
+    block['I'] = 1e-3
+    block['cycle'] = np.arange(500) // 100
+    block['timestamp'] = 1_700_000_000 * 10**9 + np.arange(500) * 200_000
+
+    encoded = encode_block(block=block, time_base=time_base, start_time=0.5)
+
+    assert decode_block(encoded).tobytes() == block.tobytes()
+    assert len(encoded) < block.nbytes / 5
+
+
+def test_empty_block():
+    block = empty_block(no_rows=0)
+
+    assert decode_block(encode_block(block=block)).dtype == block.dtype
+
+
+def test_decode_block_invalid():
+    with pytest.raises(ValueError):
+        decode_block(b'{"Ewe": [3.0]}')
@@ -0,0 +1,142 @@
+import ctypes
+from threading import Event, Thread
+import time
+
+import pytest
+
+from biologic import commands
+from biologic.potentiostats import stop_channels
+
+
+@pytest.fixture
+def serializer() -> commands.CommandSerializer:
+    return commands.CommandSerializer()
+
+
+def hold(serializer: commands.CommandSerializer) -> Event:
+    """Keeps the serializer busy until the returned event is set."""
+
+    release, busy = Event(), Event()
+
+    def block():
+        busy.set()
+        release.wait()
+
+    Thread(target=serializer.call, args=(block, ), daemon=True).start()
+    busy.wait()
+
+    return release
+
+
+def test_call(serializer: commands.CommandSerializer):
+    assert serializer.call(lambda x: x + 1, 1) == 2
+
+
+def test_stop_goes_first(serializer: commands.CommandSerializer):
+    order = list()
+    release = hold(serializer)
+
+    control = Thread(
+        target=serializer.call, args=(lambda: order.append('control'), )
+        )
+    control.start()
+    time.sleep(0.05)
+
+    stop = Thread(
+        target=serializer.stop,
+        args=(lambda: order.append('stop'), ),
+        kwargs={'channels': [0]}
+        )
+    stop.start()
+    time.sleep(0.05)
+
+    release.set()
+    control.join()
+    stop.join()
+
+    assert order == ['stop', 'control']
+
+
+def test_stop_drops_pending_polls(serializer: commands.CommandSerializer):
+    polled = list()
+    dropped = list()
+    release = hold(serializer)
+
+    def poll():
+        try:
+            serializer.poll(lambda: polled.append(True))
+        except commands.Dropped:
+            dropped.append(True)
+
+    poller = Thread(target=poll)
+    poller.start()
+    time.sleep(0.05)
+
+    stop = Thread(
+        target=serializer.stop, args=(lambda: None, ), kwargs={'channels': [0]}
+        )
+    stop.start()
+    time.sleep(0.05)
+
+    release.set()
+    poller.join()
+    stop.join()
+
+    assert dropped == [True]
+    assert polled == []
+
+    # Draining after the stop goes through
+    serializer.poll(lambda: polled.append(True))
+
+    assert polled == [True]
+
+
+def test_stopped(serializer: commands.CommandSerializer):
+    stopped = serializer.stopped(channel=1)
+    latency = serializer.stop(lambda: None, channels=[1])
+
+    assert stopped.is_set()
+    assert not serializer.stopped(channel=0).is_set()
+    assert latency >= 0
+    assert serializer.latency_stats()['count'] == 1
+
+    serializer.start(lambda: None, channel=1)
+
+    assert not stopped.is_set()
+
+
+def test_for_handle():
+    assert commands.for_handle(handle=-1) is commands.for_handle(handle=-1)
+    assert commands.for_handle(handle=-1) is not commands.for_handle(handle=-2)
+
+
+class DummyDriver:
+
+    def __init__(self):
+        self.requests = list()
+
+    def BL_StopChannels(self, id_, channels, results, length):
+        self.requests.append(list(channels[:length]))
+
+
+class DummyPotentiostat:
+
+    def __init__(self, handle: int, channel: int, driver: DummyDriver):
+        self._id = ctypes.c_int32(handle)
+        self.channel = channel
+        self.driver = driver
+        self.commands = commands.for_handle(handle=handle)
+
+
+def test_stop_channels_batched():
+    driver = DummyDriver()
+    potentiostats = [
+        DummyPotentiostat(handle=-10, channel=channel, driver=driver)
+        for channel in range(3)
+        ] + [DummyPotentiostat(handle=-11, channel=0, driver=driver)]
+
+    latencies = stop_channels(potentiostats=potentiostats)
+
+    assert driver.requests == [[0, 1, 2], [0]]
+    assert len(latencies) == 4
+    assert commands.for_handle(handle=-10).stopped(channel=2).is_set()
@@ -0,0 +1,69 @@
+import json
+import os
+
+import pytest
+
+from biologic.config_store import ConfigStore
+
+
+@pytest.fixture
+def store(tmp_path) -> ConfigStore:
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps({'usb_port': 'USB0', 'driverpath': 'drivers/'}))
+
+    return ConfigStore(path=str(path))
+
+
+def test_read_once(store: ConfigStore):
+    os.remove(store.path)
+
+    # From memory, the file is gone
+    assert store.get('usb_port') == 'USB0'
+    assert store.snapshot()['driverpath'] == 'drivers/'
+
+
+def test_snapshot_is_a_copy(store: ConfigStore):
+    store.snapshot()['usb_port'] = 'USB9'
+
+    assert store.get('usb_port') == 'USB0'
+
+
+def test_update(store: ConfigStore):
+    store.update(usb_port='USB1', devices=[{'address': 'USB1'}])
+
+    with open(store.path) as f:
+        on_file = json.load(f)
+
+    assert on_file == store.snapshot()
+    assert on_file['usb_port'] == 'USB1'
+    assert on_file['driverpath'] == 'drivers/'
+    # Nothing left behind next to it
+    assert os.listdir(os.path.dirname(store.path)) == ['config.json']
+
+
+def test_update_through_link(tmp_path, store: ConfigStore):
+    link = tmp_path / 'biologic\\config.json'
+    link.symlink_to(store.path)
+
+    ConfigStore(path=str(link)).update(usb_port='USB1')
+
+    assert link.is_symlink()
+    assert ConfigStore(path=store.path).get('usb_port') == 'USB1'
+
+
+def test_failed_update_changes_nothing(store: ConfigStore):
+    with pytest.raises(TypeError):
+        store.update(usb_port=object())
+
+    assert ConfigStore(path=store.path).get('usb_port') == 'USB0'
+    assert store.get('usb_port') == 'USB0'
+    assert os.listdir(os.path.dirname(store.path)) == ['config.json']
+
+
+def test_reload(store: ConfigStore):
+    with open(store.path, 'w') as f:
+        json.dump({'usb_port': 'USB2'}, f)
+
+    store.reload()
+
+    assert store.get('usb_port') == 'USB2'
@@ -0,0 +1,136 @@
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from biologic import daemon, ring
+from biologic.decoding import BLOCK_DTYPE
+from biologic.exceptions import PlanValidationError
+from biologic.potentiostats import HCP1005
+from tests.params import ocv_params
+
+
+@pytest.fixture(scope='module')
+def client(tmp_path_factory) -> daemon.DaemonClient:
+    client = daemon.spawn(
+        potentiostat_class=HCP1005,
+        usb_port='USB0',
+        state_dir=str(tmp_path_factory.mktemp('state'))
+        )
+
+    yield client
+
+    client.shutdown()
+
+
+def test_invalid_plan_rejected(client: daemon.DaemonClient):
+    with pytest.raises(PlanValidationError):
+        client.scheduler.submit(
+            raw_params={**ocv_params, 'steps': {'OCV': {'Rest_time_T': 'long'}}}
+            )
+
+    assert client.scheduler.to_dict() == []
+
+
+def test_no_worker(client: daemon.DaemonClient):
+    assert client.scheduler.worker(channel=3, create=False) is None
+    assert client.reader(channel=3) is None
+
+
+def test_no_data(client: daemon.DaemonClient):
+    rows = client.scheduler.data(channel=3, fields=['timestamp', 'Ewe'])
+
+    assert rows.dtype.names == ('timestamp', 'Ewe')
+    assert len(rows) == 0
+
+
+class FakeDatabase:
+    """Keeps payloads, per table, of every database opened."""
+
+    opened = list()
+
+    def __init__(self, path: str, qos: int = None):
+        self.path = path
+        self.payloads = defaultdict(list)
+        self.closed = False
+        FakeDatabase.opened.append(self)
+
+    def write(self, payload: dict, table: str) -> None:
+        self.payloads[table].append(payload)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def _block(start: int, stop: int) -> np.ndarray:
+    block = np.zeros(stop - start, dtype=BLOCK_DTYPE)
+    block['time'] = np.arange(start, stop)
+
+    return block
+
+
+def test_sink_consumer(monkeypatch):
+    monkeypatch.setattr(daemon, 'Database', FakeDatabase)
+    FakeDatabase.opened = list()
+    writer = ring.BlockRing(name='biologic-test-sinks-0', capacity=64)
+    consumer = daemon.SinkConsumer(prefix='biologic-test-sinks', interval=0.01)
+    run = {
+        'run_id': 'a',
+        'channel': 0,
+        'exp_id': 'exp-a',
+        'qos': None,
+        'sinks': {
+            'data': {'policy': 'all'},
+            'sparse': {'policy': 'every_nth', 'n': 4},
+            },
+        }
+
+    # Rows from before the run aren't its own
+    writer.write(block=_block(-3, 0))
+    consumer.announce(info={**run, 'event': 'started', 'row': 3})
+    writer.write(block=_block(0, 5))
+    writer.write(block=_block(5, 10))
+    consumer.announce(info={**run, 'event': 'finished', 'row': 13})
+    writer.write(block=_block(100, 101))
+
+    assert consumer.wait_idle(timeout=10)
+
+    db, = FakeDatabase.opened
+    data, sparse = (
+        [time for payload in db.payloads[table] for time in payload['time']]
+        for table in ('data', 'sparse')
+        )
+
+    assert db.path == 'exp-a' and db.closed
+    assert data == list(range(10))
+    assert sparse == [0, 4, 8]
+
+    writer.close()
+
+
+def test_profiling(client: daemon.DaemonClient):
+    assert client.call('profiling', action='enable')['enabled']
+    assert not client.call('profiling', action='disable')['enabled']
+    assert isinstance(client.call('profiling_trace'), str)
+
+    with pytest.raises(RuntimeError, match='Unknown profiling action'):
+        client.call('profiling', action='explode')
+
+
+def test_latencies(client: daemon.DaemonClient):
+    assert client.call('stop_latency')['count'] == 0
+    assert client.call('events_latency')['count'] == 0
+
+
+def test_unknown_command(client: daemon.DaemonClient):
+    with pytest.raises(RuntimeError, match='Unknown command'):
+        client.call('connect')
+
+
+def test_shutdown(tmp_path):
+    client = daemon.spawn(
+        potentiostat_class=HCP1005, usb_port='USB1', state_dir=str(tmp_path)
+        )
+    client.shutdown()
+
+    assert client.process.exitcode == 0
@@ -1,3 +1,5 @@
+import time
+
 import pytest
 
 from biologic import config, database
@@ -22,3 +24,92 @@ def test_write(db_instance):
     status = db_instance.write(payload=data, table='test')
 
     assert status.is_published
+
+
+@pytest.fixture
+def broker():
+    from benchmarks.broker import StandInBroker
+
+    broker = StandInBroker()
+    broker.start()
+
+    yield broker
+
+    broker.stop()
+
+
+@pytest.fixture
+def pool(broker) -> database.ConnectionPool:
+    pool = database.ConnectionPool(*broker.address, size=2)
+
+    yield pool
+
+    pool.close()
+
+
+def test_handles_share_connections(pool: database.ConnectionPool):
+    handles = [database.Database(path=path, pool=pool) for _ in range(10)]
+    clients = {id(handle.client) for handle in handles}
+
+    assert len(clients) == 2
+
+
+def test_close_sends_everything(broker, pool: database.ConnectionPool):
+    with database.Database(path=path, pool=pool) as db:
+        for _ in range(100):
+            db.write(payload=data, table='test')
+
+    assert broker.wait_for(count=100, timeout=5)
+    assert broker.messages[0].topic == f'{db.url}test'
+
+
+def test_closed_connection_replaced(broker, pool: database.ConnectionPool):
+    db = database.Database(path=path, pool=pool)
+    db.client.disconnect()
+
+    for _ in range(50):
+        if not pool.health()[0]['open']:
+            break
+
+        time.sleep(0.01)
+
+    assert not pool.health()[0]['open']
+
+    db.write(payload=data, table='test')
+
+    assert pool.health()[0]['open']
+    assert broker.wait_for(count=1, timeout=5)
+
+
+def test_qos_per_table(broker, pool: database.ConnectionPool):
+    with database.Database(path=path, pool=pool, qos={'test': 2}) as db:
+        db.write(payload=data, table='test')
+        db.write(payload=data, table='events')
+        db.write(payload=data, table='biologic')
+
+    assert broker.wait_for(count=3, timeout=5)
+    assert [message.qos for message in broker.messages] == [2, 1, 0]
+
+    stats = database.metrics.stats()[f'{db.url}test']
+
+    assert stats['qos'] == 2
+    assert stats['acknowledged'] == stats['published']
+    assert stats['undelivered'] == 0
+
+
+def test_invalid_qos():
+    with pytest.raises(ValueError):
+        database.check_qos(qos={'biologic': 3})
+
+
+def test_window_blocks_when_full():
+    window = database.InFlightWindow(size=2)
+
+    assert window.acquire(timeout=0.01)
+    assert window.acquire(timeout=0.01)
+    assert not window.acquire(timeout=0.01)
+
+    for _ in range(3):
+        window.release()
+
+    assert window.wait_empty(timeout=0.01)
@@ -0,0 +1,122 @@
+import ctypes
+import numpy as np
+import pytest
+
+from biologic.decoding import BLOCK_DTYPE, SweepTagger, decode, empty_block
+from tests.params import dummy_metadata
+
+time_base = 1e-4
+
+
+def make_buffer(rows: list[tuple], float_columns: tuple) -> ctypes.Array:
+    """Encodes rows of (t_rel, *values) the way the instrument does."""
+
+    no_cols = len(rows[0]) + 1
+    raw = np.zeros((len(rows), no_cols), dtype=np.uint32)
+
+    for i, (t_rel, *values) in enumerate(rows):
+        raw[i, 0] = t_rel >> 32
+        raw[i, 1] = t_rel & 0xFFFFFFFF
+
+        for j, value in enumerate(values, start=2):
+            if j in float_columns:
+                raw[i, j] = np.float32(value).view(np.uint32)
+            else:
+                raw[i, j] = value
+
+    buffer = (ctypes.c_uint32 * 1000)()
+    ctypes.memmove(buffer, raw.tobytes(), raw.nbytes)
+
+    return buffer
+
+
+@pytest.fixture
+def cp_infos() -> dict:
+    return {
+        **dummy_metadata,
+        'NbRaws': 2,
+        'NbCols': 5,
+        'TechniqueID': 155,
+        'TechniqueIndex': 1,
+        'loop': 3,
+        'StartTime': 10.0
+        }
+
+
+def test_empty_block():
+    block = empty_block(no_rows=2)
+
+    assert block.dtype == BLOCK_DTYPE
+    assert np.isnan(block['Ewe']).all()
+    assert (block['cycle'] == 0).all()
+
+
+def test_decode_nothing_recorded():
+    block = decode(
+        buffer=(ctypes.c_uint32 * 1000)(),
+        data_infos={**dummy_metadata, 'NbRaws': 0},
+        time_base=time_base
+        )
+
+    assert len(block) == 0
+
+
+def test_decode_cplimit(cp_infos: dict):
+    # t_rel beyond 32 bits, as after a few days at 100 us
+    rows = [(2**32 + 5, 3.1, -1.0, 0), (2**32 + 15, 3.2, -1.0, 0)]
+    buffer = make_buffer(rows=rows, float_columns=(2, 3))
+
+    block = decode(buffer=buffer, data_infos=cp_infos, time_base=time_base)
+
+    assert len(block) == 2
+    assert block['time'][0] == pytest.approx(10.0 + (2**32 + 5) * time_base)
+    assert block['Ewe'] == pytest.approx([3.1, 3.2])
+    assert block['I'] == pytest.approx([-1.0, -1.0])
+    assert np.isnan(block['Ece']).all()
+    assert (block['technique_index'] == 1).all()
+    assert (block['loop'] == 3).all()
+
+
+def test_decode_ocv_without_ece():
+    data_infos = {
+        **dummy_metadata, 'NbRaws': 1, 'NbCols': 3, 'TechniqueID': 100
+        }
+    buffer = make_buffer(rows=[(10, 2.9)], float_columns=(2, ))
+
+    block = decode(buffer=buffer, data_infos=data_infos, time_base=time_base)
+
+    assert block['Ewe'][0] == pytest.approx(2.9)
+    assert np.isnan(block['Ece'][0])
+
+
+def test_sweeps_across_blocks():
+    # Up, flat at the vertex, down, up again
+    ec = np.array([0.0, 0.1, 0.2, 0.2, 0.1, 0.0, 0.1], dtype=np.float32)
+    block = empty_block(no_rows=len(ec))
+    block['Ec'] = ec
+    tagger = SweepTagger()
+
+    tagger.tag(block=block[:3])
+    tagger.tag(block=block[3:])
+
+    assert list(block['scan']) == [0, 0, 0, 0, 1, 1, 2]
+
+
+def test_sweeps_restart_with_technique():
+    block = empty_block(no_rows=3)
+    block['Ec'] = [0.2, 0.1, 0.2]
+    tagger = SweepTagger()
+    tagger.tag(block=block)
+
+    block['technique_index'] = 1
+    tagger.tag(block=block)
+
+    assert list(block['scan']) == [0, 0, 1]
+
+
+def test_sweeps_ignore_other_techniques():
+    block = empty_block(no_rows=2)
+
+    SweepTagger().tag(block=block)
+
+    assert (block['scan'] == 0).all()
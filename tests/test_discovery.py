@@ -0,0 +1,143 @@
+import ctypes
+import json
+
+import pytest
+
+from biologic import discovery
+from biologic.config_store import ConfigStore
+from biologic.discovery import DiscoveryService, parse_devices
+
+
+def record(address: str, type_: str) -> str:
+    return f'USB${address}$$$$$serial$${type_}$fw$1$'
+
+
+class FakeFinder:
+    """Answers searches from lists of device records, per interface."""
+
+    def __init__(self):
+        self.found = {'usb': [], 'ethernet': []}
+        self.fail = set()
+
+    def _search(self, interface: str, buffer, size, no_devices) -> int:
+        if interface in self.fail:
+            raise ConnectionError('Search failed')
+
+        records = self.found[interface]
+        raw = '%'.join(records).encode('utf-16-le')
+        ctypes.memmove(buffer, raw, len(raw))
+        no_devices._obj.value = len(records)
+
+        return 0
+
+    def BL_FindEChemUsbDev(self, buffer, size, no_devices) -> int:
+        return self._search('usb', buffer, size, no_devices)
+
+    def BL_FindEChemEthDev(self, buffer, size, no_devices) -> int:
+        return self._search('ethernet', buffer, size, no_devices)
+
+
+@pytest.fixture
+def store(tmp_path) -> ConfigStore:
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps({'usb_port': 'USB0'}))
+
+    return ConfigStore(path=str(path))
+
+
+@pytest.fixture
+def finder() -> FakeFinder:
+    return FakeFinder()
+
+
+@pytest.fixture
+def service(finder: FakeFinder, store: ConfigStore) -> DiscoveryService:
+    service = DiscoveryService(driver=finder, store=store)
+
+    yield service
+
+    service.stop()
+
+
+def test_parse_devices():
+    raw = '%'.join(
+        [record('0', 'HCP-1005'), record('1', 'SP-150')]
+        ).encode('utf-16-le')
+    devices = parse_devices(raw=raw, interface='usb')
+
+    assert [(d.address, d.type_) for d in devices] == [
+        ('0', 'HCP-1005'), ('1', 'SP-150')
+        ]
+
+
+def test_parse_nothing():
+    assert parse_devices(raw=b'\x00' * 16, interface='usb') == []
+
+
+def test_added_and_removed(service: DiscoveryService, finder: FakeFinder):
+    finder.found['usb'] = [record('0', 'HCP-1005')]
+    finder.found['ethernet'] = [record('192.168.0.1', 'SP-150')]
+    added = service.scan()
+
+    assert sorted((e.kind, e.device.address) for e in added) == [
+        ('added', '0'), ('added', '192.168.0.1')
+        ]
+    assert len(service.devices()) == 2
+
+    finder.found['usb'] = []
+    removed = service.scan()
+
+    assert [(e.kind, e.device.address) for e in removed] == [('removed', '0')]
+    assert service.scan() == []
+
+
+def test_events_published(service: DiscoveryService, finder: FakeFinder):
+    published = list()
+    discovery.events.subscribe(callback=published.append)
+
+    try:
+        finder.found['usb'] = [record('0', 'HCP-1005')]
+        service.scan()
+    finally:
+        discovery.events.unsubscribe(callback=published.append)
+
+    assert [event.to_dict() for event in published] == [{
+        'event': 'device_added',
+        'interface': 'usb',
+        'address': '0',
+        'type': 'HCP-1005'
+        }]
+
+
+def test_persisted(
+    service: DiscoveryService, finder: FakeFinder, store: ConfigStore
+    ):
+    finder.found['usb'] = [record('0', 'HCP-1005')]
+    service.scan()
+
+    assert ConfigStore(path=store.path).get('devices') == service.devices()
+
+    # A restart only reports what changed meanwhile
+    restarted = DiscoveryService(driver=finder, store=store)
+
+    try:
+        assert restarted.scan() == []
+    finally:
+        restarted.stop()
+
+
+def test_failed_search_keeps_devices(
+    service: DiscoveryService, finder: FakeFinder
+    ):
+    finder.found['usb'] = [record('0', 'HCP-1005')]
+    service.scan()
+    finder.fail.add('usb')
+
+    assert service.scan() == []
+    assert len(service.devices()) == 1
+    assert service.errors == {'usb': 'ConnectionError: Search failed'}
+
+
+def test_invalid_interval(finder: FakeFinder, store: ConfigStore):
+    with pytest.raises(ValueError):
+        DiscoveryService(driver=finder, store=store, interval=0)
@@ -0,0 +1,93 @@
+import pickle
+from threading import Thread
+
+import numpy as np
+import pytest
+
+from biologic import techniques
+from biologic.driver_host import (
+    DriverHost,
+    RemoteDriver,
+    _loads,
+    library_name,
+    parse_address
+    )
+from biologic.exceptions import ChannelNotPluggedError
+from biologic.potentiostats import Potentiostat, is_full
+from biologic.simulator import SimulatedDriver
+from tests.test_simulator import Clock, cv
+
+
+@pytest.fixture
+def clock() -> Clock:
+    return Clock()
+
+
+@pytest.fixture
+def remote(clock: Clock):
+    simulated = SimulatedDriver(sampling_rate=5000.0, clock=clock)
+    host = DriverHost(
+        drivers={'EClib64.dll': simulated}, address=('127.0.0.1', 0)
+        )
+    Thread(target=host.serve_forever, daemon=True).start()
+
+    driver = RemoteDriver(address=host.address)
+
+    yield driver, simulated
+
+    driver.close()
+    host.shutdown()
+    host.server_close()
+
+
+def test_parse():
+    assert parse_address(address='127.0.0.1:5002') == ('127.0.0.1', 5002)
+    assert library_name(path='drivers\\EClib64.dll') == 'EClib64.dll'
+    assert library_name(path='drivers/blfind64.dll') == 'blfind64.dll'
+
+
+def test_no_classes_unpickled():
+    with pytest.raises(pickle.UnpicklingError):
+        _loads(payload=pickle.dumps(Clock()))
+
+
+def test_potentiostat_over_host(monkeypatch, remote, clock: Clock):
+    driver, simulated = remote
+    monkeypatch.setattr(techniques, 'driver', driver)
+
+    potentiostat = Potentiostat(type_='KBIO_DEV_HCP1005', driver=driver)
+    potentiostat.connect(usb_port='USB0')
+    potentiostat.load_technique(
+        technique_paths=['drivers\\cv.ecc'],
+        c_tecc_params=techniques.set_technique_params([cv])
+        )
+    potentiostat.start_channel()
+
+    assert simulated.channels[0].techniques[0].params['N_Cycles'] == {0: 1}
+
+    clock.now = 1.0
+    blocks = list()
+
+    while True:
+        data_infos, current_values, block = potentiostat.get_block()
+        blocks.append(block)
+
+        if not is_full(data_infos=data_infos):
+            break
+
+    block = np.concatenate(blocks)
+
+    assert len(block) == 5000 + 1
+    assert block['Ec'][-1] == pytest.approx(0.0, abs=1e-3)
+    assert block['scan'][-1] == 1
+    assert current_values['State'] == 1
+
+    potentiostat.stop_channel()
+    potentiostat.disconnect()
+
+
+def test_errors_raised_again(remote):
+    driver, _ = remote
+
+    with pytest.raises(ChannelNotPluggedError):
+        driver.BL_StartChannel(1, 5)
@@ -0,0 +1,122 @@
+import pytest
+from threading import Timer
+import time
+
+from biologic.decoding import empty_block
+from biologic.events import EventBus, Transition, TransitionDetector
+from tests.params import dummy_metadata
+
+
+def infos(technique_index: int = 0, process_index: int = 0, loop: int = 0):
+    return {
+        **dummy_metadata,
+        'TechniqueIndex': technique_index,
+        'ProcessIndex': process_index,
+        'loop': loop
+        }
+
+
+@pytest.fixture
+def block():
+    block = empty_block(no_rows=2)
+    block['time'] = [12.0, 13.0]
+
+    return block
+
+
+@pytest.fixture
+def detector(block) -> TransitionDetector:
+    detector = TransitionDetector(channel=0)
+    detector.update(data_infos=infos(), block=block, received=0.0)
+
+    return detector
+
+
+def test_baseline_fires_nothing(block):
+    detector = TransitionDetector(channel=0)
+
+    assert detector.update(data_infos=infos(), block=block, received=0) == []
+
+
+def test_no_change(detector: TransitionDetector, block):
+    assert detector.update(data_infos=infos(), block=block, received=0) == []
+
+
+def test_empty_block_ignored(detector: TransitionDetector):
+    transitions = detector.update(
+        data_infos=infos(technique_index=1),
+        block=empty_block(),
+        received=0
+        )
+
+    assert transitions == []
+
+
+def test_technique_and_loop(detector: TransitionDetector, block):
+    transitions = detector.update(
+        data_infos=infos(technique_index=1, loop=1), block=block, received=0
+        )
+
+    assert [t.kind for t in transitions] == ['technique', 'loop']
+    assert transitions[0].previous == 0
+    assert transitions[0].current == 1
+    assert transitions[0].instrument_time == 12.0
+
+
+def test_publish(detector: TransitionDetector, block):
+    bus = EventBus()
+    received = list()
+    bus.subscribe(callback=received.append)
+
+    for transition in detector.update(
+        data_infos=infos(process_index=1),
+        block=block,
+        received=time.monotonic()
+        ):
+        bus.publish(transition=transition)
+
+    assert len(received) == 1
+    assert received[0].latency_ms >= 0
+    assert bus.latency_stats()['count'] == 1
+    assert 'received' not in received[0].to_dict()
+
+
+def test_failing_subscriber_isolated(detector: TransitionDetector, block):
+    bus = EventBus()
+    received = list()
+
+    def fail(transition: Transition):
+        raise RuntimeError
+
+    bus.subscribe(callback=fail)
+    bus.subscribe(callback=received.append)
+
+    for transition in detector.update(
+        data_infos=infos(loop=1), block=block, received=time.monotonic()
+        ):
+        bus.publish(transition=transition)
+
+    assert len(received) == 1
+
+
+def test_stream_filters_channel(block):
+    bus = EventBus()
+    stream = bus.stream(channel=1)
+
+    other, this = TransitionDetector(channel=0), TransitionDetector(channel=1)
+
+    for detector in (other, this):
+        detector.update(data_infos=infos(), block=block, received=0)
+
+    # Subscribes on first next(), so publish from within
+    def publish():
+        for detector in (other, this):
+            for transition in detector.update(
+                data_infos=infos(loop=1), block=block, received=time.monotonic()
+                ):
+                bus.publish(transition=transition)
+
+    Timer(0.1, publish).start()
+
+    assert next(stream).channel == 1
+    stream.close()
@@ -0,0 +1,25 @@
+from biologic import exceptions
+
+dummy_message = 'dummy message'
+
+
+def test_from_code_specific():
+    error = exceptions.from_code(error_code=-13, message=dummy_message)
+
+    assert isinstance(error, exceptions.ChannelRunningError)
+    assert isinstance(error, exceptions.GeneralError)
+    assert error.message == dummy_message
+
+
+def test_from_code_range():
+    error = exceptions.from_code(error_code=-402, message=dummy_message)
+
+    assert type(error) is exceptions.TechniqueError
+    assert isinstance(error, exceptions.ECLibError)
+    assert error.error_code == -402
+
+
+def test_from_code_undocumented():
+    error = exceptions.from_code(error_code=-9999, message=dummy_message)
+
+    assert type(error) is exceptions.ECLibError
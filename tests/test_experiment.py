@@ -1,11 +1,29 @@
+import base64
+from collections import defaultdict
 import pytest
 from threading import Event, Thread
 from time import sleep
 
-from biologic.experiment import Experiment, run
-from biologic.potentiostats import HCP1005
+import numpy as np
+
+from biologic import experiment, ring, techniques
+from biologic.codec import decode_block
+from biologic.decoding import BLOCK_DTYPE
+from biologic.experiment import Experiment, _acquire, _sinks, run
+from biologic.potentiostats import HCP1005, Potentiostat
+from biologic.reduction import make_sinks
+from biologic.safety import Limits
+from biologic.simulator import SimulatedDriver
 from tests.params import cp_params
 
+# A fast CV, which fills the BL_GetData buffer on every poll
+cv = {
+    'Voltage_step': (0.0, 0.5, -0.5, 0.0, 0.0),
+    'Scan_Rate': (1000.0, ) * 5,  # mV/s
+    'Scan_number': 2,
+    'N_Cycles': 1,
+    }
+
 
 @pytest.fixture
 def experiment_():
@@ -65,4 +83,196 @@ def test_setting_pill(potentiostat_: HCP1005, pill: Event, experiment_: Experime
     thread = Thread(target=run, args=(potentiostat_, cp_params, pill, experiment_))
     thread.start()
     sleep(1)
-    pill.set()
\ No newline at end of file
+    pill.set()
+
+
+class SteppedDriver(SimulatedDriver):
+    """Moves time on by step on every poll, so a run takes as many polls
+    as it takes, not as long.
+    """
+
+    def __init__(self, step: float, **kwargs):
+        self.now = 0.0
+        self.step = step
+
+        super().__init__(clock=lambda: self.now, **kwargs)
+
+    def BL_GetData(self, *args) -> int:
+        self.now += self.step
+
+        return super().BL_GetData(*args)
+
+
+class FakeDatabase:
+    """Keeps payloads, per table."""
+
+    def __init__(self):
+        self.payloads = defaultdict(list)
+
+    def write(self, payload: dict, table: str) -> None:
+        self.payloads[table].append(payload)
+
+    def close(self) -> None:
+        pass
+
+
+def acquire(monkeypatch, limits=None, cursor=None, sinks=None) -> tuple:
+    """Runs a CV through _acquire() to the end.
+
+    Returns:
+        SimulatedDriver: Simulating the CV.
+        list[np.ndarray]: Every block polled.
+        FakeDatabase: What was written out.
+        Experiment: Of the run.
+    """
+
+    driver = SteppedDriver(step=0.5, sampling_rate=5000.0)
+    monkeypatch.setattr(techniques, 'driver', driver)
+
+    potentiostat = Potentiostat(type_='KBIO_DEV_HCP1005', driver=driver)
+    potentiostat.connect(usb_port='USB0')
+    potentiostat.load_technique(
+        technique_paths=['drivers/cv.ecc'],
+        c_tecc_params=techniques.set_technique_params([cv])
+        )
+    potentiostat.start_channel()
+
+    polled = list()
+    get_block = potentiostat.get_block
+
+    def record():
+        data_infos, current_values, block = get_block()
+        polled.append(block.copy())
+
+        return data_infos, current_values, block
+
+    monkeypatch.setattr(potentiostat, 'get_block', record)
+
+    db = FakeDatabase()
+    experiment_ = Experiment()
+    experiment_.set_status('running')
+
+    _acquire(
+        potentiostat=potentiostat,
+        db=db,
+        pill=Event(),
+        experiment_=experiment_,
+        exp_id='brix2/test/test',
+        sinks=sinks,
+        limits=limits,
+        cursor=cursor
+        )
+
+    return driver, polled, db, experiment_
+
+
+def written(db: FakeDatabase) -> np.ndarray:
+    return np.concatenate([payload['time'] for payload in db.payloads['data']])
+
+
+def test_acquire_writes_every_point_once(monkeypatch):
+    driver, polled, db, experiment_ = acquire(monkeypatch=monkeypatch)
+    technique = driver.channels[0].techniques[0]
+    times = written(db=db)
+
+    assert experiment_.status == 'stopped'
+    # Blocks came in full both while running and once stopped
+    assert len(polled) > technique.duration / driver.step + 1
+    assert len(times) == driver._total(technique=technique)
+    assert np.array_equal(
+        times, np.concatenate([block['time'] for block in polled])
+        )
+
+
+def test_acquire_drains_after_stop(monkeypatch):
+    driver, polled, db, experiment_ = acquire(
+        monkeypatch=monkeypatch,
+        limits=Limits.from_config(config={'Ec': {'max': 0.2}})
+        )
+    stopped = driver.channels[0].stopped
+    times = written(db=db)
+
+    assert experiment_.stop_reason.startswith('Ec')
+    assert stopped < driver.channels[0].techniques[0].duration
+    # Everything recorded up to the stop, more than a buffer's worth
+    assert len(times) == driver.channels[0].emitted
+    assert times[-1] == pytest.approx(stopped, abs=1 / driver.sampling_rate)
+    assert len(np.unique(times)) == len(times)
+
+
+class BrokenRule:
+    """Fails its check, as a badly configured limit would."""
+
+    def check(self, **_):
+        raise TypeError('not comparable')
+
+
+def test_acquire_failure_stops_limited_channel(monkeypatch):
+    driver, polled, db, experiment_ = acquire(
+        monkeypatch=monkeypatch, limits=Limits(rules=[BrokenRule()])
+        )
+    channel = driver.channels[0]
+    event, = db.payloads['events']
+
+    assert channel.stopped < channel.techniques[0].duration
+    assert len(polled) == 1
+    assert event['rule'] == 'error'
+    assert experiment_.stop_reason.startswith('acquisition failed')
+
+
+def test_acquire_skips_up_to_cursor(monkeypatch):
+    driver, polled, db, _ = acquire(monkeypatch=monkeypatch, cursor=1.0)
+    times = written(db=db)
+    everything = np.concatenate([block['time'] for block in polled])
+
+    assert np.array_equal(times, everything[everything > 1.0])
+
+
+def test_acquire_codec_sink(monkeypatch):
+    sinks = make_sinks(config={'data': {'policy': 'all', 'encoding': 'codec'}})
+    _, polled, db, _ = acquire(monkeypatch=monkeypatch, sinks=sinks)
+    blocks = [
+        decode_block(base64.b64decode(payload['data']))
+        for payload in db.payloads['data']
+        ]
+
+    decoded, polled = np.concatenate(blocks), np.concatenate(polled)
+
+    # Polled before being stamped
+    for name in polled.dtype.names:
+        if name != 'timestamp':
+            assert decoded[name].tobytes() == polled[name].tobytes()
+
+
+def test_sinks_in_process(monkeypatch):
+    monkeypatch.setattr(experiment, 'announce', None)
+
+    config = {'live': {'policy': 'all'}}
+
+    with _sinks(channel=0, exp_id='exp', config=config) as sinks:
+        assert [sink.table for sink in sinks] == ['live']
+
+
+def test_sinks_handed_off(monkeypatch):
+    announced = list()
+    monkeypatch.setattr(experiment, 'announce', announced.append)
+    monkeypatch.setattr(ring, '_prefix', 'biologic-test-handoff')
+
+    with _sinks(channel=0, exp_id='exp', qos=1, run_id='a') as sinks:
+        ring.write_block(channel=0, block=np.zeros(3, dtype=BLOCK_DTYPE))
+
+    ring.close()
+
+    assert sinks == []
+    assert [(info['event'], info['row']) for info in announced] == [
+        ('started', 0), ('finished', 3)
+        ]
+    assert announced[0] == {
+        'run_id': 'a',
+        'channel': 0,
+        'exp_id': 'exp',
+        'sinks': None,
+        'qos': 1,
+        'event': 'started',
+        'row': 0,
+        }
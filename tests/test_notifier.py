@@ -0,0 +1,114 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import pytest
+from threading import Thread
+import time
+
+from biologic.notifier import FileBackend, Notifier, SlackBackend
+
+dummy_message = 'unit testing notifier'
+
+
+class StandInSlack(BaseHTTPRequestHandler):
+    """Records posted messages. Fails the first `failures` requests."""
+
+    received = list()
+    failures = 0
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        body = json.loads(self.rfile.read(length))
+
+        if StandInSlack.failures > 0:
+            StandInSlack.failures -= 1
+            self.send_response(500)
+        else:
+            StandInSlack.received.append(body['text'])
+            self.send_response(200)
+
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    StandInSlack.received = list()
+    StandInSlack.failures = 0
+
+    server = HTTPServer(('127.0.0.1', 0), StandInSlack)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    yield f'http://127.0.0.1:{server.server_port}/'
+
+    server.shutdown()
+
+
+def test_slack(url: str):
+    notifier = Notifier(
+        backend=SlackBackend(url=url, user_id='U0'), coalesce_window=0
+        )
+    notifier.notify(message=dummy_message)
+    notifier.flush()
+
+    assert StandInSlack.received == [f'<@U0>: {dummy_message}']
+
+
+def test_retry(url: str):
+    StandInSlack.failures = 2
+    notifier = Notifier(
+        backend=SlackBackend(url=url), coalesce_window=0, backoff=0.01
+        )
+    notifier.notify(message=dummy_message)
+    notifier.flush()
+
+    assert StandInSlack.received == [dummy_message]
+
+
+def test_gives_up(url: str):
+    StandInSlack.failures = 10
+    notifier = Notifier(
+        backend=SlackBackend(url=url),
+        coalesce_window=0,
+        retries=1,
+        backoff=0.01
+        )
+    notifier.notify(message=dummy_message)
+    notifier.flush()
+
+    assert StandInSlack.received == []
+
+
+def test_coalesce(url: str):
+    notifier = Notifier(backend=SlackBackend(url=url), coalesce_window=0.2)
+
+    for channel in range(3):
+        notifier.notify(message=f'channel {channel} finished')
+
+    notifier.flush()
+
+    assert len(StandInSlack.received) == 1
+    assert StandInSlack.received[0].startswith('3 notifications:')
+
+
+def test_notify_never_blocks():
+    # Nothing listens on this port, and the worker keeps retrying
+    notifier = Notifier(
+        backend=SlackBackend(url='http://127.0.0.1:9/', timeout=1),
+        coalesce_window=0
+        )
+
+    start = time.monotonic()
+    notifier.notify(message=dummy_message)
+
+    assert time.monotonic() - start < 0.1
+
+
+def test_file(tmp_path):
+    path = tmp_path / 'notifications.log'
+    notifier = Notifier(backend=FileBackend(path=path), coalesce_window=0)
+    notifier.notify(message=dummy_message)
+    notifier.flush()
+
+    assert path.read_text().strip().endswith(dummy_message)
@@ -0,0 +1,164 @@
+import pytest
+
+from biologic.exceptions import PlanValidationError
+from biologic.plans import Step, compile_steps, parse_steps
+from tests.params import cp_params, ocv_params
+
+ocv = {'technique': 'OCV', 'params': {'Rest_time_T': 3.0}}
+
+
+def test_list():
+    steps = parse_steps(raw_steps=[ocv, {**ocv, 'technique': 'ocv'}, ocv])
+
+    assert [step.technique for step in steps] == ['OCV'] * 3
+    assert steps[0].ecc_path.endswith('ocv.ecc')
+    assert steps[0].as_dict() == {'Rest_time_T': 3.0}
+
+
+def test_legacy():
+    steps = parse_steps(raw_steps=cp_params['steps'])
+
+    assert [step.technique for step in steps] == [
+        'OCV', 'CPLIMIT', 'OCV', 'CPLIMIT', 'LOOP'
+        ]
+
+
+def test_int_to_float():
+    steps = parse_steps(
+        raw_steps=[{'technique': 'OCV', 'params': {'Rest_time_T': 3}}]
+        )
+
+    assert type(steps[0].as_dict()['Rest_time_T']) is float
+
+
+def test_hashable():
+    first = parse_steps(raw_steps=ocv_params['steps'])
+    second = parse_steps(raw_steps=ocv_params['steps'])
+
+    assert first == second
+    assert hash(first) == hash(second)
+    assert {first: None}
+
+
+def test_compile_cached():
+    steps = parse_steps(raw_steps=ocv_params['steps'])
+    technique_paths, c_tecc_params = compile_steps(steps=steps)
+
+    assert len(technique_paths) == len(c_tecc_params) == 1
+    assert compile_steps(
+        steps=parse_steps(raw_steps=ocv_params['steps'])
+        )[1] is c_tecc_params
+
+
+@pytest.mark.parametrize(
+    'raw_steps, message',
+    [
+        ([], 'No steps'),
+        ('OCV', 'steps must be a list'),
+        ([{'params': {}}], 'must be a dict with a technique'),
+        ([{'technique': 'XYZ'}], 'unknown technique'),
+        ([{'technique': 'OCV', 'params': {}}], 'Rest_time_T missing'),
+        (
+            [{'technique': 'OCV', 'params': {'Rest_time_T': 1.0, 'Foo': 1}}],
+            'unknown parameter Foo'
+            ),
+        ([{'technique': 'OCV', 'params': {'Rest_time_T': -1.0}}], 'below 0'),
+        ([{'technique': 'OCV', 'params': {'Rest_time_T': True}}], 'float'),
+        ([{'technique': 'OCV', 'params': {'Rest_time_T': '3'}}], 'float'),
+        (
+            [{'technique': 'OCV', 'params': {'Rest_time_T': [1.0, 2.0]}}],
+            'takes a single value'
+            ),
+        (
+            [
+                {
+                    'technique': 'CV',
+                    'params': {'Voltage_step': [0.0] * 6, 'Scan_Rate': 10.0}
+                    }
+                ],
+            'takes 1 to 5 values'
+            ),
+        (
+            [
+                {
+                    'technique': 'CA',
+                    'params': {
+                        'Voltage_step': [0.1, 0.2],
+                        'Duration_step': [1.0, 1.0, 1.0]
+                        }
+                    }
+                ],
+            'differ in length'
+            ),
+        (
+            [
+                {
+                    'technique': 'CA',
+                    'params': {
+                        'Voltage_step': [0.1, 0.2],
+                        'Duration_step': 1.0,
+                        'Step_number': 0
+                        }
+                    }
+                ],
+            'Step_number = 0 but 2 steps given'
+            ),
+        (
+            [
+                {
+                    'technique': 'CA',
+                    'params': {'Voltage_step': [0.1, 'x'], 'Duration_step': 1.0}
+                    }
+                ],
+            'Voltage_step[1] must be a float'
+            ),
+        (
+            [
+                ocv,
+                {
+                    'technique': 'LOOP',
+                    'params': {'loop_N_times': 1, 'protocol_number': 1}
+                    }
+                ],
+            'protocol_number must be an earlier step'
+            ),
+        ]
+    )
+def test_invalid(raw_steps, message: str):
+    with pytest.raises(PlanValidationError) as e:
+        parse_steps(raw_steps=raw_steps)
+
+    assert message in e.value.message
+    assert e.value.error_code == -9002
+
+
+def test_all_errors_reported():
+    with pytest.raises(PlanValidationError) as e:
+        parse_steps(raw_steps=[{'technique': 'XYZ'}, {'technique': 'OCV'}])
+
+    assert 'Step 0' in e.value.message
+    assert 'Step 1' in e.value.message
+
+
+def test_step_frozen():
+    step = Step(technique='OCV', params=(('Rest_time_T', 1.0), ))
+
+    with pytest.raises(Exception):
+        step.technique = 'CP'
+
+
+def test_per_step_lists():
+    steps = parse_steps(
+        raw_steps=[
+            {
+                'technique': 'CA',
+                'params': {'Voltage_step': [0.1, 1], 'Duration_step': 5.0}
+                }
+            ]
+        )
+    params = steps[0].as_dict()
+
+    assert params['Voltage_step'] == (0.1, 1.0)
+    assert params['Duration_step'] == 5.0
+    assert params['Step_number'] == 1
+    assert hash(steps)
@@ -0,0 +1,82 @@
+import pytest
+
+from biologic import exceptions
+from biologic.profiling import DriverProxy, Profiler
+
+
+class DummyDriver:
+    """Stands in for ctypes.WinDLL."""
+
+    name = 'EClib64.dll'
+
+    def BL_GetData(self, *args):
+        return 0
+
+    def BL_StartChannel(self, *args):
+        raise exceptions.ECLibError(error_code=-1, message='no instrument')
+
+
+@pytest.fixture
+def profiler_() -> Profiler:
+    profiler_ = Profiler()
+    profiler_.enable()
+
+    return profiler_
+
+
+@pytest.fixture
+def proxy(profiler_: Profiler) -> DriverProxy:
+    return DriverProxy(driver=DummyDriver(), profiler_=profiler_)
+
+
+def test_non_driver_attributes_forwarded(proxy: DriverProxy):
+    assert proxy.name == 'EClib64.dll'
+
+
+def test_wrapped_function_cached(proxy: DriverProxy):
+    assert proxy.BL_GetData is proxy.BL_GetData
+
+
+def test_disabled_records_nothing(proxy: DriverProxy, profiler_: Profiler):
+    profiler_.disable()
+    proxy.BL_GetData()
+
+    assert profiler_.stats() == {}
+
+
+def test_stats(proxy: DriverProxy, profiler_: Profiler):
+    for _ in range(3):
+        proxy.BL_GetData(0, 0)
+
+    stats = profiler_.stats()['BL_GetData']
+
+    assert stats['count'] == 3
+    assert stats['return_codes'] == {'0': 3}
+    assert stats['p99_ms'] >= stats['p50_ms'] >= 0
+
+
+def test_error_code_recorded(proxy: DriverProxy, profiler_: Profiler):
+    with pytest.raises(exceptions.ECLibError):
+        proxy.BL_StartChannel(0, 0)
+
+    stats = profiler_.stats()['BL_StartChannel']
+
+    assert stats['return_codes'] == {'-1': 1}
+
+
+def test_trace(proxy: DriverProxy, profiler_: Profiler):
+    proxy.BL_GetData(0, 0)
+
+    line = profiler_.trace().splitlines()[0]
+    stack, weight = line.rsplit(' ', 1)
+
+    assert stack.endswith('test_trace;BL_GetData')
+    assert int(weight) >= 0
+
+
+def test_reset(proxy: DriverProxy, profiler_: Profiler):
+    proxy.BL_GetData(0, 0)
+    profiler_.reset()
+
+    assert profiler_.stats() == {}
+    assert profiler_.trace() == ''
@@ -0,0 +1,84 @@
+import ctypes
+import pytest
+
+from biologic import exceptions, prototypes
+
+
+class DummyFunction:
+    """Mimics a ctypes function pointer, errcheck included."""
+
+    def __init__(self, return_code: int = 0):
+        self.return_code = return_code
+        self.errcheck = None
+
+    def __call__(self, *args):
+        if self.errcheck is None:
+            return self.return_code
+
+        return self.errcheck(self.return_code, self, args)
+
+
+class DummyDriver:
+
+    def __init__(self, return_code: int = 0):
+        self.return_code = return_code
+
+    def __getattr__(self, name: str) -> DummyFunction:
+        function = DummyFunction(return_code=self.return_code)
+        setattr(self, name, function)
+
+        return function
+
+
+def test_prototypes_complete():
+    for table in (prototypes.ECLIB_PROTOTYPES, prototypes.BLFIND_PROTOTYPES):
+        for name, (restype, argtypes, checked) in table.items():
+            assert name.startswith('BL_')
+            assert issubclass(restype, ctypes._SimpleCData)
+            assert isinstance(argtypes, list)
+            assert isinstance(checked, bool)
+
+
+def test_error_message_never_checked():
+    # Checking it would recurse, as the check itself translates the code.
+    assert prototypes.ECLIB_PROTOTYPES['BL_GetErrorMsg'][2] is False
+    assert prototypes.BLFIND_PROTOTYPES['BL_GetErrorMsg'][2] is False
+
+
+def test_bind():
+    driver = DummyDriver()
+    prototypes.bind(driver=driver)
+
+    get_data = driver.BL_GetData
+
+    assert get_data.restype is ctypes.c_int32
+    assert len(get_data.argtypes) == 5
+    assert get_data.errcheck is not None
+    assert driver.BL_IsChannelPlugged.errcheck is None
+
+
+def test_errcheck_passes_ok_status():
+    driver = DummyDriver()
+    prototypes.bind(driver=driver)
+
+    assert driver.BL_StartChannel(0, 0) == 0
+
+
+def test_errcheck_raises():
+    driver = DummyDriver(return_code=-1)
+    prototypes.bind(driver=driver)
+
+    with pytest.raises(exceptions.ECLibError):
+        driver.BL_StartChannel(0, 0)
+
+
+def test_finder_errcheck_raises():
+    driver = DummyDriver(return_code=-1)
+    prototypes.bind(
+        driver=driver,
+        prototypes=prototypes.BLFIND_PROTOTYPES,
+        assert_ok=prototypes.assert_finder_ok
+        )
+
+    with pytest.raises(exceptions.BLFindError):
+        driver.BL_FindEChemEthDev(None, None, None)
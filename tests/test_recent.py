@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from biologic import recent
+from biologic.decoding import empty_block
+from biologic.recent import RecentRing
+
+
+def make_block(timestamps: list[int]) -> np.ndarray:
+    block = empty_block(no_rows=len(timestamps))
+    block['timestamp'] = timestamps
+    block['Ewe'] = np.asarray(timestamps) / 10
+
+    return block
+
+
+def test_query_range():
+    ring = RecentRing(capacity=10)
+    ring.write(block=make_block(timestamps=[10, 20, 30, 40]))
+
+    rows = ring.query(since=20, until=40)
+
+    assert rows['timestamp'].tolist() == [20, 30]
+    assert rows['Ewe'].tolist() == [2.0, 3.0]
+
+
+def test_query_open_ended():
+    ring = RecentRing(capacity=10)
+    ring.write(block=make_block(timestamps=[10, 20, 30]))
+
+    assert ring.query(since=15)['timestamp'].tolist() == [20, 30]
+    assert ring.query(until=15)['timestamp'].tolist() == [10]
+    assert len(ring.query()) == 3
+
+
+def test_wraps_around():
+    ring = RecentRing(capacity=4)
+
+    for start in range(0, 100, 30):
+        ring.write(block=make_block(timestamps=[start, start + 10]))
+
+    # Only the last 4 rows are kept, across the end of the array
+    assert ring.query()['timestamp'].tolist() == [60, 70, 90, 100]
+    assert ring.query(since=65, until=95)['timestamp'].tolist() == [70, 90]
+
+
+def test_block_larger_than_capacity():
+    ring = RecentRing(capacity=3)
+    ring.write(block=make_block(timestamps=list(range(10))))
+
+    assert ring.query()['timestamp'].tolist() == [7, 8, 9]
+    assert ring.written == 3
+
+
+def test_out_of_order_dropped():
+    ring = RecentRing(capacity=10)
+    ring.write(block=make_block(timestamps=[10, 20]))
+    ring.write(block=make_block(timestamps=[15, 30, 25, 40]))
+
+    assert ring.query()['timestamp'].tolist() == [10, 20, 30, 40]
+    assert ring.dropped == 2
+
+
+def test_fields_packed():
+    ring = RecentRing(capacity=10)
+    ring.write(block=make_block(timestamps=[10, 20]))
+
+    rows = ring.query(fields=['Ewe', 'timestamp'])
+
+    assert rows.dtype.names == ('Ewe', 'timestamp')
+    assert rows.dtype.itemsize == 12
+
+
+def test_invalid_capacity():
+    with pytest.raises(ValueError):
+        RecentRing(capacity=0)
+
+
+def test_module_query(monkeypatch):
+    monkeypatch.setattr(recent, '_rings', dict())
+    monkeypatch.setattr(recent, 'MAX_BYTES', 52 * 100)
+    recent.write_block(channel=3, block=make_block(timestamps=[10, 20]))
+
+    assert recent._rings[3].capacity == 100
+    assert recent.query(channel=3, since=15)['timestamp'].tolist() == [20]
+    assert len(recent.query(channel=4, fields=['Ewe'])) == 0
+
+    with pytest.raises(ValueError):
+        recent.query(channel=3, fields=['Q'])
+
+
+def test_to_columns():
+    rows = make_block(timestamps=[10, 20])
+    rows['Ece'][1] = 0.5
+
+    assert recent.to_columns(rows=rows[['timestamp', 'Ewe', 'Ece', 'I']]) == {
+        'timestamp': [10, 20],
+        'Ewe': [1.0, 2.0],
+        'Ece': [None, 0.5],
+        'I': [None, None],
+        }
+
+
+def test_to_columns_drop_empty():
+    columns = recent.to_columns(
+        rows=make_block(timestamps=[10, 20]), drop_empty=True
+        )
+
+    assert 'I' not in columns and 'Ec' not in columns
+    assert columns['Ewe'] == [1.0, 2.0]
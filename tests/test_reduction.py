@@ -0,0 +1,185 @@
+import base64
+
+import numpy as np
+import pytest
+
+from biologic.codec import decode_block
+from biologic.decoding import empty_block
+from biologic.reduction import (
+    All, Deadband, EveryNth, StepEdges, TimeBucket, make_sinks, to_payload
+    )
+
+
+def make_block(time, Ewe=None, technique_index=None) -> np.ndarray:
+    block = empty_block(no_rows=len(time))
+    block['time'] = time
+    block['Ewe'] = np.arange(len(time)) if Ewe is None else Ewe
+
+    if technique_index is not None:
+        block['technique_index'] = technique_index
+
+    return block
+
+
+def test_all():
+    block = make_block(time=[0, 1, 2])
+
+    assert len(All().reduce(block)) == 3
+
+
+def test_every_nth_across_blocks():
+    policy = EveryNth(n=3)
+    first = policy.reduce(make_block(time=np.arange(4)))
+    second = policy.reduce(make_block(time=np.arange(4, 10)))
+
+    assert first['time'].tolist() == [0, 3]
+    assert second['time'].tolist() == [6, 9]
+
+
+def test_time_bucket_mean():
+    policy = TimeBucket(width=1.0)
+    rows = policy.reduce(
+        make_block(time=[0.0, 0.5, 1.0, 1.5, 2.0], Ewe=[1, 3, 5, 7, 9])
+        )
+
+    # Last bucket held back
+    assert rows['Ewe'].tolist() == [2, 6]
+    assert rows['time'].tolist() == [0.0, 1.0]
+    assert policy.flush()['Ewe'].tolist() == [9]
+
+
+def test_time_bucket_spans_blocks():
+    policy = TimeBucket(width=1.0, how='max')
+    policy.reduce(make_block(time=[0.0, 0.5], Ewe=[1, 2]))
+    rows = policy.reduce(make_block(time=[0.75, 1.0], Ewe=[5, 0]))
+
+    assert rows['Ewe'].tolist() == [5]
+
+
+def test_time_bucket_splits_steps():
+    policy = TimeBucket(width=10.0, how='min')
+    policy.reduce(
+        make_block(time=[0, 1, 2, 3], Ewe=[4, 3, 2, 1], technique_index=[0, 0, 1, 1])
+        )
+
+    rows = policy.flush()
+
+    assert rows['Ewe'].tolist() == [1]
+    assert rows['technique_index'].tolist() == [1]
+
+
+def test_deadband():
+    policy = Deadband(Ewe=1.0)
+    first = policy.reduce(make_block(time=np.arange(4), Ewe=[0, 0.5, 1, 1.5]))
+    second = policy.reduce(make_block(time=[4, 5, 6], Ewe=[1.75, 0.5, 0]))
+
+    assert first['time'].tolist() == [0, 2]
+    # Against the last point kept, 1, not the one before
+    assert second['time'].tolist() == [6]
+
+
+def test_deadband_noise_at_band_edge():
+    policy = Deadband(Ewe=0.05)
+    noise = 1.0 + 0.01 * (-1)**np.arange(100)
+    rows = policy.reduce(make_block(time=np.arange(100), Ewe=noise))
+
+    assert rows['time'].tolist() == [0]
+
+
+def test_deadband_ignores_unrecorded_columns():
+    policy = Deadband(Ewe=1.0, I=1.0)
+    rows = policy.reduce(make_block(time=[0, 1], Ewe=[0.1, 0.2]))
+
+    assert rows['time'].tolist() == [0]
+
+
+def test_step_edges():
+    policy = StepEdges()
+    first = policy.reduce(
+        make_block(time=[0, 1, 2, 3], technique_index=[0, 0, 0, 1])
+        )
+    second = policy.reduce(make_block(time=[4, 5], technique_index=[1, 2]))
+
+    assert first['time'].tolist() == [0, 2, 3]
+    assert second['time'].tolist() == [4, 5]
+    assert len(policy.flush()) == 0
+
+
+def test_step_edges_flush():
+    policy = StepEdges()
+    policy.reduce(make_block(time=[0, 1, 2], technique_index=[0, 0, 0]))
+
+    assert policy.flush()['time'].tolist() == [2]
+
+
+def test_make_sinks_default():
+    sinks = make_sinks()
+
+    assert [sink.table for sink in sinks] == ['data']
+    assert isinstance(sinks[0].policy, All)
+
+
+def test_make_sinks():
+    sinks = make_sinks(
+        config={
+            'data': {'policy': 'all'},
+            'live': {'policy': 'time_bucket', 'width': 1.0, 'how': 'max'}
+            }
+        )
+
+    assert sinks[1].policy.how == 'max'
+    assert sinks[1].encoding == 'json'
+
+
+def test_make_sinks_encoding():
+    sinks = make_sinks(
+        config={'archive': {'policy': 'all', 'encoding': 'codec'}}
+        )
+
+    assert sinks[0].encoding == 'codec'
+
+
+@pytest.mark.parametrize(
+    'config',
+    [
+        {'live': {'policy': 'nope'}},
+        {'live': {'policy': 'every_nth'}},
+        {'live': {'policy': 'every_nth', 'n': 0}},
+        {'live': {'policy': 'deadband', 'Q': 1.0}},
+        {'live': {'policy': 'all', 'encoding': 'xml'}},
+        ]
+    )
+def test_make_sinks_invalid(config: dict):
+    with pytest.raises(ValueError):
+        make_sinks(config=config)
+
+
+def test_to_payload():
+    payload = to_payload(rows=make_block(time=[0.0, 1.0]))
+
+    assert payload['Ewe'] == [0.0, 1.0]
+    assert 'I' not in payload
+
+
+def test_to_payload_codec():
+    rows = make_block(time=[0.0, 1.0])
+    payload = to_payload(rows=rows, encoding='codec')
+
+    assert payload['encoding'] == 'BLZ1'
+    assert payload['rows'] == 2
+    assert decode_block(base64.b64decode(payload['data'])).tobytes() == (
+        rows.tobytes()
+        )
+
+
+def test_to_payload_codec_time_as_ticks():
+    time_base = float(np.float32(1e-5))
+    rows = make_block(time=0.5 + np.arange(1000) * 20 * time_base)
+    as_floats = to_payload(rows=rows, encoding='codec')
+    as_ticks = to_payload(
+        rows=rows, encoding='codec', time_base=time_base, start_time=0.5
+        )
+    data = base64.b64decode(as_ticks['data'])
+
+    assert decode_block(data).tobytes() == rows.tobytes()
+    assert len(data) < len(base64.b64decode(as_floats['data']))
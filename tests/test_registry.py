@@ -0,0 +1,108 @@
+import os
+import time
+
+import pytest
+
+from biologic.exceptions import TechniqueFileError
+from biologic.registry import MANIFEST, Registry
+
+
+@pytest.fixture
+def directory(tmp_path) -> str:
+    for filename, content in [
+        ('ocv.ecc', b'ocv'),
+        ('cplimit.ecc', b'cplimit'),
+        ('ocv4.ecc', b'ocv for the SP-300 series'),
+        ('peis.ecc', b'not implemented'),
+        ('kernel.bin', b'firmware'),
+        ]:
+        (tmp_path / filename).write_bytes(content)
+
+    return str(tmp_path)
+
+
+@pytest.fixture
+def registry(directory: str) -> Registry:
+    registry = Registry(directory=directory)
+    registry.write_manifest()
+
+    return registry
+
+
+def test_scan(registry: Registry, directory: str):
+    assert set(registry.files) == {('OCV', ''), ('CPLIMIT', ''), ('OCV', '4')}
+    assert registry.files[('OCV', '')].technique_id == 100
+    assert registry.path(technique='OCV') == os.path.join(directory, 'ocv.ecc')
+
+
+def test_windows_style_directory(registry: Registry, directory: str):
+    # E.g. 'drivers\\' from config.json, with the server running natively
+    windows_style = directory.replace(os.sep, '\\') + '\\'
+    registry_ = Registry(directory=windows_style)
+
+    assert set(registry_.files) == set(registry.files)
+    assert os.path.isfile(registry_.path(technique='OCV'))
+
+
+def test_available(registry: Registry):
+    assert registry.available(device='KBIO_DEV_HCP1005') == {'OCV', 'CPLIMIT'}
+
+
+def test_unavailable(registry: Registry):
+    with pytest.raises(TechniqueFileError):
+        registry.path(technique='LOOP', device='KBIO_DEV_SP150')
+
+
+def test_content_cached(registry: Registry):
+    path = registry.path(technique='OCV')
+
+    assert registry.content(path=path) == b'ocv'
+
+
+def test_manifest_missing_file(registry: Registry, directory: str):
+    os.remove(os.path.join(directory, 'cplimit.ecc'))
+
+    with pytest.raises(TechniqueFileError) as e:
+        Registry(directory=directory)
+
+    assert 'cplimit.ecc missing' in e.value.message
+
+
+def test_manifest_corrupted_file(registry: Registry, directory: str):
+    with open(os.path.join(directory, 'ocv.ecc'), 'wb') as f:
+        f.write(b'corrupted')
+
+    with pytest.raises(TechniqueFileError) as e:
+        Registry(directory=directory)
+
+    assert 'ocv.ecc checksum mismatch' in e.value.message
+
+
+def test_verify_changed(registry: Registry):
+    path = registry.path(technique='OCV')
+    registry.verify(paths=[path])
+
+    time.sleep(0.01)
+    with open(path, 'wb') as f:
+        f.write(b'changed')
+
+    with pytest.raises(TechniqueFileError):
+        registry.verify(paths=[path])
+
+
+def test_verify_touched(registry: Registry):
+    path = registry.path(technique='OCV')
+    os.utime(path, ns=(0, 0))
+
+    # Rehashed, but unchanged
+    registry.verify(paths=[path])
+
+
+def test_verify_unregistered(registry: Registry, directory: str):
+    with pytest.raises(TechniqueFileError):
+        registry.verify(paths=[os.path.join(directory, 'loop.ecc')])
+
+
+def test_no_manifest(directory: str):
+    assert not os.path.isfile(os.path.join(directory, MANIFEST))
+    assert len(Registry(directory=directory).files) == 3
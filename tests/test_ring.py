@@ -0,0 +1,175 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from biologic import ring
+from biologic.decoding import BLOCK_DTYPE
+
+
+def _block(start: int, stop: int) -> np.ndarray:
+    block = np.zeros(stop - start, dtype=BLOCK_DTYPE)
+    block['time'] = np.arange(start, stop)
+
+    return block
+
+
+@pytest.fixture
+def writer(request) -> ring.BlockRing:
+    writer = ring.BlockRing(
+        name=f'biologic-test-{request.node.name}', capacity=8
+        )
+
+    yield writer
+
+    writer.close()
+
+
+def test_ring_name():
+    name = ring.ring_name(prefix='biologic-192.168.0.1', channel=2)
+
+    assert name == 'biologic-192-168-0-1-2'
+
+
+def test_read_in_order(writer: ring.BlockRing):
+    reader = ring.RingReader(name=writer.memory.name)
+    writer.write(block=_block(0, 3))
+
+    block, cursor, lost = reader.read(cursor=0)
+
+    assert list(block['time']) == [0, 1, 2]
+    assert (cursor, lost) == (3, 0)
+
+    writer.write(block=_block(3, 5))
+    block, cursor, lost = reader.read(cursor=cursor)
+
+    assert list(block['time']) == [3, 4]
+    assert (cursor, lost) == (5, 0)
+
+    reader.close()
+
+
+def test_wraparound(writer: ring.BlockRing):
+    reader = ring.RingReader(name=writer.memory.name)
+    writer.write(block=_block(0, 6))
+    writer.write(block=_block(6, 12))
+
+    views, end, lost = reader.views(cursor=6)
+
+    assert len(views) == 2
+    assert list(np.concatenate(views)['time']) == list(range(6, 12))
+    assert (end, lost) == (12, 0)
+
+    views = None
+    reader.close()
+
+
+def test_lapped_reader_loses_oldest(writer: ring.BlockRing):
+    reader = ring.RingReader(name=writer.memory.name)
+    writer.write(block=_block(0, 5))
+    writer.write(block=_block(5, 20))
+
+    block, cursor, lost = reader.read(cursor=0)
+
+    assert list(block['time']) == list(range(12, 20))
+    assert (cursor, lost) == (20, 12)
+
+    reader.close()
+
+
+def test_read_up_to_end(writer: ring.BlockRing):
+    reader = ring.RingReader(name=writer.memory.name)
+    writer.write(block=_block(0, 5))
+
+    block, cursor, lost = reader.read(cursor=1, end=3)
+
+    assert list(block['time']) == [1, 2]
+    assert (cursor, lost) == (3, 0)
+    # Not past what's written
+    assert reader.read(cursor=3, end=10)[1] == 5
+
+    reader.close()
+
+
+def test_query(writer: ring.BlockRing):
+    reader = ring.RingReader(name=writer.memory.name)
+    block = _block(0, 12)
+    block['timestamp'] = np.arange(12) * 10
+    writer.write(block=block)
+
+    rows = reader.query(since=55, until=100, fields=['timestamp', 'time'])
+
+    # Oldest 4 overwritten, and the rest wrapped around
+    assert rows.dtype.names == ('timestamp', 'time')
+    assert rows['timestamp'].tolist() == [60, 70, 80, 90]
+    assert rows['time'].tolist() == [6, 7, 8, 9]
+    assert len(reader.query()) == 8
+    assert len(reader.query(since=200)) == 0
+
+    reader.close()
+
+
+def test_time_base(writer: ring.BlockRing):
+    reader = ring.RingReader(name=writer.memory.name)
+
+    assert (reader.time_base, reader.start_time) == (None, 0)
+
+    writer.write(block=_block(0, 1), time_base=2e-5, start_time=1.5)
+
+    assert (reader.time_base, reader.start_time) == (2e-5, 1.5)
+
+    reader.close()
+
+
+def _read(name: str, queue: multiprocessing.Queue) -> None:
+    reader = ring.RingReader(name=name)
+    block, _, _ = reader.read(cursor=0)
+    queue.put(list(block['time']))
+    reader.close()
+
+
+def test_read_from_another_process(writer: ring.BlockRing):
+    writer.write(block=_block(0, 4))
+
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_read, args=(writer.memory.name, queue))
+    process.start()
+
+    assert queue.get(timeout=30) == [0, 1, 2, 3]
+
+    process.join()
+
+
+def test_write_block_needs_enable(monkeypatch):
+    monkeypatch.setattr(ring, '_prefix', None)
+    ring.write_block(channel=0, block=_block(0, 1))
+
+    assert ring._writers == dict()
+
+    monkeypatch.setattr(ring, '_prefix', 'biologic-test-enabled')
+    ring.write_block(channel=0, block=_block(0, 1))
+    reader = ring.RingReader(name='biologic-test-enabled-0')
+
+    assert reader.written == 1
+
+    reader.close()
+    ring.close()
+
+
+def test_position(monkeypatch):
+    monkeypatch.setattr(ring, '_prefix', None)
+
+    assert not ring.enabled()
+    assert ring.position(channel=0) is None
+
+    monkeypatch.setattr(ring, '_prefix', 'biologic-test-position')
+
+    assert ring.enabled()
+    assert ring.position(channel=0) == 0
+
+    ring.write_block(channel=0, block=_block(0, 3))
+
+    assert ring.position(channel=0) == 3
+
+    ring.close()
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from biologic.aggregates import CycleAggregator
+from biologic.decoding import empty_block
+from biologic.safety import Limits
+from tests.params import dummy_raw_data
+
+
+def make_block(Ewe, I=0.0, loop=0) -> np.ndarray:
+    block = empty_block(no_rows=len(Ewe))
+    block['time'] = np.arange(len(Ewe))
+    block['Ewe'] = Ewe
+    block['I'] = I
+    block['loop'] = loop
+
+    return block
+
+
+def check(limits: Limits, block: np.ndarray, current_values: dict = None):
+    aggregator = CycleAggregator()
+    summaries = aggregator.update(block=block)
+
+    return limits.check(
+        block=block,
+        current_values=current_values or dummy_raw_data,
+        aggregator=aggregator,
+        summaries=summaries
+        )
+
+
+def test_no_limits():
+    assert check(Limits.from_config(), make_block(Ewe=[100.0])) is None
+
+
+def test_bounds():
+    limits = Limits.from_config(config={'Ewe': {'min': 2.5, 'max': 4.3}})
+
+    assert check(limits, make_block(Ewe=[3.0, 4.0])) is None
+
+    breach = check(limits, make_block(Ewe=[3.0, 4.4, 2.0]))
+
+    assert breach.rule == 'Ewe'
+    assert breach.instrument_time == 1
+
+
+def test_bounds_ignore_unrecorded():
+    limits = Limits.from_config(config={'Ece': {'max': 1.0}})
+
+    assert check(limits, make_block(Ewe=[3.0])) is None
+
+
+def test_flags():
+    limits = Limits.from_config(config={'flags': ['Ioverflow']})
+    current_values = {**dummy_raw_data, 'Ioverflow': 1}
+
+    assert check(limits, make_block(Ewe=[3.0])) is None
+    assert 'Ioverflow' in check(
+        limits, make_block(Ewe=[3.0]), current_values=current_values
+        ).reason
+
+
+def test_capacity():
+    limits = Limits.from_config(config={'capacity': {'charge_in': 1.5}})
+
+    assert check(limits, make_block(Ewe=[3.0, 3.0], I=1.0)) is None
+    assert check(limits, make_block(Ewe=[3.0] * 3, I=1.0)).rule == 'capacity'
+
+
+def test_capacity_fade():
+    limits = Limits.from_config(config={'capacity_fade': 0.8})
+    aggregator = CycleAggregator()
+
+    def update(loop: int, I: float):
+        block = make_block(Ewe=[3.0, 3.0], I=I, loop=loop)
+        block['time'] += 2 * loop
+
+        return limits.check(
+            block=block,
+            current_values=dummy_raw_data,
+            aggregator=aggregator,
+            summaries=aggregator.update(block=block)
+            )
+
+    assert update(loop=0, I=-1.0) is None
+    assert update(loop=1, I=-0.9) is None  # Completes loop 0, the reference
+    assert update(loop=2, I=-0.5) is None  # Loop 1 at 90%
+    assert update(loop=3, I=-0.5).rule == 'capacity_fade'  # Loop 2 at 50%
+
+
+def test_cycles():
+    limits = Limits.from_config(config={'cycles': 2})
+
+    assert check(limits, make_block(Ewe=[3.0], loop=1)) is None
+    assert check(limits, make_block(Ewe=[3.0], loop=2)).rule == 'cycles'
+
+
+@pytest.mark.parametrize(
+    'config',
+    [
+        {'T': {'max': 50}},
+        {'Ewe': {}},
+        {'Ewe': {'maximum': 4.0}},
+        {'flags': ['Overheat']},
+        {'capacity': {'charge': 1.0}},
+        {'capacity_fade': 1.5},
+        {'cycles': '10'},
+        {'cycles': 2.5},
+        {'cycles': True},
+        {'Ewe': {'max': '4.3'}},
+        {'I': {'min': float('nan')}},
+        {'capacity': {'charge_in': '3600'}},
+        {'capacity_fade': '0.8'},
+        {'flags': 'Ioverflow'},
+        ]
+    )
+def test_invalid(config: dict):
+    with pytest.raises(ValueError):
+        Limits.from_config(config=config)
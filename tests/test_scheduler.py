@@ -0,0 +1,202 @@
+import pytest
+
+from biologic import experiment, scheduler
+from biologic.exceptions import PlanValidationError
+from biologic.state import StateStore
+from tests.params import cp_params, ocv_params
+
+
+@pytest.fixture
+def queue_path(tmp_path) -> str:
+    return str(tmp_path / 'queue.json')
+
+
+@pytest.fixture
+def queue(queue_path: str) -> scheduler.JobQueue:
+    return scheduler.JobQueue(path=queue_path)
+
+
+def test_priority_order(queue: scheduler.JobQueue):
+    low = scheduler.Job(raw_params=ocv_params, priority=0)
+    high = scheduler.Job(raw_params=cp_params, priority=1)
+    queue.put(job=low)
+    queue.put(job=high)
+
+    assert queue.get(channel=0) is high
+
+
+def test_submission_order_breaks_ties(queue: scheduler.JobQueue):
+    first = scheduler.Job(raw_params=ocv_params)
+    second = scheduler.Job(raw_params=ocv_params)
+    queue.put(job=second)
+    queue.put(job=first)
+
+    assert queue.jobs() == [first, second]
+
+
+def test_position(queue: scheduler.JobQueue):
+    assert queue.put(job=scheduler.Job(raw_params=ocv_params)) == 0
+    assert queue.put(job=scheduler.Job(raw_params=ocv_params)) == 1
+    assert queue.put(job=scheduler.Job(raw_params=ocv_params, channel=1)) == 0
+
+    queue.get(channel=0)
+
+    # The running job counts
+    assert queue.put(job=scheduler.Job(raw_params=ocv_params)) == 2
+
+
+def test_persisted(queue: scheduler.JobQueue, queue_path: str):
+    job = scheduler.Job(raw_params=cp_params, channel=1, priority=3)
+    queue.put(job=job)
+
+    reloaded = scheduler.JobQueue(path=queue_path).jobs()
+
+    assert len(reloaded) == 1
+    assert reloaded[0].job_id == job.job_id
+    assert reloaded[0].raw_params == cp_params
+    assert reloaded[0].channel == 1
+
+
+def test_running_job_leaves_file(queue: scheduler.JobQueue, queue_path: str):
+    queue.put(job=scheduler.Job(raw_params=cp_params))
+    queue.get(channel=0)
+
+    assert scheduler.JobQueue(path=queue_path).jobs() == []
+
+
+def test_remove(queue: scheduler.JobQueue):
+    job = scheduler.Job(raw_params=cp_params)
+    queue.put(job=job)
+
+    assert queue.remove(job_id=job.job_id)
+    assert not queue.remove(job_id=job.job_id)
+    assert queue.jobs() == []
+
+
+class DummyPotentiostat:
+
+    def __init__(self, channel: int):
+        self.channel = channel
+        self.is_connected = False
+
+
+@pytest.fixture
+def store(tmp_path) -> StateStore:
+    return StateStore(path=str(tmp_path / 'state.db'))
+
+
+@pytest.fixture
+def runs(monkeypatch) -> list:
+    runs = list()
+
+    def run(potentiostat, raw_params, pill, experiment_, plan, store, run_id):
+        runs.append((potentiostat.channel, raw_params))
+
+    def reattach(potentiostat, run_state, pill, experiment_, store):
+        runs.append(('reattached', run_state.run_id))
+        store.finish(run_id=run_state.run_id)
+
+    monkeypatch.setattr(experiment, 'prepare', lambda raw_params: None)
+    monkeypatch.setattr(experiment, 'run', run)
+    monkeypatch.setattr(experiment, 'reattach', reattach)
+
+    return runs
+
+
+@pytest.fixture
+def scheduler_(
+    runs: list, queue: scheduler.JobQueue, store: StateStore
+    ) -> scheduler.Scheduler:
+    scheduler_ = scheduler.Scheduler(
+        potentiostat_class=DummyPotentiostat, queue=queue, store=store
+        )
+    scheduler_.runs = runs
+
+    return scheduler_
+
+
+def test_back_to_back(scheduler_: scheduler.Scheduler):
+    for _ in range(3):
+        scheduler_.submit(raw_params=cp_params)
+
+    scheduler_.submit(raw_params={**ocv_params, 'channel': 1})
+    scheduler_.wait_idle(timeout=5)
+
+    assert len(scheduler_.runs) == 4
+    assert (1, {**ocv_params, 'channel': 1}) in scheduler_.runs
+
+
+def test_channel_as_string(scheduler_: scheduler.Scheduler):
+    raw_params = {**ocv_params, 'channel': '1', 'priority': 2.0}
+    job, _ = scheduler_.submit(raw_params=raw_params)
+    scheduler_.wait_idle(timeout=5)
+
+    assert (job.channel, job.priority) == (1, 2)
+    assert scheduler_.runs == [(1, raw_params)]
+    assert list(scheduler_._workers) == [1]
+
+
+def test_connection(scheduler_: scheduler.Scheduler):
+    assert scheduler_.connection() is None
+
+    scheduler_.submit(raw_params={**ocv_params, 'channel': 2})
+    scheduler_.wait_idle(timeout=5)
+
+    assert scheduler_.connection() is None
+
+    scheduler_.worker(channel=2).potentiostat.is_connected = True
+
+    assert scheduler_.connection().channel == 2
+
+
+@pytest.mark.parametrize(
+    'options', [{'channel': 'one'}, {'channel': -1}, {'channel': 0.5},
+                {'channel': None}, {'channel': True}, {'priority': '1.5'}]
+    )
+def test_bad_channel_or_priority(
+    scheduler_: scheduler.Scheduler, options: dict
+    ):
+    with pytest.raises(PlanValidationError):
+        scheduler_.submit(raw_params={**ocv_params, **options})
+
+    assert scheduler_._workers == {}
+
+
+def test_stopped_channel_holds_queue(scheduler_: scheduler.Scheduler):
+    scheduler_.worker(channel=0).stop()
+    job, _ = scheduler_.submit(raw_params=cp_params)
+
+    assert not job.done.wait(timeout=0.2)
+
+    scheduler_.worker(channel=0).resume()
+
+    assert job.done.wait(timeout=5)
+
+
+def test_reattach_before_queue(
+    runs: list, queue: scheduler.JobQueue, store: StateStore
+    ):
+    store.start(
+        run_id='interrupted',
+        exp_id=cp_params['exp_id'],
+        device='KBIO_DEV_HCP1005',
+        channel=0,
+        raw_params=cp_params
+        )
+    queue.put(job=scheduler.Job(raw_params=ocv_params))
+
+    scheduler_ = scheduler.Scheduler(
+        potentiostat_class=DummyPotentiostat, queue=queue, store=store
+        )
+    scheduler_.wait_idle(timeout=5)
+
+    assert runs == [('reattached', 'interrupted'), (0, ocv_params)]
+    assert store.unfinished() == []
+
+
+def test_stop_all_idle(scheduler_: scheduler.Scheduler):
+    scheduler_.worker(channel=0)
+    scheduler_.worker(channel=1)
+
+    assert scheduler_.stop_all() == []
+    assert scheduler_.worker(channel=1).paused
@@ -0,0 +1,202 @@
+import time
+
+import numpy as np
+import pytest
+
+from biologic import techniques
+from biologic.potentiostats import DATA_BUFFER_SIZE, Potentiostat, is_full
+from biologic.simulator import PARAM_SINGLE, SimulatedDriver
+
+cv = {
+    'Voltage_step': (0.0, 0.5, -0.5, 0.0, 0.0),
+    'Scan_Rate': (1000.0, ) * 5,  # mV/s
+    'Scan_number': 2,
+    'N_Cycles': 1,
+    }
+
+
+class Clock:
+    """Only moves when told to."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> Clock:
+    return Clock()
+
+
+def make_potentiostat(
+    monkeypatch, clock: Clock, technique: str, params: dict,
+    sampling_rate: float = 5000.0, noise: float = 0.0
+    ) -> tuple[Potentiostat, SimulatedDriver]:
+    driver = SimulatedDriver(
+        sampling_rate=sampling_rate, clock=clock, noise=noise
+        )
+    monkeypatch.setattr(techniques, 'driver', driver)
+
+    potentiostat = Potentiostat(type_='KBIO_DEV_HCP1005', driver=driver)
+    potentiostat.connect(usb_port='USB0')
+    potentiostat.load_technique(
+        technique_paths=[f'drivers/{technique}.ecc'],
+        c_tecc_params=techniques.set_technique_params([params])
+        )
+    potentiostat.start_channel()
+
+    return potentiostat, driver
+
+
+def drain(potentiostat: Potentiostat) -> list[np.ndarray]:
+    blocks = list()
+
+    while True:
+        data_infos, _, block = potentiostat.get_block()
+        blocks.append(block)
+
+        if not is_full(data_infos=data_infos):
+            return blocks
+
+
+def test_indexed_params_encoded(monkeypatch, clock: Clock):
+    _, driver = make_potentiostat(
+        monkeypatch=monkeypatch, clock=clock, technique='cv', params=cv
+        )
+    loaded = driver.channels[0].techniques[0]
+
+    assert loaded.values(label='Voltage_step', default=0) == pytest.approx(
+        cv['Voltage_step']
+        )
+    assert loaded.params['N_Cycles'] == {0: 1}
+
+
+def test_voltage_limit_per_step(monkeypatch, clock: Clock):
+    _, driver = make_potentiostat(
+        monkeypatch=monkeypatch,
+        clock=clock,
+        technique='cplimit',
+        params={
+            'Current_step': (1.0, -1.0),
+            'Duration_step': (1.0, 1.0),
+            'Step_number': 1,
+            'Voltage_limit': (4.2, 2.5),
+            }
+        )
+    loaded = driver.channels[0].techniques[0]
+
+    assert loaded.params['Test1_Config'] == {0: 0b101, 1: 0b001}
+    assert loaded.values(label='Test1_Value', default=0) == pytest.approx(
+        [4.2, 2.5]
+        )
+
+
+def test_cv_sweeps(monkeypatch, clock: Clock):
+    potentiostat, _ = make_potentiostat(
+        monkeypatch=monkeypatch, clock=clock, technique='cv', params=cv
+        )
+
+    clock.now = 10.0  # The whole CV and then some
+    block = np.concatenate(drain(potentiostat=potentiostat))
+
+    # 0 -> 0.5 -> -0.5 -> 0.5 -> -0.5 -> 0.5, 0.5 + 4 * 1 V at 1 V/s
+    assert len(block) == 4.5 * 5000 + 1
+    assert np.diff(block['time']) == pytest.approx(1 / 5000)
+    assert block['scan'][-1] == 4
+    assert (np.diff(block['scan']) >= 0).all()
+    # A vertex ends its sweep, the next one starts a point later
+    assert block['Ec'][block['scan'] == 1].max() == pytest.approx(0.5, abs=1e-3)
+    assert block['Ec'][block['scan'] == 1].min() == pytest.approx(-0.5)
+    assert potentiostat.get_current_values()['State'] == 0
+
+
+def test_drained_once_stopped(monkeypatch, clock: Clock):
+    potentiostat, _ = make_potentiostat(
+        monkeypatch=monkeypatch, clock=clock, technique='cv', params=cv
+        )
+
+    clock.now = 1.0
+    potentiostat.stop_channel()
+    clock.now = 2.0
+    block = np.concatenate(drain(potentiostat=potentiostat))
+
+    assert len(block) == 5000 + 1
+    assert potentiostat.get_block()[2].size == 0
+
+
+def test_ca_steps(monkeypatch, clock: Clock):
+    potentiostat, _ = make_potentiostat(
+        monkeypatch=monkeypatch,
+        clock=clock,
+        technique='ca',
+        params={
+            'Voltage_step': (3.1, 3.2),
+            'Duration_step': (0.1, 0.1),
+            'Step_number': 1
+            }
+        )
+
+    clock.now = 1.0
+    block = np.concatenate(drain(potentiostat=potentiostat))
+
+    assert np.unique(block['Ewe']) == pytest.approx([3.1, 3.2])
+    assert np.isnan(block['Ec']).all()
+
+
+def test_noise(monkeypatch, clock: Clock):
+    potentiostat, _ = make_potentiostat(
+        monkeypatch=monkeypatch,
+        clock=clock,
+        technique='ca',
+        params={'Voltage_step': 3.1, 'Duration_step': 1.0, 'Step_number': 0},
+        noise=1e-3
+        )
+
+    clock.now = 1.0
+    block = np.concatenate(drain(potentiostat=potentiostat))
+
+    assert block['Ewe'].std() == pytest.approx(1e-3, rel=0.2)
+    assert block['Ewe'].mean() == pytest.approx(3.1, abs=1e-3)
+    assert np.isnan(block['Ec']).all()
+
+
+def test_float_params_are_single(monkeypatch, clock: Clock):
+    make_potentiostat(
+        monkeypatch=monkeypatch, clock=clock, technique='cv', params=cv
+        )
+
+    ecc_param = techniques._make_ecc_param(
+        label='Scan_Rate', value=2.5, index=3
+        )
+
+    assert ecc_param.ParamType == PARAM_SINGLE
+    assert ecc_param.ParamIndex == 3
+
+
+def test_throughput(monkeypatch, clock: Clock):
+    """Decoding and tagging must keep up with a CV at 20 kHz many times
+    over, as a poll may carry seconds' worth of points after a hiccup.
+    """
+
+    sampling_rate = 20000.0
+    potentiostat, _ = make_potentiostat(
+        monkeypatch=monkeypatch,
+        clock=clock,
+        technique='cv',
+        params=cv,
+        sampling_rate=sampling_rate
+        )
+
+    clock.now = 4.5
+    start = time.perf_counter()
+    blocks = drain(potentiostat=potentiostat)
+    elapsed = time.perf_counter() - start
+
+    no_points = sum(len(block) for block in blocks)
+    rows_per_poll = DATA_BUFFER_SIZE // 6
+
+    assert no_points == 4.5 * sampling_rate + 1
+    assert max(len(block) for block in blocks) == rows_per_poll
+    assert no_points / elapsed > 5 * sampling_rate
@@ -0,0 +1,62 @@
+import pytest
+
+from biologic.state import StateStore
+from tests.params import cp_params
+
+run_id = 'dummy_run'
+device = 'KBIO_DEV_HCP1005'
+
+
+@pytest.fixture
+def path(tmp_path) -> str:
+    return str(tmp_path / 'state.db')
+
+
+@pytest.fixture
+def store(path: str) -> StateStore:
+    store = StateStore(path=path)
+    store.start(
+        run_id=run_id,
+        exp_id=cp_params['exp_id'],
+        device=device,
+        channel=1,
+        raw_params=cp_params
+        )
+
+    return store
+
+
+def test_unfinished(store: StateStore):
+    runs = store.unfinished()
+
+    assert len(runs) == 1
+    assert runs[0].run_id == run_id
+    assert runs[0].raw_params == cp_params
+    assert runs[0].cursor is None
+
+
+def test_unfinished_by_channel(store: StateStore):
+    assert store.unfinished(channel=0) == []
+    assert len(store.unfinished(channel=1)) == 1
+
+
+def test_acknowledge(store: StateStore):
+    store.acknowledge(run_id=run_id, cursor=12.5)
+
+    assert store.unfinished()[0].cursor == 12.5
+
+
+def test_finish(store: StateStore):
+    store.finish(run_id=run_id)
+
+    assert store.unfinished() == []
+
+
+def test_survives_restart(store: StateStore, path: str):
+    store.acknowledge(run_id=run_id, cursor=3.0)
+    store.close()
+
+    runs = StateStore(path=path).unfinished()
+
+    assert runs[0].cursor == 3.0
+    assert runs[0].device == device
@@ -0,0 +1,162 @@
+import pytest
+
+from biologic.potentiostats import Potentiostat
+from biologic.simulator import SimulatedDriver
+from biologic.status import MetadataCache
+
+
+class CountingDriver(SimulatedDriver):
+    """Counts the instrument round trips, failing them on demand."""
+
+    def __init__(self, **kwargs):
+        super(CountingDriver, self).__init__(**kwargs)
+
+        self.calls = 0
+        self.fail = False
+
+    def BL_GetChannelInfos(self, id_, channel, channel_infos) -> int:
+        self.calls += 1
+
+        if self.fail:
+            raise ConnectionError('Instrument gone')
+
+        return super(CountingDriver, self).BL_GetChannelInfos(
+            id_, channel, channel_infos
+            )
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def driver() -> CountingDriver:
+    return CountingDriver(no_channels=2)
+
+
+@pytest.fixture
+def clock() -> Clock:
+    return Clock()
+
+
+@pytest.fixture
+def potentiostat(driver: CountingDriver) -> Potentiostat:
+    potentiostat = Potentiostat(type_='KBIO_DEV_HCP1005', driver=driver)
+    potentiostat.connect(usb_port='USB0')
+
+    yield potentiostat
+
+    potentiostat.disconnect()
+
+
+@pytest.fixture
+def cache(potentiostat: Potentiostat, clock: Clock) -> MetadataCache:
+    return MetadataCache(
+        usb_port='USB0', connection=lambda: potentiostat, clock=clock
+        )
+
+
+def test_empty_before_refresh(cache: MetadataCache):
+    snapshot = cache.snapshot()
+
+    assert snapshot['device'] is None
+    assert snapshot['channels'] == []
+    assert snapshot['age'] is None
+
+
+def test_refresh(cache: MetadataCache, clock: Clock):
+    cache.refresh()
+    clock.now += 5
+    snapshot = cache.snapshot()
+
+    assert snapshot['device']['DeviceCode(translated)'] == 'KBIO_DEV_HCP1005'
+    assert [channel['plugged'] for channel in snapshot['channels']] == [
+        True, True
+        ]
+    assert snapshot['channels'][1]['Channel'] == 1
+    assert snapshot['channels'][1]['State(translated)'] == 'stopped'
+    assert snapshot['age'] == 5
+    assert snapshot['error'] is None
+
+
+def test_snapshot_without_io(cache: MetadataCache, driver: CountingDriver):
+    cache.refresh()
+    calls = driver.calls
+
+    for _ in range(100):
+        cache.snapshot()
+
+    assert driver.calls == calls
+
+
+def test_failed_refresh_keeps_snapshot(
+    cache: MetadataCache, driver: CountingDriver, potentiostat: Potentiostat
+    ):
+    cache.refresh()
+    driver.fail = True
+    cache.refresh()
+    snapshot = cache.snapshot()
+
+    assert len(snapshot['channels']) == 2
+    assert snapshot['error'] == 'ConnectionError: Instrument gone'
+    # Borrowed, so not the cache's to disconnect
+    assert potentiostat.is_connected
+
+    driver.fail = False
+    cache.refresh()
+
+    assert cache.snapshot()['error'] is None
+
+
+def test_background_refresh(cache: MetadataCache, driver: CountingDriver):
+    cache.ttl = 0.01
+    cache.start()
+
+    try:
+        while driver.calls < 6:
+            pass
+    finally:
+        cache.stop()
+
+    assert cache.snapshot()['device'] is not None
+
+
+def test_nothing_to_borrow():
+    cache = MetadataCache(usb_port='USB0', connection=lambda: None)
+    cache.refresh()
+    snapshot = cache.snapshot()
+
+    assert snapshot['device'] is None
+    assert snapshot['error'].startswith('ConnectionError')
+
+
+def test_calls_serialized(
+    cache: MetadataCache,
+    driver: CountingDriver,
+    potentiostat: Potentiostat,
+    monkeypatch
+    ):
+    calls = list()
+    serializer = potentiostat.commands
+    call = serializer.call
+
+    def recording(function, *args, **kwargs):
+        calls.append(function.__name__)
+
+        return call(function, *args, **kwargs)
+
+    monkeypatch.setattr(serializer, 'call', recording)
+    cache.refresh()
+
+    assert calls.count('BL_GetChannelInfos') == driver.calls == 2
+    assert 'BL_GetChannelsPlugged' in calls
+
+
+def test_invalid_ttl():
+    with pytest.raises(ValueError):
+        MetadataCache(usb_port='USB0', connection=lambda: None, ttl=0)
@@ -2,6 +2,7 @@ import ctypes
 import pytest
 
 from biologic import techniques
+from biologic.simulator import SimulatedDriver
 from biologic.structures import EccParam, EccParams
 from biologic.utils import parse_raw_params
 from tests.params import cp_params
@@ -110,3 +111,88 @@ def test_parse_technique_params(technique_params_raw):
 
     assert isinstance(c_tecc_params, list)
     assert isinstance(c_tecc_params[0], EccParams)
+
+
+def encoded(monkeypatch, params: dict) -> list[tuple[str, int]]:
+    """(label, ParamIndex) of every parameter set_technique_params()
+    encodes, in order.
+    """
+
+    monkeypatch.setattr(techniques, 'driver', SimulatedDriver())
+    c_tecc_params = techniques.set_technique_params([params])[0]
+
+    return [
+        (
+            bytes(c_tecc_params.pParams[i].ParamStr).rstrip(b'\x00').decode(),
+            c_tecc_params.pParams[i].ParamIndex
+            )
+        for i in range(c_tecc_params.len)
+        ]
+
+
+def test_single_value_every_step(monkeypatch):
+    pairs = encoded(
+        monkeypatch=monkeypatch,
+        params={
+            'Voltage_step': [0.1, 0.2],
+            'Duration_step': 5.0,
+            'Step_number': 1,
+            'N_Cycles': 0,
+            }
+        )
+
+    assert pairs == [
+        ('Voltage_step', 0),
+        ('Voltage_step', 1),
+        ('Duration_step', 0),
+        ('Duration_step', 1),
+        ('Step_number', 0),
+        ('N_Cycles', 0),
+        ]
+
+
+def test_single_current_and_limit_every_step(monkeypatch):
+    pairs = encoded(
+        monkeypatch=monkeypatch,
+        params={
+            'Current_step': -1.0,
+            'Duration_step': [3.0, 3.0],
+            'Voltage_limit': [2.7, 2.5],
+            'Step_number': 1,
+            }
+        )
+
+    assert pairs == [
+        ('Current_step', 0),
+        ('Current_step', 1),
+        ('Duration_step', 0),
+        ('Duration_step', 1),
+        ('Test1_Config', 0),
+        ('Test1_Value', 0),
+        ('Test1_Config', 1),
+        ('Test1_Value', 1),
+        ('Step_number', 0),
+        ]
+
+
+def test_steps_from_longest_list(monkeypatch):
+    pairs = encoded(
+        monkeypatch=monkeypatch,
+        params={'Voltage_step': [0.0, 0.5, -0.5], 'Scan_Rate': 100.0}
+        )
+
+    assert [pair for pair in pairs if pair[0] == 'Scan_Rate'] == [
+        ('Scan_Rate', 0), ('Scan_Rate', 1), ('Scan_Rate', 2)
+        ]
+
+
+@pytest.mark.parametrize(
+    'params', [
+        {'Voltage_step': [0.1, 0.2], 'Duration_step': [5.0, 5.0, 5.0]},
+        {'Voltage_step': [0.1, 0.2], 'Step_number': 2},
+        {'Current_step': [1.0, -1.0], 'Voltage_limit': [2.7, 2.5, 2.3]},
+        ]
+    )
+def test_step_lengths_differ(monkeypatch, params: dict):
+    with pytest.raises(ValueError):
+        encoded(monkeypatch=monkeypatch, params=params)
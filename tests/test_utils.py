@@ -1,5 +1,6 @@
 import ctypes
 import json
+import os
 import pytest
 
 from biologic import exceptions, utils
@@ -15,7 +16,8 @@ dummy_reference_device = 'KBIO_DEV_HCP1005'
 dummy_device_code = 18
 int_representing_a_float = 100
 
-dummy_tecc_ecc_path = 'drivers\\ocv.ecc'
+# 'drivers\\ocv.ecc' on Windows
+dummy_tecc_ecc_path = os.path.join('drivers', 'ocv.ecc')
 dummy_exp_id = 'brix2/test/test'
 
 dummy_voltage = 3.1290981769561768
@@ -146,3 +148,34 @@ def test_structure_to_dict(structure: ctypes.Structure):
 
     assert isinstance(dict_, dict)
     assert list(dict_.keys()) == ['key1', 'key2']
+
+
+class CountingDriver:
+    """Counts translations instead of asking the DLL."""
+
+    _name = 'counting_driver.dll'
+
+    def __init__(self):
+        self.calls = 0
+
+    def BL_GetErrorMsg(self, error_code, message, number_of_chars):
+        self.calls += 1
+        message.value = b'selected channel(s) already used'
+
+        return 0
+
+
+def test_error_message_memoized():
+    counting_driver = CountingDriver()
+
+    for _ in range(3):
+        with pytest.raises(exceptions.ChannelRunningError) as e:
+            utils.assert_status_ok(driver=counting_driver, return_code=-13)
+
+    assert counting_driver.calls == 1
+    assert e.value.message == 'selected channel(s) already used'
+
+
+@pytest.mark.parametrize('path', ['drivers\\', 'drivers/'])
+def test_native_path(path: str):
+    assert utils.native_path(path) == 'drivers' + os.sep